@@ -48,4 +48,21 @@ def create_app(config):
     app.register_blueprint(github_blueprint, url_prefix="/login")
     app.register_blueprint(google_blueprint, url_prefix="/login")
 
+    # plan.xml (ou o seu snapshot binário) carregado já no arranque do worker
+    from apps.rocrail_plan import preload_plan
+    preload_plan()
+
+    # ligação ao Rocrail no loop de I/O partilhado (já não arranca no import)
+    from apps.rocrail_core import rocrail
+    rocrail.start()
+
+    # previsão de colisões a correr desde o arranque (não só quando alguém
+    # abre /api/safety)
+    from apps.rocrail_safety import get_predictor
+    get_predictor()
+
+    # canal WebSocket do RC car (porta própria, no mesmo loop de I/O)
+    from apps.rc_ws import rc_ws
+    rc_ws.start()
+
     return app
@@ -0,0 +1,265 @@
+"""
+Codec das frames CAN do protocolo Märklin CS2/CS3 (CAN sobre TCP/UDP).
+
+Cada frame tem 13 bytes:
+    4 bytes  CAN ID (big-endian, 29 bits)
+               bits 28..25 prioridade | 24..17 comando | 16 resposta | 15..0 hash
+    1 byte   DLC (nº de bytes de dados válidos, 0..8)
+    8 bytes  dados (sempre 8, preenchidos com zeros)
+"""
+import struct
+from typing import Callable, List, Optional
+
+
+FRAME_SIZE = 13
+
+# Comandos (byte "Kommando" do CAN ID)
+CMD_SYSTEM = 0x00
+CMD_LOCO_DISCOVERY = 0x01
+CMD_LOCO_SPEED = 0x04
+CMD_LOCO_DIRECTION = 0x05
+CMD_LOCO_FUNCTION = 0x06
+CMD_ACCESSORY = 0x0B
+CMD_S88_POLL = 0x10
+CMD_S88_EVENT = 0x11
+CMD_PING = 0x18
+CMD_CONFIG_DATA = 0x20
+CMD_CONFIG_STREAM = 0x21
+
+# Sub-comandos de sistema (dados[4])
+SYS_STOP = 0x00
+SYS_GO = 0x01
+SYS_HALT = 0x02
+SYS_LOCO_EMERGENCY_STOP = 0x03
+
+# Direção (CMD_LOCO_DIRECTION)
+DIR_KEEP = 0
+DIR_FORWARD = 1
+DIR_REVERSE = 2
+DIR_TOGGLE = 3
+
+# Velocidade no protocolo: 0..1000
+SPEED_MAX = 1000
+
+# Bases dos UIDs (locID) por protocolo
+LOCO_UID_BASE = {"mm2": 0x0000, "sx1": 0x0800, "mfx": 0x4000, "dcc": 0xC000}
+ACCESSORY_UID_BASE = {"mm2": 0x3000, "dcc": 0x3800}
+
+# Posição de um acessório: 0 = vermelho/desvio, 1 = verde/reto
+ACC_TURNOUT = 0
+ACC_STRAIGHT = 1
+
+# Hash "fixo" de um cliente sem UID próprio (cumpre a regra dos bits 7..9)
+DEFAULT_HASH = 0x4711
+
+_HEADER = struct.Struct(">IB")          # CAN ID + DLC
+_FRAME = struct.Struct(">IB8s")         # frame completa
+
+
+def can_hash(uid: int) -> int:
+    """Hash de 16 bits do CAN ID a partir do UID (regra CS2: bits 7..9 = 110)."""
+    h = ((uid >> 16) ^ uid) & 0xFFFF
+    return ((h << 3) & 0xFF00) | 0x0300 | (h & 0x7F)
+
+
+def make_can_id(cmd: int, response: bool = False, hash_: int = DEFAULT_HASH, prio: int = 0) -> int:
+    return ((prio & 0x0F) << 25) | ((cmd & 0xFF) << 17) | (int(response) << 16) | (hash_ & 0xFFFF)
+
+
+def split_can_id(can_id: int):
+    """(prioridade, comando, resposta, hash) de um CAN ID."""
+    return (can_id >> 25) & 0x0F, (can_id >> 17) & 0xFF, (can_id >> 16) & 1, can_id & 0xFFFF
+
+
+def loco_uid(address: int, protocol: str = "mfx") -> int:
+    """locID de uma loco a partir do endereço e protocolo (mm2 / sx1 / mfx / dcc)."""
+    return LOCO_UID_BASE[protocol] + int(address)
+
+
+def accessory_uid(address: int, protocol: str = "mm2") -> int:
+    """UID de um acessório (endereços começam em 1 no teclado da CS)."""
+    return ACCESSORY_UID_BASE[protocol] + int(address) - 1
+
+
+# ---------------------------------------------------
+# ENCODER
+# ---------------------------------------------------
+
+def encode_frame(cmd: int, data: bytes = b"", response: bool = False,
+                 hash_: int = DEFAULT_HASH, prio: int = 0,
+                 out: Optional[bytearray] = None, offset: int = 0) -> bytes:
+    """
+    Frame de 13 bytes. Se `out` for dado, escreve lá (em `offset`) sem
+    alocar e devolve `out`; senão devolve bytes novos.
+    """
+    if len(data) > 8:
+        raise ValueError("dados CAN com mais de 8 bytes")
+    can_id = make_can_id(cmd, response, hash_, prio)
+    if out is not None:
+        _FRAME.pack_into(out, offset, can_id, len(data), data)
+        return out
+    return _FRAME.pack(can_id, len(data), data)
+
+
+def system_stop(uid: int = 0) -> bytes:
+    return encode_frame(CMD_SYSTEM, struct.pack(">IB", uid, SYS_STOP))
+
+
+def system_go(uid: int = 0) -> bytes:
+    return encode_frame(CMD_SYSTEM, struct.pack(">IB", uid, SYS_GO))
+
+
+def loco_emergency_stop(uid: int) -> bytes:
+    return encode_frame(CMD_SYSTEM, struct.pack(">IB", uid, SYS_LOCO_EMERGENCY_STOP))
+
+
+def loco_speed(uid: int, speed: int) -> bytes:
+    """Velocidade da loco, 0..1000."""
+    return encode_frame(CMD_LOCO_SPEED, struct.pack(">IH", uid, max(0, min(SPEED_MAX, int(speed)))))
+
+
+def loco_direction(uid: int, direction: int) -> bytes:
+    """direction: DIR_KEEP / DIR_FORWARD / DIR_REVERSE / DIR_TOGGLE."""
+    return encode_frame(CMD_LOCO_DIRECTION, struct.pack(">IB", uid, direction))
+
+
+def loco_function(uid: int, fn_no: int, value: int) -> bytes:
+    """Função fn_no (0..31) ligada (1) ou desligada (0); valores >1 = dimmer."""
+    return encode_frame(CMD_LOCO_FUNCTION, struct.pack(">IBB", uid, fn_no, value))
+
+
+def accessory(uid: int, position: int, power: int = 1, time_10ms: Optional[int] = None) -> bytes:
+    """
+    Comando de acessório. position: ACC_STRAIGHT / ACC_TURNOUT.
+    time_10ms: tempo de comutação (unidades de 10 ms) gerido pela CS.
+    """
+    if time_10ms is None:
+        data = struct.pack(">IBB", uid, position, power)
+    else:
+        data = struct.pack(">IBBH", uid, position, power, time_10ms)
+    return encode_frame(CMD_ACCESSORY, data)
+
+
+def ping() -> bytes:
+    return encode_frame(CMD_PING)
+
+
+# ---------------------------------------------------
+# DECODER (framing incremental sobre buffer pré-alocado)
+# ---------------------------------------------------
+
+# handler(cmd, response, hash, dlc, buf, data_offset): os dados ficam em
+# buf[data_offset:data_offset + dlc] e só são válidos durante a chamada.
+FrameHandler = Callable[[int, int, int, int, bytearray, int], None]
+
+
+class CanFrameReader:
+    """
+    Junta frames de 13 bytes a partir de um stream (TCP) ou de datagramas (UDP).
+
+    Os bytes recebidos vão diretamente para um bytearray pré-alocado
+    (recv_into sobre um memoryview); cada frame completa é despachada pelo
+    comando para o handler registado, que lê os campos de `buf` com
+    struct.unpack_from — não se cria nenhum objeto bytes por frame.
+    Restos de frames partidas entre leituras ficam no buffer até à próxima.
+    """
+
+    def __init__(self, default_handler: Optional[FrameHandler] = None,
+                 capacity_frames: int = 4096):
+        self.buf = bytearray(FRAME_SIZE * capacity_frames)
+        self.view = memoryview(self.buf)
+        self.start = 0
+        self.end = 0
+        self.handlers: List[Optional[FrameHandler]] = [default_handler] * 256
+        self.frames = 0
+        self.bytes = 0
+
+    def on(self, cmd: int, handler: Optional[FrameHandler]):
+        """Regista o handler de um comando (None = ignorar)."""
+        self.handlers[cmd & 0xFF] = handler
+
+    def recv_from(self, sock) -> int:
+        """Um recv_into do socket para o buffer + despacho; devolve nº de bytes (0 = fechado)."""
+        if self.end == len(self.buf):
+            self._compact()
+        n = sock.recv_into(self.view[self.end:])
+        if n:
+            self.end += n
+            self.bytes += n
+            self._drain()
+        return n
+
+    def recv_datagram(self, sock) -> int:
+        """
+        Um datagrama UDP (uma ou mais frames inteiras) direto para o buffer.
+        Ao contrário do TCP, um resto que não chega a frame é lixo e descarta-se.
+        """
+        if len(self.buf) - self.end < 1500:
+            self._compact()
+        n = sock.recv_into(self.view[self.end:])
+        if n:
+            self.end += n
+            self.bytes += n
+            self._drain()
+            self.start = self.end = 0
+        return n
+
+    def writable(self) -> memoryview:
+        """Zona livre do buffer (para asyncio.BufferedProtocol.get_buffer)."""
+        if self.end == len(self.buf):
+            self._compact()
+        return self.view[self.end:]
+
+    def commit(self, n: int):
+        """n bytes escritos em writable() (BufferedProtocol.buffer_updated) + despacho."""
+        self.end += n
+        self.bytes += n
+        self._drain()
+
+    def feed_datagram(self, data) -> int:
+        """Um datagrama já recebido; tal como em recv_datagram, restos descartam-se."""
+        n = self.feed(data)
+        self.start = self.end = 0
+        return n
+
+    def feed(self, data) -> int:
+        """Alimenta bytes já recebidos (p.ex. um datagrama UDP); devolve nº de frames."""
+        before = self.frames
+        mv = memoryview(data)
+        while len(mv):
+            if self.end == len(self.buf):
+                self._compact()
+            n = min(len(mv), len(self.buf) - self.end)
+            self.view[self.end:self.end + n] = mv[:n]
+            self.end += n
+            self.bytes += n
+            mv = mv[n:]
+            self._drain()
+        return self.frames - before
+
+    def _compact(self):
+        """Move o resto de uma frame incompleta para o início do buffer."""
+        rest = self.end - self.start
+        if rest:
+            self.buf[:rest] = self.view[self.start:self.end]
+        self.start = 0
+        self.end = rest
+
+    def _drain(self):
+        buf = self.buf
+        handlers = self.handlers
+        unpack = _HEADER.unpack_from
+        off = self.start
+        end = self.end
+        while end - off >= FRAME_SIZE:
+            can_id, dlc = unpack(buf, off)
+            handler = handlers[(can_id >> 17) & 0xFF]
+            if handler is not None:
+                handler((can_id >> 17) & 0xFF, (can_id >> 16) & 1, can_id & 0xFFFF,
+                        dlc if dlc <= 8 else 8, buf, off + 5)
+            off += FRAME_SIZE
+            self.frames += 1
+        if off == end:
+            self.start = self.end = 0
+        else:
+            self.start = off
@@ -1,34 +1,160 @@
+import asyncio
+import os
 import socket
+import struct
 import threading
 import time
 from typing import Optional, Dict, Any, List
 
+from apps import cs3_can
+from apps.cs3_can import CanFrameReader
+from apps.cs3_config import ConfigCache, ConfigStream, parse_cs2, request_frames_data, to_int
+from apps.cs3_state import CS3StateStore
+from apps.cs3_turnouts import build_turnout_batch
+from apps.layout_io import StreamConnection, layout_io
+
+# Tempo de comutação das agulhas enviado à CS (unidades de 10 ms)
+TURNOUT_PULSE_10MS = 20
+
+# Transportes: "tcp" (15731), "udp" (envio 15731 / receção 15730) ou
+# "hybrid" (comandos por UDP, streams de config por TCP)
+TRANSPORTS = ("tcp", "udp", "hybrid")
+CS3_TRANSPORT = os.environ.get("CS3_TRANSPORT", "tcp")
+# Endereço da CS3 (CS3_HOST=127.0.0.1 para usar o simulador apps/cs3_sim.py)
+CS3_HOST = os.environ.get("CS3_HOST", "192.168.59.36")
+CS3_PORT = int(os.environ.get("CS3_PORT", "15731"))
+UDP_RX_PORT = 15730
+
+# SO_RCVBUF / SO_SNDBUF dos sockets da CS3. Em UDP cada frame de 13 bytes
+# ocupa ~768 bytes do buffer do kernel; 1 MiB aguenta rajadas de ~2500 frames
+# sem perdas enquanto a thread de receção não chega ao socket.
+SOCKET_BUFFER = 1024 * 1024
+
+# Tempo máximo de um download de config data (lokomotive.cs2 grande demora segundos)
+CONFIG_TIMEOUT_S = 30.0
+
+# Log em hex de cada frame enviada (desligar para tráfego de controlo a alta taxa)
+LOG_TX = os.environ.get("CS3_LOG_TX", "1") == "1"
+
+_UID_U16 = struct.Struct(">IH")
+_UID_U8 = struct.Struct(">IB")
+_UID_U8_U8 = struct.Struct(">IBB")
+_S88_EVENT = struct.Struct(">HHBBH")   # dispositivo, contacto, estado antigo, novo, tempo
+
+
+class CS3TcpConnection(StreamConnection, asyncio.BufferedProtocol):
+    """
+    TCP 15731 no loop partilhado. Como BufferedProtocol, o loop faz o
+    recv_into diretamente para o buffer do CanFrameReader do cliente.
+    """
+
+    tag = "CS3"
+
+    def __init__(self, client: "CS3Client", host: str, port: int):
+        super().__init__(layout_io, host, port)
+        self.client = client
+
+    def connection_made(self, transport):
+        CS3Client._size_buffers(transport.get_extra_info("socket"))
+        super().connection_made(transport)
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self.client.reader.writable()
+
+    def buffer_updated(self, nbytes: int):
+        self.client.reader.commit(nbytes)
+
+    def on_connected(self):
+        pass
+
+    def on_disconnected(self, exc: Optional[Exception]):
+        if exc is not None:
+            self.client.last_error = str(exc)
+            print("[CS3] Erro na ligação TCP:", exc)
+
+
+class CS3UdpEndpoint(asyncio.DatagramProtocol):
+    """Socket UDP (envio para a CS ou receção na udp_rx_port) no loop partilhado."""
+
+    def __init__(self, client: "CS3Client", reader: CanFrameReader):
+        self.client = client
+        self.reader = reader
+        self.transport: Optional[asyncio.DatagramTransport] = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        self.transport = None
+
+    def datagram_received(self, data: bytes, addr):
+        self.reader.feed_datagram(data)
+
+    def error_received(self, exc: Exception):
+        self.client.last_error = str(exc)
+        print("[CS3] Erro UDP:", exc)
+
+    def send_frames(self, payload: bytes):
+        """Uma frame por datagrama (corre no loop)."""
+        transport = self.transport
+        if transport is None:
+            return
+        for off in range(0, len(payload), cs3_can.FRAME_SIZE):
+            transport.sendto(payload[off:off + cs3_can.FRAME_SIZE])
+
 
 class CS3Client:
     """
-    Cliente simples para Marklin CS3, inspirado no modelo do BTrain (mas em Python).
+    Cliente para Marklin CS3, inspirado no modelo do BTrain (mas em Python).
 
-    NOTA: Este é um esqueleto.
-    A CS3 fala CAN sobre TCP/UDP segundo o protocolo CS2/CS3.
-    Aqui preparamos a conexão e alguns "hooks" para enviar/receber mensagens.
+    A CS3 fala CAN sobre TCP/UDP segundo o protocolo CS2/CS3 (apps/cs3_can.py).
+    As ligações correm no loop partilhado (apps.layout_io); as frames recebidas
+    são despachadas pelo CanFrameReader para os handlers _on_*, que atualizam
+    o estado vivo (self.state). Os ficheiros de config (.cs2) chegam em
+    streams 0x21 com cache em disco por CRC (apps/cs3_config.py).
     """
 
     def __init__(self,
-                 host: str = "192.168.59.36",  # IP da tua CS3
-                 port: int = 15731,           # porta típica do protocolo CS2/CS3
-                 auto_connect: bool = True):
+                 host: str = CS3_HOST,        # IP da tua CS3
+                 port: int = CS3_PORT,        # porta típica do protocolo CS2/CS3
+                 auto_connect: bool = True,
+                 transport: str = CS3_TRANSPORT,
+                 udp_rx_port: int = UDP_RX_PORT):
+        if transport not in TRANSPORTS:
+            raise ValueError(f"transporte desconhecido: {transport}")
         self.host = host
         self.port = port
-        self.sock: Optional[socket.socket] = None
-        self.lock = threading.Lock()
-        self.receiver_thread: Optional[threading.Thread] = None
-        self.running = False
+        self.transport = transport
+        self.udp_rx_port = udp_rx_port
 
         # Estado básico em memória
         self.last_error: Optional[str] = None
         self.last_connect_time: Optional[float] = None
-        self.locos: Dict[str, Dict[str, Any]] = {}
-        self.turnouts: Dict[str, Dict[str, Any]] = {}
+        # Estado vivo (locos, agulhas, S88, sistema) com seq/timestamp por objeto
+        self.state = CS3StateStore()
+
+        # Framing CAN (13 bytes) sobre buffer pré-alocado; um reader por
+        # transporte para que restos de frames TCP não se misturem com UDP
+        self.reader = self._make_reader()
+        self.udp_reader = self._make_reader()
+
+        # Callbacks (uid, posição, power) para respostas de acessórios (na thread do loop)
+        self.accessory_listeners: List[Any] = []
+
+        # Ligações no loop partilhado (apps.layout_io): os handlers das
+        # frames correm na thread do loop
+        self.tcp = CS3TcpConnection(self, host, port)
+        self.udp_tx = CS3UdpEndpoint(self, self.udp_reader)    # UDP -> CS (port)
+        self.udp_rx = CS3UdpEndpoint(self, self.udp_reader)    # UDP <- CS (udp_rx_port)
+
+        # Config data (lokomotive.cs2, magnetartikel.cs2, gleisbild): um pedido de cada vez
+        self.config_cache = ConfigCache()
+        self.config_lock = threading.Lock()
+        self._stream: Optional[ConfigStream] = None
+        # stream anterior servido da cache cujo resto ainda está a chegar: a
+        # receção consome-o e descarta-o sem atrasar o pedido seguinte
+        self._discarding: Optional[ConfigStream] = None
+        self.config: Dict[str, Any] = {}
 
         if auto_connect:
             try:
@@ -41,125 +167,340 @@ class CS3Client:
     # LIGAÇÃO BÁSICA
     # -----------------------
 
-    def connect(self):
-        """Liga à CS3 via TCP."""
-        if self.sock is not None:
-            return
+    def _make_reader(self) -> CanFrameReader:
+        reader = CanFrameReader()
+        reader.on(cs3_can.CMD_LOCO_SPEED, self._on_loco_speed)
+        reader.on(cs3_can.CMD_LOCO_DIRECTION, self._on_loco_direction)
+        reader.on(cs3_can.CMD_LOCO_FUNCTION, self._on_loco_function)
+        reader.on(cs3_can.CMD_ACCESSORY, self._on_accessory)
+        reader.on(cs3_can.CMD_S88_EVENT, self._on_s88_event)
+        reader.on(cs3_can.CMD_SYSTEM, self._on_system)
+        reader.on(cs3_can.CMD_CONFIG_STREAM, self._on_config_stream)
+        return reader
 
-        print(f"[CS3] A ligar a {self.host}:{self.port} ...")
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        s.settimeout(5.0)
-        s.connect((self.host, self.port))
-        s.settimeout(None)
+    @staticmethod
+    def _size_buffers(s: socket.socket):
+        for opt in (socket.SO_RCVBUF, socket.SO_SNDBUF):
+            try:
+                s.setsockopt(socket.SOL_SOCKET, opt, SOCKET_BUFFER)
+            except OSError as e:
+                print("[CS3] Não foi possível ajustar buffer do socket:", e)
 
-        self.sock = s
-        self.running = True
-        self.last_connect_time = time.time()
+    def is_connected(self) -> bool:
+        tcp = self.tcp.connected
+        udp = self.udp_tx.transport is not None
+        if self.transport == "tcp":
+            return tcp
+        if self.transport == "udp":
+            return udp
+        return tcp and udp
 
-        self.receiver_thread = threading.Thread(target=self._receiver_loop, daemon=True)
-        self.receiver_thread.start()
+    def connect(self):
+        """Liga à CS3 pelo transporte configurado (tcp / udp / hybrid)."""
+        if self.is_connected():
+            return
 
+        print(f"[CS3] A ligar a {self.host}:{self.port} ({self.transport}) ...")
+        try:
+            layout_io.call(self._connect_async(), self.tcp.connect_timeout + 1.0)
+        except Exception:
+            self.disconnect()
+            raise
+        self.last_connect_time = time.time()
         print("[CS3] Ligação estabelecida.")
 
         # Aqui, no protocolo real, deveríamos enviar mensagens de "hello"/"login"
         # para registar o cliente. Esse detalhe depende da especificação CS2/CS3.
 
+    async def _connect_async(self):
+        if self.transport in ("tcp", "hybrid"):
+            await self.tcp._open()
+        if self.transport in ("udp", "hybrid") and self.udp_tx.transport is None:
+            loop = asyncio.get_running_loop()
+            rx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            rx.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._size_buffers(rx)
+            rx.bind(("", self.udp_rx_port))
+            await loop.create_datagram_endpoint(lambda: self.udp_rx, sock=rx)
+            # destino fixo: sendto() sem resolver endereço
+            await loop.create_datagram_endpoint(lambda: self.udp_tx,
+                                                remote_addr=(self.host, self.port))
+            self._size_buffers(self.udp_tx.transport.get_extra_info("socket"))
+
     def disconnect(self):
         """Desliga da CS3."""
-        self.running = False
-        if self.sock:
-            try:
-                self.sock.close()
-            except:
-                pass
-        self.sock = None
+        if layout_io.in_loop():
+            self._close_all()
+        else:
+            layout_io.call(self._close_async())
         print("[CS3] Ligação terminada.")
 
-    def _receiver_loop(self):
-        """Loop para ler dados da CS3."""
-        if self.sock is None:
-            return
+    async def _close_async(self):
+        self._close_all()
 
-        s = self.sock
-        try:
-            while self.running:
-                # Aqui depende muito do framing do protocolo CS2/CS3.
-                # Normalmente tens frames de tamanho fixo ou com header.
-                # Para um esqueleto, vamos ler em blocos e imprimir hex.
-                data = s.recv(4096)
-                if not data:
-                    print("[CS3] Conexão fechada pelo servidor.")
-                    self.running = False
-                    break
-
-                # Aqui chamaríamos um parser de frames CAN/CS2
-                self._handle_raw_data(data)
-        except Exception as e:
-            self.last_error = str(e)
-            print("[CS3] Erro no receiver_loop:", e)
-        finally:
-            self.sock = None
-            self.running = False
-
-    def _handle_raw_data(self, data: bytes):
-        """
-        Processa dados crus vindos da CS3.
-        Aqui deves decodificar frames conforme o protocolo CS2/CS3.
-        Por agora, apenas loga em hex.
-        """
-        # Só debug bruto por enquanto:
-        hex_str = data.hex(" ")
-        print(f"[CS3] RX: {hex_str[:120]}{'...' if len(hex_str) > 120 else ''}")
-
-        # TODO:
-        # - Parsear frames CAN
-        # - Atualizar self.locos, self.turnouts, etc.
-
-    def send_raw(self, payload: bytes):
-        """Envia bytes crus para a CS3 (CAN frame / CS2 frame)."""
-        with self.lock:
-            if not self.sock:
+    def _close_all(self):
+        self.tcp._close()
+        for ep in (self.udp_tx, self.udp_rx):
+            if ep.transport is not None:
+                ep.transport.close()
+                ep.transport = None
+
+    # -----------------------
+    # FRAMES RECEBIDAS
+    # -----------------------
+    # Os handlers recebem o buffer do reader e o offset dos dados; só podem
+    # ler buf[off:off + dlc] durante a chamada.
+
+    @property
+    def locos(self) -> Dict[str, Dict[str, Any]]:
+        return self.state.section("locos")
+
+    @property
+    def turnouts(self) -> Dict[str, Dict[str, Any]]:
+        return self.state.section("turnouts")
+
+    def _on_loco_speed(self, cmd, resp, hash_, dlc, buf, off):
+        if dlc >= 6:
+            uid, speed = _UID_U16.unpack_from(buf, off)
+            self.state.update("locos", str(uid), uid=uid, speed=speed)
+
+    def _on_loco_direction(self, cmd, resp, hash_, dlc, buf, off):
+        if dlc >= 5:
+            uid, direction = _UID_U8.unpack_from(buf, off)
+            self.state.update("locos", str(uid), uid=uid, direction=direction)
+
+    def _on_loco_function(self, cmd, resp, hash_, dlc, buf, off):
+        if dlc >= 6:
+            uid, fn_no, value = _UID_U8_U8.unpack_from(buf, off)
+            self.state.update_nested("locos", str(uid), "functions", str(fn_no), value)
+
+    def _on_accessory(self, cmd, resp, hash_, dlc, buf, off):
+        if dlc >= 6:
+            uid, position, power = _UID_U8_U8.unpack_from(buf, off)
+            self.state.update(
+                "turnouts", str(uid), uid=uid, power=power,
+                position="straight" if position == cs3_can.ACC_STRAIGHT else "turnout",
+            )
+            if resp:
+                for cb in list(self.accessory_listeners):
+                    try:
+                        cb(uid, position, power)
+                    except Exception as e:
+                        print("[CS3] Erro num listener de acessórios:", e)
+
+    def _on_s88_event(self, cmd, resp, hash_, dlc, buf, off):
+        if dlc >= 8:
+            device, contact, _old, new, _time = _S88_EVENT.unpack_from(buf, off)
+            self.state.update("feedback", f"{device}:{contact}",
+                              device=device, contact=contact, occupied=bool(new))
+
+    def _on_config_stream(self, cmd, resp, hash_, dlc, buf, off):
+        discard = self._discarding
+        if discard is not None:
+            if dlc == 8 and discard.received < discard.padded:
+                discard.on_frame(dlc, buf, off)
+                if discard.received >= discard.padded:
+                    self._discarding = None
+                return
+            # acabou (ou foi cortado: já chegou o cabeçalho do stream seguinte)
+            self._discarding = None
+        stream = self._stream
+        if stream is not None:
+            stream.on_frame(dlc, buf, off)
+
+    def _on_system(self, cmd, resp, hash_, dlc, buf, off):
+        if dlc >= 5:
+            uid, sub = _UID_U8.unpack_from(buf, off)
+            if uid == 0 and sub in (cs3_can.SYS_STOP, cs3_can.SYS_GO, cs3_can.SYS_HALT):
+                state = {cs3_can.SYS_STOP: "stop", cs3_can.SYS_GO: "go", cs3_can.SYS_HALT: "halt"}[sub]
+                self.state.update("system", "track", state=state)
+
+    def send_raw(self, payload: bytes, stream: bool = False):
+        """
+        Envia bytes crus para a CS3 (uma ou mais frames de 13 bytes).
+        Em modo udp/hybrid os comandos vão por UDP; stream=True (pedidos de
+        config data) força TCP no modo hybrid.
+        """
+        use_udp = self.transport == "udp" or (self.transport == "hybrid" and not stream)
+        if use_udp:
+            if self.udp_tx.transport is None:
                 raise RuntimeError("CS3 não ligada")
-            self.sock.sendall(payload)
+            layout_io.call_soon(self.udp_tx.send_frames, payload)
+        elif not self.tcp.send(payload):
+            raise RuntimeError("CS3 não ligada")
+        if LOG_TX:
             print("[CS3] TX:", payload.hex(" "))
 
     # -----------------------
     # OPERAÇÕES DE ALTO NÍVEL
     # -----------------------
 
-    def request_loco_list(self):
+    def request_config(self, name: str, timeout: float = CONFIG_TIMEOUT_S):
         """
-        Pedir à CS3 a lista de locomotivas.
-        No protocolo real CS2/CS3, isto corresponde a enviar um frame específico.
-        TODO: Implementar com base na especificação.
+        Descarrega um ficheiro de config da CS3 ("loks", "mags", "gbs", "gbs-1", ...)
+        e devolve a lista de (chave, registo) do .cs2.
+
+        Se o CRC anunciado na 1ª frame já estiver na cache em disco devolve
+        logo a versão em cache. Sem ligação, usa a última versão em cache.
         """
-        print("[CS3] request_loco_list() chamado (TODO)")
+        if not self.is_connected():
+            cached = self.config_cache.latest(name)
+            if cached is None:
+                raise RuntimeError("CS3 não ligada e sem cache de " + name)
+            print(f"[CS3] {name}: sem ligação, a usar cache em disco")
+            return parse_cs2(cached)
 
-    def request_turnout_list(self):
+        with self.config_lock:
+            stream = ConfigStream(name, self.config_cache)
+            self._stream = stream
+            t0 = time.perf_counter()
+            try:
+                payload = b"".join(
+                    cs3_can.encode_frame(cs3_can.CMD_CONFIG_DATA, chunk)
+                    for chunk in request_frames_data(name)
+                )
+                self.send_raw(payload, stream=True)
+                if not stream.done.wait(timeout):
+                    raise TimeoutError(f"config {name}: sem resposta em {timeout:.0f}s")
+            finally:
+                # com cache (CRC igual) o resto do stream ainda vai chegar:
+                # passa a ser descartado pela receção, sem esperar por ele aqui
+                if stream.from_cache and stream.received < stream.padded:
+                    self._discarding = stream
+                self._stream = None
+            if stream.error:
+                raise ValueError(stream.error)
+
+        print(f"[CS3] {name}: {len(stream.entries)} registos em "
+              f"{(time.perf_counter() - t0) * 1000:.0f} ms"
+              f"{' (cache, CRC igual)' if stream.from_cache else ''}")
+        self.config[name] = stream.entries
+        return stream.entries
+
+    def request_loco_list(self) -> List[Dict[str, Any]]:
+        """
+        Pedir à CS3 a lista de locomotivas (lokomotive.cs2) e guardá-la no estado.
+        """
+        for key, rec in self.request_config("loks"):
+            if key != "lokomotive" or "uid" not in rec:
+                continue
+            uid = to_int(rec["uid"])
+            self.state.update(
+                "locos", str(uid), uid=uid,
+                name=rec.get("name"),
+                address=to_int(rec.get("adresse")),
+                protocol=rec.get("typ"),
+                function_types={f.get("nr", str(i)): to_int(f.get("typ"))
+                                for i, f in enumerate(rec.get("funktionen", []))},
+            )
+        return list(self.locos.values())
+
+    def request_turnout_list(self) -> List[Dict[str, Any]]:
         """
-        Pedir à CS3 a lista de agulhas / acessórios.
-        TODO: Implementar com base na especificação CS2/CS3.
+        Pedir à CS3 a lista de agulhas / acessórios (magnetartikel.cs2).
         """
-        print("[CS3] request_turnout_list() chamado (TODO)")
+        for key, rec in self.request_config("mags"):
+            if key != "artikel" or "id" not in rec:
+                continue
+            address = to_int(rec["id"])
+            protocol = rec.get("dectyp") if rec.get("dectyp") in cs3_can.ACCESSORY_UID_BASE else "mm2"
+            uid = cs3_can.accessory_uid(address, protocol)
+            self.state.update(
+                "turnouts", str(uid), uid=uid, address=address, protocol=protocol,
+                name=rec.get("name"), type=rec.get("typ"),
+                switch_time_ms=to_int(rec.get("schaltzeit"), None),
+            )
+        return list(self.turnouts.values())
+
+    def request_track_diagram(self) -> Dict[str, Any]:
+        """
+        Pedir o gleisbild: índice (gleisbild.cs2) e cada página ("gbs-<id>").
+        Devolve { "pages": [...], "elements": { id_página: [elementos] } }.
+        """
+        index = self.request_config("gbs")
+        pages = [rec for key, rec in index if key == "seite"]
+        elements = {}
+        for page in pages:
+            page_id = page.get("id", "0")
+            elements[page_id] = [
+                rec for key, rec in self.request_config(f"gbs-{to_int(page_id)}")
+                if key == "element"
+            ]
+        diagram = {"pages": pages, "elements": elements}
+        self.config["gleisbild"] = diagram
+        return diagram
+
+    def turnout_uid(self, turnout_id: str) -> int:
+        """
+        UID CAN de uma agulha: endereço MM2 numérico ("12"), UID em hex
+        ("0x300b") ou nome de uma agulha já conhecida em self.turnouts.
+        """
+        turnout_id = str(turnout_id).strip()
+        if turnout_id.isdigit():
+            return cs3_can.accessory_uid(int(turnout_id))
+        if turnout_id.lower().startswith("0x"):
+            return int(turnout_id, 16)
+        for key, t in self.turnouts.items():
+            if key == turnout_id or t.get("name") == turnout_id:
+                return t["uid"]
+        raise ValueError(f"agulha desconhecida na CS3: {turnout_id}")
 
     def set_turnout(self, turnout_id: str, position: str):
         """
         Mudar uma agulha na CS3.
-        position: "straight" ou "turnout" (ou equivalente CS3).
-        Aqui precisas mapear turnout_id -> address/port e construir o frame CAN.
+        position: "straight" ou "turnout". A CS desliga a bobine ao fim de
+        TURNOUT_PULSE_10MS * 10 ms.
+        """
+        pos = cs3_can.ACC_STRAIGHT if position == "straight" else cs3_can.ACC_TURNOUT
+        self.send_raw(cs3_can.accessory(self.turnout_uid(turnout_id), pos, 1, TURNOUT_PULSE_10MS))
+
+    def set_turnouts(self, items: List[Any], pulse_ms: Optional[int] = None,
+                     spacing_ms: Optional[int] = None,
+                     max_parallel: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Muda várias agulhas (p.ex. uma rota) com impulsos espaçados por
+        distrito de booster e distritos em paralelo; volta quando todas
+        acabaram. Ver apps/cs3_turnouts.py. Lança ValueError se algum item
+        for inválido (nada é comutado).
         """
-        print(f"[CS3] set_turnout({turnout_id}, {position}) (TODO: enviar comando real)")
+        batch = build_turnout_batch(self, items,
+                                    TURNOUT_PULSE_10MS * 10 if pulse_ms is None else int(pulse_ms),
+                                    spacing_ms, max_parallel)
+        if not self.is_connected():
+            raise RuntimeError("CS3 não ligada")
+        return layout_io.call(batch.run(), batch.worst_case_s() + 5.0)
+
+    def set_loco_speed(self, uid: int, speed: int):
+        """Velocidade da loco (locID), 0..1000 como no protocolo CS2."""
+        self.send_raw(cs3_can.loco_speed(uid, speed))
+
+    def set_loco_direction(self, uid: int, forward: bool):
+        self.send_raw(cs3_can.loco_direction(
+            uid, cs3_can.DIR_FORWARD if forward else cs3_can.DIR_REVERSE))
+
+    def set_loco_function(self, uid: int, fn_no: int, on: bool):
+        self.send_raw(cs3_can.loco_function(uid, fn_no, 1 if on else 0))
+
+    def emergency_stop(self):
+        """Stop geral da CS3 (corta a energia da via)."""
+        self.send_raw(cs3_can.system_stop())
 
     def get_status(self) -> Dict[str, Any]:
         """Resumo de estado para API Flask."""
+        counts = self.state.counts()
         return {
-            "connected": self.sock is not None and self.running,
+            "connected": self.is_connected(),
             "host": self.host,
             "port": self.port,
+            "transport": self.transport,
             "last_error": self.last_error,
             "last_connect_time": self.last_connect_time,
-            "locos_count": len(self.locos),
-            "turnouts_count": len(self.turnouts),
+            "locos_count": counts["locos"],
+            "turnouts_count": counts["turnouts"],
+            "feedback_count": counts["feedback"],
+            "state_seq": self.state.seq,
+            "frames_rx": self.reader.frames + self.udp_reader.frames,
+            "bytes_rx": self.reader.bytes + self.udp_reader.bytes,
         }
 
 
@@ -170,7 +511,7 @@ cs3 = CS3Client(auto_connect=False)
 def get_cs3():
     """Helper para obter o cliente (e ligar se ainda não estiver ligado)."""
     global cs3
-    if cs3.sock is None or not cs3.running:
+    if not cs3.is_connected():
         try:
             cs3.connect()
         except Exception as e:
@@ -0,0 +1,293 @@
+"""
+Config data da CS2/CS3 (comandos 0x20 "pedir config data" / 0x21 "config
+data stream"): receção em bocados de 8 bytes, CRC, zlib e parser do
+formato de texto .cs2, com cache em disco por nome + CRC + tamanho.
+
+Stream (depois de pedir p.ex. "loks"):
+    1ª frame 0x21, DLC 6/7: tamanho total (4 bytes) + CRC-16 (2 bytes)
+    frames 0x21, DLC 8:     dados, até ao tamanho arredondado a 8 bytes
+Dados: tamanho descomprimido (4 bytes, big-endian) + stream zlib + padding.
+O CRC é CRC-CCITT (0x1021, início 0xFFFF) sobre os dados com padding.
+"""
+import binascii
+import codecs
+import os
+import re
+import struct
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# Nomes pedidos à CS -> ficheiro .cs2 correspondente
+CONFIG_FILES = {
+    "loks": "lokomotive.cs2",
+    "mags": "magnetartikel.cs2",
+    "gbs": "gleisbild.cs2",
+}
+
+# Pasta da cache em disco dos ficheiros de config já descarregados
+CONFIG_CACHE_DIR = Path(os.environ.get("CS3_CONFIG_CACHE", "cs3_cache"))
+
+_STREAM_HEADER = struct.Struct(">IH")
+_UNCOMPRESSED_LEN = struct.Struct(">I")
+
+
+def crc16_ccitt(data: bytes) -> int:
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def request_frames_data(name: str) -> List[bytes]:
+    """Dados (8 bytes cada) das frames 0x20 que pedem o ficheiro `name`."""
+    raw = name.encode("ascii")
+    chunks = [raw[i:i + 8] for i in range(0, len(raw), 8)] or [b""]
+    return [c.ljust(8, b"\0") for c in chunks]
+
+
+# ---------------------------------------------------
+# PARSER .cs2 (incremental)
+# ---------------------------------------------------
+
+class Cs2Parser:
+    """
+    Parser incremental do formato de texto .cs2:
+
+        [lokomotive]          <- secção
+        lokomotive            <- início de um registo
+         .uid=0x4006          <- campo
+         .funktionen          <- sub-registo (lista em registo["funktionen"])
+         ..nr=0               <- campo do sub-registo
+
+    feed() aceita texto em bocados arbitrários (p.ex. à medida que o zlib
+    descomprime); close() devolve a lista de (chave, registo).
+    """
+
+    def __init__(self):
+        self.section: Optional[str] = None
+        self.entries: List[Tuple[str, Dict[str, Any]]] = []
+        self._cur: Optional[Dict[str, Any]] = None
+        self._sub: Optional[Dict[str, Any]] = None
+        self._partial = ""
+
+    def feed(self, text: str):
+        lines = (self._partial + text).split("\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self._line(line)
+
+    def close(self) -> List[Tuple[str, Dict[str, Any]]]:
+        if self._partial:
+            self._line(self._partial)
+            self._partial = ""
+        return self.entries
+
+    def _line(self, line: str):
+        line = line.rstrip("\r")
+        if not line.strip():
+            return
+        if line.startswith("["):
+            self.section = line.strip().strip("[]")
+            return
+        if line.startswith(" .."):
+            if self._sub is not None:
+                key, _, value = line[3:].partition("=")
+                self._sub[key] = value
+            return
+        if line.startswith(" ."):
+            if self._cur is None:
+                self._start("")
+            body = line[2:]
+            if "=" in body:
+                key, _, value = body.partition("=")
+                self._cur[key] = value
+                self._sub = None
+            else:
+                self._sub = {}
+                self._cur.setdefault(body, []).append(self._sub)
+            return
+        self._start(line.strip())
+
+    def _start(self, key: str):
+        self._cur = {}
+        self._sub = None
+        self.entries.append((key, self._cur))
+
+
+def parse_cs2(text: str) -> List[Tuple[str, Dict[str, Any]]]:
+    parser = Cs2Parser()
+    parser.feed(text)
+    return parser.close()
+
+
+def to_int(value: Any, default: int = 0) -> int:
+    """Inteiros .cs2 vêm em decimal ou hex ("0x4006")."""
+    try:
+        return int(str(value), 0)
+    except (TypeError, ValueError):
+        return default
+
+
+# ---------------------------------------------------
+# CACHE EM DISCO
+# ---------------------------------------------------
+
+class ConfigCache:
+    """Ficheiros .cs2 descomprimidos, um por (nome, CRC, tamanho)."""
+
+    def __init__(self, directory: Path = CONFIG_CACHE_DIR):
+        self.directory = Path(directory)
+
+    @staticmethod
+    def _safe(name: str) -> str:
+        return re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+
+    def _path(self, name: str, crc: int, length: int) -> Path:
+        return self.directory / f"{self._safe(name)}-{crc:04x}-{length}.cs2"
+
+    def _versions(self, name: str) -> List[Path]:
+        """Ficheiros em cache deste nome ("gbs" não apanha as páginas "gbs-1")."""
+        pattern = re.compile(re.escape(self._safe(name)) + r"-[0-9a-f]{4}-\d+\.cs2$")
+        if not self.directory.is_dir():
+            return []
+        return [p for p in self.directory.iterdir() if pattern.match(p.name)]
+
+    def load(self, name: str, crc: int, length: int) -> Optional[str]:
+        try:
+            return self._path(name, crc, length).read_text(encoding="utf-8")
+        except OSError:
+            return None
+
+    def latest(self, name: str) -> Optional[str]:
+        """Versão mais recente em cache (para servir antes de haver ligação)."""
+        files = sorted(self._versions(name), key=lambda p: p.stat().st_mtime)
+        return files[-1].read_text(encoding="utf-8") if files else None
+
+    def store(self, name: str, crc: int, length: int, text: str):
+        path = self._path(name, crc, length)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            for old in self._versions(name):   # versões antigas deixam de interessar
+                old.unlink()
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text(text, encoding="utf-8")
+            os.replace(tmp, path)
+        except OSError as e:
+            print("[CS3] Não foi possível gravar cache de config:", e)
+
+
+# ---------------------------------------------------
+# RECEÇÃO DE UM STREAM
+# ---------------------------------------------------
+
+class ConfigStream:
+    """
+    Um pedido de config data em curso. on_frame() é chamado pela thread de
+    receção para cada frame 0x21; os dados são descomprimidos e passados ao
+    parser à medida que chegam. done fica set quando há resultado ou erro.
+
+    Se o CRC/tamanho do cabeçalho já estiverem na cache em disco, o
+    resultado fica disponível logo após a 1ª frame e o resto do stream é
+    só descartado.
+    """
+
+    def __init__(self, name: str, cache: ConfigCache):
+        self.name = name
+        self.cache = cache
+        self.done = threading.Event()
+        self.text: Optional[str] = None
+        self.entries: Optional[List[Tuple[str, Dict[str, Any]]]] = None
+        self.error: Optional[str] = None
+        self.from_cache = False
+        self.length = 0
+        self.crc = 0
+        self.padded = 0
+        self.data = bytearray()
+        self.received = 0
+        self._raw_len = 0
+        self._inflate = zlib.decompressobj()
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._parser = Cs2Parser()
+        self._chunks: List[str] = []
+
+    def on_frame(self, dlc: int, buf, off: int):
+        if self.length == 0:
+            if dlc in (6, 7):
+                self._on_header(*_STREAM_HEADER.unpack_from(buf, off))
+            return
+        if dlc != 8 or self.received >= self.padded:
+            return
+        self.received += 8
+        if self.from_cache:
+            return   # já temos o ficheiro: o resto do stream só é consumido
+        start = len(self.data)
+        self.data += buf[off:off + 8]
+        self._inflate_from(start)
+        if self.received >= self.padded:
+            self._finish()
+
+    def _on_header(self, length: int, crc: int):
+        self.length = length
+        self.crc = crc
+        self.padded = (length + 7) & ~7
+        cached = self.cache.load(self.name, crc, length)
+        if cached is not None:
+            self.from_cache = True
+            self.text = cached
+            self.entries = parse_cs2(cached)
+            self.done.set()
+
+    def _inflate_from(self, start: int):
+        """Descomprime o que chegou (os 4 primeiros bytes são o tamanho descomprimido)."""
+        begin = max(start, 4)
+        end = min(len(self.data), self.length)
+        if end <= begin or self._inflate.eof:
+            return
+        try:
+            raw = self._inflate.decompress(bytes(self.data[begin:end]))
+        except zlib.error as e:
+            self._fail(f"zlib: {e}")
+            return
+        self._raw_len += len(raw)
+        text = self._decoder.decode(raw)
+        if text:
+            self._chunks.append(text)
+            self._parser.feed(text)
+
+    def _finish(self):
+        if self.done.is_set():
+            return
+        crc = crc16_ccitt(bytes(self.data[:self.padded]))
+        if crc != self.crc:
+            self._fail(f"CRC errado em {self.name}: {crc:04x} != {self.crc:04x}")
+            return
+        tail = self._inflate.flush()
+        self._raw_len += len(tail)
+        text = self._decoder.decode(tail, final=True)
+        if text:
+            self._chunks.append(text)
+            self._parser.feed(text)
+        expected = _UNCOMPRESSED_LEN.unpack_from(self.data, 0)[0]
+        if self._raw_len != expected:
+            self._fail(f"{self.name}: descomprimido {self._raw_len} bytes, esperado {expected}")
+            return
+        text = "".join(self._chunks)
+        self.text = text
+        self.entries = self._parser.close()
+        self.cache.store(self.name, self.crc, self.length, text)
+        self.done.set()
+
+    def _fail(self, error: str):
+        self.error = error
+        self.done.set()
+
+
+def build_stream(text: str) -> Tuple[bytes, int, int]:
+    """
+    Dados de um stream 0x21 para `text` (usado pelo simulador/testes):
+    devolve (dados com padding, CRC, tamanho sem padding).
+    """
+    raw = text.encode("utf-8")
+    payload = _UNCOMPRESSED_LEN.pack(len(raw)) + zlib.compress(raw)
+    padded = payload.ljust((len(payload) + 7) & ~7, b"\0")
+    return padded, crc16_ccitt(padded), len(payload)
@@ -0,0 +1,482 @@
+"""
+Simulador local de uma Märklin CS3 (protocolo CAN CS2/CS3 sobre TCP e UDP).
+
+Serve para testar e medir o CS3Client sem a central física:
+  - responde a ping (0x18) e aos comandos de loco, acessório e sistema
+    (guarda o estado e devolve a frame com o bit de resposta, como a CS)
+  - responde a pedidos de config data (0x20) com streams 0x21 gerados a
+    partir das locos / artigos simulados ("loks", "mags", "gbs", "gbs-0")
+  - gera feedback S88 (0x11) sintético a uma taxa configurável, até à taxa
+    do barramento CAN real ou acima (stress do decoder)
+
+Uso (na raiz do projeto):
+    python -m apps.cs3_sim --port 15731 --feedback-rate max
+    CS3_HOST=127.0.0.1 python run.py
+"""
+import argparse
+import random
+import socket
+import struct
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from apps import cs3_can
+from apps.cs3_can import CanFrameReader
+from apps.cs3_config import build_stream
+
+# Portas do protocolo: TCP e UDP de entrada na CS, UDP de saída para os clientes
+SIM_PORT = 15731
+SIM_UDP_REPLY_PORT = 15730
+
+# UID da central simulada e identificação no ping (0xFFFF = CS2/CS3 GUI master)
+SIM_UID = 0x63735300
+SIM_SW_VERSION = 0x0400
+SIM_DEVICE_ID = 0xFFFF
+
+# Taxa aproximada do barramento CAN da CS (250 kbit/s, frames de 8 bytes com stuffing)
+BUS_RATE_FPS = 2000
+
+# Período do gerador de feedback: as frames devidas em cada tick saem num só envio
+FEEDBACK_TICK_S = 0.002
+
+_UID = struct.Struct(">I")
+_UID_U8 = struct.Struct(">IB")
+_UID_U16 = struct.Struct(">IH")
+_UID_U8_U8 = struct.Struct(">IBB")
+_PING = struct.Struct(">IHH")
+_S88_EVENT = struct.Struct(">HHBBH")
+_STREAM_HEADER = struct.Struct(">IH")
+
+
+class CS3Simulator:
+    """
+    Central simulada. start() abre o servidor TCP e o socket UDP e arranca as
+    threads; stop() fecha tudo.
+
+    As respostas a comandos vão para todos os clientes (TCP ligados e
+    endereços UDP já vistos, na porta udp_reply_port), como a CS faz; os
+    streams de config vão só para quem os pediu.
+    """
+
+    def __init__(self,
+                 host: str = "127.0.0.1",
+                 port: int = SIM_PORT,
+                 udp_reply_port: int = SIM_UDP_REPLY_PORT,
+                 locos: int = 16,
+                 turnouts: int = 32,
+                 contacts: int = 64,
+                 feedback_rate: float = 0.0,
+                 seed: int = 1):
+        self.host = host
+        self.port = port
+        self.udp_reply_port = udp_reply_port
+        self.contacts = contacts
+        self.feedback_rate = feedback_rate
+        self.hash = cs3_can.can_hash(SIM_UID)
+        self.rng = random.Random(seed)
+
+        self.track = "stop"
+        self.locos: Dict[int, Dict[str, Any]] = {}
+        for i in range(1, locos + 1):
+            uid = cs3_can.loco_uid(i, "mfx")
+            self.locos[uid] = {"name": f"SIM {i:03d}", "address": i, "protocol": "mfx",
+                               "speed": 0, "direction": cs3_can.DIR_FORWARD, "functions": {}}
+        self.accessories: Dict[int, Dict[str, Any]] = {}
+        for address in range(1, turnouts + 1):
+            uid = cs3_can.accessory_uid(address, "mm2")
+            self.accessories[uid] = {"name": f"W{address}", "address": address,
+                                     "position": cs3_can.ACC_STRAIGHT, "power": 0}
+        # bobines de acessórios ligadas agora / no máximo ao mesmo tempo
+        self.coils_on = 0
+        self.max_coils_on = 0
+        self.coil_lock = threading.Lock()
+        # estado (0/1) e instante da última mudança de cada contacto S88
+        self.feedback: Dict[Tuple[int, int], List[float]] = {}
+
+        self.tcp: Optional[socket.socket] = None
+        self.udp: Optional[socket.socket] = None
+        self.clients: List[socket.socket] = []
+        self.udp_peers: Set[str] = set()
+        self.send_lock = threading.Lock()
+        self.running = False
+        self.threads: List[threading.Thread] = []
+
+        # reader dos datagramas UDP: o remetente do datagrama em curso fica em _udp_src
+        self._udp_src: Optional[str] = None
+        self._udp_reader = self._make_reader(self._reply_udp)
+
+        self.frames_rx = 0
+        self.frames_tx = 0
+        self.feedback_tx = 0
+        self.config_streams = 0
+
+    # -----------------------
+    # SERVIDOR
+    # -----------------------
+
+    def start(self) -> "CS3Simulator":
+        tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        tcp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        tcp.bind((self.host, self.port))
+        tcp.listen()
+        self.port = tcp.getsockname()[1]    # port=0 -> porta livre escolhida pelo SO
+        udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        udp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        udp.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024 * 1024)
+        udp.bind((self.host, self.port))
+        self.tcp, self.udp = tcp, udp
+        self.running = True
+
+        loops = [self._accept_loop, self._udp_loop]
+        if self.feedback_rate > 0:
+            loops.append(self._feedback_loop)
+        for target in loops:
+            t = threading.Thread(target=target, daemon=True)
+            t.start()
+            self.threads.append(t)
+        print(f"[CS3-SIM] A escutar em {self.host}:{self.port} (tcp/udp), "
+              f"{len(self.locos)} locos, {len(self.accessories)} artigos, "
+              f"feedback {self.feedback_rate:g} frames/s")
+        return self
+
+    def stop(self):
+        self.running = False
+        with self.send_lock:
+            for s in [self.tcp, self.udp] + self.clients:
+                if s:
+                    try:
+                        s.close()
+                    except OSError:
+                        pass
+            self.clients = []
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                conn, _ = self.tcp.accept()
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self.send_lock:
+                self.clients.append(conn)
+            threading.Thread(target=self._tcp_conn, args=(conn,), daemon=True).start()
+
+    def _tcp_conn(self, conn: socket.socket):
+        reader = self._make_reader(lambda frames: self._send_tcp(conn, frames))
+        try:
+            while self.running and reader.recv_from(conn):
+                pass
+        except OSError:
+            pass
+        finally:
+            with self.send_lock:
+                if conn in self.clients:
+                    self.clients.remove(conn)
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    def _udp_loop(self):
+        buf = bytearray(2048)
+        while self.running:
+            try:
+                n, (ip, _port) = self.udp.recvfrom_into(buf)
+            except OSError:
+                return
+            self.udp_peers.add(ip)
+            self._udp_src = ip
+            # um datagrama traz frames inteiras; restos não passam para o seguinte
+            self._udp_reader.feed(memoryview(buf)[:n - n % cs3_can.FRAME_SIZE])
+
+    # -----------------------
+    # ENVIO
+    # -----------------------
+
+    def _send_tcp(self, conn: socket.socket, frames: bytes):
+        with self.send_lock:
+            try:
+                conn.sendall(frames)
+                self.frames_tx += len(frames) // cs3_can.FRAME_SIZE
+            except OSError:
+                pass
+
+    def _reply_udp(self, frames: bytes):
+        if self._udp_src is None:
+            return
+        with self.send_lock:
+            self._sendto_udp(frames, self._udp_src)
+
+    def _sendto_udp(self, frames: bytes, ip: str):
+        """Uma frame por datagrama (com o send_lock)."""
+        view = memoryview(frames)
+        for off in range(0, len(view), cs3_can.FRAME_SIZE):
+            try:
+                self.udp.sendto(view[off:off + cs3_can.FRAME_SIZE], (ip, self.udp_reply_port))
+                self.frames_tx += 1
+            except OSError:
+                return
+
+    def broadcast(self, frames: bytes):
+        """Envia frames a todos os clientes TCP e UDP."""
+        n = len(frames) // cs3_can.FRAME_SIZE
+        with self.send_lock:
+            for conn in list(self.clients):
+                try:
+                    conn.sendall(frames)
+                    self.frames_tx += n
+                except OSError:
+                    self.clients.remove(conn)
+            for ip in list(self.udp_peers):
+                self._sendto_udp(frames, ip)
+
+    def _response(self, cmd: int, data: bytes) -> bytes:
+        return cs3_can.encode_frame(cmd, data, response=True, hash_=self.hash)
+
+    # -----------------------
+    # COMANDOS RECEBIDOS
+    # -----------------------
+
+    def _make_reader(self, reply) -> CanFrameReader:
+        """Reader com os handlers da central; reply(frames) responde só ao remetente."""
+        reader = CanFrameReader()
+        reader.on(cs3_can.CMD_SYSTEM, self._on_system)
+        reader.on(cs3_can.CMD_LOCO_SPEED, self._on_loco_speed)
+        reader.on(cs3_can.CMD_LOCO_DIRECTION, self._on_loco_direction)
+        reader.on(cs3_can.CMD_LOCO_FUNCTION, self._on_loco_function)
+        reader.on(cs3_can.CMD_ACCESSORY, self._on_accessory)
+        reader.on(cs3_can.CMD_PING, lambda *a: self._on_ping(reply, *a))
+        reader.on(cs3_can.CMD_CONFIG_DATA, lambda *a: self._on_config_data(reply, *a))
+        return reader
+
+    def _loco(self, uid: int) -> Dict[str, Any]:
+        loco = self.locos.get(uid)
+        if loco is None:   # loco desconhecida: a CS aceita comandos para qualquer locID
+            loco = self.locos[uid] = {"name": f"UID {uid:#06x}", "address": uid & 0x3FFF,
+                                      "protocol": "mfx", "speed": 0,
+                                      "direction": cs3_can.DIR_FORWARD, "functions": {}}
+        return loco
+
+    def _on_system(self, cmd, resp, hash_, dlc, buf, off):
+        self.frames_rx += 1
+        if resp or dlc < 5:
+            return
+        uid, sub = _UID_U8.unpack_from(buf, off)
+        if sub == cs3_can.SYS_LOCO_EMERGENCY_STOP and uid:
+            self._loco(uid)["speed"] = 0
+        elif uid == 0 and sub in (cs3_can.SYS_STOP, cs3_can.SYS_GO, cs3_can.SYS_HALT):
+            self.track = {cs3_can.SYS_STOP: "stop", cs3_can.SYS_GO: "go",
+                          cs3_can.SYS_HALT: "halt"}[sub]
+        self.broadcast(self._response(cmd, bytes(buf[off:off + dlc])))
+
+    def _on_loco_speed(self, cmd, resp, hash_, dlc, buf, off):
+        self.frames_rx += 1
+        if resp or dlc < 4:
+            return
+        uid = _UID.unpack_from(buf, off)[0]
+        loco = self._loco(uid)
+        if dlc >= 6:
+            loco["speed"] = min(cs3_can.SPEED_MAX, _UID_U16.unpack_from(buf, off)[1])
+        self.broadcast(self._response(cmd, _UID_U16.pack(uid, loco["speed"])))
+
+    def _on_loco_direction(self, cmd, resp, hash_, dlc, buf, off):
+        self.frames_rx += 1
+        if resp or dlc < 4:
+            return
+        uid = _UID.unpack_from(buf, off)[0]
+        loco = self._loco(uid)
+        if dlc >= 5:
+            direction = _UID_U8.unpack_from(buf, off)[1]
+            if direction == cs3_can.DIR_TOGGLE:
+                direction = (cs3_can.DIR_REVERSE if loco["direction"] == cs3_can.DIR_FORWARD
+                             else cs3_can.DIR_FORWARD)
+            if direction in (cs3_can.DIR_FORWARD, cs3_can.DIR_REVERSE):
+                loco["direction"] = direction
+                loco["speed"] = 0   # como na CS: mudar o sentido pára a loco
+        self.broadcast(self._response(cmd, _UID_U8.pack(uid, loco["direction"])))
+
+    def _on_loco_function(self, cmd, resp, hash_, dlc, buf, off):
+        self.frames_rx += 1
+        if resp or dlc < 5:
+            return
+        uid, fn_no = _UID_U8.unpack_from(buf, off)
+        loco = self._loco(uid)
+        if dlc >= 6:
+            loco["functions"][fn_no] = buf[off + 5]
+        value = loco["functions"].get(fn_no, 0)
+        self.broadcast(self._response(cmd, _UID_U8_U8.pack(uid, fn_no, value)))
+
+    def _on_accessory(self, cmd, resp, hash_, dlc, buf, off):
+        self.frames_rx += 1
+        if resp or dlc < 6:
+            return
+        uid, position, power = _UID_U8_U8.unpack_from(buf, off)
+        acc = self.accessories.get(uid)
+        if acc is None:
+            acc = self.accessories[uid] = {"name": f"UID {uid:#06x}",
+                                           "address": (uid & 0x7FF) + 1,
+                                           "position": position, "power": 0}
+        with self.coil_lock:
+            acc["position"] = position
+            if power and not acc["power"]:
+                self.coils_on += 1
+                self.max_coils_on = max(self.max_coils_on, self.coils_on)
+            elif not power and acc["power"]:
+                self.coils_on -= 1
+            acc["power"] = power
+        self.broadcast(self._response(cmd, bytes(buf[off:off + dlc])))
+        if power and dlc >= 8:
+            # com tempo de comutação a CS corta a bobine e reporta power=0
+            time_10ms = struct.unpack_from(">H", buf, off + 6)[0]
+            timer = threading.Timer(time_10ms / 100.0, self._accessory_off, args=(uid, position))
+            timer.daemon = True
+            timer.start()
+
+    def _accessory_off(self, uid: int, position: int):
+        acc = self.accessories[uid]
+        with self.coil_lock:
+            if acc["power"]:
+                acc["power"] = 0
+                self.coils_on -= 1
+        self.broadcast(self._response(cs3_can.CMD_ACCESSORY, _UID_U8_U8.pack(uid, position, 0)))
+
+    def _on_ping(self, reply, cmd, resp, hash_, dlc, buf, off):
+        self.frames_rx += 1
+        if not resp:
+            reply(self._response(cmd, _PING.pack(SIM_UID, SIM_SW_VERSION, SIM_DEVICE_ID)))
+
+    def _on_config_data(self, reply, cmd, resp, hash_, dlc, buf, off):
+        self.frames_rx += 1
+        if resp:
+            return
+        name = bytes(buf[off:off + dlc]).rstrip(b"\0").decode("ascii", "replace")
+        text = self.config_file(name)
+        if text is None:
+            print("[CS3-SIM] Pedido de config desconhecido:", name)
+            return
+        padded, crc, length = build_stream(text)
+        out = bytearray(cs3_can.FRAME_SIZE * (1 + len(padded) // 8))
+        cs3_can.encode_frame(cs3_can.CMD_CONFIG_STREAM, _STREAM_HEADER.pack(length, crc),
+                             hash_=self.hash, out=out)
+        for i in range(0, len(padded), 8):
+            cs3_can.encode_frame(cs3_can.CMD_CONFIG_STREAM, padded[i:i + 8], hash_=self.hash,
+                                 out=out, offset=cs3_can.FRAME_SIZE * (1 + i // 8))
+        self.config_streams += 1
+        reply(bytes(out))
+
+    # -----------------------
+    # FICHEIROS DE CONFIG (.cs2)
+    # -----------------------
+
+    def config_file(self, name: str) -> Optional[str]:
+        """Texto .cs2 pedido por `name` ("loks", "mags", "gbs", "gbs-0")."""
+        if name == "loks":
+            lines = ["[lokomotive]", "version", " .minor=3"]
+            for uid, loco in sorted(self.locos.items()):
+                lines += ["lokomotive", f" .name={loco['name']}", f" .uid=0x{uid:x}",
+                          f" .adresse=0x{loco['address']:x}", f" .typ={loco['protocol']}"]
+                for fn_no in range(16):
+                    lines += [" .funktionen", f" ..nr={fn_no}", f" ..typ={fn_no + 1}"]
+        elif name == "mags":
+            lines = ["[magnetartikel]", "version", " .minor=1"]
+            for uid, acc in sorted(self.accessories.items()):
+                lines += ["artikel", f" .id={acc['address']}", f" .name={acc['name']}",
+                          " .typ=linksweiche", f" .stellung={acc['position']}",
+                          " .schaltzeit=200", " .dectyp=mm2"]
+        elif name == "gbs":
+            lines = ["[gleisbild]", "version", " .major=1", "seite", " .name=Simulador"]
+        elif name == "gbs-0":
+            lines = ["[gleisbildseite]", "version", " .major=1", "page=0"]
+            for i, acc in enumerate(sorted(self.accessories.values(), key=lambda a: a["address"])):
+                lines += ["element", f" .id=0x{(2 << 8) | (2 * i):x}", " .typ=linksweiche",
+                          f" .artikel={acc['address']}"]
+        else:
+            return None
+        return "\n".join(lines) + "\n"
+
+    # -----------------------
+    # FEEDBACK S88 SINTÉTICO
+    # -----------------------
+
+    def _feedback_loop(self):
+        """
+        Muda contactos S88 aleatórios a feedback_rate frames/s. Em cada tick
+        envia de uma vez todas as frames devidas desde o início (sem deriva).
+        """
+        out = bytearray()
+        t0 = time.perf_counter()
+        sent = 0
+        while self.running:
+            now = time.perf_counter()
+            due = int((now - t0) * self.feedback_rate) - sent
+            if due > 0:
+                need = due * cs3_can.FRAME_SIZE
+                if len(out) < need:
+                    out = bytearray(need)
+                for i in range(due):
+                    cs3_can.encode_frame(cs3_can.CMD_S88_EVENT, self._s88_event(now),
+                                         response=True, hash_=self.hash,
+                                         out=out, offset=i * cs3_can.FRAME_SIZE)
+                self.broadcast(bytes(out[:need]))
+                sent += due
+                self.feedback_tx += due
+            time.sleep(FEEDBACK_TICK_S)
+
+    def _s88_event(self, now: float) -> bytes:
+        """Dados de um evento S88: um contacto ao acaso muda de estado."""
+        contact_no = self.rng.randrange(self.contacts)
+        key = (1 + contact_no // 16, 1 + contact_no % 16)   # módulos S88 de 16 contactos
+        state = self.feedback.get(key)
+        if state is None:
+            state = self.feedback[key] = [0, now]
+        old = state[0]
+        elapsed_10ms = min(0xFFFF, int((now - state[1]) * 100))
+        state[0], state[1] = 1 - old, now
+        return _S88_EVENT.pack(key[0], key[1], old, state[0], elapsed_10ms)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "port": self.port,
+            "tcp_clients": len(self.clients),
+            "udp_peers": sorted(self.udp_peers),
+            "track": self.track,
+            "frames_rx": self.frames_rx,
+            "frames_tx": self.frames_tx,
+            "feedback_tx": self.feedback_tx,
+            "config_streams": self.config_streams,
+            "coils_on": self.coils_on,
+            "max_coils_on": self.max_coils_on,
+        }
+
+
+def parse_rate(value: str) -> float:
+    """--feedback-rate: nº de frames/s ou "max" (taxa do barramento CAN)."""
+    return float(BUS_RATE_FPS) if value == "max" else float(value)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Simulador local da Märklin CS3")
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=SIM_PORT)
+    ap.add_argument("--udp-reply-port", type=int, default=SIM_UDP_REPLY_PORT)
+    ap.add_argument("--locos", type=int, default=16)
+    ap.add_argument("--turnouts", type=int, default=32)
+    ap.add_argument("--contacts", type=int, default=64)
+    ap.add_argument("--feedback-rate", type=parse_rate, default=0.0,
+                    help='frames S88/s ("max" = ~%d, taxa do barramento)' % BUS_RATE_FPS)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    sim = CS3Simulator(args.host, args.port, args.udp_reply_port, args.locos,
+                       args.turnouts, args.contacts, args.feedback_rate, args.seed).start()
+    try:
+        while True:
+            time.sleep(5)
+            print("[CS3-SIM]", sim.get_stats())
+    except KeyboardInterrupt:
+        sim.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import itertools
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+
+# Secções do estado da CS3
+SECTIONS = ("locos", "turnouts", "feedback", "system")
+
+
+class CS3StateStore:
+    """
+    Estado vivo da CS3 alimentado pelas frames recebidas.
+
+    Cada objeto é um dicionário imutável depois de publicado:
+      { "kind", "id", ..., "seq": n, "ts": epoch }
+    Uma atualização cria um registo novo (cópia + alterações) com o próximo
+    número de sequência e substitui-o no índice com uma única atribuição.
+
+    Os escritores (threads de receção) serializam-se entre si com um lock
+    curto; os leitores não usam lock nenhum. A receção nunca espera por
+    leitores, e um leitor obtém um corte consistente com
+    list(self._objects.values()) (uma só operação em C, atómica com o GIL):
+    nunca vê meio registo nem um registo mais antigo que outro já incluído.
+    """
+
+    def __init__(self):
+        self._objects: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._write_lock = threading.RLock()
+        self._seq = itertools.count(1)
+        self.seq = 0          # último número de sequência publicado
+        self.updates = 0
+
+    def update(self, kind: str, obj_id: str, **attrs) -> Optional[Dict[str, Any]]:
+        """Aplica atributos a um objeto; só publica (e gasta seq) se algo mudou."""
+        key = (kind, obj_id)
+        with self._write_lock:
+            old = self._objects.get(key)
+            if old is not None and all(old.get(k) == v for k, v in attrs.items()):
+                return old
+            rec = dict(old) if old is not None else {"kind": kind, "id": obj_id}
+            rec.update(attrs)
+            rec["seq"] = seq = next(self._seq)
+            rec["ts"] = time.time()
+            self._objects[key] = rec
+            self.seq = seq
+            self.updates += 1
+            return rec
+
+    def update_nested(self, kind: str, obj_id: str, field: str, key: Any, value: Any):
+        """Atualiza uma entrada de um sub-dicionário (p.ex. funções de uma loco)."""
+        with self._write_lock:
+            old = self._objects.get((kind, obj_id))
+            current = dict(old.get(field) or {}) if old is not None else {}
+            if old is not None and key in current and current[key] == value:
+                return old
+            current[key] = value
+            return self.update(kind, obj_id, **{field: current})
+
+    def get(self, kind: str, obj_id: str) -> Optional[Dict[str, Any]]:
+        return self._objects.get((kind, obj_id))
+
+    def section(self, kind: str) -> Dict[str, Dict[str, Any]]:
+        """Objetos de uma secção {id: registo} (cópia, não bloqueia a receção)."""
+        return {r["id"]: r for r in list(self._objects.values()) if r["kind"] == kind}
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Corte consistente de todo o estado, agrupado por secção."""
+        records = list(self._objects.values())
+        out: Dict[str, Any] = {k: {} for k in SECTIONS}
+        seq = 0
+        for r in records:
+            out.setdefault(r["kind"], {})[r["id"]] = r
+            seq = max(seq, r["seq"])
+        out["seq"] = seq
+        return out
+
+    def changes_since(self, since: int) -> Dict[str, Any]:
+        """
+        Objetos alterados depois da sequência `since` (polling barato).
+        "seq" é a sequência a usar no próximo pedido; "reset"=True quando
+        `since` é de outra sessão (p.ex. servidor reiniciado) e vai tudo.
+        """
+        current = self.seq
+        records = list(self._objects.values())
+        reset = since > current
+        if reset:
+            since = 0
+        changed = sorted((r for r in records if r["seq"] > since), key=lambda r: r["seq"])
+        seq = max(current, changed[-1]["seq"] if changed else 0)
+        return {"since": since, "seq": seq, "reset": reset, "changed": changed}
+
+    def counts(self) -> Dict[str, int]:
+        out = {k: 0 for k in SECTIONS}
+        for kind, _ in list(self._objects):
+            out[kind] = out.get(kind, 0) + 1
+        return out
@@ -0,0 +1,219 @@
+"""
+Comutação de agulhas em lote na CS3 (p.ex. ao estabelecer uma rota).
+
+Ligar todas as bobines ao mesmo tempo deita abaixo a fonte dos decoders de
+acessórios; uma agulha por pedido HTTP é lenta. Aqui cada distrito de
+booster tem a sua fila: no máximo max_parallel bobines ligadas ao mesmo
+tempo, um impulso de pulse_ms (cortado pela própria CS) e spacing_ms de
+folga antes de a fonte servir a agulha seguinte. Distritos diferentes têm
+fontes diferentes e comutam em paralelo.
+
+Uma agulha está "done" quando a CS reporta o fim do impulso (frame de
+acessório com power=0); sem esse relatório ao fim de pulse_ms +
+DONE_MARGIN_MS fica "assumed" (a CS corta o impulso na mesma).
+Tudo corre como corrotinas no loop partilhado (apps.layout_io).
+"""
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from apps import cs3_can
+
+# Folga entre o fim de um impulso e o início do seguinte no mesmo distrito
+SPACING_MS = int(os.environ.get("CS3_TURNOUT_SPACING_MS", "50"))
+
+# Bobines ligadas ao mesmo tempo em cada distrito (capacidade da fonte)
+MAX_PARALLEL = int(os.environ.get("CS3_TURNOUT_PARALLEL", "1"))
+
+# Espera pelo relatório de fim de impulso além da duração do impulso
+DONE_MARGIN_MS = 150
+
+# Máximo de agulhas num lote
+BATCH_MAX_TURNOUTS = 256
+
+DEFAULT_DISTRICT = "default"
+
+
+def parse_districts(spec: str) -> List[Tuple[int, int, str]]:
+    """
+    Distritos de booster por intervalos de endereço de acessório:
+    "1-16=norte,17-32=sul,40=patio" -> [(1, 16, "norte"), (17, 32, "sul"), (40, 40, "patio")]
+    """
+    out = []
+    for part in spec.split(","):
+        if "=" not in part:
+            continue
+        rng, name = part.split("=", 1)
+        lo, _, hi = rng.strip().partition("-")
+        try:
+            out.append((int(lo), int(hi or lo), name.strip()))
+        except ValueError:
+            print("[CS3] Distrito de agulhas inválido:", part)
+    return out
+
+
+# Distritos configurados (endereços fora de todos os intervalos -> DEFAULT_DISTRICT)
+DISTRICTS = parse_districts(os.environ.get("CS3_TURNOUT_DISTRICTS", ""))
+
+
+def district_of(address: int, districts: List[Tuple[int, int, str]] = DISTRICTS) -> str:
+    for lo, hi, name in districts:
+        if lo <= address <= hi:
+            return name
+    return DEFAULT_DISTRICT
+
+
+class TurnoutBatch:
+    """
+    Um lote de agulhas já validado: items = [{"id", "uid", "position", "district"}].
+    run() corre no loop e devolve o resultado com tempos por agulha.
+    """
+
+    def __init__(self, client, items: List[Dict[str, Any]], pulse_ms: int,
+                 spacing_ms: int = SPACING_MS, max_parallel: int = MAX_PARALLEL):
+        self.client = client
+        self.items = items
+        self.pulse_ms = pulse_ms
+        self.spacing_ms = spacing_ms
+        self.max_parallel = max(1, max_parallel)
+        self._waiting: Dict[int, Dict[str, Any]] = {}   # uid -> item em curso
+        self._t0 = 0.0
+
+    def worst_case_s(self) -> float:
+        """Duração máxima do lote (para o timeout de quem espera)."""
+        per_district: Dict[str, int] = {}
+        for it in self.items:
+            per_district[it["district"]] = per_district.get(it["district"], 0) + 1
+        n = max(per_district.values(), default=0)
+        rounds = -(-n // self.max_parallel)
+        return rounds * (self.pulse_ms + DONE_MARGIN_MS + self.spacing_ms) / 1000.0
+
+    # Listener de frames de acessório do CS3Client (corre no loop)
+    def on_accessory(self, uid: int, position: int, power: int):
+        it = self._waiting.get(uid)
+        if it is None or position != it["can_position"]:
+            return
+        now = self._ms()
+        if power:
+            it.setdefault("ack_ms", now)
+        else:
+            it["done"].set()
+
+    def _ms(self) -> float:
+        return round((time.perf_counter() - self._t0) * 1000.0, 1)
+
+    async def _switch_one(self, it: Dict[str, Any]):
+        it["done"] = asyncio.Event()
+        self._waiting[it["uid"]] = it
+        it["start_ms"] = self._ms()
+        try:
+            self.client.send_raw(cs3_can.accessory(it["uid"], it["can_position"], 1,
+                                                   max(1, self.pulse_ms // 10)))
+            await asyncio.wait_for(it["done"].wait(), (self.pulse_ms + DONE_MARGIN_MS) / 1000.0)
+            it["status"] = "done"
+        except asyncio.TimeoutError:
+            it["status"] = "assumed"
+        except Exception as e:
+            it["status"] = "error"
+            it["error"] = str(e)
+        finally:
+            self._waiting.pop(it["uid"], None)
+            it["done_ms"] = self._ms()
+
+    async def _run_district(self, items: List[Dict[str, Any]]) -> float:
+        slots = asyncio.Semaphore(self.max_parallel)
+        tasks = []
+
+        async def one(it, last):
+            try:
+                await self._switch_one(it)
+                if not last:   # depois da última agulha não há nada à espera da fonte
+                    await asyncio.sleep(self.spacing_ms / 1000.0)
+            finally:
+                slots.release()
+
+        for i, it in enumerate(items):
+            await slots.acquire()
+            tasks.append(asyncio.ensure_future(one(it, i >= len(items) - self.max_parallel)))
+        await asyncio.gather(*tasks)
+        return max((it["done_ms"] for it in items), default=0.0)
+
+    async def run(self) -> Dict[str, Any]:
+        self._t0 = time.perf_counter()
+        districts: Dict[str, List[Dict[str, Any]]] = {}
+        for it in self.items:
+            districts.setdefault(it["district"], []).append(it)
+
+        self.client.accessory_listeners.append(self.on_accessory)
+        try:
+            ends = await asyncio.gather(*(self._run_district(v) for v in districts.values()))
+        finally:
+            self.client.accessory_listeners.remove(self.on_accessory)
+
+        results = []
+        for it in self.items:
+            r = {k: it.get(k) for k in ("id", "uid", "position", "district", "status",
+                                         "start_ms", "ack_ms", "done_ms")}
+            if "error" in it:
+                r["error"] = it["error"]
+            results.append(r)
+        counts = {s: sum(1 for r in results if r["status"] == s) for s in ("done", "assumed", "error")}
+        return {
+            "status": "ok" if not counts["error"] else "error",
+            "total_ms": self._ms(),
+            "pulse_ms": self.pulse_ms,
+            "spacing_ms": self.spacing_ms,
+            "max_parallel": self.max_parallel,
+            "districts": {name: end for name, end in zip(districts, ends)},
+            "counts": counts,
+            "results": results,
+        }
+
+
+def build_turnout_batch(client, items: List[Any], pulse_ms: int,
+                        spacing_ms: Optional[int] = None,
+                        max_parallel: Optional[int] = None) -> TurnoutBatch:
+    """
+    Valida o lote inteiro antes de comutar o que quer que seja (tudo ou nada).
+    items: [{"id": "12" | "0x300b" | nome, "position": "straight"|"turnout",
+             "district": opcional}] ou pares [id, position].
+    Lança ValueError com a lista de erros por índice.
+    """
+    if not isinstance(items, list) or not items:
+        raise ValueError("items tem de ser uma lista não vazia")
+    if len(items) > BATCH_MAX_TURNOUTS:
+        raise ValueError(f"máximo de {BATCH_MAX_TURNOUTS} agulhas por lote")
+
+    by_uid: Dict[int, Dict[str, Any]] = {}
+    errors = []
+    for idx, item in enumerate(items):
+        try:
+            if isinstance(item, (list, tuple)) and len(item) == 2:
+                item = {"id": item[0], "position": item[1]}
+            if not isinstance(item, dict) or not item.get("id"):
+                raise ValueError("missing id")
+            position = item.get("position", "straight")
+            if position not in ("straight", "turnout"):
+                raise ValueError(f"position inválida: {position}")
+            uid = client.turnout_uid(item["id"])
+            address = (uid & 0x7FF) + 1
+            # a mesma agulha duas vezes: fica a última posição pedida
+            by_uid.pop(uid, None)
+            by_uid[uid] = {
+                "id": str(item["id"]),
+                "uid": uid,
+                "position": position,
+                "can_position": cs3_can.ACC_STRAIGHT if position == "straight" else cs3_can.ACC_TURNOUT,
+                "district": str(item.get("district") or district_of(address)),
+            }
+        except (ValueError, TypeError) as e:
+            errors.append({"index": idx, "error": str(e)})
+    if errors:
+        raise ValueError(errors)
+
+    return TurnoutBatch(
+        client, list(by_uid.values()), pulse_ms,
+        SPACING_MS if spacing_ms is None else max(0, int(spacing_ms)),
+        MAX_PARALLEL if max_parallel is None else int(max_parallel),
+    )
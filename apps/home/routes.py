@@ -1,10 +1,19 @@
 from flask import render_template, Response, jsonify, request, redirect, url_for
 from apps.home import blueprint
 from apps.yolo_core import yolo_camera
-from apps.rocrail_core import rocrail, LOCO_DEFAULT
-from apps.rocrail_plan import parse_plan
-from apps.cs3_client import get_cs3
-from apps.rc_car_core import rc_car
+from apps.rocrail_core import rocrail, LOCO_DEFAULT, build_batch, BATCH_MAX_ITEMS
+from apps.rocrail_plan import parse_plan, get_plan_cache_stats
+from apps.rocrail_plan_index import get_plan_index, KINDS, SPATIAL_KINDS
+from apps.rocrail_plan_watch import get_plan_watcher
+from apps.rocrail_plan_http import plan_responses, variant_key
+from apps.rocrail_graph import get_block_graph
+from apps.rocrail_dispatcher import get_dispatcher, simulate
+from apps.rocrail_safety import get_predictor
+from apps.cs3_client import cs3, get_cs3
+from apps.layout_io import layout_io
+from apps.rc_car_core import rc_car, set_serial_backend
+from apps.rc_ws import rc_ws
+from apps.rc_autopilot import autopilot
 import json
 from pathlib import Path
 
@@ -60,10 +69,9 @@ def api_switch_positions():
 def api_rocrail_switches():
     """
     Devolve a lista de agulhas (switches) do plan.xml.
+    Aceita ?fields=id,x,y (ver _plan_json_response).
     """
-    plan = parse_plan()
-    switches = plan.get("switches", [])
-    return jsonify(switches)
+    return _plan_json_response("switches")
 
 
 
@@ -108,10 +116,217 @@ def layout_map():
 @blueprint.route("/api/rocrail/plan")
 def api_rocrail_plan():
     """
-    Devolve o resumo do plan.xml (sem cache, lê sempre).
+    Devolve o resumo do plan.xml (em cache até o ficheiro mudar).
+    Query opcional: ?types=switches,tracks&fields=id,x,y
     """
-    plan = parse_plan()
-    return jsonify(plan)
+    return _plan_json_response()
+
+
+def _plan_json_response(kind=None):
+    """
+    Resposta JSON do plano já serializada e comprimida (plan_responses).
+    ETag forte por versão do plano + variante; If-None-Match -> 304 sem
+    enviar o corpo. gzip só se o cliente o aceitar (ETag própria "-gz").
+    """
+    key = variant_key(kind, request.args.get("fields"), request.args.get("types"))
+    # respeita q-values: "gzip;q=0" e "*, gzip;q=0" recusam gzip
+    use_gzip = request.accept_encodings["gzip"] > 0
+
+    # a ETag vem do próprio corpo em cache: é sempre a da versão servida
+    body = plan_responses.get(key)
+    etag = body.etag[:-1] + '-gz"' if use_gzip else body.etag
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if request.if_none_match.contains_raw(etag):
+        plan_responses.count_not_modified()
+        return Response(status=304, headers=headers)
+
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+    return Response(body.gz if use_gzip else body.raw, mimetype="application/json", headers=headers)
+
+
+@blueprint.route("/api/rocrail/plan/cache")
+def api_rocrail_plan_cache():
+    """
+    Estatísticas da cache do plan.xml (hits, misses, tempos de parse).
+    """
+    stats = get_plan_cache_stats()
+    stats["responses"] = plan_responses.get_stats()
+    return jsonify(stats)
+
+
+@blueprint.route("/api/rocrail/plan/diffs")
+def api_rocrail_plan_diffs():
+    """
+    Diffs do plan.xml desde uma versão (adicionados / removidos / alterados).
+    Query: ?since=<versão> (sem since: só a versão atual).
+    Responde logo, sem esperar por alterações: as páginas fazem polling
+    (static/assets/js/plan-live.js) e, com a versão na ETag, enquanto o plano
+    não muda cada pedido é um 304 sem corpo.
+      { "version": n, "diffs": [ { "version": n, "added": {...}, "removed": {...}, "changed": {...} } ] }
+      { "version": n, "reset": true }  (cliente demasiado atrasado: recarregar tudo)
+    """
+    watcher = get_plan_watcher()
+    since = request.args.get("since", type=int)
+    if since is None:
+        current, diffs = watcher.version, []
+    else:
+        current, diffs = watcher.diffs_since(since, 0)
+
+    etag = f'"plan-v{current}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.if_none_match.contains_raw(etag):
+        return Response(status=304, headers=headers)
+    body = {"version": current, "reset": True} if diffs is None else {"version": current, "diffs": diffs}
+    return Response(json.dumps(body), mimetype="application/json", headers=headers)
+
+
+@blueprint.route("/api/rocrail/plan/watch")
+def api_rocrail_plan_watch():
+    """Estado do watcher do plan.xml (modo inotify/polling, versão, nº de reloads)."""
+    return jsonify(get_plan_watcher().get_status())
+
+@blueprint.route("/api/rocrail/object/<kind>/<obj_id>")
+def api_rocrail_object(kind, obj_id):
+    """
+    Devolve um objeto do plano pelo id (lookup O(1) no índice).
+    kind: blocks | locos | switches | sensors | tracks
+    """
+    if kind not in KINDS:
+        return jsonify({"status": "error", "error": f"tipo desconhecido: {kind}"}), 400
+    index = get_plan_index()
+    obj = index.get(kind, obj_id)
+    if obj is None:
+        return jsonify({"status": "error", "error": "not found"}), 404
+    return jsonify(index.data(obj))
+
+
+@blueprint.route("/api/rocrail/viewport")
+def api_rocrail_viewport():
+    """
+    Objetos do plano dentro de um retângulo (grelha espacial).
+    Query: ?x0=0&y0=0&x1=40&y1=30&z=0&types=tracks,switches
+    Devolve { "tracks": [...], "switches": [...], ... }.
+    """
+    try:
+        x0 = float(request.args.get("x0", 0))
+        y0 = float(request.args.get("y0", 0))
+        x1 = float(request.args["x1"])
+        y1 = float(request.args["y1"])
+        z = request.args.get("z")
+        z = int(z) if z not in (None, "") else None
+    except (KeyError, ValueError):
+        return jsonify({"status": "error", "error": "x1/y1 obrigatórios e numéricos"}), 400
+
+    types = request.args.get("types")
+    kinds = [t for t in types.split(",") if t in SPATIAL_KINDS] if types else list(SPATIAL_KINDS)
+
+    index = get_plan_index()
+    result = {k: [] for k in kinds}
+    for obj in index.query_rect(x0, y0, x1, y1, z=z, kinds=kinds):
+        result[obj.kind].append(index.data(obj))
+    return jsonify(result)
+
+
+@blueprint.route("/api/rocrail/block/<block_id>/tracks")
+def api_rocrail_block_tracks(block_id):
+    """
+    Tracks associados a um bloco (blockid), sem percorrer a lista toda.
+    """
+    index = get_plan_index()
+    tracks = index.tracks_by_block.get(block_id, [])
+    return jsonify([index.data(t) for t in tracks])
+
+
+@blueprint.route("/api/rocrail/route")
+def api_rocrail_route():
+    """
+    Rota mais curta entre dois blocos e as agulhas a posicionar.
+    Query: ?from=B1&to=B5
+    O grafo é construído uma vez por versão do plano e as rotas ficam em cache.
+    """
+    src = request.args.get("from")
+    dst = request.args.get("to")
+    if not src or not dst:
+        return jsonify({"status": "error", "error": "from/to obrigatórios"}), 400
+
+    t0 = time.perf_counter()
+    route = get_block_graph().route_dict(src, dst)
+    lookup_us = (time.perf_counter() - t0) * 1e6
+    if route is None:
+        return jsonify({"status": "error", "error": f"sem rota de {src} para {dst}"}), 404
+    route["lookup_us"] = round(lookup_us, 1)
+    return jsonify(route)
+
+
+def _cs3_turnout_address(sw):
+    """
+    Endereço de acessório da CS3 de uma agulha do plano: addr+port ao
+    estilo Rocrail (decoder MM com 4 portas) ou só addr (endereço direto).
+    """
+    try:
+        addr = int(sw.get("addr") or 0)
+        port = int(sw.get("port") or 0)
+    except (TypeError, ValueError):
+        return None
+    if addr <= 0:
+        return None
+    return (addr - 1) * 4 + port if port > 0 else addr
+
+
+@blueprint.route("/api/rocrail/route/set", methods=["POST"])
+def api_rocrail_route_set():
+    """
+    Posiciona todas as agulhas da rota from -> to.
+    Body JSON: { "from": "B1", "to": "B5", "via": "rocrail" | "cs3" }
+    via=rocrail (default): um único lote de comandos para o Rocrail.
+    via=cs3: diretamente na CS3, com impulsos espaçados por distrito
+    (endereço da agulha tirado de addr/port do plan.xml).
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        data = {}
+    src, dst = data.get("from"), data.get("to")
+    if not isinstance(src, str) or not isinstance(dst, str) or not src or not dst:
+        return jsonify({"status": "error", "error": "from/to obrigatórios"}), 400
+    route = get_block_graph().route_dict(src, dst)
+    if route is None:
+        return jsonify({"status": "error", "error": f"sem rota de {src} para {dst}"}), 404
+
+    if data.get("via") == "cs3":
+        index = get_plan_index()
+        items = []
+        for sw in route["switches"]:
+            obj = index.get("switches", sw["id"])
+            address = _cs3_turnout_address(index.data(obj) if obj else {})
+            if address is None:
+                return jsonify({"status": "error", "route": route,
+                                "error": f"agulha {sw['id']} sem addr no plano"}), 400
+            items.append({"id": str(address), "position": sw["cmd"]})
+        if not items:
+            return jsonify({"status": "ok", "route": route})
+        try:
+            result = get_cs3().set_turnouts(items)
+        except ValueError as e:
+            return jsonify({"status": "error", "error": e.args[0], "route": route}), 400
+        except (RuntimeError, TimeoutError) as e:
+            return jsonify({"status": "error", "error": str(e), "route": route}), 503
+        return jsonify({"status": result["status"], "route": route, "cs3": result})
+
+    items = [{"op": "switch", "id": sw["id"], "cmd": sw["cmd"]} for sw in route["switches"]]
+    if items and not rocrail.send_commands(items):
+        return jsonify({"status": "error", "error": "Rocrail desligado", "route": route}), 503
+    return jsonify({"status": "ok", "route": route})
+
+
+@blueprint.route("/api/rocrail/graph")
+def api_rocrail_graph():
+    """Grafo de blocos do plano atual e estatísticas da cache de rotas."""
+    graph = get_block_graph()
+    result = graph.to_dict()
+    result["stats"] = graph.stats()
+    return jsonify(result)
+
 
 @blueprint.route("/fleet")
 def fleet():
@@ -171,6 +386,37 @@ def api_train_direction():
         print("[TRAIN-DIR] erro:", e)
         return jsonify({"status": "error", "error": str(e)}), 500
 
+@blueprint.route("/api/train/batch", methods=["POST"])
+def api_train_batch():
+    """
+    Executa várias operações de locos/agulhas num só pedido.
+    JSON: { "commands": [ { "op": "go", "loco_id": "ICE1", "speed": 40 },
+                          { "op": "switch", "id": "SW1", "cmd": "turnout" }, ... ] }
+    Todas as operações são validadas antes de enviar; se alguma for inválida
+    nada é enviado. Os comandos válidos seguem numa única escrita para o Rocrail.
+    """
+    data = request.json or {}
+    items = data.get("commands") if isinstance(data, dict) else data
+
+    if not isinstance(items, list) or not items:
+        return jsonify({"status": "error", "error": "commands em falta"}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"status": "error", "error": f"máximo {BATCH_MAX_ITEMS} comandos por lote"}), 400
+
+    xml_list, results = build_batch(items)
+    if not xml_list:
+        return jsonify({"status": "error", "error": "lote inválido", "results": results}), 400
+
+    print(f"[TRAIN-BATCH] {len(xml_list)} comandos")
+    sent = rocrail.send_commands(items)
+    if not sent:
+        for r in results:
+            r["status"] = "discarded"
+        return jsonify({"status": "error", "error": "Rocrail sem ligação", "results": results}), 503
+
+    return jsonify({"status": "ok", "results": results})
+
+
 @blueprint.route("/switch-editor")
 def switch_editor():
     return render_template("home/switch_editor.html")
@@ -219,6 +465,28 @@ def api_train_go():
     return jsonify({"status": "ok"})
 
 
+@blueprint.route("/api/layout/io")
+def api_layout_io():
+    """
+    Estado do loop de I/O partilhado e das ligações (Rocrail, CS3 TCP):
+    buffer de escrita, pausas por controlo de fluxo, religações.
+    """
+    return jsonify({
+        "loop": layout_io.get_status(),
+        "rocrail": rocrail.conn.get_status(),
+        "cs3": cs3.tcp.get_status(),
+    })
+
+
+@blueprint.route("/api/rocrail/metrics")
+def api_rocrail_metrics():
+    """
+    Latência comando -> confirmação do Rocrail, com histogramas por tipo
+    de comando (speed, direction, function, switch, stop).
+    """
+    return jsonify(rocrail.metrics.snapshot())
+
+
 @blueprint.route("/api/train/preset_speed", methods=["POST"])
 def api_train_preset_speed():
     data = request.json
@@ -238,9 +506,36 @@ def api_train_preset_speed():
     return jsonify({"status": "ok", "speed": speed})
 
 
+@blueprint.route("/api/train/ramp", methods=["POST"])
+def api_train_ramp():
+    """
+    Acelera/trava a loco até uma velocidade com uma rampa gerada no servidor.
+    JSON: { "loco_id": "ICE1", "speed": 60, "duration_s": 3.0, "curve": "s_curve" }
+    curve: linear | ease_in | ease_out | s_curve
+    """
+    data = request.json or {}
+    loco_id = data.get("loco_id", LOCO_DEFAULT)
+    try:
+        speed = int(data.get("speed", 40))
+        duration_s = float(data.get("duration_s", 2.0))
+        rocrail.ramp_speed(loco_id, speed, duration_s, data.get("curve", "linear"))
+    except (TypeError, ValueError) as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+    return jsonify({"status": "ok"})
+
+
+@blueprint.route("/api/train/ramps")
+def api_train_ramps():
+    """
+    Rampas de velocidade ativas e estatísticas do scheduler.
+    """
+    return jsonify(rocrail.ramps.get_status())
+
+
 @blueprint.route("/api/train/emergency_stop", methods=["POST"])
 def api_train_emergency_stop():
-    rocrail.stop_loco()
+    data = request.get_json(silent=True) or {}
+    rocrail.emergency_stop(data.get("loco_ids"))
     return jsonify({"status": "ok"})
 
 
@@ -257,22 +552,14 @@ def load_switch_positions():
             return json.load(f)
 
     # Ficheiro não existe ? criar posições simples a partir do plan.xml
-    plan = parse_plan()
-    switches = plan.get("switches", [])
-    positions = {}
+    # (agulhas do índice, com x,y já numéricos)
+    switches = get_plan_index().by_id["switches"]
 
     # Usamos x,y do Rocrail se existirem; caso contrário, metemos (50, 50)
-    for sw in switches:
-        sw_id = sw.get("id")
-        if not sw_id:
-            continue
-
-        try:
-            x = float(sw.get("x") or 50)
-            y = float(sw.get("y") or 50)
-        except ValueError:
-            x, y = 50.0, 50.0
-
+    positions = {}
+    for sw_id, sw in switches.items():
+        x = sw.x if sw.x is not None else 50.0
+        y = sw.y if sw.y is not None else 50.0
         positions[sw_id] = [x, y]
 
     save_switch_positions(positions)
@@ -350,9 +637,172 @@ def api_auto_mode():
 def api_rocrail_tracks():
     """
     Devolve a lista de elementos gráficos (tracks) do track plan do Rocrail.
+    Aceita ?fields=id,x,y (ver _plan_json_response).
     """
-    plan = parse_plan()
-    return jsonify(plan.get("tracks", []))
+    return _plan_json_response("tracks")
+
+
+# ---------------------------------------------------
+# DISPATCHER (reserva de blocos)
+# ---------------------------------------------------
+
+@blueprint.route("/api/dispatcher/status")
+def api_dispatcher_status():
+    """
+    Estado do dispatcher: comboios, blocos reservados/ocupados e tempos de decisão.
+    """
+    return jsonify(get_dispatcher().get_status())
+
+
+@blueprint.route("/api/dispatcher/train", methods=["POST"])
+def api_dispatcher_train():
+    """
+    Coloca um comboio sob controlo do dispatcher.
+    JSON: { "loco_id": "ICE1", "route": ["B1", "B2", "B3"], "loop": true, "speed": 40 }
+    ou   { "loco_id": "ICE1", "from": "B1", "to": "B5" } (caminho mais curto, sem loop)
+    """
+    data = request.json or {}
+    loco_id = data.get("loco_id")
+    if not loco_id:
+        return jsonify({"status": "error", "error": "missing loco_id"}), 400
+
+    disp = get_dispatcher()
+    route = data.get("route")
+    loop = bool(data.get("loop", True))
+    if not route and data.get("from") and data.get("to"):
+        route = disp.graph.shortest_path(data["from"], data["to"])
+        loop = False
+        if route is None:
+            return jsonify({"status": "error", "error": "sem caminho entre os blocos"}), 400
+
+    speed = data.get("speed")
+    try:
+        train = disp.add_train(loco_id, route or [], loop=loop,
+                               cruise_speed=int(speed) if speed is not None else None)
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+
+    print(f"[DISPATCHER] loco={loco_id} route={train.route} loop={loop}")
+    return jsonify({"status": "ok", "train": train.to_dict()})
+
+
+@blueprint.route("/api/dispatcher/train/remove", methods=["POST"])
+def api_dispatcher_train_remove():
+    """
+    Retira um comboio do dispatcher (pára-o e liberta os blocos reservados).
+    JSON: { "loco_id": "ICE1" }
+    """
+    data = request.json or {}
+    get_dispatcher().remove_train(data.get("loco_id", ""))
+    return jsonify({"status": "ok"})
+
+
+@blueprint.route("/api/dispatcher/occupancy", methods=["POST"])
+def api_dispatcher_occupancy():
+    """
+    Ocupação de blocos vinda do YOLO (ou manual).
+    JSON: { "block": "B1", "occupied": true, "source": "yolo" }
+    """
+    data = request.json or {}
+    block_id = data.get("block")
+    if not block_id:
+        return jsonify({"status": "error", "error": "missing block"}), 400
+
+    get_dispatcher().set_occupancy(block_id, bool(data.get("occupied", False)),
+                                   source=data.get("source", "yolo"))
+    return jsonify({"status": "ok"})
+
+
+@blueprint.route("/api/dispatcher/simulate", methods=["POST"])
+def api_dispatcher_simulate():
+    """
+    Simula o dispatcher no plano atual e devolve comboios/hora.
+    JSON: { "trains": [ { "loco_id": "A", "route": ["B1", "B2"], "loop": true } ],
+            "duration_s": 3600, "block_time_s": 20, "lookahead": 2 }
+    """
+    data = request.json or {}
+    trains = data.get("trains") or []
+    if not trains:
+        return jsonify({"status": "error", "error": "missing trains"}), 400
+
+    graph = get_dispatcher().graph
+    try:
+        result = simulate(
+            graph, trains,
+            duration_s=float(data.get("duration_s", 3600)),
+            block_time_s=float(data.get("block_time_s", 20)),
+            lookahead=int(data.get("lookahead", 2)),
+        )
+    except (ValueError, KeyError, TypeError) as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+    return jsonify({"status": "ok", "result": result})
+
+
+# ---------------------------------------------------
+# SAFETY (previsão de colisões)
+# ---------------------------------------------------
+
+@blueprint.route("/api/safety/status")
+def api_safety_status():
+    """
+    Estado do motor de previsão: comboios seguidos, conflitos previstos,
+    limiares de abrandar/parar e tempo de reação garantido.
+    """
+    return jsonify(get_predictor().get_status())
+
+
+@blueprint.route("/api/safety/position", methods=["POST"])
+def api_safety_position():
+    """
+    Posição/velocidade de um comboio vinda do tracker da câmara.
+    JSON: { "loco_id": "ICE1", "block": "B1", "offset": 1.5, "speed": 40 }
+    offset em células desde a entrada do bloco, speed em % (V).
+    """
+    data = request.json or {}
+    loco_id = data.get("loco_id")
+    if not loco_id:
+        return jsonify({"status": "error", "error": "missing loco_id"}), 400
+
+    try:
+        offset = data.get("offset")
+        speed = data.get("speed")
+        get_predictor().update_train(
+            loco_id,
+            block=data.get("block"),
+            offset=float(offset) if offset is not None else None,
+            speed=float(speed) if speed is not None else None,
+            source=data.get("source", "camera"),
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+    return jsonify({"status": "ok"})
+
+
+@blueprint.route("/api/safety/obstacle", methods=["POST"])
+def api_safety_obstacle():
+    """
+    Bloco ocupado por algo que não é um comboio seguido.
+    JSON: { "block": "B3", "occupied": true }
+    """
+    data = request.json or {}
+    block_id = data.get("block")
+    if not block_id:
+        return jsonify({"status": "error", "error": "missing block"}), 400
+    get_predictor().set_obstacle(block_id, bool(data.get("occupied", False)))
+    return jsonify({"status": "ok"})
+
+
+@blueprint.route("/api/safety/enable", methods=["POST"])
+def api_safety_enable():
+    """
+    Liga/desliga as intervenções automáticas.
+    JSON: { "enabled": true }
+    """
+    data = request.json or {}
+    predictor = get_predictor()
+    predictor.enabled = bool(data.get("enabled", True))
+    print("[SAFETY]", "ENABLED" if predictor.enabled else "DISABLED")
+    return jsonify({"status": "ok", "enabled": predictor.enabled})
 
 
 # ---------------------------------------------------
@@ -367,6 +817,28 @@ def api_cs3_status():
     client = get_cs3()
     return jsonify(client.get_status())
 
+@blueprint.route("/api/cs3/state")
+def api_cs3_state():
+    """
+    Estado vivo da CS3 (cache alimentada pelas frames recebidas; não liga à CS3).
+    Query: ?since=<seq> -> só os objetos alterados depois dessa sequência.
+    Sem since -> { "seq": n, "locos": {...}, "turnouts": {...}, "feedback": {...}, "system": {...} }
+    """
+    since = request.args.get("since", type=int)
+    if since is None:
+        return jsonify(cs3.state.snapshot())
+    return jsonify(cs3.state.changes_since(since))
+
+
+@blueprint.route("/api/cs3/state/<kind>/<obj_id>")
+def api_cs3_state_object(kind, obj_id):
+    """Um objeto do estado da CS3 (kind: locos | turnouts | feedback | system)."""
+    rec = cs3.state.get(kind, obj_id)
+    if rec is None:
+        return jsonify({"status": "error", "error": "not found"}), 404
+    return jsonify(rec)
+
+
 @blueprint.route("/api/cs3/turnout", methods=["POST"])
 def api_cs3_turnout():
     """
@@ -388,15 +860,40 @@ def api_cs3_turnout():
         print("[CS3] erro em /api/cs3/turnout:", e)
         return jsonify({"status": "error", "error": str(e)}), 500
 
+@blueprint.route("/api/cs3/turnouts", methods=["POST"])
+def api_cs3_turnouts():
+    """
+    Muda várias agulhas na CS3 com impulsos espaçados (p.ex. uma rota).
+    JSON: { "items": [ {"id": "12", "position": "turnout", "district": "norte"}, ... ],
+            "pulse_ms": 200, "spacing_ms": 50, "max_parallel": 1 }
+    Responde quando todas acabaram, com os tempos por agulha e por distrito.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        result = get_cs3().set_turnouts(
+            data.get("items"), data.get("pulse_ms"), data.get("spacing_ms"), data.get("max_parallel"))
+    except ValueError as e:
+        return jsonify({"status": "error", "error": e.args[0]}), 400
+    except (RuntimeError, TimeoutError) as e:
+        print("[CS3] erro em /api/cs3/turnouts:", e)
+        return jsonify({"status": "error", "error": str(e)}), 503
+    return jsonify(result)
+
+
 @blueprint.route("/api/cs3/refresh", methods=["POST"])
 def api_cs3_refresh():
     """
-    Triggers para pedir lista de locos/turnouts da CS3 (a implementar no cs3_client).
+    Pede de novo à CS3 as listas de locos e de artigos (streams de config
+    data; se o CRC não mudou vêm da cache em disco).
     """
     client = get_cs3()
-    client.request_loco_list()
-    client.request_turnout_list()
-    return jsonify({"status": "ok"})
+    try:
+        locos = client.request_loco_list()
+        turnouts = client.request_turnout_list()
+    except Exception as e:
+        print("[CS3] erro em /api/cs3/refresh:", e)
+        return jsonify({"status": "error", "error": str(e)}), 502
+    return jsonify({"status": "ok", "locos": len(locos), "turnouts": len(turnouts)})
 
 @blueprint.route("/cs3-status")
 def cs3_status():
@@ -434,6 +931,15 @@ def api_rc_autopilot():
     rc_car.enable_autopilot(enabled)
     return jsonify({"status": "ok", "autopilot": enabled})
 
+
+@blueprint.route("/api/rc/autopilot/status")
+def api_rc_autopilot_status():
+    """
+    Pipeline de visão do autopilot: frames, comandos enviados/atrasados,
+    último resultado e tempos por etapa (p50/p99, ms).
+    """
+    return jsonify(autopilot.get_status())
+
 ## RC CAR
 
 @blueprint.route("/api/rc/emergency_stop", methods=["POST"])
@@ -444,7 +950,47 @@ def api_rc_emergency_stop():
     rc_car.emergency_stop()
     return jsonify({"status": "ok"})
 
+@blueprint.route("/api/rc/serial", methods=["POST"])
+def api_rc_serial():
+    """
+    Liga o RC car à porta série (não espera pela abertura da porta).
+    Espera JSON: { "port": "COM5" | "/dev/ttyUSB0", "baudrate": 115200, "protocol": "binary"|"ascii" }
+    """
+    data = request.json or {}
+    port = data.get("port")
+    if not port:
+        return jsonify({"status": "error", "error": "missing port"}), 400
+    try:
+        set_serial_backend(str(port), int(data.get("baudrate", 115200)),
+                           data.get("protocol", "binary"))
+    except (RuntimeError, ValueError) as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+    return jsonify({"status": "ok", "port": port})
+
+
+@blueprint.route("/api/rc/telemetry")
+def api_rc_telemetry():
+    """
+    Janela de telemetria reduzida: ?seconds=30&points=200
+    (cópia do ring buffer; não toca na porta série).
+    """
+    ring = rc_car.backend.telemetry
+    if ring is None:
+        return jsonify({"status": "error", "error": "backend sem telemetria"}), 404
+    seconds = request.args.get("seconds", 30.0, type=float)
+    points = request.args.get("points", 200, type=int)
+    return jsonify(ring.window(seconds, points))
+
+
+@blueprint.route("/api/rc/ws")
+def api_rc_ws():
+    """
+    Estado do canal WebSocket de controlo (clientes, mensagens, estados enviados).
+    """
+    return jsonify(rc_ws.get_status())
+
+
 @blueprint.route("/rc-dashboard")
 def rc_dashboard():
-    return render_template("home/rc_dashboard.html")
+    return render_template("home/rc_dashboard.html", rc_ws_url=rc_ws.public_url())
 
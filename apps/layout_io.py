@@ -0,0 +1,325 @@
+"""
+Núcleo de I/O das ligações ao layout (Rocrail, CS3, ...).
+
+Um só event loop asyncio numa thread dedicada aloja todas as ligações:
+cada uma é uma classe de protocolo (asyncio.Protocol / BufferedProtocol /
+DatagramProtocol) chamada pelo loop quando chegam dados, sem threads de
+leitura nem locks por ligação. Timeouts e cancelamento são os do asyncio
+em todo o lado.
+
+As rotas Flask e os motores (rampas, dispatcher) correm noutras threads e
+usam só a fachada thread-safe:
+    layout_io.call(coro, timeout)   -> corre a corrotina no loop e espera
+    layout_io.call_soon(fn, *args)  -> agenda fn no loop sem esperar
+    StreamConnection.send(data)     -> escrita com controlo de fluxo
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, Callable, Coroutine, Dict, List, Optional
+
+# Buffer de escrita de cada ligação: acima de HIGH o loop chama
+# pause_writing() e as threads que enviam passam a esperar até baixar de LOW
+WRITE_HIGH_WATER = 256 * 1024
+WRITE_LOW_WATER = 64 * 1024
+
+# Tempo máximo que uma thread espera por uma operação no loop
+CALL_TIMEOUT_S = 5.0
+
+# Espera entre tentativas de (re)ligação
+RETRY_S = 3.0
+CONNECT_TIMEOUT_S = 5.0
+
+
+class LayoutLoop:
+    """Event loop partilhado, arrancado na primeira utilização."""
+
+    def __init__(self, name: str = "layout-io"):
+        self.name = name
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> "LayoutLoop":
+        if self.thread is not None:
+            return self
+        with self._lock:
+            if self.thread is None:
+                self.loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                thread.start()
+                self.thread = thread
+        return self
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def in_loop(self) -> bool:
+        """True se a thread atual é a do loop (aí não se pode bloquear)."""
+        return self.thread is not None and threading.get_ident() == self.thread.ident
+
+    def submit(self, coro: Coroutine) -> "asyncio.Future":
+        """Agenda uma corrotina no loop; devolve um concurrent.futures.Future."""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call(self, coro: Coroutine, timeout: float = CALL_TIMEOUT_S) -> Any:
+        """
+        Corre `coro` no loop e espera pelo resultado (a partir de outra thread).
+        Ao fim de `timeout` a corrotina é cancelada e lança TimeoutError.
+        """
+        if self.in_loop():
+            coro.close()
+            raise RuntimeError("layout_io.call() bloqueante dentro do próprio loop")
+        fut = self.submit(coro)
+        try:
+            return fut.result(timeout)
+        except FutureTimeout:
+            fut.cancel()
+            raise TimeoutError(f"operação no loop sem resposta em {timeout:.1f}s") from None
+
+    def call_soon(self, fn: Callable, *args):
+        """Executa fn(*args) no loop (já, se estivermos nele)."""
+        self.start()
+        if self.in_loop():
+            fn(*args)
+        else:
+            self.loop.call_soon_threadsafe(fn, *args)
+
+    def get_status(self) -> Dict[str, Any]:
+        loop = self.loop
+        return {
+            "running": bool(loop and loop.is_running()),
+            "thread": self.name,
+        }
+
+
+class StreamConnection(asyncio.Protocol):
+    """
+    Ligação TCP gerida pelo loop partilhado.
+
+    O mesmo objeto é o protocolo de todas as ligações sucessivas; com
+    reconnect=True uma tarefa mantém a ligação aberta (tenta de novo a cada
+    retry_s). As subclasses tratam os dados em data_received() (ou
+    get_buffer()/buffer_updated() se também herdarem de BufferedProtocol)
+    e podem redefinir on_connected() / on_disconnected().
+    """
+
+    tag = "IO"
+
+    def __init__(self, io: LayoutLoop, host: str, port: int,
+                 reconnect: bool = False, retry_s: float = RETRY_S,
+                 connect_timeout: float = CONNECT_TIMEOUT_S):
+        self.io = io
+        self.host = host
+        self.port = port
+        self.reconnect = reconnect
+        self.retry_s = retry_s
+        self.connect_timeout = connect_timeout
+        self.transport: Optional[asyncio.Transport] = None
+        self.paused = False
+        self.last_error: Optional[str] = None
+        self.last_connect_time: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lost: Optional[asyncio.Future] = None
+        # set quando uma tentativa de ligação termina (ligou ou falhou)
+        self._attempted = threading.Event()
+        self._drain_waiters: List[asyncio.Future] = []
+        # bytes agendados por outras threads que o loop ainda não escreveu
+        self._queued = 0
+        self._queued_lock = threading.Lock()
+        self.connects = 0
+        self.bytes_tx = 0
+        self.dropped = 0
+        self.pauses = 0
+
+    @property
+    def connected(self) -> bool:
+        return self.transport is not None
+
+    # -----------------------
+    # CICLO DE VIDA (thread-safe)
+    # -----------------------
+
+    def start(self):
+        """Arranca a tarefa de (re)ligação no loop (idempotente)."""
+        self.io.call_soon(self._start_task)
+
+    def open(self, timeout: Optional[float] = None):
+        """Liga uma vez e espera (lança OSError / TimeoutError se falhar)."""
+        timeout = self.connect_timeout if timeout is None else timeout
+        self.io.call(self._open(), timeout + 1.0)
+
+    def wait_connected(self, timeout: Optional[float] = None) -> bool:
+        """
+        Espera (noutra thread) que a tentativa de ligação em curso termine;
+        devolve True se ficou ligado. Não espera se já houve uma tentativa.
+        """
+        if self.transport is None and not self.io.in_loop():
+            self._attempted.wait(self.connect_timeout + 1.0 if timeout is None else timeout)
+        return self.transport is not None
+
+    def close(self):
+        """Fecha a ligação e pára a tarefa de religação."""
+        self.io.call_soon(self._close)
+
+    def _start_task(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    def _close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.transport is not None:
+            self.transport.close()
+
+    async def _open(self):
+        if self.transport is not None:
+            return
+        loop = asyncio.get_running_loop()
+        await asyncio.wait_for(loop.create_connection(lambda: self, self.host, self.port),
+                               self.connect_timeout)
+
+    async def _run(self):
+        while True:
+            try:
+                await self._open()
+                await asyncio.shield(self._lost)
+            except asyncio.CancelledError:
+                raise
+            except (OSError, asyncio.TimeoutError) as e:
+                self.last_error = str(e) or type(e).__name__
+                self._attempted.set()
+                print(f"[{self.tag}] Erro a ligar a {self.host}:{self.port}: {self.last_error}, "
+                      f"a tentar de novo em {self.retry_s:g}s...")
+            if not self.reconnect:
+                return
+            await asyncio.sleep(self.retry_s)
+
+    # -----------------------
+    # CALLBACKS DO PROTOCOLO
+    # -----------------------
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.paused = False
+        self._lost = asyncio.get_running_loop().create_future()
+        transport.set_write_buffer_limits(WRITE_HIGH_WATER, WRITE_LOW_WATER)
+        self.connects += 1
+        self.last_connect_time = time.time()
+        self._attempted.set()
+        self.on_connected()
+
+    def connection_lost(self, exc):
+        self.transport = None
+        if exc is not None:
+            self.last_error = str(exc)
+        if self._lost is not None and not self._lost.done():
+            self._lost.set_result(None)
+        self._wake_writers(ConnectionError("ligação fechada"))
+        self.on_disconnected(exc)
+
+    def pause_writing(self):
+        self.paused = True
+        self.pauses += 1
+
+    def resume_writing(self):
+        self.paused = False
+        self._wake_writers(None)
+
+    def on_connected(self):
+        print(f"[{self.tag}] Ligado a {self.host}:{self.port}")
+
+    def on_disconnected(self, exc: Optional[Exception]):
+        print(f"[{self.tag}] Ligação terminada" + (f": {exc}" if exc else "."))
+
+    # -----------------------
+    # ESCRITA
+    # -----------------------
+
+    def _wake_writers(self, exc: Optional[Exception]):
+        waiters, self._drain_waiters = self._drain_waiters, []
+        for w in waiters:
+            if not w.done():
+                if exc is None:
+                    w.set_result(None)
+                else:
+                    w.set_exception(exc)
+
+    async def write(self, data: bytes):
+        """
+        Escreve no loop; com o buffer acima do limite espera primeiro que
+        esvazie (se for cancelada a meio, nada foi escrito).
+        """
+        while self.paused and self.transport is not None:
+            waiter = asyncio.get_running_loop().create_future()
+            self._drain_waiters.append(waiter)
+            await waiter
+        if self.transport is None:
+            raise ConnectionError(f"{self.tag} sem ligação")
+        self.transport.write(data)
+        self.bytes_tx += len(data)
+
+    def _write_queued(self, data: bytes):
+        """Escrita agendada por send() a partir de outra thread (corre no loop)."""
+        with self._queued_lock:
+            self._queued -= len(data)
+        self._write_now(data)
+
+    def _write_now(self, data: bytes):
+        if self.transport is None:
+            self.dropped += 1
+            return
+        self.transport.write(data)
+        self.bytes_tx += len(data)
+
+    def send(self, data: bytes, timeout: float = CALL_TIMEOUT_S) -> bool:
+        """
+        Envio thread-safe. Devolve False se não há ligação ou se o buffer
+        não esvaziou em `timeout` (os dados são descartados).
+
+        Normalmente só agenda a escrita no loop e volta logo; se o que está
+        por escrever (agendado + buffer do transporte) passa de
+        WRITE_HIGH_WATER, a thread que envia fica à espera que esvazie em
+        vez de acumular memória sem limite. As escritas de uma thread saem
+        sempre pela ordem em que foram feitas.
+        """
+        if self.transport is None:
+            return False
+        if self.io.in_loop():
+            self._write_now(data)
+            return True
+        if self.paused or self._queued > WRITE_HIGH_WATER:
+            try:
+                self.io.call(self.write(data), timeout)
+                return True
+            except (ConnectionError, TimeoutError):
+                self.dropped += 1
+                return False
+        with self._queued_lock:
+            self._queued += len(data)
+        self.io.call_soon(self._write_queued, data)
+        return True
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "connected": self.connected,
+            "host": self.host,
+            "port": self.port,
+            "last_error": self.last_error,
+            "last_connect_time": self.last_connect_time,
+            "connects": self.connects,
+            "bytes_tx": self.bytes_tx,
+            "write_buffer": self.transport.get_write_buffer_size() if self.transport else 0,
+            "queued": self._queued,
+            "paused": self.paused,
+            "pauses": self.pauses,
+            "dropped": self.dropped,
+        }
+
+
+# Instância global: um loop para todas as ligações ao layout
+layout_io = LayoutLoop()
@@ -0,0 +1,536 @@
+"""
+Autopilot do RC car por visão: seguir a faixa (ou uma linha marcada no chão).
+
+Pipeline por frame (LanePilot.process):
+  1. preprocess  ROI inferior da imagem, reduzida (linhas saltadas, colunas
+                 em média de blocos) e passada a luminância, tudo em NumPy
+  2. lane        limiar adaptativo (média + K * desvio) e, em SCAN_ROWS
+                 linhas de perto para longe, o centro da faixa por linha
+                 (bordas esquerda/direita ou centróide da linha), vetorizado
+  3. yolo        opcional, a cada YOLO_EVERY frames: obstáculo no caminho
+                 (modelo partilhado de apps.yolo_core) -> throttle 0
+  4. control     pure pursuit sobre o ponto de lookahead ou PID sobre o
+                 erro lateral; throttle reduzido em curva e sem faixa
+
+Coordenadas normalizadas: x em [-1, 1] (positivo = direita, igual ao
+steering), y em [0, 1] de perto (fundo da ROI) para longe.
+
+O AutopilotRunner corre numa thread enquanto rc_car.autopilot_enabled:
+a câmara é lida noutra thread que guarda só a frame mais recente (nunca se
+processa uma fila atrasada) e um comando que sai depois de BUDGET_MS desde
+a captura é descartado (conta como "late"; se continuar, o watchdog do
+RCCarController pára o carro), a não ser que abrande ou pare o carro (um
+obstáculo dá throttle 0): esses saem sempre. Acima do orçamento o YOLO
+corre menos vezes.
+
+Modo replay (afinação offline sobre vídeo gravado, sem mexer no carro):
+    python -m apps.rc_autopilot --replay gravacao.mp4 --out replay.csv --kp 1.0
+"""
+import argparse
+import csv
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+try:
+    import cv2  # câmara e vídeo (o processamento em si é só NumPy)
+except ImportError:
+    cv2 = None
+
+from apps.rc_car_core import rc_car
+
+# Fonte de vídeo do carro: índice da câmara local ("0") ou URL RTSP/HTTP
+CAM_URL = os.environ.get("RC_CAM_URL", "0")
+
+# Tempo máximo captura -> comando; acima disto o comando é descartado
+BUDGET_MS = float(os.environ.get("RC_AUTOPILOT_BUDGET_MS", "80"))
+
+# Velocidade de cruzeiro e controlador ("pursuit" ou "pid")
+BASE_THROTTLE = float(os.environ.get("RC_AUTOPILOT_THROTTLE", "0.3"))
+CONTROLLER = os.environ.get("RC_AUTOPILOT_CONTROLLER", "pursuit")
+
+# "lane": duas linhas (bordas da faixa); "line": seguir uma só linha
+LANE_MODE = os.environ.get("RC_LANE_MODE", "lane")
+# Linhas escuras em chão claro (em vez de fita clara em chão escuro)
+LANE_DARK = os.environ.get("RC_LANE_DARK", "0") == "1"
+
+# Deteção de obstáculos com YOLO (precisa de ultralytics)
+USE_YOLO = os.environ.get("RC_AUTOPILOT_YOLO", "0") == "1"
+
+# ROI: a partir desta fração da altura até ao fundo; redução por DOWNSCALE
+ROI_TOP = 0.55
+DOWNSCALE = 8
+SCAN_ROWS = 6
+THRESHOLD_K = 1.5          # limiar = média + K * desvio padrão da ROI
+MIN_PIXELS = 1             # píxeis (já reduzidos) para uma linha contar
+LANE_WIDTH_INIT = 0.6      # largura da faixa (fração da largura) até haver medida
+LOST_FRAMES = 10           # frames sem faixa -> throttle 0
+
+# Controlador
+LOOKAHEAD_Y = 0.6          # y normalizado do ponto de lookahead
+LOOKAHEAD_NEAR = 0.6       # distância no chão (em meias-larguras de imagem) de y=0
+LOOKAHEAD_FAR = 2.0        # ... e de y=1
+PURSUIT_GAIN = 1.0
+KP, KI, KD = 1.2, 0.0, 0.15
+INTEGRAL_MAX = 0.5
+CURVE_SLOWDOWN = 0.5       # throttle *= 1 - CURVE_SLOWDOWN * |steering|
+
+# Obstáculos
+YOLO_EVERY = 5
+YOLO_EVERY_MAX = 30
+OBSTACLE_MIN_AREA = 0.02   # fração da imagem
+OBSTACLE_LANE_X = 0.33     # caixa com parte no terço central = no caminho
+
+# Amostras guardadas por etapa para p50/p99
+STATS_WINDOW = 500
+
+STAGES = ("age", "preprocess", "lane", "yolo", "control", "total")
+
+
+def _pct(values, q: float) -> Optional[float]:
+    if not values:
+        return None
+    v = sorted(values)
+    return round(v[min(len(v) - 1, int(q * len(v)))], 3)
+
+
+class StageTimes:
+    """Tempos por etapa (ms) das últimas STATS_WINDOW frames."""
+
+    def __init__(self):
+        self.samples = {s: deque(maxlen=STATS_WINDOW) for s in STAGES}
+
+    def add(self, times: Dict[str, float]):
+        for s, v in times.items():
+            self.samples[s].append(v)
+
+    def summary(self) -> Dict[str, Any]:
+        return {s: {"p50": _pct(v, 0.5), "p99": _pct(v, 0.99)} for s, v in self.samples.items()}
+
+
+class LaneDetector:
+    """Centro da faixa em SCAN_ROWS linhas da ROI, com estado entre frames."""
+
+    def __init__(self, mode: str = LANE_MODE, dark: bool = LANE_DARK):
+        self.mode = mode
+        self.dark = dark
+        self._split: Optional[np.ndarray] = None    # centro anterior por linha (px reduzidos)
+        self._width: Optional[np.ndarray] = None    # largura da faixa por linha
+
+    def preprocess(self, frame: np.ndarray) -> np.ndarray:
+        """ROI inferior reduzida, em luminância float32."""
+        h, w = frame.shape[:2]
+        f = DOWNSCALE
+        roi = frame[int(h * ROI_TOP)::f]
+        cols = (w // f) * f
+        roi = roi[:, :cols]
+        if roi.ndim == 3:
+            # média de blocos de f colunas e BGR -> luma (BT.601) num só passo
+            small = roi.reshape(roi.shape[0], cols // f, f, roi.shape[2]).mean(axis=2, dtype=np.float32)
+            small = small[..., :3] @ np.array([0.114, 0.587, 0.299], dtype=np.float32)
+        else:
+            small = roi.reshape(roi.shape[0], cols // f, f).mean(axis=2, dtype=np.float32)
+        return small
+
+    def detect(self, small: np.ndarray) -> Dict[str, Any]:
+        H, W = small.shape
+        thr = small.mean() + THRESHOLD_K * small.std() * (-1.0 if self.dark else 1.0)
+        mask = small < thr if self.dark else small > thr
+        rows = np.linspace(H - 1, 0, SCAN_ROWS).astype(int)      # perto -> longe
+        m = mask[rows]
+        xs = np.arange(W)
+
+        if self.mode == "line":
+            cnt = m.sum(axis=1)
+            center = np.where(cnt >= MIN_PIXELS, (m * xs).sum(axis=1) / np.maximum(cnt, 1), np.nan)
+        else:
+            if self._split is None:
+                self._split = np.full(SCAN_ROWS, (W - 1) / 2.0)
+                self._width = np.full(SCAN_ROWS, W * LANE_WIDTH_INIT)
+            left = m & (xs < self._split[:, None])
+            right = m & (xs >= self._split[:, None])
+            has_l = left.sum(axis=1) >= MIN_PIXELS
+            has_r = right.sum(axis=1) >= MIN_PIXELS
+            l_edge = W - 1 - np.argmax(left[:, ::-1], axis=1)    # pixel mais à direita da borda esquerda
+            r_edge = np.argmax(right, axis=1)                     # pixel mais à esquerda da borda direita
+            both = has_l & has_r
+            self._width = np.where(both, 0.8 * self._width + 0.2 * (r_edge - l_edge), self._width)
+            center = np.where(both, (l_edge + r_edge) / 2.0,
+                              np.where(has_l, l_edge + self._width / 2.0,
+                                       np.where(has_r, r_edge - self._width / 2.0, np.nan)))
+            self._split = np.where(np.isnan(center), self._split, center)
+
+        valid = ~np.isnan(center)
+        half = (W - 1) / 2.0
+        return {
+            "x": (center - half) / half,                  # NaN onde não há faixa
+            "y": 1.0 - rows / max(H - 1, 1),
+            "valid": valid,
+            "found": int(valid.sum()),
+        }
+
+
+class SteeringController:
+    """Pure pursuit (por omissão) ou PID sobre o erro lateral."""
+
+    def __init__(self, kind: str = CONTROLLER, kp: float = KP, ki: float = KI, kd: float = KD,
+                 pursuit_gain: float = PURSUIT_GAIN):
+        self.kind = kind
+        self.kp, self.ki, self.kd = kp, ki, kd
+        self.pursuit_gain = pursuit_gain
+        self._integral = 0.0
+        self._prev_err: Optional[float] = None
+        self._prev_t: Optional[float] = None
+
+    def reset(self):
+        self._integral = 0.0
+        self._prev_err = None
+        self._prev_t = None
+
+    def update(self, lane: Dict[str, Any], t: float) -> Tuple[float, float]:
+        """Devolve (steering, erro lateral)."""
+        x, y, valid = lane["x"], lane["y"], lane["valid"]
+        err = float(x[valid][0])            # linha válida mais perto
+        if self.kind == "pid":
+            dt = t - self._prev_t if self._prev_t is not None else 0.0
+            if dt > 0:
+                self._integral = max(-INTEGRAL_MAX, min(INTEGRAL_MAX, self._integral + err * dt))
+            deriv = (err - self._prev_err) / dt if dt > 0 and self._prev_err is not None else 0.0
+            self._prev_err, self._prev_t = err, t
+            steering = self.kp * err + self.ki * self._integral + self.kd * deriv
+        else:
+            # ponto válido mais próximo de LOOKAHEAD_Y; curvatura = 2 x / ld²
+            i = int(np.argmin(np.where(valid, np.abs(y - LOOKAHEAD_Y), np.inf)))
+            x_la = float(x[i])
+            d = LOOKAHEAD_NEAR + float(y[i]) * (LOOKAHEAD_FAR - LOOKAHEAD_NEAR)
+            steering = self.pursuit_gain * 2.0 * x_la / (x_la * x_la + d * d)
+        return max(-1.0, min(1.0, steering)), err
+
+
+class LanePilot:
+    """Uma frame -> (steering, throttle) com os tempos de cada etapa."""
+
+    def __init__(self, detector: Optional[LaneDetector] = None,
+                 controller: Optional[SteeringController] = None,
+                 base_throttle: float = BASE_THROTTLE, use_yolo: bool = USE_YOLO):
+        self.detector = detector or LaneDetector()
+        self.controller = controller or SteeringController()
+        self.base_throttle = base_throttle
+        self.use_yolo = use_yolo
+        self.yolo_every = YOLO_EVERY
+        self.frames = 0
+        self.lost = 0
+        self.obstacle = False
+        self._model = None
+
+    def _obstacle(self, frame: np.ndarray) -> bool:
+        if self._model is None:
+            from apps.yolo_core import get_model   # só carrega ultralytics se for preciso
+            self._model = get_model()
+        h, w = frame.shape[:2]
+        boxes = self._model.predict(frame, verbose=False)[0].boxes
+        if boxes is None:
+            return False
+        for x1, y1, x2, y2 in boxes.xyxy.tolist():
+            area = (x2 - x1) * (y2 - y1) / float(w * h)
+            in_path = x2 > w * (0.5 - OBSTACLE_LANE_X / 2) and x1 < w * (0.5 + OBSTACLE_LANE_X / 2)
+            if area >= OBSTACLE_MIN_AREA and in_path and y2 > h * ROI_TOP:
+                return True
+        return False
+
+    def process(self, frame: np.ndarray, t_capture: float) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        small = self.detector.preprocess(frame)
+        t1 = time.perf_counter()
+        lane = self.detector.detect(small)
+        t2 = time.perf_counter()
+        if self.use_yolo and self.frames % self.yolo_every == 0:
+            self.obstacle = self._obstacle(frame)
+        t3 = time.perf_counter()
+
+        self.frames += 1
+        if lane["found"]:
+            self.lost = 0
+            steering, err = self.controller.update(lane, t_capture)
+            confidence = lane["found"] / SCAN_ROWS
+            throttle = self.base_throttle * (1.0 - CURVE_SLOWDOWN * abs(steering)) * (0.5 + 0.5 * confidence)
+        else:
+            self.lost += 1
+            steering, err = 0.0, None
+            throttle = self.base_throttle * 0.5 if self.lost < LOST_FRAMES else 0.0
+            if self.lost == LOST_FRAMES:
+                self.controller.reset()
+        if self.obstacle:
+            throttle = 0.0
+        t4 = time.perf_counter()
+
+        return {
+            "steering": round(steering, 4),
+            "throttle": round(throttle, 4),
+            "error": None if err is None else round(err, 4),
+            "found": lane["found"],
+            "obstacle": self.obstacle,
+            "times": {
+                "age": (t0 - t_capture) * 1000.0,
+                "preprocess": (t1 - t0) * 1000.0,
+                "lane": (t2 - t1) * 1000.0,
+                "yolo": (t3 - t2) * 1000.0,
+                "control": (t4 - t3) * 1000.0,
+                "total": (t4 - t_capture) * 1000.0,
+            },
+        }
+
+
+class CameraSource:
+    """Lê a câmara numa thread e guarda só a frame mais recente."""
+
+    def __init__(self, url: str = CAM_URL):
+        self.url = int(url) if str(url).isdigit() else url
+        self.frame: Optional[np.ndarray] = None
+        self.t_capture = 0.0
+        self.seq = 0
+        self.cond = threading.Condition()
+        self.running = False
+
+    def start(self):
+        if cv2 is None:
+            raise RuntimeError("opencv não instalado. Instala com: pip install opencv-python")
+        self.running = True
+        threading.Thread(target=self._loop, name="rc-autopilot-cam", daemon=True).start()
+
+    def stop(self):
+        self.running = False
+
+    def _loop(self):
+        cap = None
+        while self.running:
+            if cap is None:
+                cap = cv2.VideoCapture(self.url)
+                if not cap.isOpened():
+                    print(f"[RC-AP] Não foi possível abrir a câmara {self.url}, nova tentativa em 2s...")
+                    cap.release()
+                    cap = None
+                    time.sleep(2)
+                    continue
+                print(f"[RC-AP] Câmara aberta: {self.url}")
+            ok, frame = cap.read()
+            if not ok or frame is None:
+                print("[RC-AP] Falha a ler frame, a reabrir a câmara...")
+                cap.release()
+                cap = None
+                continue
+            with self.cond:
+                self.frame, self.t_capture = frame, time.perf_counter()
+                self.seq += 1
+                self.cond.notify_all()
+        if cap is not None:
+            cap.release()
+
+    def wait(self, last_seq: int, timeout: float = 1.0):
+        """Próxima frame depois de last_seq: (seq, frame, t_capture) ou None."""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.seq != last_seq or not self.running, timeout):
+                return None
+            return self.seq, self.frame, self.t_capture
+
+
+class AutopilotRunner:
+    """Thread do autopilot; arranca quando rc_car.enable_autopilot(True)."""
+
+    def __init__(self, budget_ms: float = BUDGET_MS, cam_url: str = CAM_URL):
+        self.budget_ms = budget_ms
+        self.cam_url = cam_url
+        self.pilot: Optional[LanePilot] = None
+        self.stats = StageTimes()
+        self.last: Optional[Dict[str, Any]] = None
+        self.last_error: Optional[str] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()     # arranque vs saída da thread
+        self.frames = 0
+        self.sent = 0
+        self.late = 0
+        self.skipped = 0       # frames que chegaram enquanto a anterior era processada
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def on_autopilot(self, enabled: bool):
+        with self._lock:
+            if enabled and not self.running:
+                self._thread = threading.Thread(target=self._run, name="rc-autopilot", daemon=True)
+                self._thread.start()
+
+    def _finish(self) -> bool:
+        """
+        A thread só sai com o autopilot desligado, decidido com o lock: um
+        ON que chegue entretanto ou a mantém viva ou arranca uma nova.
+        """
+        with self._lock:
+            if rc_car.autopilot_enabled:
+                return False
+            self._thread = None
+            return True
+
+    def _run(self):
+        cam = CameraSource(self.cam_url)
+        try:
+            cam.start()
+        except RuntimeError as e:
+            self.last_error = str(e)
+            print("[RC-AP]", e)
+            with self._lock:
+                self._thread = None
+            rc_car.enable_autopilot(False)
+            return
+        self.pilot = LanePilot()
+        print("[RC-AP] Autopilot a correr")
+        seq = 0
+        try:
+            while not self._finish():
+                while rc_car.autopilot_enabled:
+                    got = cam.wait(seq)
+                    if got is None:
+                        continue
+                    new_seq, frame, t_capture = got
+                    self.skipped += max(0, new_seq - seq - 1)
+                    seq = new_seq
+                    r = self.pilot.process(frame, t_capture)
+                    self.frames += 1
+                    self.stats.add(r["times"])
+                    self.last = r
+                    self._send(r)
+        finally:
+            cam.stop()
+            print("[RC-AP] Autopilot parado")
+
+    def _send(self, r: Dict[str, Any]):
+        """Comando de uma frame; fora do orçamento só sai se abranda / pára."""
+        if r["times"]["total"] > self.budget_ms:
+            self.late += 1
+            # fora do orçamento: YOLO mais espaçado até recuperar
+            self.pilot.yolo_every = min(YOLO_EVERY_MAX, self.pilot.yolo_every * 2)
+            throttle = r["throttle"]
+            if throttle != 0.0 and abs(throttle) >= abs(rc_car.last_command["throttle"]):
+                return
+        else:
+            self.pilot.yolo_every = max(YOLO_EVERY, self.pilot.yolo_every - 1)
+        rc_car.set_autopilot_command(r["steering"], r["throttle"])
+        self.sent += 1
+
+    def get_status(self) -> Dict[str, Any]:
+        last = self.last
+        return {
+            "running": self.running,
+            "budget_ms": self.budget_ms,
+            "controller": CONTROLLER,
+            "lane_mode": LANE_MODE,
+            "yolo": USE_YOLO,
+            "frames": self.frames,
+            "sent": self.sent,
+            "late": self.late,
+            "skipped": self.skipped,
+            "last_error": self.last_error,
+            "last": None if last is None else {k: v for k, v in last.items() if k != "times"},
+            "stage_ms": self.stats.summary(),
+        }
+
+
+def read_video(path: str) -> Iterable[Tuple[np.ndarray, float]]:
+    """Frames de um vídeo gravado com o seu tempo (s) no vídeo."""
+    if cv2 is None:
+        raise RuntimeError("opencv não instalado. Instala com: pip install opencv-python")
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise OSError(f"não foi possível abrir {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    i = 0
+    try:
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                return
+            yield frame, i / fps
+            i += 1
+    finally:
+        cap.release()
+
+
+def replay(frames: Iterable[Tuple[np.ndarray, float]], pilot: Optional[LanePilot] = None,
+           out: Optional[str] = None, realtime: bool = False) -> Dict[str, Any]:
+    """
+    Corre o pipeline sobre frames gravadas (frame, t_video) sem mexer no
+    carro. Com out escreve um CSV por frame (erro, comandos, tempos) para
+    afinar ganhos e limiares. realtime=True respeita o ritmo do vídeo.
+    """
+    pilot = pilot or LanePilot()
+    stats = StageTimes()
+    writer = None
+    fh = open(out, "w", newline="") if out else None
+    if fh:
+        writer = csv.writer(fh)
+        writer.writerow(["frame", "t", "error", "steering", "throttle", "found", "obstacle"]
+                        + [f"{s}_ms" for s in STAGES])
+    n = lost = 0
+    t_start = time.perf_counter()
+    try:
+        for frame, t_video in frames:
+            if realtime:
+                time.sleep(max(0.0, t_video - (time.perf_counter() - t_start)))
+            r = pilot.process(frame, time.perf_counter())
+            stats.add(r["times"])
+            n += 1
+            lost += r["found"] == 0
+            if writer:
+                writer.writerow([n, round(t_video, 3), r["error"], r["steering"], r["throttle"],
+                                 r["found"], int(r["obstacle"])]
+                                + [round(r["times"][s], 3) for s in STAGES])
+    finally:
+        if fh:
+            fh.close()
+    elapsed = time.perf_counter() - t_start
+    return {
+        "frames": n,
+        "lost_frames": lost,
+        "fps": round(n / elapsed, 1) if elapsed > 0 else None,
+        "stage_ms": stats.summary(),
+    }
+
+
+# Instância global: arranca sozinha quando o autopilot é ligado
+autopilot = AutopilotRunner()
+rc_car.autopilot_listeners.append(autopilot.on_autopilot)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay do autopilot sobre vídeo gravado")
+    ap.add_argument("--replay", required=True, help="ficheiro de vídeo")
+    ap.add_argument("--out", help="CSV por frame")
+    ap.add_argument("--realtime", action="store_true")
+    ap.add_argument("--controller", choices=("pursuit", "pid"), default=CONTROLLER)
+    ap.add_argument("--mode", choices=("lane", "line"), default=LANE_MODE)
+    ap.add_argument("--dark", action="store_true", default=LANE_DARK)
+    ap.add_argument("--kp", type=float, default=KP)
+    ap.add_argument("--ki", type=float, default=KI)
+    ap.add_argument("--kd", type=float, default=KD)
+    ap.add_argument("--pursuit-gain", type=float, default=PURSUIT_GAIN)
+    ap.add_argument("--yolo", action="store_true", default=USE_YOLO)
+    args = ap.parse_args()
+
+    pilot = LanePilot(LaneDetector(args.mode, args.dark),
+                      SteeringController(args.controller, args.kp, args.ki, args.kd, args.pursuit_gain),
+                      use_yolo=args.yolo)
+    summary = replay(read_video(args.replay), pilot, args.out, args.realtime)
+    print(f"[RC-AP] {summary['frames']} frames, {summary['lost_frames']} sem faixa, "
+          f"{summary['fps']} fps")
+    for stage, v in summary["stage_ms"].items():
+        if stage != "age":
+            print(f"  {stage:10s} p50 {v['p50']} ms  p99 {v['p99']} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,8 @@
+from collections import deque
 from typing import Optional, Dict, Any
+import os
+import queue
+import threading
 import time
 
 try:
@@ -6,6 +10,35 @@ try:
 except ImportError:
     serial = None
 
+from apps import rc_serial_proto
+from apps.rc_telemetry import TelemetryRing
+
+# Frequência fixa do loop de controlo (setpoint -> backend), em Hz
+CONTROL_HZ = float(os.environ.get("RC_CONTROL_HZ", "50"))
+
+# Watchdog: sem setpoint novo durante este tempo -> emergency_stop automático
+SETPOINT_TIMEOUT_S = float(os.environ.get("RC_SETPOINT_TIMEOUT_S", "0.5"))
+
+# Slew do throttle (unidades de throttle por segundo): acelerar devagar,
+# travar/largar mais depressa. Steering sem limite (o servo já é lento).
+THROTTLE_ACCEL_PER_S = 2.0
+THROTTLE_DECEL_PER_S = 4.0
+
+# Porta série: protocolo ("binary" ou "ascii" para firmwares antigos) e ACKs
+SERIAL_PROTOCOL = os.environ.get("RC_SERIAL_PROTOCOL", "binary")
+SERIAL_ACK = os.environ.get("RC_SERIAL_ACK", "0") == "1"
+
+# Comandos à espera da thread de escrita (cheia -> descarta o mais antigo)
+SERIAL_TX_QUEUE = 32
+# Timeout de cada leitura da thread rx e espera entre tentativas de abrir a porta
+SERIAL_RX_TIMEOUT_S = 0.05
+SERIAL_RETRY_S = 3.0
+# close(): tempo máximo à espera que o STOP final saia antes de fechar a porta
+SERIAL_CLOSE_TIMEOUT_S = 1.0
+
+# Nº de ticks guardados para as estatísticas de jitter
+JITTER_WINDOW = 1000
+
 
 class RCCarBackendBase:
     """
@@ -13,53 +46,259 @@ class RCCarBackendBase:
     Podemos ter:
       - DummyBackend (não envia nada, só loga)
       - SerialBackend (envia comandos num COM para Arduino, p.ex.)
+
+    telemetry: TelemetryRing com o que o carro reporta (None se não há).
     """
 
+    telemetry: Optional[TelemetryRing] = None
+
     def set_command(self, steering: float, throttle: float):
         raise NotImplementedError()
 
     def stop(self):
         self.set_command(0.0, 0.0)
 
+    def close(self):
+        pass
+
     def get_status(self) -> Dict[str, Any]:
         return {}
 
 
 class DummyBackend(RCCarBackendBase):
+    def __init__(self):
+        self._last = None
+
     def set_command(self, steering: float, throttle: float):
-        print(f"[RC-DUMMY] steering={steering:.2f} throttle={throttle:.2f}")
+        # o loop de controlo repete o comando a CONTROL_HZ: só loga mudanças
+        cmd = (round(steering, 2), round(throttle, 2))
+        if cmd != self._last:
+            self._last = cmd
+            print(f"[RC-DUMMY] steering={steering:.2f} throttle={throttle:.2f}")
 
 
 class SerialBackend(RCCarBackendBase):
     """
-    Exemplo de backend via porta série (para Arduino).
-    Protocolo sugerido (por exemplo):
-      "S:<steering_float>;T:<throttle_float>\n"
-    O Arduino lê isto e converte para PWM no servo/ESC.
+    Backend via porta série (Arduino).
+
+    protocol="binary" (por omissão): frames CMD de 9 bytes com seq e CRC-8
+    (ver apps/rc_serial_proto.py). protocol="ascii": o formato antigo
+    "S:<steering>;T:<throttle>\n", para firmwares que ainda não falam o
+    binário (sem ACKs nem telemetria).
+
+    A porta é toda tratada por duas threads próprias, nunca por quem chama:
+      - rc-serial-rx abre a porta (e espera o reset do Arduino), volta a
+        abri-la se cair, e lê ACKs e frames TELEM; a telemetria vai para
+        self.telemetry (TelemetryRing)
+      - rc-serial-tx tira comandos da fila e codifica-os num buffer
+        pré-alocado; com a fila cheia o comando mais antigo é descartado
+    set_command()/stop() só põem na fila; get_status() não toca na porta.
+    close() deita fora os comandos por enviar e espera (no máximo
+    SERIAL_CLOSE_TIMEOUT_S) que o STOP final seja escrito antes de fechar.
     """
 
-    def __init__(self, port: str, baudrate: int = 115200):
+    def __init__(self, port: str, baudrate: int = 115200,
+                 protocol: str = SERIAL_PROTOCOL, ack: bool = SERIAL_ACK,
+                 reset_wait_s: float = 2.0, telemetry: Optional[TelemetryRing] = None):
         if serial is None:
             raise RuntimeError("pyserial não instalado. Instala com: pip install pyserial")
+        if protocol not in ("binary", "ascii"):
+            raise ValueError(f"protocolo série desconhecido: {protocol}")
 
         self.port_name = port
         self.baudrate = baudrate
-        self.ser = serial.Serial(port, baudrate, timeout=0.1)
-        time.sleep(2.0)  # tempo para Arduino resetar
+        self.protocol = protocol
+        self.ack = ack and protocol == "binary"
+        self.reset_wait_s = reset_wait_s
+        self.ser = None
+        self.ready = threading.Event()     # porta aberta e Arduino pronto
+        self.last_error: Optional[str] = None
+        self._last_cmd = None
+        self._running = True
+        self._port_lock = threading.Lock()
+
+        self.encoder = rc_serial_proto.CommandEncoder()
+        self.reader = rc_serial_proto.FrameReader()
+        self.reader.on(rc_serial_proto.T_ACK, self._on_ack)
+        self.reader.on(rc_serial_proto.T_TELEM, self._on_telemetry)
+        self.telemetry = telemetry if telemetry is not None else TelemetryRing()
+        self.tx_queue: "queue.Queue" = queue.Queue(SERIAL_TX_QUEUE)
+        self._pending: Dict[int, float] = {}      # seq -> perf_counter do envio
+        self.ack_latency = deque(maxlen=JITTER_WINDOW)
+        self.frames_tx = 0
+        self.bytes_tx = 0
+        self.dropped = 0
+        self.acks = 0
+        self.nacks = 0
+
+        threading.Thread(target=self._rx_loop, name="rc-serial-rx", daemon=True).start()
+        self._tx_thread = threading.Thread(target=self._tx_loop, name="rc-serial-tx", daemon=True)
+        self._tx_thread.start()
+
+    # -----------------------
+    # API (não bloqueia)
+    # -----------------------
+
+    def send(self, steering: Optional[float], throttle: float = 0.0, flags: int = 0):
+        """
+        Põe um comando na fila de escrita (descarta o mais antigo se cheia).
+        steering=None é o fim da thread de escrita (close()).
+        """
+        item = None if steering is None else (steering, throttle, flags)
+        while True:
+            try:
+                self.tx_queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.tx_queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
 
     def set_command(self, steering: float, throttle: float):
-        # clamp
-        s = max(-1.0, min(1.0, steering))
-        t = max(-1.0, min(1.0, throttle))
-        msg = f"S:{s:.2f};T:{t:.2f}\n"
-        self.ser.write(msg.encode("ascii"))
-        print("[RC-SERIAL] TX:", msg.strip())
+        self.send(steering, throttle)
+        cmd = (round(steering, 2), round(throttle, 2))
+        if cmd != self._last_cmd:   # repetido a CONTROL_HZ: só loga mudanças
+            self._last_cmd = cmd
+            print(f"[RC-SERIAL] TX ({self.protocol}): S={cmd[0]:.2f} T={cmd[1]:.2f}")
+
+    def stop(self):
+        self.send(0.0, 0.0, rc_serial_proto.FLAG_STOP)
+        self._last_cmd = (0.0, 0.0)
+
+    def close(self):
+        self._running = False
+        # os comandos por enviar ficam obsoletos: o STOP sai logo a seguir
+        while True:
+            try:
+                self.tx_queue.get_nowait()
+                self.dropped += 1
+            except queue.Empty:
+                break
+        self.send(0.0, 0.0, rc_serial_proto.FLAG_STOP)
+        self.send(None)
+        self._tx_thread.join(SERIAL_CLOSE_TIMEOUT_S)
+        self._drop_port(None)
+
+    # -----------------------
+    # THREADS DA PORTA
+    # -----------------------
+
+    def _open(self):
+        ser = serial.Serial(self.port_name, self.baudrate, timeout=SERIAL_RX_TIMEOUT_S)
+        time.sleep(self.reset_wait_s)  # tempo para Arduino resetar
+        with self._port_lock:
+            self.ser = ser
+        self.last_error = None
+        self.ready.set()
+        print(f"[RC-SERIAL] Porta {self.port_name} aberta ({self.baudrate} baud, {self.protocol})")
+
+    def _drop_port(self, exc: Optional[Exception]):
+        with self._port_lock:
+            ser, self.ser = self.ser, None
+        self.ready.clear()
+        if exc is not None:
+            self.last_error = str(exc)
+        if ser is not None:
+            try:
+                ser.close()
+            except (serial.SerialException, OSError):
+                pass
+            if exc is not None:
+                print(f"[RC-SERIAL] Porta {self.port_name} perdida: {exc}")
+
+    def _rx_loop(self):
+        while self._running:
+            ser = self.ser
+            if ser is None:
+                try:
+                    self._open()
+                except (serial.SerialException, OSError) as e:
+                    self.last_error = str(e)
+                    print(f"[RC-SERIAL] Erro a abrir {self.port_name}: {e}, "
+                          f"a tentar de novo em {SERIAL_RETRY_S:g}s...")
+                    time.sleep(SERIAL_RETRY_S)
+                continue
+            try:
+                data = ser.read(max(1, ser.in_waiting))
+            except (serial.SerialException, OSError, TypeError) as e:
+                # TypeError: pyserial com a porta fechada por outra thread
+                if self._running:
+                    self._drop_port(e)
+                continue
+            if data:
+                self.reader.feed(data)
+
+    def _tx_loop(self):
+        ascii_mode = self.protocol == "ascii"
+        while True:
+            item = self.tx_queue.get()
+            if item is None:
+                ser = self.ser
+                if ser is not None:
+                    try:
+                        ser.flush()     # o STOP sai da porta antes de a fechar
+                    except (serial.SerialException, OSError, TypeError):
+                        pass
+                return
+            ser = self.ser
+            if ser is None:
+                self.dropped += 1
+                continue
+            steering, throttle, flags = item
+            if ascii_mode:
+                data = rc_serial_proto.encode_ascii(steering, throttle)
+            else:
+                if self.ack:
+                    flags |= rc_serial_proto.FLAG_ACK_REQ
+                data = self.encoder.encode(steering, throttle, flags)
+                if self.ack:
+                    self._pending[self.encoder.seq] = time.perf_counter()
+            try:
+                ser.write(data)
+            except (serial.SerialException, OSError, TypeError) as e:
+                # TypeError: close() fechou a porta com o write() bloqueado
+                self.dropped += 1
+                if self._running:
+                    self._drop_port(e)
+                continue
+            self.frames_tx += 1
+            self.bytes_tx += len(data)
+
+    def _on_ack(self, seq: int, fields: tuple):
+        sent = self._pending.pop(seq, None)
+        if fields[0] != rc_serial_proto.ACK_OK:
+            self.nacks += 1
+        else:
+            self.acks += 1
+        if sent is not None:
+            self.ack_latency.append(time.perf_counter() - sent)
+
+    def _on_telemetry(self, seq: int, fields: tuple):
+        self.telemetry.append(fields)
 
     def get_status(self) -> Dict[str, Any]:
+        lat = sorted(self.ack_latency)
         return {
             "port": self.port_name,
             "baudrate": self.baudrate,
-            "is_open": self.ser.is_open,
+            "is_open": self.ready.is_set(),
+            "last_error": self.last_error,
+            "protocol": self.protocol,
+            "ack": self.ack,
+            "frames_tx": self.frames_tx,
+            "bytes_tx": self.bytes_tx,
+            "queued": self.tx_queue.qsize(),
+            "dropped": self.dropped,
+            "acks": self.acks,
+            "nacks": self.nacks,
+            "crc_errors": self.reader.crc_errors,
+            "ack_ms": {
+                "p50": round(lat[len(lat) // 2] * 1000.0, 3),
+                "p99": round(lat[min(len(lat) - 1, int(0.99 * len(lat)))] * 1000.0, 3),
+            } if lat else None,
+            "telemetry": self.telemetry.summary(),
         }
 
 
@@ -68,20 +307,50 @@ class RCCarController:
     Controlador de alto nível do RC car.
     Converte comandos normalizados [-1,1] em calls ao backend.
     Também guarda estado de autopilot/manual.
+
+    Os comandos (manual ou autopilot) só trancam o setpoint; uma thread de
+    controlo envia ao backend o último setpoint a CONTROL_HZ, seja qual for
+    o ritmo dos pedidos HTTP:
+      - throttle com slew (THROTTLE_ACCEL_PER_S / THROTTLE_DECEL_PER_S)
+      - watchdog: sem setpoint novo em SETPOINT_TIMEOUT_S com o carro a
+        andar -> emergency_stop; com a saída já a 0/0 só desarma
+      - jitter de cada tick e deadlines falhadas (tick > 1 período atrasado)
+    Sem setpoint ativo e com a saída a zero o loop dorme (não envia nada).
     """
 
-    def __init__(self, backend: RCCarBackendBase):
+    def __init__(self, backend: RCCarBackendBase, hz: float = CONTROL_HZ,
+                 setpoint_timeout_s: float = SETPOINT_TIMEOUT_S):
         self.backend = backend
         self.autopilot_enabled = False
         self.last_command = {"steering": 0.0, "throttle": 0.0}
         self.last_update = None
+        # chamados com enabled em enable_autopilot() (p.ex. arrancar o pipeline de visão)
+        self.autopilot_listeners = []
+
+        self.period = 1.0 / hz
+        self.setpoint_timeout_s = setpoint_timeout_s
+        self.lock = threading.Lock()           # setpoint trancado
+        self.backend_lock = threading.Lock()   # escritas no backend (loop vs emergency_stop)
+        self._setpoint = (0.0, 0.0)
+        self._setpoint_at = 0.0                # perf_counter do último setpoint
+        self._armed = False                    # há setpoint ativo (watchdog ligado)
+        self._output = [0.0, 0.0]              # steering / throttle enviados
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # estatísticas do loop
+        self.ticks = 0
+        self.missed = 0
+        self.watchdog_trips = 0
+        self.setpoints = 0
+        self._jitter = deque(maxlen=JITTER_WINDOW)
 
     def set_manual_command(self, steering: float, throttle: float):
         """
         Comando manual. steering, throttle ? [-1, 1].
         """
         self.autopilot_enabled = False
-        self._apply_command(steering, throttle)
+        self._latch(steering, throttle)
 
     def set_autopilot_command(self, steering: float, throttle: float):
         """
@@ -90,17 +359,106 @@ class RCCarController:
         """
         if not self.autopilot_enabled:
             return
-        self._apply_command(steering, throttle)
+        self._latch(steering, throttle)
 
-    def _apply_command(self, steering: float, throttle: float):
+    def _latch(self, steering: float, throttle: float):
         s = max(-1.0, min(1.0, steering))
         t = max(-1.0, min(1.0, throttle))
-        self.backend.set_command(s, t)
+        with self.lock:
+            self._setpoint = (s, t)
+            self._setpoint_at = time.perf_counter()
+            self._armed = True
+            self.setpoints += 1
         self.last_command = {"steering": s, "throttle": t}
         self.last_update = time.time()
+        self._ensure_loop()
+        self._wake.set()
+
+    # -----------------------
+    # LOOP DE CONTROLO
+    # -----------------------
+
+    def _ensure_loop(self):
+        if self._thread is None:
+            with self.lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._control_loop,
+                                                    name="rc-control", daemon=True)
+                    self._thread.start()
+
+    def _control_loop(self):
+        while True:
+            # parado: espera pelo próximo setpoint sem gastar ticks
+            self._wake.wait()
+            self._wake.clear()
+            next_t = time.perf_counter()
+            while True:
+                now = time.perf_counter()
+                if now < next_t:
+                    time.sleep(next_t - now)
+                    now = time.perf_counter()
+                late = now - next_t
+                self._jitter.append(late)
+                self.ticks += 1
+                if late > self.period:
+                    # deadline falhada: não tenta recuperar os ticks perdidos
+                    self.missed += 1
+                    next_t = now
+                next_t += self.period
+                if not self._tick(now):
+                    break
+
+    def _tick(self, now: float) -> bool:
+        """Um período de controlo; devolve False quando o loop pode dormir."""
+        with self.lock:
+            armed = self._armed
+            target_s, target_t = self._setpoint
+            latched_at = self._setpoint_at
+        if not armed:
+            return False
+
+        with self.backend_lock:
+            # um emergency_stop entretanto já parou o carro: não reenviar
+            if not self._armed:
+                return False
+            out = self._output
+            moving = out[0] != 0.0 or out[1] != 0.0
+            if now - latched_at > self.setpoint_timeout_s:
+                if not moving:
+                    # já parado (p.ex. stick largado em 0/0): desarma sem STOP
+                    self._disarm(latched_at)
+                    return False
+            else:
+                dt = self.period
+                delta = target_t - out[1]
+                # a acelerar (|t| a subir no mesmo sentido) vs a travar / inverter
+                accelerating = abs(target_t) > abs(out[1]) and target_t * out[1] >= 0
+                step = (THROTTLE_ACCEL_PER_S if accelerating else THROTTLE_DECEL_PER_S) * dt
+                out[0] = target_s
+                out[1] += max(-step, min(step, delta))
+                self.backend.set_command(out[0], out[1])
+                if out[0] == 0.0 and out[1] == 0.0 and target_t == 0.0:
+                    # chegou a 0/0: não há mais nada a enviar
+                    self._disarm(latched_at)
+                    return False
+                return True
+
+        # sem setpoint novo com o carro a andar
+        self.watchdog_trips += 1
+        print(f"[RC] Watchdog: sem setpoint há {(now - latched_at) * 1000:.0f} ms -> STOP")
+        self.emergency_stop()
+        return False
+
+    def _disarm(self, latched_at: float):
+        """Desarma o watchdog, a não ser que tenha chegado outro setpoint."""
+        with self.lock:
+            if self._setpoint_at == latched_at:
+                self._armed = False
 
     def enable_autopilot(self, enabled: bool):
         self.autopilot_enabled = bool(enabled)
+        for fn in self.autopilot_listeners:
+            fn(self.autopilot_enabled)
         if not enabled:
             # quando desligamos autopilot, não mexemos automaticamente nos comandos
             print("[RC] Autopilot OFF")
@@ -108,17 +466,53 @@ class RCCarController:
             print("[RC] Autopilot ON")
 
     def emergency_stop(self):
+        """Pára já (sem slew), desliga o autopilot e desarma o setpoint."""
         self.autopilot_enabled = False
-        self.backend.stop()
+        with self.lock:
+            self._setpoint = (0.0, 0.0)
+            self._armed = False
+        with self.backend_lock:
+            self._output = [0.0, 0.0]
+            self.backend.stop()
         self.last_command = {"steering": 0.0, "throttle": 0.0}
         self.last_update = time.time()
 
+    def set_backend(self, backend: RCCarBackendBase):
+        """Troca o backend (pára o carro antes; fecha o anterior)."""
+        self.emergency_stop()
+        with self.backend_lock:
+            old, self.backend = self.backend, backend
+        old.close()
+
+    def get_loop_stats(self) -> Dict[str, Any]:
+        jitter = sorted(self._jitter)
+
+        def pct(q):
+            return round(jitter[min(len(jitter) - 1, int(q * len(jitter)))] * 1000.0, 3) if jitter else None
+
+        with self.lock:
+            armed = self._armed
+            age = time.perf_counter() - self._setpoint_at if self.setpoints else None
+        return {
+            "hz": round(1.0 / self.period, 1),
+            "running": armed,
+            "setpoint_timeout_ms": round(self.setpoint_timeout_s * 1000),
+            "setpoint_age_ms": round(age * 1000, 1) if age is not None else None,
+            "output": {"steering": round(self._output[0], 3), "throttle": round(self._output[1], 3)},
+            "ticks": self.ticks,
+            "missed_deadlines": self.missed,
+            "watchdog_trips": self.watchdog_trips,
+            "setpoints": self.setpoints,
+            "jitter_ms": {"p50": pct(0.5), "p99": pct(0.99), "max": pct(1.0)},
+        }
+
     def get_status(self) -> Dict[str, Any]:
         return {
             "autopilot": self.autopilot_enabled,
             "last_command": self.last_command,
             "last_update": self.last_update,
             "backend": self.backend.get_status(),
+            "control_loop": self.get_loop_stats(),
         }
 
 
@@ -127,13 +521,18 @@ _backend = DummyBackend()
 rc_car = RCCarController(_backend)
 
 
-def set_serial_backend(port: str, baudrate: int = 115200):
+def set_serial_backend(port: str, baudrate: int = 115200, protocol: str = SERIAL_PROTOCOL):
     """
     Quando tiveres o Arduino ligado, podes trocar backend por SerialBackend.
     Exemplo (mais tarde):
       set_serial_backend("COM5")
+
+    Não bloqueia: a porta é aberta pela thread do backend (ver
+    get_status()["backend"]["is_open"]). O controlador é o mesmo (as rotas
+    guardam a referência a rc_car), só muda o backend.
     """
-    global rc_car, _backend
-    _backend = SerialBackend(port, baudrate=baudrate)
-    rc_car = RCCarController(_backend)
+    global _backend
+    _backend = SerialBackend(port, baudrate=baudrate, protocol=protocol)
+    rc_car.set_backend(_backend)
     print("[RC] Backend trocado para SerialBackend:", port)
+    return _backend
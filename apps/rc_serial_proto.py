@@ -0,0 +1,204 @@
+"""
+Protocolo série binário entre o servidor e o Arduino do RC car.
+
+Todas as frames começam pelo byte de sync e acabam num CRC-8 (polinómio
+0x07, init 0x00) calculado sobre tudo o que vem depois do sync. O tamanho
+é fixo e depende do tipo:
+
+  CMD  (servidor -> carro), 9 bytes
+    0xA5 | 0x01 | seq u8 | steering i16 LE | throttle i16 LE | flags u8 | crc8
+    steering/throttle em [-1, 1] quantizados para [-32767, 32767]
+    flags: bit0 STOP (parar já), bit1 ACK_REQ (pede ACK)
+
+  ACK  (carro -> servidor), 5 bytes
+    0xA5 | 0x81 | seq u8 (do CMD) | status u8 (0 = ok) | crc8
+
+  TELEM (carro -> servidor), 20 bytes
+    0xA5 | 0x82 | seq u8 | bateria u16 (mV) | roda i16 (mm/s)
+         | ax ay az i16 (mg) | gx gy gz i16 (0.1 °/s) | crc8
+
+O modo ASCII antigo ("S:<steering>;T:<throttle>\\n", 15..17 bytes, sem
+verificação) continua disponível em encode_ascii() para firmwares antigos.
+"""
+import struct
+from typing import Callable, Dict, List, Optional, Tuple
+
+SYNC = 0xA5
+
+T_CMD = 0x01
+T_ACK = 0x81
+T_TELEM = 0x82
+
+FLAG_STOP = 0x01
+FLAG_ACK_REQ = 0x02
+
+ACK_OK = 0
+
+# Escala de [-1, 1] para int16
+SCALE = 32767
+
+_CMD = struct.Struct("<BBBhhB")         # sem o CRC
+_ACK = struct.Struct("<BBBB")
+_TELEM = struct.Struct("<BBBHh6h")
+
+CMD_SIZE = _CMD.size + 1
+ACK_SIZE = _ACK.size + 1
+TELEM_SIZE = _TELEM.size + 1
+
+# Tamanho da frame por tipo (o leitor precisa dele para saber onde acaba)
+FRAME_SIZES: Dict[int, int] = {T_CMD: CMD_SIZE, T_ACK: ACK_SIZE, T_TELEM: TELEM_SIZE}
+
+# Campos de uma frame TELEM já em unidades físicas (ordem de FrameReader)
+TELEM_FIELDS = ("battery_v", "wheel_speed", "ax", "ay", "az", "gx", "gy", "gz")
+
+
+def _crc8_table(poly: int = 0x07) -> bytes:
+    table = []
+    for i in range(256):
+        c = i
+        for _ in range(8):
+            c = ((c << 1) ^ poly) & 0xFF if c & 0x80 else (c << 1) & 0xFF
+        table.append(c)
+    return bytes(table)
+
+
+_CRC8 = _crc8_table()
+
+
+def crc8(data, start: int = 0, end: Optional[int] = None) -> int:
+    """CRC-8 (poly 0x07, init 0) de data[start:end]."""
+    crc = 0
+    table = _CRC8
+    for i in range(start, len(data) if end is None else end):
+        crc = table[crc ^ data[i]]
+    return crc
+
+
+def quantize(v: float) -> int:
+    return int(round(max(-1.0, min(1.0, v)) * SCALE))
+
+
+def dequantize(q: int) -> float:
+    return q / SCALE
+
+
+def encode_ascii(steering: float, throttle: float) -> bytes:
+    """Modo antigo (fallback): "S:0.25;T:-0.50\\n"."""
+    s = max(-1.0, min(1.0, steering))
+    t = max(-1.0, min(1.0, throttle))
+    return f"S:{s:.2f};T:{t:.2f}\n".encode("ascii")
+
+
+def encode_ack(seq: int, status: int = ACK_OK) -> bytes:
+    buf = bytearray(ACK_SIZE)
+    _ACK.pack_into(buf, 0, SYNC, T_ACK, seq & 0xFF, status)
+    buf[-1] = crc8(buf, 1, ACK_SIZE - 1)
+    return bytes(buf)
+
+
+def encode_telemetry(seq: int, battery_v: float, wheel_speed: float,
+                     accel=(0.0, 0.0, 1.0), gyro=(0.0, 0.0, 0.0)) -> bytes:
+    """
+    Frame TELEM (lado do carro; usada pelo Arduino virtual dos benchmarks).
+    battery_v em V, wheel_speed em m/s, accel em g, gyro em °/s.
+    """
+    buf = bytearray(TELEM_SIZE)
+    imu = [int(round(a * 1000.0)) for a in accel] + [int(round(g * 10.0)) for g in gyro]
+    _TELEM.pack_into(buf, 0, SYNC, T_TELEM, seq & 0xFF,
+                     max(0, min(0xFFFF, int(round(battery_v * 1000.0)))),
+                     max(-32768, min(32767, int(round(wheel_speed * 1000.0)))),
+                     *(max(-32768, min(32767, v)) for v in imu))
+    buf[-1] = crc8(buf, 1, TELEM_SIZE - 1)
+    return bytes(buf)
+
+
+class CommandEncoder:
+    """
+    Codifica CMDs sempre no mesmo buffer pré-alocado (sem alocar por
+    comando). O seq avança 1 por frame (mod 256). O buffer devolvido é
+    reutilizado na chamada seguinte: escrever antes de codificar outra.
+    """
+
+    def __init__(self):
+        self.buf = bytearray(CMD_SIZE)
+        self.seq = 0
+
+    def encode(self, steering: float, throttle: float, flags: int = 0) -> bytearray:
+        self.seq = (self.seq + 1) & 0xFF
+        buf = self.buf
+        _CMD.pack_into(buf, 0, SYNC, T_CMD, self.seq, quantize(steering), quantize(throttle), flags)
+        buf[CMD_SIZE - 1] = crc8(buf, 1, CMD_SIZE - 1)
+        return buf
+
+
+# Frame descodificada: (tipo, seq, campos)
+Frame = Tuple[int, int, tuple]
+
+
+class FrameReader:
+    """
+    Leitor incremental de frames (serve os dois lados: o servidor lê ACKs e
+    telemetria, o Arduino virtual dos benchmarks lê CMDs). feed() aceita
+    pedaços de qualquer tamanho; lixo, tipos desconhecidos e CRC errado
+    fazem ressincronizar no byte de sync seguinte.
+
+    Os handlers registados com on(tipo, fn) são chamados como
+    fn(seq, campos); feed() devolve também a lista das frames lidas.
+    """
+
+    def __init__(self):
+        self.buf = bytearray()
+        self.frames = 0
+        self.crc_errors = 0
+        self.resyncs = 0
+        self.handlers: Dict[int, Callable[[int, tuple], None]] = {}
+
+    def on(self, frame_type: int, fn: Callable[[int, tuple], None]):
+        self.handlers[frame_type] = fn
+
+    def feed(self, data: bytes) -> List[Frame]:
+        buf = self.buf
+        buf += data
+        out: List[Frame] = []
+        pos = 0
+        n = len(buf)
+        while n - pos >= 2:
+            if buf[pos] != SYNC:
+                nxt = buf.find(SYNC, pos + 1)
+                self.resyncs += 1
+                pos = n if nxt < 0 else nxt
+                continue
+            size = FRAME_SIZES.get(buf[pos + 1])
+            if size is None:
+                self.resyncs += 1
+                pos += 1
+                continue
+            if n - pos < size:
+                break
+            end = pos + size
+            if crc8(buf, pos + 1, end - 1) != buf[end - 1]:
+                self.crc_errors += 1
+                pos += 1
+                continue
+            frame = self._decode(buf, pos)
+            pos = end
+            self.frames += 1
+            out.append(frame)
+            fn = self.handlers.get(frame[0])
+            if fn is not None:
+                fn(frame[1], frame[2])
+        del buf[:pos]
+        return out
+
+    @staticmethod
+    def _decode(buf: bytearray, pos: int) -> Frame:
+        ftype = buf[pos + 1]
+        if ftype == T_CMD:
+            _, _, seq, s, t, flags = _CMD.unpack_from(buf, pos)
+            return ftype, seq, (dequantize(s), dequantize(t), flags)
+        if ftype == T_TELEM:
+            _, _, seq, mv, wheel, ax, ay, az, gx, gy, gz = _TELEM.unpack_from(buf, pos)
+            return ftype, seq, (mv / 1000.0, wheel / 1000.0, ax / 1000.0, ay / 1000.0, az / 1000.0,
+                                gx / 10.0, gy / 10.0, gz / 10.0)
+        _, _, seq, status = _ACK.unpack_from(buf, pos)
+        return ftype, seq, (status,)
@@ -0,0 +1,97 @@
+"""
+Telemetria do RC car (bateria, velocidade da roda, IMU) num ring buffer
+NumPy de tamanho fixo.
+
+A thread de leitura série faz append() de cada frame TELEM; as rotas Flask
+só leem (summary() / window()) e nunca tocam na porta. Uma linha por
+amostra: [t (epoch s), battery_v, wheel_speed, ax, ay, az, gx, gy, gz].
+O lock só protege a cópia das linhas pedidas, nunca I/O.
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+from apps.rc_serial_proto import TELEM_FIELDS
+
+# Amostras guardadas (a 50 Hz, 6000 = 2 minutos)
+TELEMETRY_SAMPLES = int(os.environ.get("RC_TELEMETRY_SAMPLES", "6000"))
+
+# Janela das médias de summary()
+SUMMARY_WINDOW_S = 1.0
+
+# Máximo de pontos devolvidos por window()
+WINDOW_MAX_POINTS = 2000
+
+
+class TelemetryRing:
+    def __init__(self, size: int = TELEMETRY_SAMPLES, fields: Sequence[str] = TELEM_FIELDS):
+        self.fields = tuple(fields)
+        self.size = max(1, size)
+        self.data = np.full((self.size, len(self.fields) + 1), np.nan)
+        self.count = 0          # total de amostras desde o arranque
+        self.lock = threading.Lock()
+
+    def append(self, values: Sequence[float], t: Optional[float] = None):
+        with self.lock:
+            row = self.data[self.count % self.size]
+            row[0] = time.time() if t is None else t
+            row[1:] = values
+            self.count += 1
+
+    def _last(self, n: int) -> np.ndarray:
+        """Cópia das últimas n linhas por ordem cronológica (com o lock)."""
+        end = self.count % self.size
+        if n <= end:
+            return self.data[end - n:end].copy()
+        return np.concatenate((self.data[self.size - (n - end):], self.data[:end]))
+
+    def since(self, seconds: float) -> np.ndarray:
+        """Amostras dos últimos `seconds` segundos (relativos à última amostra)."""
+        with self.lock:
+            n = min(self.count, self.size)
+            if n == 0:
+                return self.data[:0].copy()
+            # só a coluna do tempo (por ordem) para achar o corte
+            end = self.count % self.size
+            if self.count > self.size:
+                t = np.concatenate((self.data[end:, 0], self.data[:end, 0]))
+            else:
+                t = self.data[:n, 0]
+            k = n - int(np.searchsorted(t, t[-1] - seconds, side="left"))
+            return self._last(k)
+
+    def summary(self, seconds: float = SUMMARY_WINDOW_S) -> Dict[str, Any]:
+        rows = self.since(seconds)
+        if not len(rows):
+            return {"samples": self.count, "last": None}
+        last = rows[-1]
+        span = rows[-1, 0] - rows[0, 0]
+        return {
+            "samples": self.count,
+            "age_ms": round((time.time() - float(last[0])) * 1000.0, 1),
+            "rate_hz": round((len(rows) - 1) / float(span), 1) if span > 0 else None,
+            "last": {f: round(float(v), 3) for f, v in zip(self.fields, last[1:])},
+            "mean": {f: round(float(v), 3) for f, v in zip(self.fields, rows[:, 1:].mean(axis=0))},
+            "min_battery_v": round(float(rows[:, 1].min()), 3),
+        }
+
+    def window(self, seconds: float, points: int = 200) -> Dict[str, Any]:
+        """
+        Últimos `seconds` segundos reduzidos a no máximo `points` pontos
+        (média de blocos consecutivos com o mesmo nº de amostras).
+        """
+        rows = self.since(seconds)
+        points = max(1, min(points, WINDOW_MAX_POINTS))
+        n = len(rows)
+        if n > points:
+            edges = np.linspace(0, n, points + 1).astype(int)[:-1]
+            counts = np.diff(np.append(edges, n))[:, None]
+            rows = np.add.reduceat(rows, edges, axis=0) / counts
+        out: Dict[str, Any] = {"samples": n, "points": len(rows),
+                               "t": np.round(rows[:, 0], 3).tolist()}
+        for i, f in enumerate(self.fields, start=1):
+            out[f] = np.round(rows[:, i], 4).tolist()
+        return out
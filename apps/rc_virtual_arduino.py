@@ -0,0 +1,346 @@
+"""
+Arduino virtual do RC car num pseudo-terminal (Linux/macOS), para testar e
+medir o SerialBackend sem hardware.
+
+Cria um par pty e expõe o lado escravo (p.ex. /dev/pts/3) como a "porta
+COM" do carro; o firmware é emulado numa thread do lado mestre:
+
+  - reset ao abrir a porta (como o DTR do Arduino): durante reset_delay_s o
+    bootloader deita fora o que chega; no fim escreve um banner de texto
+    (o FrameReader do servidor tem de ressincronizar por cima dele)
+  - UART ao baud rate configurado: chegam no máximo baud/10 bytes por
+    segundo a um buffer de rx_buffer bytes (64 num ATmega) que o loop do
+    sketch esvazia a cada loop_ms; o que chega com o buffer cheio perde-se.
+    O resto fica no buffer do pty, e quando este enche o write() do
+    servidor bloqueia: é a contrapressão da porta série real
+  - comandos binários (apps/rc_serial_proto.py) ou ASCII "S:..;T:..",
+    aplicados ao fim de latency_ms (+ jitter_ms), com ACK se pedido
+  - failsafe: sem comandos durante failsafe_ms o throttle vai a 0
+  - telemetria TELEM a telemetry_hz (bateria com queda em carga, roda com
+    inércia, IMU coerente com throttle/steering)
+  - erros injetados: bits trocados por byte (error_rate, nos dois sentidos)
+    e ACKs perdidos (ack_drop_rate)
+
+Uso:
+    python -m apps.rc_virtual_arduino --latency-ms 5 --error-rate 0.001
+    (escreve a porta; depois POST /api/rc/serial {"port": "/dev/pts/N"})
+"""
+import argparse
+import os
+import random
+import select
+import threading
+import time
+import tty
+from collections import deque
+from typing import Any, Dict, Optional
+
+from apps import rc_serial_proto
+
+# Banner do sketch depois do reset
+BOOT_BANNER = b"RC car firmware READY\r\n"
+
+# Dinâmica do carro emulado
+MAX_SPEED = 3.0            # m/s com throttle = 1
+SPEED_TAU_S = 0.4          # constante de tempo da roda
+BATTERY_FULL_V = 8.4
+BATTERY_SAG_V = 0.6        # queda de tensão com throttle = 1
+BATTERY_DRAIN_V_S = 0.002  # descarga por segundo a throttle = 1
+
+# Comandos aplicados guardados (para medir latência ponta a ponta)
+APPLIED_HISTORY = 20000
+
+
+class VirtualArduino:
+    def __init__(self, baudrate: int = 115200, protocol: str = "binary",
+                 reset_delay_s: float = 1.5, telemetry_hz: float = 50.0,
+                 latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 error_rate: float = 0.0, ack_drop_rate: float = 0.0,
+                 rx_buffer: int = 64, loop_ms: float = 1.0, failsafe_ms: float = 500.0,
+                 seed: Optional[int] = None):
+        if protocol not in ("binary", "ascii"):
+            raise ValueError(f"protocolo série desconhecido: {protocol}")
+        self.baudrate = baudrate
+        self.protocol = protocol
+        self.reset_delay_s = reset_delay_s
+        self.telemetry_period = 1.0 / telemetry_hz if telemetry_hz > 0 else 0.0
+        self.latency_s = latency_ms / 1000.0
+        self.jitter_s = jitter_ms / 1000.0
+        self.error_rate = error_rate
+        self.ack_drop_rate = ack_drop_rate
+        self.rx_buffer = rx_buffer
+        self.loop_s = loop_ms / 1000.0
+        self.failsafe_s = failsafe_ms / 1000.0
+        self.rng = random.Random(seed)
+
+        self.master: Optional[int] = None
+        self.port: Optional[str] = None
+        self.running = False
+        self.connected = False
+        self._thread: Optional[threading.Thread] = None
+
+        self.reader = rc_serial_proto.FrameReader()
+        self.reader.on(rc_serial_proto.T_CMD, self._on_cmd)
+        self._line = bytearray()
+        self._pending = deque()         # (aplicar_em, steering, throttle, flags, seq)
+        self.applied = deque(maxlen=APPLIED_HISTORY)   # (perf_counter, steering, throttle)
+
+        # estado do "carro"
+        self.steering = 0.0
+        self.throttle = 0.0
+        self.speed = 0.0
+        self.battery = BATTERY_FULL_V
+        self._accel = 0.0
+
+        self.resets = 0
+        self.boot_discarded = 0
+        self.bytes_rx = 0
+        self.rx_overflow = 0
+        self.cmds_rx = 0
+        self.crc_errors_injected = 0
+        self.acks_tx = 0
+        self.acks_dropped = 0
+        self.telem_tx = 0
+        self.failsafe_trips = 0
+
+    # -----------------------
+    # CICLO DE VIDA
+    # -----------------------
+
+    def start(self) -> "VirtualArduino":
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        self.port = os.ttyname(slave)
+        # só o servidor fica com o lado escravo aberto: assim o mestre vê
+        # POLLHUP enquanto a porta está fechada e sabe quando é aberta (reset)
+        os.close(slave)
+        self.master = master
+        self.running = True
+        self._thread = threading.Thread(target=self._loop, name="rc-virtual-arduino", daemon=True)
+        self._thread.start()
+        print(f"[RC-VARD] Arduino virtual em {self.port} ({self.baudrate} baud, {self.protocol})")
+        return self
+
+    def stop(self):
+        self.running = False
+        if self._thread is not None:
+            self._thread.join(1.0)
+        if self.master is not None:
+            os.close(self.master)
+            self.master = None
+
+    # -----------------------
+    # FIRMWARE
+    # -----------------------
+
+    def _reset(self, now: float):
+        self.resets += 1
+        self._boot_until = now + self.reset_delay_s
+        self._banner_sent = False
+        self.reader = rc_serial_proto.FrameReader()
+        self.reader.on(rc_serial_proto.T_CMD, self._on_cmd)
+        self._line = bytearray()
+        self._pending.clear()
+        self.steering = self.throttle = self.speed = 0.0
+        self._last_cmd = now
+        self._next_telem = now + self.reset_delay_s
+
+    def _loop(self):
+        poller = select.poll()
+        poller.register(self.master, select.POLLIN)
+        byte_s = 10.0 / self.baudrate
+        carry = 0.0
+        last = time.perf_counter()
+        while self.running:
+            events = poller.poll(max(1, int(self.loop_s * 1000)))
+            now = time.perf_counter()
+            dt, last = now - last, now
+            if any(ev & select.POLLHUP for _, ev in events):
+                if self.connected:
+                    # o que o servidor escreveu antes de fechar já está no fio
+                    self._drain(now)
+                    self.connected = False
+                    print("[RC-VARD] Porta fechada pelo servidor")
+                time.sleep(0.01)
+                continue
+            if not self.connected:
+                self.connected = True
+                self._reset(now)
+                print("[RC-VARD] Porta aberta -> reset")
+
+            if not self._banner_sent and now >= self._boot_until:
+                self._banner_sent = True
+                self._write(BOOT_BANNER, inject=False)
+
+            # o fio entrega no máximo baud/10 bytes por segundo ao buffer da UART
+            if any(ev & select.POLLIN for _, ev in events):
+                carry = min(carry + dt / byte_s, 4096.0)
+                if carry >= 1.0:
+                    try:
+                        data = os.read(self.master, int(carry))
+                    except OSError:
+                        continue
+                    carry -= len(data)
+                    self._receive(data, now)
+            else:
+                carry = 0.0     # linha parada
+
+            self._apply_due(now)
+            self._update_car(now, dt)
+            if self.telemetry_period and self.protocol == "binary" and now >= self._next_telem:
+                self._next_telem = max(self._next_telem + self.telemetry_period, now)
+                self._send_telemetry()
+            # trabalho do sketch (servos, IMU...) entre leituras da UART
+            if self.loop_s:
+                time.sleep(self.loop_s)
+
+    def _drain(self, now: float):
+        """Lê e aplica o que ficou no pty quando o servidor fechou a porta."""
+        while True:
+            try:
+                data = os.read(self.master, self.rx_buffer)
+            except OSError:
+                break
+            if not data:
+                break
+            self._receive(data, now)
+        # o sketch continua a correr: os comandos em espera são aplicados
+        self._apply_due(time.perf_counter() + self.latency_s + self.jitter_s)
+
+    def _receive(self, data: bytes, now: float):
+        if now < self._boot_until:
+            self.boot_discarded += len(data)
+            return
+        self.bytes_rx += len(data)
+        # o loop só esvazia o buffer da UART uma vez por volta: o excesso perde-se
+        if len(data) > self.rx_buffer:
+            self.rx_overflow += len(data) - self.rx_buffer
+            data = data[:self.rx_buffer]
+        data = self._corrupt(data)
+        if self.protocol == "binary":
+            before = self.reader.crc_errors
+            self.reader.feed(data)
+            self.crc_errors_injected += self.reader.crc_errors - before
+            return
+        self._line += data
+        while True:
+            end = self._line.find(b"\n")
+            if end < 0:
+                break
+            raw = bytes(self._line[:end]).strip()
+            del self._line[:end + 1]
+            try:
+                s, t = (float(p.split(b":")[1]) for p in raw.split(b";"))
+            except (ValueError, IndexError):
+                continue
+            self._on_cmd(0, (s, t, 0))
+
+    def _corrupt(self, data: bytes) -> bytes:
+        if not self.error_rate or not data:
+            return data
+        out = bytearray(data)
+        for i in range(len(out)):
+            if self.rng.random() < self.error_rate:
+                out[i] ^= 1 << self.rng.randrange(8)
+        return bytes(out)
+
+    def _on_cmd(self, seq: int, fields: tuple):
+        steering, throttle, flags = fields
+        self.cmds_rx += 1
+        now = time.perf_counter()
+        self._last_cmd = now
+        delay = self.latency_s + (self.rng.uniform(0.0, self.jitter_s) if self.jitter_s else 0.0)
+        self._pending.append((now + delay, steering, throttle, flags, seq))
+
+    def _apply_due(self, now: float):
+        while self._pending and self._pending[0][0] <= now:
+            _, steering, throttle, flags, seq = self._pending.popleft()
+            if flags & rc_serial_proto.FLAG_STOP:
+                steering = throttle = 0.0
+            self.steering, self.throttle = steering, throttle
+            self.applied.append((time.perf_counter(), steering, throttle))
+            if flags & rc_serial_proto.FLAG_ACK_REQ:
+                if self.ack_drop_rate and self.rng.random() < self.ack_drop_rate:
+                    self.acks_dropped += 1
+                else:
+                    self._write(rc_serial_proto.encode_ack(seq))
+                    self.acks_tx += 1
+        if self.throttle and now - self._last_cmd > self.failsafe_s:
+            self.failsafe_trips += 1
+            self.throttle = 0.0
+            print("[RC-VARD] Failsafe: sem comandos -> throttle 0")
+
+    def _update_car(self, now: float, dt: float):
+        target = self.throttle * MAX_SPEED
+        prev = self.speed
+        self.speed += (target - self.speed) * min(1.0, dt / SPEED_TAU_S)
+        self._accel = (self.speed - prev) / dt if dt > 0 else 0.0
+        self.battery = max(6.0, self.battery - BATTERY_DRAIN_V_S * abs(self.throttle) * dt)
+
+    def _send_telemetry(self):
+        load_v = self.battery - BATTERY_SAG_V * abs(self.throttle)
+        yaw_rate = 90.0 * self.steering * self.speed / MAX_SPEED     # °/s
+        noise = self.rng.gauss
+        frame = rc_serial_proto.encode_telemetry(
+            self.telem_tx, load_v + noise(0, 0.01), self.speed,
+            (self._accel / 9.81 + noise(0, 0.01), 0.0 + noise(0, 0.01), 1.0 + noise(0, 0.01)),
+            (noise(0, 0.2), noise(0, 0.2), yaw_rate + noise(0, 0.2)))
+        self._write(frame)
+        self.telem_tx += 1
+
+    def _write(self, data: bytes, inject: bool = True):
+        if inject:
+            data = self._corrupt(data)
+        try:
+            os.write(self.master, data)
+        except OSError:
+            pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "port": self.port,
+            "connected": self.connected,
+            "resets": self.resets,
+            "boot_discarded": self.boot_discarded,
+            "bytes_rx": self.bytes_rx,
+            "rx_overflow": self.rx_overflow,
+            "cmds_rx": self.cmds_rx,
+            "crc_errors": self.reader.crc_errors,
+            "acks_tx": self.acks_tx,
+            "acks_dropped": self.acks_dropped,
+            "telem_tx": self.telem_tx,
+            "failsafe_trips": self.failsafe_trips,
+            "steering": round(self.steering, 3),
+            "throttle": round(self.throttle, 3),
+            "speed": round(self.speed, 3),
+            "battery_v": round(self.battery, 3),
+        }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Arduino virtual do RC car num pty")
+    ap.add_argument("--baud", type=int, default=115200)
+    ap.add_argument("--protocol", choices=("binary", "ascii"), default="binary")
+    ap.add_argument("--reset-delay", type=float, default=1.5)
+    ap.add_argument("--telemetry-hz", type=float, default=50.0)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0, help="probabilidade de erro por byte")
+    ap.add_argument("--ack-drop-rate", type=float, default=0.0)
+    ap.add_argument("--loop-ms", type=float, default=1.0)
+    args = ap.parse_args()
+
+    dev = VirtualArduino(args.baud, args.protocol, args.reset_delay, args.telemetry_hz,
+                         args.latency_ms, args.jitter_ms, args.error_rate, args.ack_drop_rate,
+                         loop_ms=args.loop_ms).start()
+    print(f"Porta: {dev.port}  (Ctrl+C para sair)")
+    try:
+        while True:
+            time.sleep(5)
+            print("[RC-VARD]", dev.get_stats())
+    except KeyboardInterrupt:
+        dev.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+"""
+Canal WebSocket de controlo do RC car (dashboard <-> RCCarController).
+
+Em vez de um POST HTTP por cada movimento dos sliders, o browser abre uma
+ligação persistente e manda mensagens binárias curtas que vão direitas ao
+rc_car; o servidor devolve o estado (com a telemetria) a STATUS_HZ.
+
+O servidor é um protocolo asyncio no loop partilhado (apps.layout_io), numa
+porta própria (RC_WS_PORT), para não prender o worker do gunicorn com
+ligações longas. Implementa só o que o dashboard usa do RFC 6455:
+handshake, frames mascaradas do cliente, fragmentação, ping/pong e close.
+
+O handshake só é aceite com um Origin do mesmo host que o pedido (Host,
+ou X-Forwarded-Host atrás do nginx; o dashboard é servido pelo Flask
+noutra porta) ou da lista
+RC_WS_ALLOWED_ORIGINS: sem isto qualquer página aberta no browser podia
+ligar-se e conduzir o carro (cross-site WebSocket hijacking).
+
+Mensagens binárias do browser (little-endian):
+    0x01 steering i16 | throttle i16   comando manual, [-1, 1] * 32767
+    0x02                               emergency stop
+    0x03 enabled u8                    autopilot on/off
+    0x04 id u32                        ping da aplicação -> 0x84 id u32
+Do servidor: texto JSON com rc_car.get_status() a STATUS_HZ e os pongs 0x84.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import socket
+import struct
+from typing import Any, Dict, Iterable, Optional, Set
+from urllib.parse import urlsplit
+
+from apps.layout_io import LayoutLoop, layout_io
+from apps.rc_car_core import rc_car
+from apps.rc_serial_proto import SCALE
+
+RC_WS_HOST = os.environ.get("RC_WS_HOST", "0.0.0.0")
+RC_WS_PORT = int(os.environ.get("RC_WS_PORT", "5006"))     # 0 = desligado
+RC_WS_PATH = "/rc"
+
+# URL pública quando há um proxy à frente (p.ex. "/rc-ws" no nginx);
+# vazio = ws://<mesmo host>:RC_WS_PORT/rc
+RC_WS_PUBLIC_URL = os.environ.get("RC_WS_PUBLIC_URL", "")
+
+# Origens extra aceites no handshake, separadas por vírgulas (p.ex.
+# "https://rocrail.example.com"); as páginas do mesmo host são sempre aceites
+RC_WS_ALLOWED_ORIGINS = [o for o in os.environ.get("RC_WS_ALLOWED_ORIGINS", "").split(",") if o.strip()]
+
+# Estado enviado aos browsers (vezes por segundo)
+STATUS_HZ = float(os.environ.get("RC_WS_STATUS_HZ", "10"))
+
+MAX_HANDSHAKE = 8192
+MAX_MESSAGE = 4096
+
+# Cliente lento: com mais do que isto por enviar salta-se o estado seguinte
+STATUS_MAX_BUFFER = 64 * 1024
+
+MSG_CONTROL = 0x01
+MSG_STOP = 0x02
+MSG_AUTOPILOT = 0x03
+MSG_PING = 0x04
+MSG_PONG = 0x84
+
+OP_CONT = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+_CONTROL = struct.Struct("<hh")
+
+
+def accept_key(key: str) -> str:
+    return base64.b64encode(hashlib.sha1(key.encode("ascii") + _GUID).digest()).decode("ascii")
+
+
+def encode_frame(opcode: int, payload: bytes = b"", mask: Optional[bytes] = None) -> bytes:
+    """Frame completa (FIN=1). mask só para clientes (benchmarks)."""
+    n = len(payload)
+    if n < 126:
+        head = struct.pack("!BB", 0x80 | opcode, n | (0x80 if mask else 0))
+    elif n < 65536:
+        head = struct.pack("!BBH", 0x80 | opcode, 126 | (0x80 if mask else 0), n)
+    else:
+        head = struct.pack("!BBQ", 0x80 | opcode, 127 | (0x80 if mask else 0), n)
+    if mask:
+        return head + mask + unmask(payload, mask)
+    return head + payload
+
+
+def unmask(payload: bytes, mask: bytes) -> bytes:
+    n = len(payload)
+    if not n:
+        return b""
+    key = int.from_bytes((mask * (n // 4 + 1))[:n], "big")
+    return (int.from_bytes(payload, "big") ^ key).to_bytes(n, "big")
+
+
+class RCWebSocket(asyncio.Protocol):
+    """Uma ligação de um browser (corre no loop)."""
+
+    def __init__(self, server: "RCWebSocketServer"):
+        self.server = server
+        self.transport: Optional[asyncio.Transport] = None
+        self.buf = bytearray()
+        self.open = False
+        self.controlled = False     # mandou comandos: ao cair pára o carro
+        self._frag_op = 0
+        self._frag = bytearray()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        sock = transport.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def connection_lost(self, exc):
+        self.server.clients.discard(self)
+        self.transport = None
+        if self.controlled:
+            print("[RC-WS] Ligação de controlo perdida -> STOP")
+            rc_car.emergency_stop()
+
+    def data_received(self, data: bytes):
+        self.buf += data
+        if not self.open and not self._handshake():
+            return
+        self._read_frames()
+
+    # -----------------------
+    # HANDSHAKE
+    # -----------------------
+
+    def _handshake(self) -> bool:
+        end = self.buf.find(b"\r\n\r\n")
+        if end < 0:
+            if len(self.buf) > MAX_HANDSHAKE:
+                self._reject("431 Request Header Fields Too Large")
+            return False
+        lines = bytes(self.buf[:end]).decode("latin-1").split("\r\n")
+        del self.buf[:end + 4]
+        parts = lines[0].split()
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        key = headers.get("sec-websocket-key")
+        if len(parts) < 2 or parts[0] != "GET" or parts[1].split("?")[0] != self.server.path:
+            self._reject("404 Not Found")
+            return False
+        if "websocket" not in headers.get("upgrade", "").lower() or not key:
+            self._reject("400 Bad Request")
+            return False
+        origin = headers.get("origin", "")
+        hosts = [headers.get("host", "")]
+        if "x-forwarded-host" in headers:
+            # atrás do proxy (nginx/appseed-app.conf) o host público vem aqui
+            hosts += headers["x-forwarded-host"].split(",")
+        if not any(self.server.origin_allowed(origin, host) for host in hosts):
+            self.server.rejected += 1
+            print(f"[RC-WS] Handshake recusado: Origin {origin or '(nenhum)'!r}")
+            self._reject("403 Forbidden")
+            return False
+        self.transport.write(
+            b"HTTP/1.1 101 Switching Protocols\r\n"
+            b"Upgrade: websocket\r\nConnection: Upgrade\r\n"
+            b"Sec-WebSocket-Accept: " + accept_key(key).encode("ascii") + b"\r\n\r\n")
+        self.open = True
+        self.server.clients.add(self)
+        self.server.connections += 1
+        return True
+
+    def _reject(self, status: str):
+        self.transport.write(f"HTTP/1.1 {status}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+                             .encode("latin-1"))
+        self.transport.close()
+
+    # -----------------------
+    # FRAMES
+    # -----------------------
+
+    def _read_frames(self):
+        buf = self.buf
+        while len(buf) >= 2 and self.transport is not None:
+            b0, b1 = buf[0], buf[1]
+            n = b1 & 0x7F
+            pos = 2
+            if n == 126:
+                if len(buf) < 4:
+                    return
+                n = int.from_bytes(buf[2:4], "big")
+                pos = 4
+            elif n == 127:
+                if len(buf) < 10:
+                    return
+                n = int.from_bytes(buf[2:10], "big")
+                pos = 10
+            if not b1 & 0x80:
+                self.close(1002)        # frames do cliente têm de vir mascaradas
+                return
+            if n > MAX_MESSAGE:
+                self.close(1009)
+                return
+            end = pos + 4 + n
+            if len(buf) < end:
+                return
+            payload = unmask(bytes(buf[pos + 4:end]), bytes(buf[pos:pos + 4]))
+            del buf[:end]
+            self._on_frame(bool(b0 & 0x80), b0 & 0x0F, payload)
+
+    def _on_frame(self, fin: bool, opcode: int, payload: bytes):
+        if opcode == OP_CLOSE:
+            self.close(1000)
+            return
+        if opcode == OP_PING:
+            self.send(OP_PONG, payload)
+            return
+        if opcode == OP_PONG:
+            return
+        if opcode != OP_CONT:
+            self._frag_op = opcode
+            self._frag = bytearray(payload)
+        else:
+            self._frag += payload
+            if len(self._frag) > MAX_MESSAGE:
+                self.close(1009)
+                return
+        if fin:
+            self._on_message(self._frag_op, bytes(self._frag))
+
+    def _on_message(self, opcode: int, data: bytes):
+        server = self.server
+        server.messages_rx += 1
+        if opcode != OP_BINARY or not data:
+            server.bad_messages += 1
+            return
+        kind = data[0]
+        if kind == MSG_CONTROL and len(data) >= 5:
+            steering, throttle = _CONTROL.unpack_from(data, 1)
+            self.controlled = True
+            server.control_rx += 1
+            rc_car.set_manual_command(steering / SCALE, throttle / SCALE)
+        elif kind == MSG_PING and len(data) >= 5:
+            self.send(OP_BINARY, bytes((MSG_PONG,)) + data[1:5])
+        elif kind == MSG_STOP:
+            rc_car.emergency_stop()
+        elif kind == MSG_AUTOPILOT and len(data) >= 2:
+            rc_car.enable_autopilot(bool(data[1]))
+        else:
+            server.bad_messages += 1
+
+    def send(self, opcode: int, payload: bytes):
+        if self.transport is not None:
+            self.transport.write(encode_frame(opcode, payload))
+
+    def close(self, code: int):
+        if self.transport is not None:
+            self.send(OP_CLOSE, struct.pack("!H", code))
+            self.transport.close()
+
+
+class RCWebSocketServer:
+    """Servidor no loop partilhado; start() é chamado no arranque da app."""
+
+    def __init__(self, io: LayoutLoop = layout_io, host: str = RC_WS_HOST,
+                 port: int = RC_WS_PORT, path: str = RC_WS_PATH, status_hz: float = STATUS_HZ,
+                 allowed_origins: Iterable[str] = RC_WS_ALLOWED_ORIGINS, enabled: bool = True):
+        self.io = io
+        self.enabled = enabled
+        self.host = host
+        self.port = port
+        self.path = path
+        self.status_period = 1.0 / status_hz
+        self.allowed_origins = {o.strip().rstrip("/").lower() for o in allowed_origins}
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.clients: Set[RCWebSocket] = set()
+        self.last_error: Optional[str] = None
+        self._status_task: Optional[asyncio.Task] = None
+        self.connections = 0
+        self.rejected = 0
+        self.messages_rx = 0
+        self.control_rx = 0
+        self.bad_messages = 0
+        self.status_tx = 0
+        self.status_skipped = 0
+
+    @property
+    def listening(self) -> bool:
+        return self.server is not None
+
+    def origin_allowed(self, origin: str, host: str) -> bool:
+        """
+        Origin do mesmo host que o header Host (a porta pode ser outra) ou da
+        lista allowed_origins. Sem Origin (cliente que não é um browser) é
+        recusado também.
+        """
+        origin = origin.strip().rstrip("/").lower()
+        if not origin or origin == "null":
+            return False
+        if origin in self.allowed_origins:
+            return True
+        try:
+            origin_host = urlsplit(origin).hostname
+            host_name = urlsplit("//" + host.strip()).hostname
+        except ValueError:
+            return False
+        return origin_host is not None and origin_host == host_name
+
+    def start(self) -> "RCWebSocketServer":
+        """Abre a porta (idempotente; port=0 escolhe uma porta livre)."""
+        if self.server is not None or not self.enabled:
+            return self
+        try:
+            self.io.call(self._start())
+        except (OSError, TimeoutError) as e:
+            self.last_error = str(e)
+            print(f"[RC-WS] Não foi possível escutar em {self.host}:{self.port}: {e}")
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.io.call(self._stop())
+
+    async def _start(self):
+        loop = asyncio.get_running_loop()
+        self.server = await loop.create_server(lambda: RCWebSocket(self), self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]   # port=0 -> porta livre
+        self._status_task = asyncio.ensure_future(self._status_loop())
+        print(f"[RC-WS] A escutar em ws://{self.host}:{self.port}{self.path}")
+
+    async def _stop(self):
+        self._status_task.cancel()
+        self.server.close()
+        for c in list(self.clients):
+            c.close(1001)
+        self.server = None
+
+    async def _status_loop(self):
+        while True:
+            await asyncio.sleep(self.status_period)
+            if not self.clients:
+                continue
+            frame = encode_frame(OP_TEXT, json.dumps(rc_car.get_status()).encode("utf-8"))
+            for c in list(self.clients):
+                t = c.transport
+                if t is None:
+                    continue
+                if t.get_write_buffer_size() > STATUS_MAX_BUFFER:
+                    self.status_skipped += 1
+                    continue
+                t.write(frame)
+                self.status_tx += 1
+
+    def public_url(self) -> str:
+        """
+        URL para o dashboard: RC_WS_PUBLIC_URL se definida, senão ":porta/rc"
+        (o browser junta ws://<host>); "" se o canal não está ligado.
+        """
+        if RC_WS_PUBLIC_URL:
+            return RC_WS_PUBLIC_URL
+        return f":{self.port}{self.path}" if self.listening else ""
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "listening": self.listening,
+            "port": self.port,
+            "path": self.path,
+            "last_error": self.last_error,
+            "clients": len(self.clients),
+            "connections": self.connections,
+            "rejected": self.rejected,
+            "messages_rx": self.messages_rx,
+            "control_rx": self.control_rx,
+            "bad_messages": self.bad_messages,
+            "status_tx": self.status_tx,
+            "status_skipped": self.status_skipped,
+        }
+
+
+# Instância global (arrancada por create_app; RC_WS_PORT=0 desliga o canal)
+rc_ws = RCWebSocketServer(enabled=RC_WS_PORT != 0)
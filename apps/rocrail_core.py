@@ -1,6 +1,13 @@
-import socket
-import threading
+import re
 import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from apps.layout_io import StreamConnection, layout_io
+from apps.rocrail_metrics import CommandLatencyTracker, parse_attrs
+from apps.rocrail_ramp import SpeedRampEngine
+
+# Eventos de estado que o Rocrail envia e que passamos aos listeners
+_EVENT_RE = re.compile(r"<(lc|fn|sw|bk|fb)\b([^>]*)/?>")
 
 # Ajusta estes valores para o teu Rocrail
 ROCRAIL_HOST = "localhost"   # ou IP do PC onde corre o Rocrail
@@ -8,43 +15,137 @@ ROCRAIL_PORT = 8051          # porta de serviço configurada no Rocrail
 LOCO_DEFAULT = "ICE1"        # muda para um ID de loco que exista no Rocrail
 
 
+class RocrailConnection(StreamConnection):
+    """
+    Ligação de serviço ao Rocrail no loop partilhado (apps.layout_io):
+    mantém-se aberta sozinha e entrega os eventos de estado ao cliente.
+    """
+
+    tag = "Rocrail"
+
+    def __init__(self, client: "RocrailClient", host: str, port: int):
+        super().__init__(layout_io, host, port, reconnect=True)
+        self.client = client
+        self._buf = ""
+
+    def on_connected(self):
+        self._buf = ""
+        super().on_connected()
+
+    def data_received(self, data: bytes):
+        """
+        Lê os eventos de estado que o Rocrail devolve (<lc>, <fn>, <sw>...)
+        e passa-os ao tracker de latência para confirmar comandos pendentes.
+        """
+        received_at = time.perf_counter()
+        buf = self._buf + data.decode("utf-8", errors="replace")
+        # só processa até à última tag completa; o resto fica no buffer
+        cut = buf.rfind(">") + 1
+        if cut:
+            self.client._dispatch_events(buf[:cut], received_at)
+            buf = buf[cut:]
+        self._buf = buf
+
+
 class RocrailClient:
     def __init__(self, host=ROCRAIL_HOST, port=ROCRAIL_PORT):
         self.host = host
         self.port = port
-        self.sock = None
-        self.lock = threading.Lock()
-        self._connect_thread = threading.Thread(target=self._ensure_connected, daemon=True)
-        self._connect_thread.start()
-
-    def _ensure_connected(self):
-        """Tenta manter a ligação TCP ao Rocrail sempre aberta."""
-        while True:
-            if self.sock is None:
+        # Latência comando -> confirmação do Rocrail, por tipo de comando
+        self.metrics = CommandLatencyTracker()
+        # Callbacks (tag, attrs) chamados para cada evento recebido (na thread do loop)
+        self.listeners: List[Callable[[str, Dict[str, str]], None]] = []
+        # Rampas de velocidade (uma thread para todas as locos)
+        self.ramps = SpeedRampEngine(self.send_batch)
+        # Ligação TCP no loop partilhado; só arranca em start() (não no import)
+        self.conn = RocrailConnection(self, host, port)
+        self._started = False
+
+    def start(self):
+        """Arranca a ligação (com religação automática) no loop partilhado."""
+        if not self._started:
+            self._started = True
+            self.conn.start()
+
+    @property
+    def connected(self) -> bool:
+        return self.conn.connected
+
+    def _ready(self) -> bool:
+        """
+        Arranca a ligação se preciso e diz se há ligação. Se a primeira
+        tentativa ainda está em curso (arranque lazy no primeiro comando)
+        espera por ela em vez de descartar o comando.
+        """
+        self.start()
+        return self.conn.wait_connected()
+
+    def _dispatch_events(self, xml_text: str, received_at: float):
+        for m in _EVENT_RE.finditer(xml_text):
+            tag, attrs = m.group(1), parse_attrs(m.group(2))
+            if tag in ("lc", "fn", "sw"):
+                self.metrics.on_event(tag, attrs, received_at)
+            if tag == "lc" and attrs.get("id") and "V" in attrs:
+                # V atual da loco, de onde parte a próxima rampa
                 try:
-                    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    s.connect((self.host, self.port))
-                    self.sock = s
-                    print(f"[Rocrail] Ligado a {self.host}:{self.port}")
+                    self.ramps.note_speed(attrs["id"], int(float(attrs["V"])))
+                except ValueError:
+                    pass
+            for cb in self.listeners:
+                try:
+                    cb(tag, attrs)
                 except Exception as e:
-                    print(f"[Rocrail] Erro a ligar: {e}, a tentar de novo em 3s...")
-                    self.sock = None
-                    time.sleep(3)
-            time.sleep(1)
+                    print("[Rocrail] Erro num listener:", e)
+
+    def add_listener(self, callback: Callable[[str, Dict[str, str]], None]):
+        """Regista um callback para eventos do Rocrail (<lc>, <sw>, <bk>, <fb>...)."""
+        if callback not in self.listeners:
+            self.listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[str, Dict[str, str]], None]):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
 
     def send_xml(self, xml_str: str):
         """Envia comando XML simples para o Rocrail (terminado com newline)."""
         xml_str = xml_str.strip() + "\n"
-        with self.lock:
-            if self.sock is None:
-                print("[Rocrail] Sem ligação, comando descartado:", xml_str.strip())
-                return
-            try:
-                print("[Rocrail] ?", xml_str.strip())
-                self.sock.sendall(xml_str.encode("utf-8"))
-            except Exception as e:
-                print("[Rocrail] Erro ao enviar:", e)
-                self.sock = None  # força reconexão
+        if not self._ready():
+            print("[Rocrail] Sem ligação, comando descartado:", xml_str.strip())
+            return
+        print("[Rocrail] ?", xml_str.strip())
+        # registado antes de agendar a escrita: a resposta pode chegar (na
+        # thread do loop) antes de esta thread voltar de send()
+        self.metrics.on_sent(xml_str)
+        self.conn.send(xml_str.encode("utf-8"))
+
+    def send_batch(self, xml_list: List[str]) -> bool:
+        """
+        Envia vários comandos XML numa única escrita no socket, por isso
+        nenhum outro comando se intercala no meio do lote.
+        Devolve True se o lote foi enviado, False se foi descartado.
+        """
+        if not xml_list:
+            return True
+        payload = "".join(x.strip() + "\n" for x in xml_list)
+        if not self._ready():
+            print(f"[Rocrail] Sem ligação, lote de {len(xml_list)} comandos descartado")
+            return False
+        print(f"[Rocrail] ? lote de {len(xml_list)} comandos")
+        sent_at = time.perf_counter()
+        for xml_str in xml_list:
+            self.metrics.on_sent(xml_str, sent_at)
+        return self.conn.send(payload.encode("utf-8"))
+
+    def send_commands(self, items: List[Dict[str, Any]]) -> bool:
+        """Envia operações no formato de build_command() num único lote."""
+        xml_list = [build_command(it) for it in items]
+        # tal como set_speed/stop_loco: um V direto cancela a rampa da loco
+        for it in items:
+            op = it.get("op")
+            if op in ("go", "speed", "stop"):
+                self.ramps.cancel(it["loco_id"])
+                self.ramps.note_speed(it["loco_id"], 0 if op == "stop" else int(it.get("speed", 40)))
+        return self.send_batch(xml_list)
 
     def set_switch(self, switch_id: str, cmd: str = "straight"):
         """
@@ -75,12 +176,33 @@ class RocrailClient:
 
     # Helpers de alto nível
     def stop_loco(self, loco_id=LOCO_DEFAULT):
+        self.ramps.cancel(loco_id)
+        self.ramps.note_speed(loco_id, 0)
         self.send_xml(f'<lc id="{loco_id}" cmd="stop"/>')
 
     def set_speed(self, loco_id=LOCO_DEFAULT, speed=40):
-        # speed em percentagem (0-100)
+        # speed em percentagem (0-100); um V direto cancela a rampa em curso
+        self.ramps.cancel(loco_id)
+        self.ramps.note_speed(loco_id, speed)
         self.send_xml(f'<lc id="{loco_id}" V="{speed}"/>')
 
+    def ramp_speed(self, loco_id: str = LOCO_DEFAULT, speed: int = 40,
+                   duration_s: float = 2.0, curve: str = "linear"):
+        """
+        Leva a loco até `speed` de forma suave em `duration_s` segundos,
+        com os V intermédios gerados no servidor (ver SpeedRampEngine).
+        """
+        return self.ramps.start_ramp(loco_id, speed, duration_s, curve)
+
+    def emergency_stop(self, loco_ids: List[str] = None):
+        """
+        Cancela todas as rampas e pára, num só lote, as locos indicadas (ou a
+        default) e todas as que estavam a meio de uma rampa.
+        """
+        stop = list(loco_ids or [LOCO_DEFAULT])
+        stop += [loco_id for loco_id in self.ramps.cancel_all() if loco_id not in stop]
+        return self.send_commands([{"op": "stop", "loco_id": loco_id} for loco_id in stop])
+
     def go_loco(self, loco_id=LOCO_DEFAULT, speed=40):
         self.set_speed(loco_id, speed)
 
@@ -103,5 +225,104 @@ class RocrailClient:
         self.send_xml(f'<lc id="{loco_id}" {attr_name}="{val}"/>')
 
 
-# Instância global para usar nas routes
+# ---------------------------------------------------
+# LOTES DE COMANDOS (várias locos/agulhas num só pedido)
+# ---------------------------------------------------
+
+BATCH_MAX_ITEMS = 200
+BATCH_OPS = ("go", "speed", "stop", "direction", "function", "switch")
+
+
+def _int_field(item: Dict[str, Any], name: str, default: int) -> int:
+    try:
+        return int(item.get(name, default))
+    except (ValueError, TypeError):
+        raise ValueError(f"{name} não é um inteiro: {item.get(name)!r}") from None
+
+
+def build_command(item: Dict[str, Any]) -> str:
+    """
+    Converte uma operação do lote em XML Rocrail.
+    Lança ValueError se a operação for inválida.
+
+    Operações suportadas:
+      { "op": "go",        "loco_id": "ICE1", "speed": 40 }
+      { "op": "stop",      "loco_id": "ICE1" }
+      { "op": "direction", "loco_id": "ICE1", "direction": "fwd" | "rev" }
+      { "op": "function",  "loco_id": "ICE1", "fn_no": 0, "state": true }
+      { "op": "switch",    "id": "SW1", "cmd": "straight" | "turnout" }
+    """
+    if not isinstance(item, dict):
+        raise ValueError("item tem de ser um objeto JSON")
+
+    op = (item.get("op") or "").lower()
+    if op not in BATCH_OPS:
+        raise ValueError(f"op desconhecida: {op or '(vazia)'}")
+
+    if op == "switch":
+        sw_id = item.get("id")
+        if not sw_id:
+            raise ValueError("id em falta")
+        cmd = (item.get("cmd") or "straight").lower()
+        if cmd not in ("straight", "turnout"):
+            raise ValueError(f"cmd inválido: {cmd}")
+        return f'<sw id="{sw_id}" cmd="{cmd}"/>'
+
+    loco_id = item.get("loco_id")
+    if not loco_id:
+        raise ValueError("loco_id em falta")
+
+    if op in ("go", "speed"):
+        speed = _int_field(item, "speed", 40)
+        if not 0 <= speed <= 100:
+            raise ValueError(f"speed fora de 0..100: {speed}")
+        return f'<lc id="{loco_id}" V="{speed}"/>'
+
+    if op == "stop":
+        return f'<lc id="{loco_id}" cmd="stop"/>'
+
+    if op == "direction":
+        direction = item.get("direction", "fwd")
+        if direction not in ("fwd", "rev"):
+            raise ValueError(f"direction inválida: {direction}")
+        dir_str = "false" if direction == "rev" else "true"
+        return f'<lc id="{loco_id}" dir="{dir_str}"/>'
+
+    # op == "function"
+    fn_no = _int_field(item, "fn_no", 0)
+    if fn_no < 0:
+        raise ValueError(f"fn_no inválido: {fn_no}")
+    val = "true" if bool(item.get("state", True)) else "false"
+    return f'<lc id="{loco_id}" f{fn_no}="{val}"/>'
+
+
+def build_batch(items: List[Any]) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """
+    Valida todas as operações do lote de uma vez.
+    Devolve (lista de XML, resultados por item). Se algum item falhar,
+    a lista de XML vem vazia para que nada seja enviado (tudo ou nada) e os
+    itens válidos ficam "skipped" (não foram enviados).
+    """
+    xml_list: List[str] = []
+    results: List[Dict[str, Any]] = []
+    ok = True
+
+    for idx, item in enumerate(items):
+        try:
+            xml_list.append(build_command(item))
+            results.append({"index": idx, "status": "ok"})
+        except (ValueError, TypeError) as e:
+            ok = False
+            results.append({"index": idx, "status": "error", "error": str(e)})
+
+    if not ok:
+        for r in results:
+            if r["status"] == "ok":
+                r["status"] = "skipped"
+        return [], results
+    return xml_list, results
+
+
+# Instância global para usar nas routes (a ligação arranca em create_app()
+# ou no primeiro comando, não no import)
 rocrail = RocrailClient()
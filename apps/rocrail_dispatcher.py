@@ -0,0 +1,436 @@
+import heapq
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from apps.rocrail_graph import BlockGraph, get_block_graph
+
+
+# Blocos reservados à frente de cada comboio
+LOOKAHEAD_BLOCKS = 2
+
+# Velocidade (%) com que um comboio anda quando tem caminho reservado
+CRUISE_SPEED = 40
+
+
+class Train:
+    """Estado de um comboio gerido pelo dispatcher."""
+
+    __slots__ = ("loco_id", "route", "loop", "pos", "ahead", "behind",
+                 "speed", "cruise_speed", "laps", "moves", "finished")
+
+    def __init__(self, loco_id: str, route: List[str], loop: bool, cruise_speed: int):
+        self.loco_id = loco_id
+        self.route = route
+        self.loop = loop
+        self.pos = 0                 # índice em route do bloco onde está a frente do comboio
+        self.ahead: List[str] = []   # blocos reservados à frente, por ordem
+        self.behind: List[str] = []  # blocos já deixados mas ainda ocupados
+        self.speed = 0
+        self.cruise_speed = cruise_speed
+        self.laps = 0
+        self.moves = 0
+        self.finished = False
+
+    @property
+    def head(self) -> str:
+        return self.route[self.pos]
+
+    def next_index(self, offset: int) -> Optional[int]:
+        idx = self.pos + offset
+        if idx < len(self.route):
+            return idx
+        if self.loop and len(self.route) > 1:
+            return idx % len(self.route)
+        return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "loco_id": self.loco_id,
+            "head": self.head,
+            "route": self.route,
+            "loop": self.loop,
+            "ahead": list(self.ahead),
+            "behind": list(self.behind),
+            "speed": self.speed,
+            "laps": self.laps,
+            "moves": self.moves,
+            "finished": self.finished,
+        }
+
+
+class BlockDispatcher:
+    """
+    Dispatcher por reserva de blocos.
+
+    Cada comboio segue uma rota (lista de blocos). O dispatcher reserva até
+    `lookahead` blocos livres à frente de cada comboio, posiciona as agulhas
+    do caminho e dá velocidade; se o bloco seguinte não estiver livre, pára
+    o comboio até ser libertado. Assim vários comboios circulam ao mesmo
+    tempo sem nunca partilharem um bloco.
+
+    Tudo é orientado a eventos e incremental: uma mudança de ocupação só
+    reavalia o comboio que entrou/saiu do bloco e os comboios que estavam
+    à espera desse bloco.
+
+    Os comandos saem pelo `commander`, que recebe uma lista de operações no
+    formato de rocrail_core.build_command() (enviadas num único lote).
+    """
+
+    def __init__(self, graph: BlockGraph,
+                 commander: Optional[Callable[[List[Dict[str, Any]]], Any]] = None,
+                 lookahead: int = LOOKAHEAD_BLOCKS,
+                 cruise_speed: int = CRUISE_SPEED):
+        self.graph = graph
+        self.commander = commander
+        self.lookahead = max(1, lookahead)
+        self.cruise_speed = cruise_speed
+        self.lock = threading.RLock()
+
+        self.trains: Dict[str, Train] = {}
+        self.occupied: Dict[str, Set[str]] = {}   # bloco -> fontes que o veem ocupado
+        self.reserved_by: Dict[str, str] = {}     # bloco -> loco_id
+        self.waiting: Dict[str, Set[str]] = {}    # bloco -> locos à espera dele
+
+        self.decisions = 0
+        self.last_decision_ms = 0.0
+        self.max_decision_ms = 0.0
+
+    # -----------------------
+    # COMBOIOS
+    # -----------------------
+
+    def add_train(self, loco_id: str, route: List[str], loop: bool = True,
+                  cruise_speed: Optional[int] = None) -> Train:
+        """
+        Coloca um comboio sob controlo do dispatcher.
+        route[0] é o bloco onde o comboio está agora.
+        """
+        if not route:
+            raise ValueError("route vazia")
+        unknown = [b for b in route if b not in self.graph.block_cells]
+        if unknown:
+            raise ValueError(f"blocos desconhecidos: {', '.join(unknown)}")
+        for a, b in zip(route, route[1:] + (route[:1] if loop else [])):
+            if a != b and self.graph.edge(a, b) is None:
+                raise ValueError(f"blocos não ligados: {a} -> {b}")
+
+        with self.lock:
+            if loco_id in self.trains:
+                self.remove_train(loco_id)
+            owner = self.reserved_by.get(route[0])
+            if owner is not None and owner != loco_id:
+                raise ValueError(f"bloco {route[0]} reservado por {owner}")
+
+            train = Train(loco_id, list(route), loop,
+                          self.cruise_speed if cruise_speed is None else cruise_speed)
+            self.trains[loco_id] = train
+            self.reserved_by[route[0]] = loco_id
+            self._run([train])
+            return train
+
+    def set_graph(self, graph: BlockGraph):
+        """
+        Passa a usar o grafo de uma versão nova do plano. Os comboios cuja
+        rota deixou de existir (blocos ou ligações removidos) são parados e
+        retirados; os outros continuam com as reservas que tinham.
+        """
+        with self.lock:
+            self.graph = graph
+            for loco_id, train in list(self.trains.items()):
+                route = train.route
+                closing = route[:1] if train.loop else []
+                if (any(b not in graph.block_cells for b in route) or
+                        any(a != b and graph.edge(a, b) is None
+                            for a, b in zip(route, route[1:] + closing))):
+                    print(f"[DISPATCHER] Rota de {loco_id} já não existe no plano, comboio retirado")
+                    self.remove_train(loco_id)
+
+    def remove_train(self, loco_id: str):
+        """Retira o comboio do dispatcher, pára-o e liberta as reservas."""
+        with self.lock:
+            train = self.trains.pop(loco_id, None)
+            if train is None:
+                return
+            commands: List[Dict[str, Any]] = []
+            if train.speed:
+                commands.append({"op": "stop", "loco_id": loco_id})
+                train.speed = 0
+            for waiters in self.waiting.values():
+                waiters.discard(loco_id)
+            released = [b for b, owner in self.reserved_by.items() if owner == loco_id]
+            for b in released:
+                del self.reserved_by[b]
+            self._send(commands)
+            self._run(self._waiters_of(released))
+
+    # -----------------------
+    # OCUPAÇÃO (YOLO / ROCRAIL)
+    # -----------------------
+
+    def set_occupancy(self, block_id: str, occupied: bool, source: str = "yolo"):
+        """Atualiza a ocupação de um bloco vista por uma fonte (yolo, rocrail...)."""
+        with self.lock:
+            sources = self.occupied.setdefault(block_id, set())
+            was_occupied = bool(sources)
+            if occupied:
+                sources.add(source)
+            else:
+                sources.discard(source)
+            now_occupied = bool(sources)
+            if was_occupied == now_occupied:
+                return
+
+            affected: List[Train] = []
+            owner = self.reserved_by.get(block_id)
+            train = self.trains.get(owner) if owner else None
+
+            if now_occupied and train is not None and train.ahead and train.ahead[0] == block_id:
+                # o comboio entrou no bloco seguinte reservado
+                affected.append(train)
+                affected.extend(self._advance(train))
+            elif not now_occupied and train is not None and block_id in train.behind:
+                # a cauda do comboio saiu do bloco anterior
+                train.behind.remove(block_id)
+                del self.reserved_by[block_id]
+                affected.extend(self._waiters_of([block_id]))
+            elif not now_occupied and owner is None:
+                affected.extend(self._waiters_of([block_id]))
+
+            self._run(affected)
+
+    def on_rocrail_event(self, tag: str, attrs: Dict[str, str]):
+        """Listener para RocrailClient: eventos <bk occ="true|false"/>."""
+        if tag != "bk" or "occ" not in attrs or not attrs.get("id"):
+            return
+        self.set_occupancy(attrs["id"], attrs["occ"] == "true", source="rocrail")
+
+    # -----------------------
+    # LÓGICA INTERNA
+    # -----------------------
+
+    def _is_free_for(self, block_id: str, loco_id: str) -> bool:
+        owner = self.reserved_by.get(block_id)
+        if owner is not None:
+            return owner == loco_id
+        return not self.occupied.get(block_id)
+
+    def _advance(self, train: Train) -> List[Train]:
+        """Move a frente do comboio para o bloco seguinte; devolve comboios a reavaliar."""
+        prev = train.head
+        train.ahead.pop(0)
+        nxt = train.next_index(1)
+        train.pos = nxt if nxt is not None else train.pos
+        train.moves += 1
+        if train.pos == 0 and train.loop:
+            train.laps += 1
+        if prev != train.head:
+            if self.occupied.get(prev):
+                train.behind.append(prev)
+            elif self.reserved_by.get(prev) == train.loco_id:
+                del self.reserved_by[prev]
+                return [t for t in self._waiters_of([prev]) if t is not train]
+        return []
+
+    def _waiters_of(self, blocks: List[str]) -> List[Train]:
+        out: List[Train] = []
+        for b in blocks:
+            for loco_id in self.waiting.pop(b, set()):
+                t = self.trains.get(loco_id)
+                if t is not None and t not in out:
+                    out.append(t)
+        return out
+
+    def _run(self, trains: List[Train]):
+        """Reavalia os comboios afetados e envia os comandos resultantes num lote."""
+        if not trains:
+            return
+        t0 = time.perf_counter()
+        commands: List[Dict[str, Any]] = []
+        for train in trains:
+            self._extend(train, commands)
+        self._send(commands)
+
+        elapsed_ms = (time.perf_counter() - t0) * 1000.0
+        self.decisions += 1
+        self.last_decision_ms = elapsed_ms
+        self.max_decision_ms = max(self.max_decision_ms, elapsed_ms)
+
+    def _extend(self, train: Train, commands: List[Dict[str, Any]]):
+        """Reserva blocos à frente do comboio e ajusta a velocidade."""
+        if train.loco_id not in self.trains:
+            return
+
+        # reservar enquanto houver blocos livres, até ao lookahead
+        while len(train.ahead) < self.lookahead:
+            idx = train.next_index(len(train.ahead) + 1)
+            if idx is None:
+                break
+            block_id = train.route[idx]
+            if block_id == train.head or block_id in train.ahead:
+                break  # rota mais curta que o lookahead
+            if not self._is_free_for(block_id, train.loco_id):
+                self.waiting.setdefault(block_id, set()).add(train.loco_id)
+                break
+            prev = train.ahead[-1] if train.ahead else train.head
+            edge = self.graph.edge(prev, block_id)
+            self.reserved_by[block_id] = train.loco_id
+            train.ahead.append(block_id)
+            if edge is not None:
+                for sw_id, cmd in edge.switches:
+                    commands.append({"op": "switch", "id": sw_id, "cmd": cmd})
+
+        if train.ahead:
+            target = train.cruise_speed
+        else:
+            target = 0
+            if train.next_index(1) is None:
+                train.finished = True
+
+        if target != train.speed:
+            train.speed = target
+            if target:
+                commands.append({"op": "go", "loco_id": train.loco_id, "speed": target})
+            else:
+                commands.append({"op": "stop", "loco_id": train.loco_id})
+
+    def _send(self, commands: List[Dict[str, Any]]):
+        if commands and self.commander is not None:
+            try:
+                self.commander(commands)
+            except Exception as e:
+                print("[DISPATCHER] Erro a enviar comandos:", e)
+
+    def get_status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "lookahead": self.lookahead,
+                "trains": [t.to_dict() for t in self.trains.values()],
+                "reserved": dict(self.reserved_by),
+                "occupied": {b: sorted(s) for b, s in self.occupied.items() if s},
+                "waiting": {b: sorted(s) for b, s in self.waiting.items() if s},
+                "decisions": self.decisions,
+                "last_decision_ms": self.last_decision_ms,
+                "max_decision_ms": self.max_decision_ms,
+            }
+
+
+# ---------------------------------------------------
+# SIMULAÇÃO
+# ---------------------------------------------------
+
+def simulate(graph: BlockGraph, trains: List[Dict[str, Any]],
+             duration_s: float = 3600.0, block_time_s: float = 20.0,
+             clear_time_s: float = 3.0, restart_s: float = 2.0,
+             lookahead: int = LOOKAHEAD_BLOCKS) -> Dict[str, Any]:
+    """
+    Simula o dispatcher num plano sem hardware e devolve o débito.
+
+    trains: [{ "loco_id": "ICE1", "route": ["B1", "B2", ...], "loop": true }, ...]
+    Cada comboio demora block_time_s a atravessar um bloco e clear_time_s até
+    a cauda sair do bloco anterior; arrancar depois de parado custa restart_s.
+    """
+    commanded: Dict[str, int] = {}
+
+    def commander(items: List[Dict[str, Any]]):
+        for it in items:
+            if it["op"] == "go":
+                commanded[it["loco_id"]] = it["speed"]
+            elif it["op"] == "stop":
+                commanded[it["loco_id"]] = 0
+
+    disp = BlockDispatcher(graph, commander=commander, lookahead=lookahead)
+
+    events: List[Any] = []   # (tempo, seq, tipo, loco_id, bloco)
+    seq = 0
+    ready_at: Dict[str, float] = {}   # instante em que chega ao fim do bloco atual
+    scheduled: Set[str] = set()
+    waited_s: Dict[str, float] = {}
+    stopped_since: Dict[str, float] = {}
+
+    def schedule(now: float):
+        nonlocal seq
+        for loco_id, train in disp.trains.items():
+            if loco_id in scheduled or train.finished:
+                continue
+            if commanded.get(loco_id, 0) and train.ahead:
+                start = max(now, ready_at[loco_id])
+                since = stopped_since.pop(loco_id, None)
+                if since is not None and now > since:
+                    # chegou ao fim do bloco antes de ter caminho: parou de facto
+                    waited_s[loco_id] = waited_s.get(loco_id, 0.0) + (now - since)
+                    start += restart_s
+                seq += 1
+                heapq.heappush(events, (start, seq, "enter", loco_id, train.ahead[0]))
+                scheduled.add(loco_id)
+            elif loco_id not in stopped_since:
+                stopped_since[loco_id] = max(now, ready_at[loco_id])
+
+    # marcar primeiro todos os blocos de partida como ocupados, para que
+    # nenhum comboio reserve o bloco onde outro está parado
+    for spec in trains:
+        disp.set_occupancy(spec["route"][0], True, source="sim")
+    for spec in trains:
+        train = disp.add_train(spec["loco_id"], list(spec["route"]), loop=spec.get("loop", True))
+        ready_at[train.loco_id] = block_time_s
+
+    schedule(0.0)
+    now = 0.0
+    while events:
+        now, _, kind, loco_id, block_id = heapq.heappop(events)
+        if now > duration_s:
+            break
+        train = disp.trains[loco_id]
+        if kind == "enter":
+            scheduled.discard(loco_id)
+            prev = train.head
+            disp.set_occupancy(block_id, True, source="sim")
+            ready_at[loco_id] = now + block_time_s
+            seq += 1
+            heapq.heappush(events, (now + clear_time_s, seq, "clear", loco_id, prev))
+        else:
+            disp.set_occupancy(block_id, False, source="sim")
+        schedule(now)
+
+    laps = {t.loco_id: t.laps for t in disp.trains.values()}
+    moves = sum(t.moves for t in disp.trains.values())
+    hours = duration_s / 3600.0
+    return {
+        "duration_s": duration_s,
+        "trains": len(disp.trains),
+        "laps": laps,
+        "trains_per_hour": sum(laps.values()) / hours if hours else 0.0,
+        "block_moves_per_hour": moves / hours if hours else 0.0,
+        "wait_s": waited_s,
+        "decisions": disp.decisions,
+        "max_decision_ms": disp.max_decision_ms,
+    }
+
+
+# ---------------------------------------------------
+# INSTÂNCIA GLOBAL (lazy, como get_cs3)
+# ---------------------------------------------------
+
+dispatcher: Optional[BlockDispatcher] = None
+
+
+def get_dispatcher(rebuild: bool = False) -> BlockDispatcher:
+    """
+    Devolve o dispatcher global, com o grafo da versão atual do plan.xml:
+    get_block_graph() só devolve outro grafo quando a cache de parse_plan()
+    tem outra versão, e nesse caso o dispatcher passa a usá-lo.
+    """
+    global dispatcher
+    graph = get_block_graph()
+    if dispatcher is None or rebuild:
+        from apps.rocrail_core import rocrail
+
+        if dispatcher is not None:
+            rocrail.remove_listener(dispatcher.on_rocrail_event)
+        dispatcher = BlockDispatcher(graph, commander=rocrail.send_commands)
+        rocrail.add_listener(dispatcher.on_rocrail_event)
+        print(f"[DISPATCHER] Grafo com {len(graph.block_cells)} blocos")
+    elif dispatcher.graph is not graph:
+        dispatcher.set_graph(graph)
+        print(f"[DISPATCHER] Plano mudou: grafo com {len(graph.block_cells)} blocos")
+    return dispatcher
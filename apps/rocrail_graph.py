@@ -0,0 +1,296 @@
+import heapq
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+
+# Célula da grelha do plano Rocrail: (x, y, z)
+Cell = Tuple[int, int, int]
+
+# Vizinhos em 4 direções (mesmo nível z)
+DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+# Nº máximo de rotas (origem, destino) memorizadas por versão do plano
+ROUTE_CACHE_SIZE = 4096
+
+# Tipos de track que restringem a saída: só em frente, só a virar, fim de linha
+STRAIGHT_TRACKS = ("straight",)
+CURVE_TRACKS = ("curve",)
+END_TRACKS = ("buffer", "buffer_stop")
+
+# Agulhas sem posição a comandar (cruzamento simples: atravessa-se a direito)
+FIXED_SWITCHES = ("crossing",)
+
+
+def _to_int(value: Any) -> Optional[int]:
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _cell(obj: Dict[str, Any]) -> Optional[Cell]:
+    x, y = _to_int(obj.get("x")), _to_int(obj.get("y"))
+    if x is None or y is None:
+        return None
+    return x, y, _to_int(obj.get("z")) or 0
+
+
+class BlockEdge:
+    """Ligação dirigida entre dois blocos e as agulhas a posicionar pelo caminho."""
+
+    __slots__ = ("src", "dst", "switches", "length")
+
+    def __init__(self, src: str, dst: str, switches: Tuple[Tuple[str, str], ...], length: int):
+        self.src = src
+        self.dst = dst
+        self.switches = switches  # ((switch_id, "straight" | "turnout"), ...)
+        self.length = length      # número de células entre os blocos
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "from": self.src,
+            "to": self.dst,
+            "switches": [{"id": sw, "cmd": cmd} for sw, cmd in self.switches],
+            "length": self.length,
+        }
+
+
+class BlockGraph:
+    """
+    Grafo de blocos do plano: nós = blocos, arestas = caminhos de via
+    (tracks + agulhas) que ligam um bloco ao seguinte.
+
+    route(src, dst) devolve a rota mais curta (em células) e as posições de
+    agulha necessárias. O resultado fica numa LRU do próprio grafo; como o
+    grafo é reconstruído a cada versão do plano, a cache nunca fica velha.
+    """
+
+    def __init__(self):
+        self.block_cells: Dict[str, Set[Cell]] = {}
+        self.edges: Dict[str, List[BlockEdge]] = {}
+        self.build_ms = 0.0
+        self.route = lru_cache(maxsize=ROUTE_CACHE_SIZE)(self._route)
+
+    def blocks(self) -> List[str]:
+        return list(self.block_cells)
+
+    def neighbours(self, block_id: str) -> List[BlockEdge]:
+        return self.edges.get(block_id, [])
+
+    def edge(self, src: str, dst: str) -> Optional[BlockEdge]:
+        """Aresta mais curta de src para dst (ou None se não forem vizinhos)."""
+        best = None
+        for e in self.edges.get(src, []):
+            if e.dst == dst and (best is None or e.length < best.length):
+                best = e
+        return best
+
+    def shortest_path(self, src: str, dst: str) -> Optional[List[str]]:
+        """Blocos da rota mais curta entre src e dst (ou None)."""
+        r = self.route(src, dst)
+        return list(r[0]) if r is not None else None
+
+    def _route(self, src: str, dst: str) -> Optional[Tuple[Tuple[str, ...], Tuple[Tuple[str, str], ...], int]]:
+        """
+        Dijkstra pelo comprimento em células (via entre blocos + blocos).
+        Devolve (blocos, agulhas, comprimento) ou None se não houver caminho.
+        """
+        if src not in self.block_cells or dst not in self.block_cells:
+            return None
+        if src == dst:
+            return (src,), (), 0
+
+        dist: Dict[str, int] = {src: 0}
+        prev: Dict[str, BlockEdge] = {}
+        heap = [(0, src)]
+        while heap:
+            d, cur = heapq.heappop(heap)
+            if cur == dst:
+                break
+            if d > dist[cur]:
+                continue
+            for e in self.edges.get(cur, []):
+                nd = d + e.length + len(self.block_cells[e.dst])
+                if e.dst not in dist or nd < dist[e.dst]:
+                    dist[e.dst] = nd
+                    prev[e.dst] = e
+                    heapq.heappush(heap, (nd, e.dst))
+
+        if dst not in prev:
+            return None
+        path: List[BlockEdge] = []
+        cur = dst
+        while cur != src:
+            path.append(prev[cur])
+            cur = prev[cur].src
+        path.reverse()
+        blocks = (src,) + tuple(e.dst for e in path)
+        switches = tuple(sw for e in path for sw in e.switches)
+        return blocks, switches, dist[dst]
+
+    def route_dict(self, src: str, dst: str) -> Optional[Dict[str, Any]]:
+        r = self.route(src, dst)
+        if r is None:
+            return None
+        blocks, switches, length = r
+        return {
+            "from": src,
+            "to": dst,
+            "blocks": list(blocks),
+            "switches": [{"id": sw, "cmd": cmd} for sw, cmd in switches],
+            "length": length,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        info = self.route.cache_info()
+        return {
+            "blocks": len(self.block_cells),
+            "edges": sum(len(v) for v in self.edges.values()),
+            "build_ms": self.build_ms,
+            "route_cache": {
+                "hits": info.hits,
+                "misses": info.misses,
+                "size": info.currsize,
+                "max_size": info.maxsize,
+            },
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "blocks": self.blocks(),
+            "edges": [e.to_dict() for edges in self.edges.values() for e in edges],
+        }
+
+
+def build_block_graph(plan: Dict[str, Any]) -> BlockGraph:
+    """
+    Constrói o grafo de blocos a partir do resultado de parse_plan().
+
+    Um bloco ocupa a sua célula (x, y, z) e as células dos tracks com
+    blockid igual ao id do bloco. A partir de cada bloco faz-se uma pesquisa
+    em largura pelas células de via livres (tracks sem blockid e agulhas)
+    até encontrar células de outro bloco.
+
+    Ao atravessar uma agulha, sair na mesma direção em que se entrou conta
+    como "straight"; mudar de direção conta como "turnout". O tipo de cada
+    célula limita as saídas: tracks "straight" e cruzamentos só seguem em
+    frente, "curve" obriga a virar e "buffer" é fim de linha.
+    """
+    t0 = time.perf_counter()
+    graph = BlockGraph()
+    owner: Dict[Cell, str] = {}
+    switch_at: Dict[Cell, str] = {}
+    cell_type: Dict[Cell, str] = {}
+    track_cells: Set[Cell] = set()
+
+    for b in plan.get("blocks", []):
+        c = _cell(b)
+        if b.get("id") and c is not None:
+            graph.block_cells.setdefault(b["id"], set()).add(c)
+            owner[c] = b["id"]
+
+    for trk in plan.get("tracks", []):
+        c = _cell(trk)
+        if c is None:
+            continue
+        block_id = trk.get("blockid")
+        if block_id and block_id in graph.block_cells:
+            graph.block_cells[block_id].add(c)
+            owner[c] = block_id
+        else:
+            track_cells.add(c)
+            cell_type[c] = (trk.get("type") or "").lower()
+
+    for sw in plan.get("switches", []):
+        c = _cell(sw)
+        if sw.get("id") is None or c is None:
+            continue
+        if (sw.get("type") or "").lower() in FIXED_SWITCHES:
+            track_cells.add(c)
+            cell_type[c] = "straight"
+        else:
+            switch_at[c] = sw["id"]
+
+    passable = track_cells | set(switch_at)
+
+    for block_id, cells in graph.block_cells.items():
+        found: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], int] = {}
+        # estado: (célula, direção de entrada, agulhas, comprimento)
+        queue = deque()
+        seen: Set[Tuple[Cell, Tuple[int, int]]] = set()
+        for (x, y, z) in cells:
+            for d in DIRECTIONS:
+                nxt = (x + d[0], y + d[1], z)
+                if nxt in cells:
+                    continue
+                queue.append((nxt, d, (), 1))
+
+        while queue:
+            cell, d_in, switches, length = queue.popleft()
+            other = owner.get(cell)
+            if other is not None:
+                if other != block_id:
+                    key = (other, switches)
+                    if key not in found or length < found[key]:
+                        found[key] = length
+                continue
+            if cell not in passable or (cell, d_in) in seen:
+                continue
+            seen.add((cell, d_in))
+
+            x, y, z = cell
+            sw_id = switch_at.get(cell)
+            kind = cell_type.get(cell, "")
+            if kind in END_TRACKS:
+                continue
+            for d in DIRECTIONS:
+                if d == (-d_in[0], -d_in[1]):
+                    continue  # não voltar para trás
+                if kind in STRAIGHT_TRACKS and d != d_in:
+                    continue
+                if kind in CURVE_TRACKS and d == d_in:
+                    continue
+                nxt_switches = switches
+                if sw_id is not None:
+                    cmd = "straight" if d == d_in else "turnout"
+                    nxt_switches = switches + ((sw_id, cmd),)
+                queue.append(((x + d[0], y + d[1], z), d, nxt_switches, length + 1))
+
+        graph.edges[block_id] = [
+            BlockEdge(block_id, dst, switches, length)
+            for (dst, switches), length in sorted(found.items(), key=lambda kv: kv[1])
+        ]
+
+    graph.build_ms = (time.perf_counter() - t0) * 1000.0
+    return graph
+
+
+# ---------------------------------------------------
+# GRAFO DO PLANO ATUAL
+# ---------------------------------------------------
+
+# (plano, grafo): parse_plan() devolve o mesmo objeto enquanto o plan.xml
+# não muda, por isso o grafo (e a sua cache de rotas) só é refeito quando muda.
+_current: Optional[Tuple[Dict[str, Any], BlockGraph]] = None
+_lock = threading.Lock()
+
+
+def get_block_graph() -> BlockGraph:
+    """Grafo de blocos do plan.xml atual (reconstruído só quando o plano muda)."""
+    global _current
+    from apps.rocrail_plan import parse_plan
+
+    plan = parse_plan()
+    current = _current
+    if current is not None and current[0] is plan:
+        return current[1]
+    with _lock:
+        if _current is None or _current[0] is not plan:
+            graph = build_block_graph(plan)
+            _current = (plan, graph)
+            print(f"[rocrail_graph] Grafo com {len(graph.block_cells)} blocos "
+                  f"construído em {graph.build_ms:.1f} ms")
+        return _current[1]
@@ -0,0 +1,272 @@
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+
+# Comandos mais lentos do que isto (ms) são logados no terminal
+SLOW_COMMAND_MS = 250.0
+
+# Comandos sem confirmação do Rocrail ao fim deste tempo (s) contam como timeout
+ACK_TIMEOUT_S = 10.0
+
+# Máximo de comandos pendentes por objeto (os mais antigos contam como timeout)
+MAX_PENDING_PER_OBJECT = 64
+
+# De quanto em quanto tempo (s) se expiram as filas de todos os objetos
+EXPIRE_INTERVAL_S = 1.0
+
+# Limites superiores (ms) dos buckets do histograma (escala ~logarítmica)
+BUCKET_BOUNDS_MS = [
+    1, 2, 5, 10, 20, 35, 50, 75, 100, 150, 200, 300,
+    500, 750, 1000, 2000, 5000, 10000,
+]
+
+COMMAND_TYPES = ("speed", "direction", "function", "switch", "stop")
+
+_ATTR_RE = re.compile(r'([\w:]+)="([^"]*)"')
+_TAG_RE = re.compile(r"<(lc|fn|sw)\b([^>]*)/?>")
+_FN_ATTR_RE = re.compile(r"^f(\d+)$")
+
+
+def parse_attrs(attr_str: str) -> Dict[str, str]:
+    """Extrai os atributos name="value" de uma tag XML simples."""
+    return dict(_ATTR_RE.findall(attr_str))
+
+
+def normalize_value(attr: str, value: Optional[str]) -> Optional[str]:
+    """Valor de um atributo na forma usada para comparar comando e evento."""
+    if value is None:
+        return None
+    if attr == "V":
+        try:
+            return str(int(float(value)))
+        except ValueError:
+            return value
+    return value.strip().lower()
+
+
+def classify_command(xml_str: str) -> Optional[Tuple[str, str, str, str, Optional[str]]]:
+    """
+    Classifica um comando XML enviado ao Rocrail.
+    Devolve (tipo_comando, tipo_objeto, id_objeto, atributo_esperado,
+    valor_esperado) ou None se não for um comando que o Rocrail confirme com
+    um evento de estado. valor_esperado None = qualquer valor confirma.
+    """
+    m = _TAG_RE.search(xml_str)
+    if not m:
+        return None
+    tag, attrs = m.group(1), parse_attrs(m.group(2))
+    obj_id = attrs.get("id")
+    if not obj_id:
+        return None
+
+    if tag == "sw":
+        cmd = normalize_value("state", attrs.get("cmd"))
+        return "switch", "sw", obj_id, "state", cmd if cmd in ("straight", "turnout") else None
+
+    if attrs.get("cmd") == "stop":
+        return "stop", "lc", obj_id, "V", "0"
+    if "V" in attrs:
+        return "speed", "lc", obj_id, "V", normalize_value("V", attrs["V"])
+    if "dir" in attrs:
+        return "direction", "lc", obj_id, "dir", normalize_value("dir", attrs["dir"])
+    for name in attrs:
+        if _FN_ATTR_RE.match(name):
+            return "function", "lc", obj_id, name, normalize_value(name, attrs[name])
+    return None
+
+
+def event_confirms(attrs: Dict[str, str], expect: str, value: Optional[str]) -> bool:
+    """
+    True se o evento mostra o estado pedido pelo comando. Não chega o
+    atributo existir: os <lc> do Rocrail trazem sempre V e dir.
+    """
+    got = attrs.get(expect)
+    if got is None and expect == "f0":
+        got = attrs.get("fn")      # F0 (luzes) vem como fn="..." nos <lc>
+    if got is None:
+        return False
+    return value is None or normalize_value(expect, got) == value
+
+
+class LatencyHistogram:
+    """
+    Histograma de latências com buckets fixos.
+    Guarda apenas contadores, por isso o custo por amostra é constante.
+    """
+
+    def __init__(self, bounds_ms: List[float] = BUCKET_BOUNDS_MS):
+        self.bounds_ms = list(bounds_ms)
+        # último bucket = "+Inf"
+        self.counts = [0] * (len(self.bounds_ms) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.min_ms: Optional[float] = None
+        self.max_ms: Optional[float] = None
+
+    def observe(self, value_ms: float):
+        self.counts[bisect_left(self.bounds_ms, value_ms)] += 1
+        self.count += 1
+        self.sum_ms += value_ms
+        if self.min_ms is None or value_ms < self.min_ms:
+            self.min_ms = value_ms
+        if self.max_ms is None or value_ms > self.max_ms:
+            self.max_ms = value_ms
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Percentil aproximado (limite superior do bucket onde cai)."""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        acc = 0
+        for idx, c in enumerate(self.counts):
+            acc += c
+            if acc >= rank and c:
+                if idx < len(self.bounds_ms):
+                    return float(self.bounds_ms[idx])
+                return self.max_ms
+        return self.max_ms
+
+    def to_dict(self) -> Dict[str, Any]:
+        buckets = []
+        for idx, c in enumerate(self.counts):
+            le = self.bounds_ms[idx] if idx < len(self.bounds_ms) else "+Inf"
+            buckets.append({"le_ms": le, "count": c})
+        return {
+            "count": self.count,
+            "avg_ms": (self.sum_ms / self.count) if self.count else None,
+            "min_ms": self.min_ms,
+            "max_ms": self.max_ms,
+            "p50_ms": self.percentile(0.50),
+            "p90_ms": self.percentile(0.90),
+            "p99_ms": self.percentile(0.99),
+            "buckets": buckets,
+        }
+
+
+class CommandLatencyTracker:
+    """
+    Correlaciona comandos enviados ao Rocrail com os eventos de estado
+    que o Rocrail devolve, e mede o tempo de ida-e-volta por tipo de comando.
+
+    Cada comando enviado fica pendente em (tipo_objeto, id). Quando chega um
+    evento <lc>/<fn>/<sw> com o mesmo id e com o valor pedido (V, dir, fN,
+    state), o comando pendente mais antigo que ele satisfaz é confirmado. Os
+    comandos anteriores ao mesmo atributo que ainda esperavam ficam
+    "superseded": o Rocrail processa por ordem, por isso já foram aplicados
+    e depois substituídos.
+    """
+
+    def __init__(self, slow_ms: float = SLOW_COMMAND_MS, timeout_s: float = ACK_TIMEOUT_S):
+        self.slow_ms = slow_ms
+        self.timeout_s = timeout_s
+        self.lock = threading.Lock()
+        self.histograms: Dict[str, LatencyHistogram] = {
+            t: LatencyHistogram() for t in COMMAND_TYPES
+        }
+        # (tipo_objeto, id) -> comandos (tipo, atributo, valor, enviado_em)
+        self.pending: Dict[Tuple[str, str], Deque[Tuple[str, str, Optional[str], float]]] = {}
+        self.sent = {t: 0 for t in COMMAND_TYPES}
+        self.timeouts = {t: 0 for t in COMMAND_TYPES}
+        self.superseded = {t: 0 for t in COMMAND_TYPES}
+        self.slow = {t: 0 for t in COMMAND_TYPES}
+        self._last_expire = 0.0
+
+    def on_sent(self, xml_str: str, sent_at: Optional[float] = None):
+        """Regista o envio de um comando (chamado depois do sendall)."""
+        info = classify_command(xml_str)
+        if info is None:
+            return
+        cmd_type, kind, obj_id, expect, value = info
+        t = time.perf_counter() if sent_at is None else sent_at
+        with self.lock:
+            self.sent[cmd_type] += 1
+            queue = self.pending.setdefault((kind, obj_id), deque())
+            queue.append((cmd_type, expect, value, t))
+            if len(queue) > MAX_PENDING_PER_OBJECT:
+                self.timeouts[queue.popleft()[0]] += 1
+            if t - self._last_expire > EXPIRE_INTERVAL_S:
+                self._expire_all(t)
+
+    def on_event(self, tag: str, attrs: Dict[str, str], received_at: Optional[float] = None):
+        """Processa um evento de estado vindo do Rocrail."""
+        obj_id = attrs.get("id")
+        if not obj_id:
+            return
+        kind = "sw" if tag == "sw" else "lc"
+        t = time.perf_counter() if received_at is None else received_at
+
+        with self.lock:
+            if t - self._last_expire > EXPIRE_INTERVAL_S:
+                self._expire_all(t)
+            queue = self.pending.get((kind, obj_id))
+            if not queue:
+                return
+            # um <lc> traz o estado todo: pode confirmar um comando por atributo
+            entries = list(queue)
+            done = set()
+            drop = set()
+            slow = []
+            for idx, (cmd_type, expect, value, sent_at) in enumerate(entries):
+                if expect in done or not event_confirms(attrs, expect, value):
+                    continue
+                done.add(expect)
+                # os anteriores ao mesmo atributo já foram aplicados e substituídos
+                for j in range(idx):
+                    if entries[j][1] == expect and j not in drop:
+                        drop.add(j)
+                        self.superseded[entries[j][0]] += 1
+                drop.add(idx)
+                latency_ms = (t - sent_at) * 1000.0
+                self.histograms[cmd_type].observe(latency_ms)
+                if latency_ms > self.slow_ms:
+                    self.slow[cmd_type] += 1
+                    slow.append((cmd_type, latency_ms))
+            if drop:
+                queue = deque(e for j, e in enumerate(entries) if j not in drop)
+                if queue:
+                    self.pending[(kind, obj_id)] = queue
+                else:
+                    del self.pending[(kind, obj_id)]
+
+        for cmd_type, latency_ms in slow:
+            print(f"[Rocrail] Comando lento: {cmd_type} {obj_id} {latency_ms:.1f} ms")
+
+    def on_event_xml(self, xml_text: str, received_at: Optional[float] = None):
+        """Procura eventos <lc>/<fn>/<sw> num bloco de texto recebido."""
+        for m in _TAG_RE.finditer(xml_text):
+            self.on_event(m.group(1), parse_attrs(m.group(2)), received_at)
+
+    def _expire_all(self, now: float):
+        """Conta como timeout os pendentes há mais de timeout_s (com o lock)."""
+        self._last_expire = now
+        for key in list(self.pending):
+            queue = self.pending[key]
+            while queue and now - queue[0][3] > self.timeout_s:
+                self.timeouts[queue.popleft()[0]] += 1
+            if not queue:
+                del self.pending[key]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Resumo para a API de métricas."""
+        now = time.perf_counter()
+        with self.lock:
+            self._expire_all(now)
+            return {
+                "slow_threshold_ms": self.slow_ms,
+                "ack_timeout_s": self.timeout_s,
+                "pending": sum(len(q) for q in self.pending.values()),
+                "commands": {
+                    t: {
+                        "sent": self.sent[t],
+                        "timeouts": self.timeouts[t],
+                        "superseded": self.superseded[t],
+                        "slow": self.slow[t],
+                        "latency": self.histograms[t].to_dict(),
+                    }
+                    for t in COMMAND_TYPES
+                },
+            }
@@ -1,6 +1,32 @@
+import os
+import threading
+import time
 import xml.etree.ElementTree as ET
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
+
+from apps.rocrail_plan_snapshot import load_snapshot, source_hash, write_snapshot
+
+try:
+    from lxml import etree as _lxml_etree  # backend XML alternativo (opcional)
+except ImportError:
+    _lxml_etree = None
+
+# "etree" (ElementTree em C, default) ou "lxml". Nos benchmarks deste parser
+# (benchmarks/bench_plan_parse.py) o lxml não foi mais rápido que o
+# ElementTree, por isso só é usado se pedido explicitamente.
+XML_BACKEND = os.environ.get("ROCRAIL_PLAN_XML_BACKEND", "etree")
+if XML_BACKEND == "lxml" and _lxml_etree is None:
+    print("[rocrail_plan] lxml não instalado, a usar ElementTree")
+    XML_BACKEND = "etree"
+
+PARSE_ERRORS: Tuple[type, ...] = (ET.ParseError,)
+if _lxml_etree is not None:
+    PARSE_ERRORS += (_lxml_etree.XMLSyntaxError,)
+
+# Snapshot binário do plano na pasta da aplicação (apps/rocrail_plan_snapshot.py):
+# arranques/workers novos carregam-no em vez de fazer parse se o XML não mudou.
+SNAPSHOT_ENABLED = os.environ.get("ROCRAIL_PLAN_SNAPSHOT", "1") != "0"
 
 
 # ?? MUITO IMPORTANTE:
@@ -11,7 +37,88 @@ ROCRAIL_PLAN_PATH = Path(
 )
 
 
-def parse_plan() -> Dict[str, Any]:
+def _empty_plan() -> Dict[str, Any]:
+    return {
+        "blocks": [],
+        "locos": [],
+        "switches": [],
+        "sensors": [],
+        "tracks": [],
+    }
+
+
+# Plano devolvido enquanto o ficheiro não existe: sempre o mesmo objeto, para
+# que quem reconstrói por versão do plano (grafo, índice...) não o faça a
+# cada chamada
+_MISSING_PLAN = _empty_plan()
+
+
+# ---------------------------------------------------
+# CACHE DO PLANO (por caminho + mtime + tamanho)
+# ---------------------------------------------------
+
+# caminho -> ((mtime_ns, size), plano)
+_plan_cache: Dict[str, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+# caminho -> ((mtime_ns, size), erro) da última versão que não se conseguiu ler:
+# essa versão não volta a ser lida (só quando o ficheiro mudar)
+_plan_errors: Dict[str, Tuple[Tuple[int, int], Exception]] = {}
+# um lock por caminho: pedidos concorrentes esperam pelo mesmo parse (single-flight)
+_path_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+_cache_stats = {
+    "hits": 0,
+    "misses": 0,
+    "parses": 0,
+    "parse_errors": 0,
+    "snapshot_loads": 0,
+    "snapshot_writes": 0,
+    "parse_time_ms_total": 0.0,
+    "last_parse_ms": None,
+}
+
+
+def _file_key(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _count(name: str):
+    with _locks_guard:
+        _cache_stats[name] += 1
+
+
+def _path_lock(path_str: str) -> threading.Lock:
+    with _locks_guard:
+        lock = _path_locks.get(path_str)
+        if lock is None:
+            lock = _path_locks[path_str] = threading.Lock()
+        return lock
+
+
+def _cached_plan(path_str: str, key: Tuple[int, int]) -> Optional[Dict[str, Any]]:
+    """
+    Plano em cache para esta versão do ficheiro, ou None se for preciso lê-lo.
+    Se esta versão já falhou devolve a última versão boa (ou volta a lançar
+    o erro, se não houver nenhuma) sem tentar ler outra vez.
+    """
+    cached = _plan_cache.get(path_str)
+    if cached is not None and cached[0] == key:
+        _count("hits")
+        return cached[1]
+    failed = _plan_errors.get(path_str)
+    if failed is not None and failed[0] == key:
+        _count("hits")
+        if cached is not None:
+            return cached[1]
+        raise failed[1].with_traceback(None)
+    return None
+
+
+def parse_plan(path: Optional[Path] = None) -> Dict[str, Any]:
     """
     Lê o plan.xml do Rocrail e devolve:
     {
@@ -21,111 +128,252 @@ def parse_plan() -> Dict[str, Any]:
       "sensors": [...],
       "tracks": [...],
     }
+
+    O resultado fica em cache por processo, chaveado pelo caminho, mtime e
+    tamanho do ficheiro: só volta a fazer parse quando o plan.xml muda. Um
+    XML inválido também fica registado com a sua chave (mantém-se a última
+    versão boa até o ficheiro voltar a mudar).
+    O dicionário devolvido é partilhado entre pedidos -> não o alterar.
     """
+    path = Path(path or ROCRAIL_PLAN_PATH)
+    path_str = str(path)
 
-    path = ROCRAIL_PLAN_PATH
-    print("[rocrail_plan] A LER:", path)
-
-    if not path.exists():
-        print("[rocrail_plan] FICHEIRO NAO ENCONTRADO!")
-        return {
-            "blocks": [],
-            "locos": [],
-            "switches": [],
-            "sensors": [],
-            "tracks": [],
-        }
-
-    tree = ET.parse(path)
-    root = tree.getroot()
-
-    blocks: List[Dict[str, Any]] = []
-    locos: List[Dict[str, Any]] = []
-    switches: List[Dict[str, Any]] = []
-    sensors: List[Dict[str, Any]] = []
-    tracks: List[Dict[str, Any]] = []
-
-    # ---------- BLOCS ----------
-    for b in root.findall(".//block"):
-        blocks.append({
-            "id": b.get("id"),
-            "desc": b.get("desc"),
-            "type": b.get("type"),
-            "x": b.get("x"),
-            "y": b.get("y"),
-            "z": b.get("z"),
-        })
+    key = _file_key(path)
+    if key is None:
+        print("[rocrail_plan] FICHEIRO NAO ENCONTRADO!", path)
+        return _MISSING_PLAN
 
-    # ---------- LOCOS ----------
-    # Rocrail costuma usar <loc> para locomotivas; nalguns casos existe <lc>.
-    loco_elements = root.findall(".//loc")
-    loco_elements += root.findall(".//lc")
-
-    print(f"[rocrail_plan] Encontradas {len(loco_elements)} tags de loco (<loc> ou <lc>)")
-
-    for lc in loco_elements:
-        loco_id = lc.get("id")
-        addr = lc.get("addr")
-        desc = lc.get("desc")
-        protoc = lc.get("prot")
-        image = lc.get("image")
-        max_speed = lc.get("V_max")
-
-        functions: List[Dict[str, Any]] = []
-        for fn in lc.findall("fn"):
-            functions.append({
-                "no": fn.get("no"),
-                "text": fn.get("text"),
-                "icon": fn.get("icon"),
-                "type": fn.get("type"),
-                "state": fn.get("state"),
-            })
-
-        locos.append({
-            "id": loco_id,
-            "addr": addr,
-            "desc": desc,
-            "protocol": protoc,
-            "image": image,
-            "max_speed": max_speed,
-            "functions": functions,
-        })
+    plan = _cached_plan(path_str, key)
+    if plan is not None:
+        return plan
 
-    # ---------- SWITCHES (AGULHAS) ----------
-    for sw in root.findall(".//switch"):
-        switches.append({
-            "id": sw.get("id"),
-            "addr": sw.get("addr"),
-            "port": sw.get("port"),
-            "desc": sw.get("desc"),
-            "type": sw.get("type"),
-            "state": sw.get("state"),
-            "x": sw.get("x"),
-            "y": sw.get("y"),
-        })
+    with _path_lock(path_str):
+        # outro pedido pode ter feito o parse enquanto esperávamos pelo lock
+        key = _file_key(path)
+        if key is None:
+            return _MISSING_PLAN
+        plan = _cached_plan(path_str, key)
+        if plan is not None:
+            return plan
 
-    # ---------- SENSORES ----------
-    for sn in root.findall(".//sensor"):
-        sensors.append({
-            "id": sn.get("id"),
-            "addr": sn.get("addr"),
-            "port": sn.get("port"),
-            "desc": sn.get("desc"),
-            "type": sn.get("type"),
-        })
+        _count("misses")
+        t0 = time.perf_counter()
+        try:
+            plan = _load_plan(path)
+        except PARSE_ERRORS as e:
+            print("[rocrail_plan] XML inválido:", e)
+            _plan_errors[path_str] = (key, e)
+            _count("parse_errors")
+            cached = _plan_cache.get(path_str)
+            if cached is not None:
+                return cached[1]  # mantém a última versão boa
+            raise
+        elapsed_ms = (time.perf_counter() - t0) * 1000.0
+
+        with _locks_guard:
+            _cache_stats["parses"] += 1
+            _cache_stats["parse_time_ms_total"] += elapsed_ms
+            _cache_stats["last_parse_ms"] = elapsed_ms
+        _plan_cache[path_str] = (key, plan)
+        _plan_errors.pop(path_str, None)
+        return plan
+
+
+def _load_plan(path: Path) -> Dict[str, Any]:
+    """
+    Carrega o plano do snapshot binário se o hash do XML coincidir; senão faz
+    o parse completo e grava um snapshot novo para os próximos arranques.
+    """
+    if not SNAPSHOT_ENABLED:
+        return _parse_plan_file(path)
+
+    digest = source_hash(path)
+    snapshot = load_snapshot(path, digest)
+    if snapshot is not None:
+        try:
+            plan = snapshot.to_plan()
+        finally:
+            snapshot.close()
+        _count("snapshot_loads")
+        print(f"[rocrail_plan] Snapshot carregado: {len(plan.get('tracks', []))} tracks")
+        return plan
+
+    plan = _parse_plan_file(path)
+    if write_snapshot(path, digest, plan) is not None:
+        _count("snapshot_writes")
+    return plan
 
-    # ---------- TRACKS (elementos gráficos de via) ----------
-    for trk in root.findall(".//track"):
-        tracks.append({
-            "id": trk.get("id"),
-            "type": trk.get("type"),
-            "blockid": trk.get("blockid"),
-            "x": trk.get("x"),
-            "y": trk.get("y"),
-            "z": trk.get("z"),
-            "angle": trk.get("angle"),
+
+def preload_plan():
+    """Carrega o plano numa thread em segundo plano (arranque do worker)."""
+    threading.Thread(target=parse_plan, daemon=True).start()
+
+
+def get_plan_cache_stats() -> Dict[str, Any]:
+    """Estatísticas da cache de parse_plan() para a API."""
+    with _locks_guard:
+        stats = dict(_cache_stats)
+    stats["backend"] = XML_BACKEND
+    stats["snapshot_enabled"] = SNAPSHOT_ENABLED
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = (stats["hits"] / lookups) if lookups else None
+    stats["avg_parse_ms"] = (stats["parse_time_ms_total"] / stats["parses"]) if stats["parses"] else None
+    stats["cached_paths"] = [
+        {"path": p, "mtime_ns": k[0], "size": k[1]} for p, (k, _) in _plan_cache.items()
+    ]
+    stats["failed_paths"] = [
+        {"path": p, "mtime_ns": k[0], "size": k[1], "error": str(e)} for p, (k, e) in _plan_errors.items()
+    ]
+    return stats
+
+
+# ---------------------------------------------------
+# PARSER (streaming, uma só passagem)
+# ---------------------------------------------------
+
+def _block_record(b) -> Dict[str, Any]:
+    return {
+        "id": b.get("id"),
+        "desc": b.get("desc"),
+        "type": b.get("type"),
+        "x": b.get("x"),
+        "y": b.get("y"),
+        "z": b.get("z"),
+    }
+
+
+def _loco_record(lc) -> Dict[str, Any]:
+    functions: List[Dict[str, Any]] = []
+    for fn in lc.findall("fn"):
+        functions.append({
+            "no": fn.get("no"),
+            "text": fn.get("text"),
+            "icon": fn.get("icon"),
+            "type": fn.get("type"),
+            "state": fn.get("state"),
         })
 
+    return {
+        "id": lc.get("id"),
+        "addr": lc.get("addr"),
+        "desc": lc.get("desc"),
+        "protocol": lc.get("prot"),
+        "image": lc.get("image"),
+        "max_speed": lc.get("V_max"),
+        "functions": functions,
+    }
+
+
+def _switch_record(sw) -> Dict[str, Any]:
+    return {
+        "id": sw.get("id"),
+        "addr": sw.get("addr"),
+        "port": sw.get("port"),
+        "desc": sw.get("desc"),
+        "type": sw.get("type"),
+        "state": sw.get("state"),
+        "x": sw.get("x"),
+        "y": sw.get("y"),
+        "z": sw.get("z"),
+    }
+
+
+def _sensor_record(sn) -> Dict[str, Any]:
+    return {
+        "id": sn.get("id"),
+        "addr": sn.get("addr"),
+        "port": sn.get("port"),
+        "desc": sn.get("desc"),
+        "type": sn.get("type"),
+    }
+
+
+def _track_record(trk) -> Dict[str, Any]:
+    return {
+        "id": trk.get("id"),
+        "type": trk.get("type"),
+        "blockid": trk.get("blockid"),
+        "x": trk.get("x"),
+        "y": trk.get("y"),
+        "z": trk.get("z"),
+        "angle": trk.get("angle"),
+    }
+
+
+# tag -> (chave no plano, função que extrai o registo)
+# Rocrail costuma usar <loc> para locomotivas; nalguns casos existe <lc>.
+# Os <loc> vêm antes dos <lc> no resultado (ordem histórica de parse_plan).
+_RECORDS = {
+    "block": ("blocks", _block_record),
+    "loc": ("locos", _loco_record),
+    "lc": ("lc", _loco_record),
+    "switch": ("switches", _switch_record),
+    "sensor": ("sensors", _sensor_record),
+    "track": ("tracks", _track_record),
+}
+
+
+def _iter_elements_etree(path: Path):
+    """
+    Elementos do plano à medida que fecham, com ElementTree.iterparse.
+
+    Tal como no ramo lxml, cada elemento tratado sai logo da árvore (é
+    retirado do pai, e a raiz nunca acumula filhos). Os filhos de um
+    registo (os <fn> de uma loco) só saem com ele; tudo o resto (listas,
+    <fn> soltos, rotas...) sai assim que fecha.
+    """
+    open_elems = []      # elementos abertos, da raiz até ao atual
+    in_record = 0        # quantos dos abertos são registos
+    for event, elem in ET.iterparse(str(path), events=("start", "end")):
+        if event == "start":
+            open_elems.append(elem)
+            if elem.tag in _RECORDS:
+                in_record += 1
+            continue
+        open_elems.pop()
+        if elem.tag in _RECORDS:
+            in_record -= 1
+            yield elem
+        if in_record == 0 and open_elems:
+            # os irmãos anteriores já saíram: o pai só tem este filho
+            elem.clear()
+            open_elems[-1].remove(elem)
+
+
+def _iter_elements_lxml(path: Path):
+    """Igual a _iter_elements_etree, com lxml (filtra as tags em C)."""
+    for _, elem in _lxml_etree.iterparse(str(path), events=("end",), tag=tuple(_RECORDS)):
+        yield elem
+        # com lxml os elementos anteriores só saem da árvore se os apagarmos
+        elem.clear(keep_tail=True)
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
+
+def _parse_plan_file(path: Path) -> Dict[str, Any]:
+    """
+    Faz o parse completo do plan.xml (sem cache) numa só passagem com
+    iterparse: cada elemento é despachado pelo tipo quando fecha e sai da
+    árvore a seguir, por isso a árvore nunca chega a existir inteira em
+    memória. O ganho é sobretudo de memória (pico ~55% do parse DOM com
+    100k elementos); em tempo é modesto (1.0x-1.4x conforme o tamanho).
+    """
+    print(f"[rocrail_plan] A LER ({XML_BACKEND}):", path)
+
+    out: Dict[str, List[Dict[str, Any]]] = {key: [] for key, _ in _RECORDS.values()}
+    elements = _iter_elements_lxml(path) if XML_BACKEND == "lxml" else _iter_elements_etree(path)
+    for elem in elements:
+        key, record = _RECORDS[elem.tag]
+        out[key].append(record(elem))
+
+    blocks = out["blocks"]
+    locos = out["locos"] + out["lc"]
+    switches = out["switches"]
+    sensors = out["sensors"]
+    tracks = out["tracks"]
+
+    print(f"[rocrail_plan] Encontradas {len(locos)} tags de loco (<loc> ou <lc>)")
+
     plan: Dict[str, Any] = {
         "blocks": blocks,
         "locos": locos,
@@ -0,0 +1,139 @@
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from apps.rocrail_plan import parse_plan
+
+
+# Nº máximo de variantes (tipo / fields / types) guardadas por versão do plano
+VARIANT_CACHE_SIZE = 64
+
+# Nível de compressão gzip (6 = bom compromisso tamanho / CPU)
+GZIP_LEVEL = 6
+
+# Tipos de objeto que podem ser filtrados em ?types=
+PLAN_KINDS = ("blocks", "locos", "switches", "sensors", "tracks")
+
+# (kind, fields, types): kind=None -> plano inteiro (dict), senão a lista desse tipo
+VariantKey = Tuple[Optional[str], Optional[Tuple[str, ...]], Optional[Tuple[str, ...]]]
+
+
+def _dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _project(items: Iterable[Dict[str, Any]], fields: Optional[Tuple[str, ...]]):
+    if fields is None:
+        return list(items)
+    return [{f: obj.get(f) for f in fields} for obj in items]
+
+
+class PlanBody:
+    """Corpo JSON já serializado (e comprimido) de uma variante do plano."""
+
+    __slots__ = ("etag", "raw", "gz")
+
+    def __init__(self, etag: str, raw: bytes):
+        self.etag = etag
+        self.raw = raw
+        self.gz = gzip.compress(raw, GZIP_LEVEL, mtime=0)
+
+
+class PlanResponseCache:
+    """
+    Respostas do plano pré-serializadas por versão de parse_plan().
+
+    O hash do plano (sha1 do JSON completo) é calculado uma vez por versão;
+    a ETag de cada variante deriva desse hash e da chave da variante e fica
+    no próprio PlanBody, por isso ETag e corpo são sempre da mesma versão e
+    um If-None-Match a uma variante em cache não serializa nada.
+    """
+
+    def __init__(self, max_variants: int = VARIANT_CACHE_SIZE):
+        self.max_variants = max_variants
+        self.lock = threading.Lock()
+        self.plan: Optional[Dict[str, Any]] = None
+        self.plan_hash = ""
+        self.variants: "OrderedDict[VariantKey, PlanBody]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def _sync(self, plan: Dict[str, Any]):
+        """Troca de versão: novo hash e variantes antigas descartadas (com o lock)."""
+        if plan is self.plan:
+            return
+        full = _dumps(plan)
+        self.plan = plan
+        self.plan_hash = hashlib.sha1(full).hexdigest()
+        self.variants.clear()
+        key: VariantKey = (None, None, None)
+        self.variants[key] = PlanBody(self.etag_for(key), full)
+
+    def etag_for(self, key: VariantKey) -> str:
+        """ETag forte: hash do plano + hash curto da variante."""
+        if key == (None, None, None):
+            return f'"{self.plan_hash}"'
+        variant = hashlib.sha1(repr(key).encode()).hexdigest()[:12]
+        return f'"{self.plan_hash}-{variant}"'
+
+    def get(self, key: VariantKey) -> PlanBody:
+        plan = parse_plan()
+        with self.lock:
+            self._sync(plan)
+            body = self.variants.get(key)
+            if body is not None:
+                self.hits += 1
+                self.variants.move_to_end(key)
+                return body
+            self.misses += 1
+            etag = self.etag_for(key)
+
+        kind, fields, types = key
+        if kind is not None:
+            data: Any = _project(plan.get(kind, []), fields)
+        else:
+            data = {k: _project(plan.get(k, []), fields)
+                    for k in (PLAN_KINDS if types is None else types)}
+        body = PlanBody(etag, _dumps(data))
+
+        with self.lock:
+            if self.plan is plan:
+                self.variants[key] = body
+                while len(self.variants) > self.max_variants:
+                    self.variants.popitem(last=False)
+        return body
+
+    def count_not_modified(self):
+        with self.lock:
+            self.not_modified += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "plan_hash": self.plan_hash,
+                "variants": len(self.variants),
+                "bytes_raw": sum(len(b.raw) for b in self.variants.values()),
+                "bytes_gzip": sum(len(b.gz) for b in self.variants.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+            }
+
+
+def variant_key(kind: Optional[str], fields: Optional[str], types: Optional[str]) -> VariantKey:
+    """
+    Normaliza ?fields=id,x,y e ?types=switches,tracks numa chave de cache
+    (ordenada, sem duplicados; tipos desconhecidos são ignorados).
+    """
+    f = tuple(sorted({x.strip() for x in fields.split(",") if x.strip()})) if fields else None
+    t = None
+    if kind is None and types:
+        t = tuple(k for k in PLAN_KINDS if k in {x.strip() for x in types.split(",")})
+    return kind, f or None, t
+
+
+plan_responses = PlanResponseCache()
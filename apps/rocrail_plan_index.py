@@ -0,0 +1,142 @@
+import math
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from apps.rocrail_plan import parse_plan
+
+
+# Tamanho de cada célula da grelha espacial (em unidades do plano Rocrail)
+GRID_CELL = 8
+
+# Tipos de objeto do plano indexados por id
+KINDS = ("blocks", "locos", "switches", "sensors", "tracks")
+
+# Tipos com coordenadas (entram na grelha espacial)
+SPATIAL_KINDS = ("blocks", "switches", "tracks")
+
+
+def _num(value: Any) -> Optional[float]:
+    """Coordenada como número; None se faltar ou não for finita (NaN, inf)."""
+    try:
+        num = float(value)
+    except (TypeError, ValueError):
+        return None
+    return num if math.isfinite(num) else None
+
+
+class PlanObject:
+    """
+    Objeto do plano com coordenadas já convertidas para número.
+    Não guarda o dicionário de parse_plan(): `pos` é a posição do registo na
+    lista do seu tipo, e o JSON sai de PlanIndex.data() a partir do plano.
+    """
+
+    __slots__ = ("kind", "pos", "id", "x", "y", "z")
+
+    def __init__(self, kind: str, pos: int, data: Dict[str, Any]):
+        self.kind = kind
+        self.pos = pos
+        self.id = data.get("id")
+        self.x = _num(data.get("x"))
+        self.y = _num(data.get("y"))
+        z = _num(data.get("z"))
+        self.z = int(z) if z is not None else 0
+
+
+class PlanIndex:
+    """
+    Modelo indexado do plano:
+      - by_id[tipo][id] -> PlanObject (lookup O(1))
+      - grid[(z, gx, gy)] -> objetos nessa célula (consultas por retângulo)
+      - tracks_by_block[blockid] -> tracks desse bloco
+    """
+
+    def __init__(self, plan: Dict[str, Any], cell: int = GRID_CELL):
+        t0 = time.perf_counter()
+        self.plan = plan
+        self.cell = cell
+        self.by_id: Dict[str, Dict[str, PlanObject]] = {k: {} for k in KINDS}
+        self.grid: Dict[Tuple[int, int, int], List[PlanObject]] = {}
+        self.tracks_by_block: Dict[str, List[PlanObject]] = {}
+
+        for kind in KINDS:
+            ids = self.by_id[kind]
+            for pos, data in enumerate(plan.get(kind, [])):
+                obj = PlanObject(kind, pos, data)
+                if obj.id is not None:
+                    ids[obj.id] = obj
+                if kind in SPATIAL_KINDS and obj.x is not None and obj.y is not None:
+                    key = (obj.z, int(obj.x // cell), int(obj.y // cell))
+                    self.grid.setdefault(key, []).append(obj)
+                if kind == "tracks" and data.get("blockid"):
+                    self.tracks_by_block.setdefault(data["blockid"], []).append(obj)
+
+        self.build_ms = (time.perf_counter() - t0) * 1000.0
+
+    def get(self, kind: str, obj_id: str) -> Optional[PlanObject]:
+        return self.by_id.get(kind, {}).get(obj_id)
+
+    def data(self, obj: PlanObject) -> Dict[str, Any]:
+        """Registo original de parse_plan() (para o JSON)."""
+        return self.plan[obj.kind][obj.pos]
+
+    def query_rect(self, x0: float, y0: float, x1: float, y1: float,
+                   z: Optional[int] = None,
+                   kinds: Iterable[str] = SPATIAL_KINDS) -> List[PlanObject]:
+        """Objetos com x0 <= x <= x1 e y0 <= y <= y1 (e nível z, se indicado)."""
+        if x0 > x1:
+            x0, x1 = x1, x0
+        if y0 > y1:
+            y0, y1 = y1, y0
+        kinds = set(kinds)
+        levels = [z] if z is not None else sorted({k[0] for k in self.grid})
+        gx0, gx1 = int(x0 // self.cell), int(x1 // self.cell)
+        gy0, gy1 = int(y0 // self.cell), int(y1 // self.cell)
+
+        out: List[PlanObject] = []
+        # se o retângulo cobre mais células do que as ocupadas, percorre só as ocupadas
+        if (gx1 - gx0 + 1) * (gy1 - gy0 + 1) * len(levels) > len(self.grid):
+            cells = [c for c in self.grid
+                     if c[0] in levels and gx0 <= c[1] <= gx1 and gy0 <= c[2] <= gy1]
+        else:
+            cells = [(lz, gx, gy) for lz in levels
+                     for gx in range(gx0, gx1 + 1) for gy in range(gy0, gy1 + 1)]
+
+        for c in cells:
+            for obj in self.grid.get(c, ()):
+                if obj.kind in kinds and x0 <= obj.x <= x1 and y0 <= obj.y <= y1:
+                    out.append(obj)
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "build_ms": self.build_ms,
+            "grid_cell": self.cell,
+            "grid_cells": len(self.grid),
+            "counts": {k: len(v) for k, v in self.by_id.items()},
+        }
+
+
+# ---------------------------------------------------
+# ÍNDICE DO PLANO ATUAL
+# ---------------------------------------------------
+
+# (plano, índice): parse_plan() devolve o mesmo objeto enquanto o ficheiro
+# não muda, por isso o índice só é reconstruído quando o plano é outro.
+_current: Optional[Tuple[Dict[str, Any], PlanIndex]] = None
+_lock = threading.Lock()
+
+
+def get_plan_index() -> PlanIndex:
+    """Índice do plan.xml atual (reconstruído só quando o plano muda)."""
+    global _current
+    plan = parse_plan()
+    current = _current
+    if current is not None and current[0] is plan:
+        return current[1]
+    with _lock:
+        if _current is None or _current[0] is not plan:
+            _current = (plan, PlanIndex(plan))
+            print(f"[plan_index] Índice construído em {_current[1].build_ms:.1f} ms")
+        return _current[1]
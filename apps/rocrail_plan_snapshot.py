@@ -0,0 +1,241 @@
+import gc
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from itertools import repeat
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# Formato do snapshot binário do plano (incrementar quando o layout mudar)
+FORMAT_VERSION = 1
+MAGIC = b"RVPS"
+
+# Pasta dos snapshots (da aplicação, não a do workspace do Rocrail), como a
+# cache de config da CS3 em apps/cs3_config.py
+SNAPSHOT_DIR = Path(os.environ.get("ROCRAIL_PLAN_SNAPSHOT_DIR", "plan_cache"))
+SNAPSHOT_SUFFIX = ".snapshot"
+
+# Valor "None" nas colunas int32 (coordenadas)
+I32_NONE = -2 ** 31
+
+# Colunas candidatas a int32 (se todos os valores forem inteiros "canónicos")
+COORD_FIELDS = ("x", "y", "z")
+
+# magic, versão, ordem de bytes (0=little, 1=big), sha1 do XML, tamanho do manifesto
+_HEADER = struct.Struct("<4sHH20sI")
+
+
+def source_hash(path: Path) -> bytes:
+    """sha1 do plan.xml (chave do snapshot)."""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.digest()
+
+
+def snapshot_path(path: Path) -> Path:
+    """Ficheiro do snapshot de um plan.xml: um por caminho absoluto do XML."""
+    name = hashlib.sha1(str(Path(path).resolve()).encode("utf-8")).hexdigest()[:16]
+    return SNAPSHOT_DIR / f"plan-{name}{SNAPSHOT_SUFFIX}"
+
+
+def _is_canonical_int(value: Any) -> bool:
+    if value is None:
+        return True
+    if not isinstance(value, str):
+        return False
+    try:
+        return str(int(value)) == value and -2 ** 31 < int(value) < 2 ** 31
+    except ValueError:
+        return False
+
+
+def _pad(buf: bytearray, align: int = 8):
+    buf.extend(b"\0" * (-len(buf) % align))
+
+
+def write_snapshot(path: Path, digest: bytes, plan: Dict[str, Any]) -> Optional[Path]:
+    """
+    Escreve o snapshot de `plan` em SNAPSHOT_DIR (escrita atómica).
+
+    Layout: cabeçalho | manifesto JSON | tabela de strings | colunas.
+      - strings: todas as strings distintas separadas por '\\0' (índice 0 = None)
+      - coluna "i32": int32 nativo, I32_NONE para None (x/y/z inteiros)
+      - coluna "str": uint32 com o índice na tabela de strings
+      - coluna "json": como "str", mas com o valor em JSON (p.ex. funções das locos)
+    """
+    strings: List[str] = [""]
+    index: Dict[str, int] = {}
+
+    def intern(s: Optional[str]) -> int:
+        if s is None:
+            return 0
+        i = index.get(s)
+        if i is None:
+            i = index[s] = len(strings)
+            strings.append(s)
+        return i
+
+    kinds: Dict[str, Any] = {}
+    columns: List[Tuple[Dict[str, Any], array]] = []
+    for kind, records in plan.items():
+        names: List[str] = []
+        for rec in records:
+            for k in rec:
+                if k not in names:
+                    names.append(k)
+        cols = []
+        for name in names:
+            values = [rec.get(name) for rec in records]
+            if name in COORD_FIELDS and all(_is_canonical_int(v) for v in values):
+                col = {"name": name, "type": "i32"}
+                data = array("i", (I32_NONE if v is None else int(v) for v in values))
+            elif all(v is None or isinstance(v, str) for v in values):
+                col = {"name": name, "type": "str"}
+                data = array("I", (intern(v) for v in values))
+            else:
+                col = {"name": name, "type": "json"}
+                data = array("I", (0 if v is None else intern(json.dumps(v, ensure_ascii=False))
+                                   for v in values))
+            cols.append(col)
+            columns.append((col, data))
+        kinds[kind] = {"n": len(records), "columns": cols}
+
+    blob = "\0".join(strings).encode("utf-8")
+
+    # offsets relativos ao início da zona de dados (alinhada a 8 bytes)
+    body = bytearray(blob)
+    _pad(body)
+    for col, data in columns:
+        col["offset"] = len(body)
+        body.extend(data.tobytes())
+        _pad(body)
+
+    manifest = json.dumps({
+        "kinds": kinds,
+        "strings": {"offset": 0, "length": len(blob), "count": len(strings)},
+    }).encode("utf-8")
+    head = bytearray(_HEADER.pack(MAGIC, FORMAT_VERSION, 0 if sys.byteorder == "little" else 1,
+                                  digest, len(manifest)))
+    head.extend(manifest)
+    _pad(head)
+
+    out = snapshot_path(path)
+    tmp = out.with_name(f"{out.name}.{os.getpid()}.tmp")
+    try:
+        out.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp, "wb") as f:
+            f.write(head)
+            f.write(body)
+        os.replace(tmp, out)   # os outros workers veem o ficheiro antigo ou o novo, nunca meio
+    except OSError as e:
+        print("[rocrail_plan] Não foi possível gravar snapshot:", e)
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        return None
+    return out
+
+
+class PlanSnapshot:
+    """
+    Snapshot aberto com mmap só de leitura, para o converter de volta no
+    dicionário de parse_plan() (to_plan) mais depressa do que um parse do
+    XML. Só serve o arranque a frio: depois de to_plan() fecha-se com close().
+    """
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, order, digest, manifest_len = _HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError("snapshot com formato diferente")
+        if order != (0 if sys.byteorder == "little" else 1):
+            self.close()
+            raise ValueError("snapshot com outra ordem de bytes")
+        self.digest = digest
+        start = _HEADER.size
+        self.manifest = json.loads(self.mm[start:start + manifest_len])
+        self.data_offset = start + manifest_len + (-(start + manifest_len) % 8)
+        self.view = memoryview(self.mm)
+
+    def strings(self) -> List[Optional[str]]:
+        info = self.manifest["strings"]
+        o = self.data_offset + info["offset"]
+        table: List[Optional[str]] = str(self.mm[o:o + info["length"]], "utf-8").split("\0")
+        table[0] = None
+        return table
+
+    def _column(self, kind: str, name: str) -> Optional[memoryview]:
+        """memoryview ('i' ou 'I') de uma coluna, sem cópia."""
+        meta = self.manifest["kinds"].get(kind)
+        if meta is None:
+            return None
+        for col in meta["columns"]:
+            if col["name"] == name:
+                o = self.data_offset + col["offset"]
+                fmt = "i" if col["type"] == "i32" else "I"
+                return self.view[o:o + 4 * meta["n"]].cast(fmt)
+        return None
+
+    def to_plan(self) -> Dict[str, Any]:
+        """Materializa o dicionário no formato de parse_plan()."""
+        table = self.strings()
+        plan: Dict[str, Any] = {}
+        # só se criam dicts/strings sem ciclos: o GC a meio só custa tempo
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for kind, meta in self.manifest["kinds"].items():
+                names = [c["name"] for c in meta["columns"]]
+                cols = []
+                for c in meta["columns"]:
+                    with self._column(kind, c["name"]) as view:
+                        values = view.tolist()
+                    if c["type"] == "i32":
+                        col = list(map(str, values))
+                        if I32_NONE in values:
+                            col = [None if v == I32_NONE else t for v, t in zip(values, col)]
+                        cols.append(col)
+                    elif c["type"] == "str":
+                        cols.append(list(map(table.__getitem__, values)))
+                    else:
+                        cols.append([None if i == 0 else json.loads(table[i]) for i in values])
+                if cols:
+                    plan[kind] = list(map(dict, map(zip, repeat(names), zip(*cols))))
+                else:
+                    plan[kind] = [{} for _ in range(meta["n"])]
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        return plan
+
+    def close(self):
+        view = getattr(self, "view", None)
+        if view is not None:
+            view.release()
+        self.mm.close()
+
+
+def load_snapshot(path: Path, digest: bytes) -> Optional[PlanSnapshot]:
+    """Abre o snapshot do plan.xml se existir e corresponder ao hash do XML."""
+    snap = snapshot_path(path)
+    if not snap.exists():
+        return None
+    try:
+        snapshot = PlanSnapshot(snap)
+    except (OSError, ValueError, struct.error) as e:
+        print("[rocrail_plan] Snapshot ignorado:", e)
+        return None
+    if snapshot.digest != digest:
+        snapshot.close()
+        return None
+    return snapshot
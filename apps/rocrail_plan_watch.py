@@ -0,0 +1,244 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from apps import rocrail_plan
+from apps.rocrail_plan import parse_plan
+
+
+# Tipos do plano comparados no diff
+DIFF_KINDS = ("blocks", "locos", "switches", "sensors", "tracks")
+
+# Intervalo do modo polling (sem inotify, p.ex. Windows)
+POLL_S = 1.0
+
+# Espera depois de um evento inotify (o Rocrail escreve o ficheiro aos bocados)
+DEBOUNCE_S = 0.2
+
+# Nº de diffs guardados para clientes que se atrasem
+HISTORY = 32
+
+# inotify (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT_HDR = struct.Struct("iIII")
+
+
+def _object_key(obj: Dict[str, Any]) -> str:
+    """Chave estável de um objeto: o id, ou a posição para objetos sem id."""
+    if obj.get("id") is not None:
+        return obj["id"]
+    return f"@{obj.get('x')},{obj.get('y')},{obj.get('z')}"
+
+
+def diff_plans(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Diff estrutural entre dois resultados de parse_plan(), por id:
+    {
+      "added":   { tipo: [objeto, ...] },
+      "removed": { tipo: [id, ...] },
+      "changed": { tipo: [ { "id": ..., "attrs": { atributo: novo valor } } ] }
+    }
+    Só aparecem os tipos com alterações. Objetos sem id são identificados
+    pela posição ("@x,y,z").
+    """
+    added: Dict[str, List[Any]] = {}
+    removed: Dict[str, List[Any]] = {}
+    changed: Dict[str, List[Any]] = {}
+
+    for kind in DIFF_KINDS:
+        before = {_object_key(o): o for o in old.get(kind, [])}
+        after = {_object_key(o): o for o in new.get(kind, [])}
+
+        for key, obj in after.items():
+            prev = before.get(key)
+            if prev is None:
+                added.setdefault(kind, []).append(obj)
+            elif prev != obj:
+                attrs = {k: v for k, v in obj.items() if prev.get(k) != v}
+                attrs.update({k: None for k in prev if k not in obj})
+                changed.setdefault(kind, []).append({"id": key, "attrs": attrs})
+
+        gone = [key for key in before if key not in after]
+        if gone:
+            removed[kind] = gone
+
+    return {"added": added, "removed": removed, "changed": changed}
+
+
+def _diff_is_empty(diff: Dict[str, Any]) -> bool:
+    return not (diff["added"] or diff["removed"] or diff["changed"])
+
+
+class _Inotify:
+    """inotify mínimo via ctypes (só Linux); lança OSError se não existir."""
+
+    def __init__(self, directory: Path):
+        name = ctypes.util.find_library("c")
+        if not name:
+            raise OSError("libc não encontrada")
+        libc = ctypes.CDLL(name, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify indisponível")
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falhou")
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+        if libc.inotify_add_watch(self.fd, os.fsencode(str(directory)), mask) < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, f"inotify_add_watch falhou em {directory}")
+
+    def wait(self, timeout: float) -> List[str]:
+        """Nomes de ficheiros alterados na pasta (lista vazia se der timeout)."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        names: List[str] = []
+        try:
+            while True:
+                buf = os.read(self.fd, 8192)
+                pos = 0
+                while pos + _EVENT_HDR.size <= len(buf):
+                    _wd, _mask, _cookie, length = _EVENT_HDR.unpack_from(buf, pos)
+                    pos += _EVENT_HDR.size
+                    names.append(buf[pos:pos + length].rstrip(b"\0").decode(errors="replace"))
+                    pos += length
+        except BlockingIOError:
+            pass
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PlanWatcher:
+    """
+    Vigia o plan.xml (inotify na pasta; polling se não houver inotify),
+    volta a fazer parse quando muda e guarda o diff em relação à versão
+    anterior. Os clientes (polling de /api/rocrail/plan/diffs) pedem os
+    diffs a partir da versão que têm.
+    """
+
+    def __init__(self, path: Optional[Path] = None, poll_s: float = POLL_S):
+        self.path = Path(path or rocrail_plan.ROCRAIL_PLAN_PATH)
+        self.poll_s = poll_s
+        self.cond = threading.Condition()
+        self.version = 0
+        self.history: deque = deque(maxlen=HISTORY)   # (versão, diff)
+        self.plan = parse_plan(self.path)
+        self.mode = "stopped"
+        self.reloads = 0
+        self.last_diff_ms = 0.0
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._loop, daemon=True)
+            self.thread.start()
+
+    def _loop(self):
+        try:
+            notify = _Inotify(self.path.parent)
+            self.mode = "inotify"
+        except OSError as e:
+            print(f"[PLAN_WATCH] inotify indisponível ({e}); a usar polling de {self.poll_s}s")
+            notify = None
+            self.mode = "polling"
+
+        while True:
+            if notify is not None:
+                names = notify.wait(self.poll_s * 30)
+                if self.path.name not in names:
+                    continue
+                time.sleep(DEBOUNCE_S)
+                notify.wait(0)   # descarta eventos da mesma escrita
+            else:
+                time.sleep(self.poll_s)
+            try:
+                self.check()
+            except Exception as e:
+                print("[PLAN_WATCH] Erro ao recarregar plano:", e)
+
+    def check(self) -> bool:
+        """Faz parse (em cache por mtime/tamanho) e publica o diff se o plano mudou."""
+        plan = parse_plan(self.path)
+        if plan is self.plan:
+            return False
+
+        t0 = time.perf_counter()
+        diff = diff_plans(self.plan, plan)
+        self.last_diff_ms = (time.perf_counter() - t0) * 1000.0
+        self.plan = plan
+        if _diff_is_empty(diff):
+            return False
+
+        with self.cond:
+            self.version += 1
+            self.reloads += 1
+            self.history.append((self.version, diff))
+            self.cond.notify_all()
+        print(f"[PLAN_WATCH] plano v{self.version}: "
+              f"+{sum(map(len, diff['added'].values()))} "
+              f"-{sum(map(len, diff['removed'].values()))} "
+              f"~{sum(map(len, diff['changed'].values()))} "
+              f"({self.last_diff_ms:.1f} ms)")
+        return True
+
+    def diffs_since(self, version: int, timeout: float) -> Tuple[int, Optional[List[Dict[str, Any]]]]:
+        """
+        Espera até haver uma versão > `version` (ou timeout).
+        Devolve (versão atual, diffs em falta); diffs=None se o cliente estiver
+        tão atrasado que já não há histórico e deve recarregar o plano todo,
+        ou se `version` for de outro processo (a app reiniciou e a contagem
+        voltou ao 0).
+        """
+        with self.cond:
+            if version > self.version:
+                return self.version, None
+            self.cond.wait_for(lambda: self.version > version, timeout)
+            if self.version <= version:
+                return self.version, []
+            if not self.history or self.history[0][0] > version + 1:
+                return self.version, None
+            return self.version, [
+                {"version": v, **diff} for v, diff in self.history if v > version
+            ]
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "mode": self.mode,
+            "version": self.version,
+            "reloads": self.reloads,
+            "last_diff_ms": self.last_diff_ms,
+        }
+
+
+# ---------------------------------------------------
+# WATCHER GLOBAL
+# ---------------------------------------------------
+
+watcher: Optional[PlanWatcher] = None
+_lock = threading.Lock()
+
+
+def get_plan_watcher() -> PlanWatcher:
+    """Devolve o watcher global do plan.xml (arranca-o na primeira chamada)."""
+    global watcher
+    with _lock:
+        if watcher is None:
+            watcher = PlanWatcher()
+            watcher.start()
+        return watcher
@@ -0,0 +1,225 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+# Período do tick do scheduler (s)
+RAMP_TICK_S = 0.05
+
+# Nº de slots da timer wheel (cobre WHEEL_SLOTS * RAMP_TICK_S por volta)
+WHEEL_SLOTS = 256
+
+
+def _linear(x: float) -> float:
+    return x
+
+
+def _ease_in(x: float) -> float:
+    return x * x
+
+
+def _ease_out(x: float) -> float:
+    return 1.0 - (1.0 - x) * (1.0 - x)
+
+
+def _s_curve(x: float) -> float:
+    return x * x * (3.0 - 2.0 * x)
+
+
+# Curvas de aceleração: f(0)=0, f(1)=1
+CURVES: Dict[str, Callable[[float], float]] = {
+    "linear": _linear,
+    "ease_in": _ease_in,
+    "ease_out": _ease_out,
+    "s_curve": _s_curve,
+}
+
+
+class TimerWheel:
+    """
+    Timer wheel simples: cada slot guarda os itens que vencem nesse tick
+    (módulo WHEEL_SLOTS). Agendar e avançar um tick são O(1) amortizado.
+    """
+
+    def __init__(self, slots: int = WHEEL_SLOTS):
+        self.slots: List[List[Any]] = [[] for _ in range(slots)]
+        self.tick = 0
+
+    def schedule(self, due_tick: int, item: Any):
+        due_tick = max(due_tick, self.tick + 1)
+        self.slots[due_tick % len(self.slots)].append((due_tick, item))
+
+    def advance(self) -> List[Any]:
+        """Avança um tick e devolve os itens vencidos."""
+        self.tick += 1
+        slot = self.slots[self.tick % len(self.slots)]
+        if not slot:
+            return []
+        due = [item for t, item in slot if t <= self.tick]
+        slot[:] = [(t, item) for t, item in slot if t > self.tick]
+        return due
+
+
+class SpeedRamp:
+    """Rampa de velocidade de uma loco entre start e target."""
+
+    __slots__ = ("loco_id", "start", "target", "start_tick", "ticks", "curve", "last_sent")
+
+    def __init__(self, loco_id: str, start: int, target: int, start_tick: int,
+                 ticks: int, curve: Callable[[float], float]):
+        self.loco_id = loco_id
+        self.start = start
+        self.target = target
+        self.start_tick = start_tick
+        self.ticks = max(1, ticks)
+        self.curve = curve
+        self.last_sent = start
+
+    def value_at(self, tick: int) -> int:
+        x = min(1.0, max(0.0, (tick - self.start_tick) / self.ticks))
+        return int(round(self.start + (self.target - self.start) * self.curve(x)))
+
+    def next_change(self, tick: int) -> int:
+        """Próximo tick em que o V arredondado muda (ou o fim da rampa)."""
+        end = self.start_tick + self.ticks
+        t = tick + 1
+        while t < end and self.value_at(t) == self.last_sent:
+            t += 1
+        return min(t, end)
+
+
+class SpeedRampEngine:
+    """
+    Motor de rampas de velocidade no servidor.
+
+    Uma única thread avança uma timer wheel a tick fixo (RAMP_TICK_S) para
+    todas as locos. Cada rampa só é agendada para os ticks em que o V
+    arredondado muda, e todos os <lc V=.../> que vencem no mesmo tick são
+    enviados ao Rocrail num único lote.
+
+    As rampas são canceladas por cancel()/cancel_all(), o que o
+    RocrailClient faz em stop_loco() e em set_speed() diretos. Ambos esperam
+    pelo lote do tick em curso (send_lock): depois de voltarem nenhum V da
+    rampa cancelada sai, e o stop de quem cancelou chega sempre em último. O V de
+    partida de cada rampa é o último conhecido: o enviado por nós ou o que
+    o Rocrail anunciou num <lc> (throttles, autopilot do Rocrail...).
+    """
+
+    def __init__(self, send_batch: Callable[[List[str]], Any], tick_s: float = RAMP_TICK_S):
+        self.send_batch = send_batch
+        self.tick_s = tick_s
+        self.wheel = TimerWheel()
+        self.ramps: Dict[str, SpeedRamp] = {}
+        self.current: Dict[str, int] = {}    # último V conhecido por loco
+        self.cond = threading.Condition()
+        self.send_lock = threading.Lock()    # lote de um tick: montar + enviar
+        self.thread: Optional[threading.Thread] = None
+        self.ticks_run = 0
+        self.commands_sent = 0
+        self.max_lag_ms = 0.0
+
+    def start_ramp(self, loco_id: str, target: int, duration_s: float,
+                   curve: str = "linear", start: Optional[int] = None) -> SpeedRamp:
+        """Inicia (ou substitui) a rampa de uma loco até `target` em `duration_s`."""
+        if curve not in CURVES:
+            raise ValueError(f"curva desconhecida: {curve}")
+        target = int(target)
+        if not 0 <= target <= 100:
+            raise ValueError(f"speed fora de 0..100: {target}")
+        if duration_s < 0:
+            raise ValueError("duration_s negativo")
+
+        with self.cond:
+            if start is None:
+                running = self.ramps.get(loco_id)
+                start = running.last_sent if running is not None else self.current.get(loco_id, 0)
+            ticks = int(round(duration_s / self.tick_s))
+            ramp = SpeedRamp(loco_id, int(start), target, self.wheel.tick, ticks, CURVES[curve])
+            self.ramps[loco_id] = ramp
+            self.wheel.schedule(ramp.next_change(self.wheel.tick), ramp)
+            self._ensure_thread()
+            self.cond.notify()
+        print(f"[RAMP] {loco_id}: {start} -> {target} em {duration_s:.2f}s ({curve})")
+        return ramp
+
+    def cancel(self, loco_id: str) -> bool:
+        """Cancela a rampa da loco (se existir). As entradas na wheel ficam órfãs e são ignoradas."""
+        with self.send_lock, self.cond:
+            return self.ramps.pop(loco_id, None) is not None
+
+    def cancel_all(self) -> List[str]:
+        """Cancela todas as rampas; devolve as locos que estavam a meio de uma."""
+        with self.send_lock, self.cond:
+            locos = list(self.ramps)
+            self.ramps.clear()
+        return locos
+
+    def note_speed(self, loco_id: str, speed: int):
+        """Regista um V enviado fora do motor (set_speed/stop_loco) ou lido do Rocrail."""
+        with self.cond:
+            self.current[loco_id] = int(speed)
+
+    def _ensure_thread(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._loop, daemon=True)
+            self.thread.start()
+
+    def _loop(self):
+        next_t = time.perf_counter()
+        while True:
+            with self.cond:
+                while not self.ramps:
+                    self.cond.wait()
+                    next_t = time.perf_counter()
+
+            delay = next_t - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                self.max_lag_ms = max(self.max_lag_ms, -delay * 1000.0)
+            next_t += self.tick_s
+
+            with self.send_lock:
+                xml_list: List[str] = []
+                with self.cond:
+                    self.ticks_run += 1
+                    tick = self.wheel.tick + 1
+                    for ramp in self.wheel.advance():
+                        if self.ramps.get(ramp.loco_id) is not ramp:
+                            continue  # cancelada ou substituída
+                        v = ramp.value_at(tick)
+                        if v != ramp.last_sent:
+                            ramp.last_sent = v
+                            self.current[ramp.loco_id] = v
+                            xml_list.append(f'<lc id="{ramp.loco_id}" V="{v}"/>')
+                        if tick >= ramp.start_tick + ramp.ticks:
+                            del self.ramps[ramp.loco_id]
+                        else:
+                            self.wheel.schedule(ramp.next_change(tick), ramp)
+
+                if xml_list:
+                    self.commands_sent += len(xml_list)
+                    try:
+                        self.send_batch(xml_list)
+                    except Exception as e:
+                        print("[RAMP] Erro a enviar:", e)
+
+    def get_status(self) -> Dict[str, Any]:
+        with self.cond:
+            tick = self.wheel.tick
+            return {
+                "tick_s": self.tick_s,
+                "ticks_run": self.ticks_run,
+                "commands_sent": self.commands_sent,
+                "max_lag_ms": self.max_lag_ms,
+                "active": [
+                    {
+                        "loco_id": r.loco_id,
+                        "start": r.start,
+                        "target": r.target,
+                        "current": r.last_sent,
+                        "remaining_s": max(0, r.start_tick + r.ticks - tick) * self.tick_s,
+                    }
+                    for r in self.ramps.values()
+                ],
+            }
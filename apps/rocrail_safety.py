@@ -0,0 +1,463 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from apps.rocrail_graph import BlockGraph
+
+
+# Horizonte de previsão (s) e número de passos de tempo
+HORIZON_S = 6.0
+HORIZON_STEPS = 31
+
+# Período do ciclo de previsão (s)
+LOOP_PERIOD_S = 0.1
+
+# Velocidade em células/s de uma loco a V=100 (calibrar no layout)
+CELLS_PER_S_AT_100 = 2.0
+
+# Comprimento típico de um comboio em células
+TRAIN_LENGTH_CELLS = 2.0
+
+# Tempo de travagem (s) desde V atual até parar
+BRAKING_S = 1.5
+
+# Fator aplicado à velocidade quando o comboio tem de abrandar
+SLOW_FACTOR = 0.5
+
+# Quantos blocos à frente se projeta cada comboio
+PATH_BLOCKS = 6
+
+
+class TrackedTrain:
+    """Posição/velocidade conhecidas de um comboio (câmara ou Rocrail)."""
+
+    __slots__ = ("loco_id", "block", "prev_block", "offset", "speed",
+                 "requested_speed", "action", "updated", "source")
+
+    def __init__(self, loco_id: str):
+        self.loco_id = loco_id
+        self.block: Optional[str] = None
+        self.prev_block: Optional[str] = None
+        self.offset = 0.0              # células desde a entrada no bloco
+        self.speed = 0.0               # V em % (0-100)
+        self.requested_speed = 0.0     # V pedida antes de qualquer intervenção
+        self.action = "clear"          # clear | slow | stop
+        self.updated = 0.0
+        self.source = ""
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "loco_id": self.loco_id,
+            "block": self.block,
+            "prev_block": self.prev_block,
+            "offset": self.offset,
+            "speed": self.speed,
+            "requested_speed": self.requested_speed,
+            "action": self.action,
+            "updated": self.updated,
+            "source": self.source,
+        }
+
+
+class CollisionPredictor:
+    """
+    Motor de previsão de colisões.
+
+    Cada comboio é projetado ao longo do seu caminho no grafo de blocos
+    (rota do dispatcher se existir; senão o vizinho mais curto em frente)
+    durante HORIZON_S segundos. A projeção é feita em NumPy para todos os
+    comboios de uma vez: posições (N, K) -> índice de bloco da frente e da
+    cauda -> matriz de conflitos (N, N, K).
+
+    Para cada conflito, o comboio que chega mais tarde ao bloco em causa
+    cede: abranda se o conflito está a menos de slow_s, pára se está a menos
+    de stop_s. O tempo de reação garantido = período do ciclo + pior tempo
+    de cálculo + latência p99 dos comandos (medida pelo RocrailClient).
+    """
+
+    def __init__(self, graph: BlockGraph,
+                 commander: Optional[Callable[[List[Dict[str, Any]]], Any]] = None,
+                 route_provider: Optional[Callable[[str], Optional[List[str]]]] = None,
+                 latency_provider: Optional[Callable[[], Optional[float]]] = None,
+                 graph_provider: Optional[Callable[[], BlockGraph]] = None,
+                 horizon_s: float = HORIZON_S, steps: int = HORIZON_STEPS,
+                 period_s: float = LOOP_PERIOD_S, braking_s: float = BRAKING_S):
+        self.graph = graph
+        self.commander = commander
+        self.route_provider = route_provider
+        self.latency_provider = latency_provider
+        self.graph_provider = graph_provider
+        self.horizon_s = horizon_s
+        self.t = np.linspace(0.0, horizon_s, steps)
+        self.period_s = period_s
+        self.braking_s = braking_s
+        self.lock = threading.Lock()
+
+        self.trains: Dict[str, TrackedTrain] = {}
+        self.obstacles: Dict[str, bool] = {}    # blocos ocupados por algo que não é comboio
+        self.block_index = {b: i for i, b in enumerate(graph.blocks())}
+
+        self.enabled = True
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+        self.last_conflicts: List[Dict[str, Any]] = []
+        self.cycles = 0
+        self.last_compute_ms = 0.0
+        self.max_compute_ms = 0.0
+
+    def set_graph(self, graph: BlockGraph):
+        """Passa a prever sobre o grafo de uma versão nova do plano."""
+        with self.lock:
+            self.graph = graph
+            self.block_index = {b: i for i, b in enumerate(graph.blocks())}
+
+    # -----------------------
+    # ENTRADAS (câmara / Rocrail)
+    # -----------------------
+
+    def update_train(self, loco_id: str, block: Optional[str] = None,
+                     offset: Optional[float] = None, speed: Optional[float] = None,
+                     source: str = "camera"):
+        """Atualiza posição (bloco + offset em células) e/ou velocidade (V %)."""
+        with self.lock:
+            tr = self.trains.get(loco_id)
+            if tr is None:
+                tr = self.trains[loco_id] = TrackedTrain(loco_id)
+            if block is not None and block != tr.block:
+                tr.prev_block, tr.block = tr.block, block
+                tr.offset = 0.0
+            if offset is not None:
+                tr.offset = max(0.0, float(offset))
+            if speed is not None:
+                tr.speed = float(speed)
+                if tr.action == "clear":
+                    tr.requested_speed = tr.speed
+            tr.updated = time.time()
+            tr.source = source
+
+    def set_obstacle(self, block_id: str, occupied: bool):
+        """Bloco ocupado por algo que não é um comboio seguido (ex.: YOLO)."""
+        with self.lock:
+            if occupied:
+                self.obstacles[block_id] = True
+            else:
+                self.obstacles.pop(block_id, None)
+
+    def on_rocrail_event(self, tag: str, attrs: Dict[str, str]):
+        """Listener para RocrailClient: <lc V=.../> e <bk occ="true" locid=.../>."""
+        if tag == "lc" and attrs.get("id") and "V" in attrs:
+            try:
+                self.update_train(attrs["id"], speed=float(attrs["V"]), source="rocrail")
+            except ValueError:
+                pass
+        elif tag == "bk" and attrs.get("occ") == "true" and attrs.get("locid"):
+            self.update_train(attrs["locid"], block=attrs.get("id"), source="rocrail")
+
+    # -----------------------
+    # PREVISÃO
+    # -----------------------
+
+    def _path(self, tr: TrackedTrain) -> List[str]:
+        """Blocos à frente do comboio, começando pelo bloco atual."""
+        route = self.route_provider(tr.loco_id) if self.route_provider else None
+        if route and tr.block in route:
+            i = route.index(tr.block)
+            return [route[(i + k) % len(route)] for k in range(min(PATH_BLOCKS, len(route)))]
+
+        path = [tr.block]
+        prev = tr.prev_block
+        while len(path) < PATH_BLOCKS:
+            nxt = [e for e in self.graph.neighbours(path[-1]) if e.dst != prev and e.dst not in path]
+            if not nxt:
+                break
+            prev = path[-1]
+            path.append(min(nxt, key=lambda e: e.length).dst)
+        return path
+
+    def _segment_length(self, block_id: str, nxt: Optional[str]) -> float:
+        length = float(len(self.graph.block_cells.get(block_id, ())) or 1)
+        if nxt is not None:
+            e = self.graph.edge(block_id, nxt)
+            if e is not None:
+                length += e.length
+        return length
+
+    def _build_arrays(self) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Prepara os arrays de entrada da projeção:
+          paths (N, L) ids de bloco (inteiros), ends (N, L) fim cumulativo de cada
+          segmento, dist0 (N,) distância da frente desde o início do caminho,
+          vel (N,) células/s. Os obstáculos entram como comboios parados.
+        """
+        ids: List[str] = []
+        paths: List[List[int]] = []
+        seg_ends: List[List[float]] = []
+        dist0: List[float] = []
+        vel: List[float] = []
+
+        for tr in self.trains.values():
+            if tr.block not in self.block_index:
+                continue
+            path = self._path(tr)
+            # o bloco anterior entra no início do caminho para apanhar a cauda
+            if tr.prev_block in self.block_index and tr.prev_block not in path:
+                path = [tr.prev_block] + path
+                start = self._segment_length(tr.prev_block, tr.block)
+            else:
+                start = 0.0
+            lengths = [self._segment_length(b, path[i + 1] if i + 1 < len(path) else None)
+                       for i, b in enumerate(path)]
+            ids.append(tr.loco_id)
+            paths.append([self.block_index[b] for b in path])
+            seg_ends.append(list(np.cumsum(lengths)))
+            dist0.append(start + tr.offset)
+            # parado/abrandado pelo motor: projeta-se com a V pedida, para só
+            # ser libertado quando o conflito deixar de existir
+            speed = tr.speed if tr.action == "clear" else tr.requested_speed
+            vel.append(speed / 100.0 * CELLS_PER_S_AT_100)
+
+        for block_id in self.obstacles:
+            if block_id in self.block_index:
+                ids.append(f"obstacle:{block_id}")
+                paths.append([self.block_index[block_id]])
+                seg_ends.append([1.0])
+                dist0.append(TRAIN_LENGTH_CELLS)
+                vel.append(0.0)
+
+        n = len(ids)
+        width = max((len(p) for p in paths), default=1)
+        P = np.full((n, width), -1, dtype=np.int32)
+        E = np.full((n, width), np.inf)
+        for i, (p, e) in enumerate(zip(paths, seg_ends)):
+            P[i, :len(p)] = p
+            P[i, len(p):] = p[-1]
+            E[i, :len(e) - 1] = e[:-1]   # último segmento prolonga-se (fim do caminho conhecido)
+        return ids, P, E, np.asarray(dist0, dtype=float), np.asarray(vel, dtype=float)
+
+    def predict(self) -> List[Dict[str, Any]]:
+        """
+        Projeta todos os comboios e devolve os conflitos previstos, um por
+        comboio que tem de ceder: [{loco_id, other, block, time_s, action}].
+        """
+        with self.lock:
+            ids, P, E, d0, v = self._build_arrays()
+        n = len(ids)
+        if n < 2:
+            return []
+
+        # posição da frente e da cauda ao longo do tempo: (N, K)
+        head_d = d0[:, None] + v[:, None] * self.t[None, :]
+        tail_d = np.maximum(head_d - TRAIN_LENGTH_CELLS, 0.0)
+
+        # índice do segmento: nº de fins de segmento já ultrapassados -> (N, K)
+        head_i = (head_d[:, :, None] >= E[:, None, :]).sum(axis=2)
+        tail_i = (tail_d[:, :, None] >= E[:, None, :]).sum(axis=2)
+        rows = np.arange(n)[:, None]
+        H = P[rows, head_i]
+        T = P[rows, tail_i]
+
+        # conflito (i, j, k): a frente de i entra num bloco que j ocupa no passo k
+        C = (H[:, None, :] == H[None, :, :]) | (H[:, None, :] == T[None, :, :])
+        C[np.arange(n), np.arange(n), :] = False
+        any_c = C.any(axis=2)
+        first_k = np.where(any_c, C.argmax(axis=2), -1)
+
+        moving = v > 0
+        I, J = np.nonzero(any_c & moving[:, None])   # um comboio parado não tem de ceder
+        if I.size == 0:
+            return []
+        k = first_k[I, J]
+        block = H[I, k]
+
+        # primeiro passo em que cada comboio do par ocupa o bloco em conflito
+        occ_i = (H[I] == block[:, None]) | (T[I] == block[:, None])
+        occ_j = (H[J] == block[:, None]) | (T[J] == block[:, None])
+        ti = occ_i.argmax(axis=1)
+        tj = occ_j.argmax(axis=1)
+
+        # profundidade da frente dentro do bloco (para decidir quem vai atrás)
+        seg_start = np.concatenate([np.zeros((n, 1)), E[:, :-1]], axis=1)
+        depth_i = head_d[I, k] - seg_start[I, head_i[I, k]]
+        depth_j = head_d[J, k] - seg_start[J, head_i[J, k]]
+        j_leads = (T[J, k] == block) & (H[J, k] != block)
+
+        # cede quem chega mais tarde ao bloco; se chegam juntos cede quem vai
+        # atrás (cauda do outro no bloco, ou frente menos adiantada)
+        yields = (~moving[J]) | (ti > tj) | (
+            (ti == tj) & (j_leads | ((H[J, k] == block) & (
+                (depth_i < depth_j) | ((depth_i == depth_j) & (I > J))))))
+
+        I, J, k, block = I[yields], J[yields], k[yields], block[yields]
+        # conflito mais próximo de cada comboio que cede
+        order = np.lexsort((k, I))
+        first = np.ones(order.size, dtype=bool)
+        first[1:] = I[order][1:] != I[order][:-1]
+        blocks = self.graph.blocks()
+        result = [
+            {
+                "loco_id": ids[I[o]],
+                "other": ids[J[o]],
+                "block": blocks[block[o]],
+                "time_s": float(self.t[k[o]]),
+            }
+            for o in order[first]
+        ]
+
+        stop_s, slow_s = self.thresholds()
+        conflicts = []
+        for c in result:
+            if c["time_s"] <= stop_s:
+                c["action"] = "stop"
+            elif c["time_s"] <= slow_s:
+                c["action"] = "slow"
+            else:
+                continue
+            conflicts.append(c)
+        return conflicts
+
+    def reaction_time_s(self) -> float:
+        """Pior tempo entre uma mudança no layout e o comando chegar ao Rocrail."""
+        latency_ms = self.latency_provider() if self.latency_provider else None
+        return self.period_s + self.max_compute_ms / 1000.0 + (latency_ms or 0.0) / 1000.0
+
+    def thresholds(self) -> Tuple[float, float]:
+        """(stop_s, slow_s): abaixo de stop_s pára, abaixo de slow_s abranda."""
+        stop_s = self.reaction_time_s() + self.braking_s
+        return stop_s, min(self.horizon_s, 2.0 * stop_s)
+
+    # -----------------------
+    # CICLO / COMANDOS
+    # -----------------------
+
+    def step(self) -> List[Dict[str, Any]]:
+        """Um ciclo: prevê, gradua a resposta e envia os comandos necessários."""
+        if self.graph_provider is not None:
+            # o plano pode ter mudado: troca de grafo entre previsões, nesta thread
+            graph = self.graph_provider()
+            if graph is not self.graph:
+                self.set_graph(graph)
+        t0 = time.perf_counter()
+        conflicts = self.predict() if self.enabled else []
+        elapsed_ms = (time.perf_counter() - t0) * 1000.0
+        self.last_compute_ms = elapsed_ms
+        self.max_compute_ms = max(self.max_compute_ms, elapsed_ms)
+        self.cycles += 1
+
+        wanted = {c["loco_id"]: c["action"] for c in conflicts}
+        commands: List[Dict[str, Any]] = []
+        with self.lock:
+            for tr in self.trains.values():
+                action = wanted.get(tr.loco_id, "clear")
+                if tr.action == "stop" and action == "slow":
+                    action = "stop"     # de stop só se sai com o conflito resolvido
+                if action == tr.action:
+                    continue
+                if action == "stop":
+                    commands.append({"op": "stop", "loco_id": tr.loco_id})
+                    tr.speed = 0.0
+                elif action == "slow":
+                    tr.speed = round(tr.requested_speed * SLOW_FACTOR)
+                    commands.append({"op": "go", "loco_id": tr.loco_id, "speed": int(tr.speed)})
+                else:
+                    # conflito resolvido: repõe a velocidade pedida
+                    tr.speed = tr.requested_speed
+                    commands.append({"op": "go", "loco_id": tr.loco_id, "speed": int(tr.speed)})
+                print(f"[SAFETY] {tr.loco_id}: {tr.action} -> {action}")
+                tr.action = action
+            self.last_conflicts = conflicts
+
+        if commands and self.commander is not None:
+            try:
+                self.commander(commands)
+            except Exception as e:
+                print("[SAFETY] Erro a enviar comandos:", e)
+        return conflicts
+
+    def _loop(self):
+        next_t = time.perf_counter()
+        while self.running:
+            try:
+                self.step()
+            except Exception as e:
+                print("[SAFETY] Erro no ciclo:", e)
+            next_t += self.period_s
+            delay = next_t - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_t = time.perf_counter()
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def get_status(self) -> Dict[str, Any]:
+        stop_s, slow_s = self.thresholds()
+        with self.lock:
+            return {
+                "enabled": self.enabled,
+                "running": self.running,
+                "horizon_s": self.horizon_s,
+                "period_s": self.period_s,
+                "cycles": self.cycles,
+                "last_compute_ms": self.last_compute_ms,
+                "max_compute_ms": self.max_compute_ms,
+                "reaction_time_s": self.reaction_time_s(),
+                "stop_threshold_s": stop_s,
+                "slow_threshold_s": slow_s,
+                "trains": [t.to_dict() for t in self.trains.values()],
+                "obstacles": sorted(self.obstacles),
+                "conflicts": self.last_conflicts,
+            }
+
+
+# ---------------------------------------------------
+# INSTÂNCIA GLOBAL (lazy, como get_cs3)
+# ---------------------------------------------------
+
+predictor: Optional[CollisionPredictor] = None
+_predictor_lock = threading.Lock()
+
+
+def get_predictor() -> CollisionPredictor:
+    """
+    Devolve o motor global, ligado ao Rocrail e ao dispatcher. create_app()
+    chama-o no arranque, para o layout estar protegido desde o início.
+    """
+    global predictor
+    if predictor is not None:
+        return predictor
+    with _predictor_lock:
+        if predictor is not None:
+            return predictor
+        from apps import rocrail_dispatcher
+        from apps.rocrail_core import rocrail
+        from apps.rocrail_dispatcher import get_dispatcher
+
+        disp = get_dispatcher()
+
+        def route_of(loco_id: str) -> Optional[List[str]]:
+            # o dispatcher global pode ser reconstruído (rebuild=True)
+            tr = rocrail_dispatcher.dispatcher.trains.get(loco_id)
+            return tr.route if tr is not None else None
+
+        def stop_latency_ms() -> Optional[float]:
+            lat = rocrail.metrics.snapshot()["commands"]["stop"]["latency"]
+            return lat["p99_ms"]
+
+        predictor = CollisionPredictor(disp.graph, commander=rocrail.send_commands,
+                                       route_provider=route_of,
+                                       latency_provider=stop_latency_ms,
+                                       graph_provider=lambda: get_dispatcher().graph)
+        rocrail.add_listener(predictor.on_rocrail_event)
+        predictor.start()
+        print("[SAFETY] Motor de previsão de colisões iniciado")
+    return predictor
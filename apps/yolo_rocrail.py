@@ -1,6 +1,10 @@
+import json
+import queue
 import sys
 import socket
+import threading
 import time
+import urllib.request
 
 import cv2
 import numpy as np
@@ -40,6 +44,12 @@ BLOCK_ACTIONS = {
     # Add more blocks here if you like
 }
 
+# Optional: also report block occupancy to the Flask dispatcher
+# (e.g. "http://localhost:5000/api/dispatcher/occupancy"); None = disabled
+DISPATCHER_OCCUPANCY_URL = None
+# Pending updates for the dispatcher; when full the oldest one is dropped
+DISPATCHER_QUEUE_SIZE = 64
+
 # 4) Block zones (ROIs) in IMAGE PIXELS
 # These coordinates are for the *resized* image (see DISPLAY_WIDTH below).
 # Adjust these to match your camera view.
@@ -76,6 +86,45 @@ def send_xml(sock: socket.socket, xml_str: str):
     sock.sendall(msg.encode("utf-8"))
 
 
+_occupancy_queue = queue.Queue(DISPATCHER_QUEUE_SIZE)
+_occupancy_thread = None
+
+
+def _occupancy_worker():
+    """POSTs queued occupancy changes, in order, off the video loop."""
+    while True:
+        block_name, occupied = _occupancy_queue.get()
+        body = json.dumps({"block": block_name, "occupied": occupied, "source": "yolo"}).encode("utf-8")
+        req = urllib.request.Request(
+            DISPATCHER_OCCUPANCY_URL, data=body,
+            headers={"Content-Type": "application/json"}, method="POST",
+        )
+        try:
+            urllib.request.urlopen(req, timeout=0.5).close()
+        except Exception as e:
+            print("? Error reporting occupancy to dispatcher:", e)
+
+
+def report_occupancy(block_name: str, occupied: bool):
+    """Queue one occupancy change for the dispatcher (if configured); never blocks."""
+    global _occupancy_thread
+    if not DISPATCHER_OCCUPANCY_URL:
+        return
+    if _occupancy_thread is None:
+        _occupancy_thread = threading.Thread(target=_occupancy_worker, name="yolo-occupancy", daemon=True)
+        _occupancy_thread.start()
+    while True:
+        try:
+            _occupancy_queue.put_nowait((block_name, occupied))
+            return
+        except queue.Full:
+            try:
+                _occupancy_queue.get_nowait()
+                print("? Dispatcher not keeping up, dropping oldest occupancy update")
+            except queue.Empty:
+                pass
+
+
 def point_in_poly(point, poly) -> bool:
     """Return True if point (x, y) lies inside polygon poly."""
     x, y = point
@@ -183,6 +232,7 @@ def main():
                 block_occupied[block_name] = occ_now
                 state_str = "OCCUPIED" if occ_now else "FREE"
                 print(f"[{block_name}] ? {state_str}")
+                report_occupancy(block_name, occ_now)
 
                 actions = BLOCK_ACTIONS.get(block_name, {})
                 xml_cmd = actions.get("occupied" if occ_now else "free")
@@ -0,0 +1,107 @@
+"""
+Benchmark do codec CAN CS2/CS3 (apps/cs3_can.py): framing incremental com
+recv_into num socketpair local, com as frames partidas em pedaços de tamanho
+aleatório (como chegam por TCP), e custo do encoder.
+
+Uso (na raiz do projeto):
+    python benchmarks/bench_cs3_can.py
+    python benchmarks/bench_cs3_can.py --frames 500000
+
+Referência: um bus CAN a 250 kbit/s carregado a 100% não passa das ~2000
+frames/s (frames de 29 bits com 8 bytes de dados).
+"""
+import argparse
+import random
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from apps import cs3_can  # noqa: E402
+from apps.cs3_can import CanFrameReader  # noqa: E402
+
+CAN_BUS_FRAMES_PER_S = 2000
+
+
+def make_stream(n: int) -> bytes:
+    rnd = random.Random(1)
+    frames = []
+    for i in range(n):
+        kind = i % 4
+        if kind == 0:
+            frames.append(cs3_can.loco_speed(0x4000 + rnd.randrange(64), rnd.randrange(1001)))
+        elif kind == 1:
+            frames.append(cs3_can.loco_function(0x4000 + rnd.randrange(64), rnd.randrange(32), 1))
+        elif kind == 2:
+            frames.append(cs3_can.accessory(cs3_can.accessory_uid(rnd.randrange(1, 256)), 1, 1))
+        else:
+            frames.append(cs3_can.encode_frame(cs3_can.CMD_S88_EVENT, bytes(8), response=True))
+    return b"".join(frames)
+
+
+def bench_decode(n: int):
+    payload = make_stream(n)
+    seen = [0, 0]
+
+    def handler(cmd, resp, hash_, dlc, buf, off):
+        seen[0] += 1
+        seen[1] += buf[off + 3]   # lê um byte dos dados, como um handler real
+
+    reader = CanFrameReader(default_handler=handler)
+    a, b = socket.socketpair()
+
+    def writer():
+        rnd = random.Random(2)
+        pos = 0
+        while pos < len(payload):
+            step = rnd.randrange(1, 4096)
+            a.sendall(payload[pos:pos + step])
+            pos += step
+        a.shutdown(socket.SHUT_WR)
+
+    t = threading.Thread(target=writer)
+    cpu0, t0 = time.process_time(), time.perf_counter()
+    t.start()
+    while reader.recv_from(b):
+        pass
+    elapsed = time.perf_counter() - t0
+    cpu = time.process_time() - cpu0
+    t.join()
+    a.close()
+    b.close()
+
+    assert seen[0] == n, (seen[0], n)
+    rate = n / elapsed
+    print(f"decode: {n} frames em {elapsed * 1000:.0f} ms -> {rate:,.0f} frames/s "
+          f"(CPU {cpu * 1000:.0f} ms, {cpu / n * 1e6:.2f} us/frame)")
+    print(f"        bus CAN cheio ({CAN_BUS_FRAMES_PER_S} frames/s) ~ "
+          f"{CAN_BUS_FRAMES_PER_S * cpu / n * 100:.2f}% de um core")
+
+
+def bench_encode(n: int):
+    out = bytearray(cs3_can.FRAME_SIZE)
+    data = bytes(6)
+    t0 = time.perf_counter()
+    for i in range(n):
+        cs3_can.encode_frame(cs3_can.CMD_LOCO_SPEED, data, out=out)
+    into = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for i in range(n):
+        cs3_can.loco_speed(0x4006, i % 1000)
+    helper = time.perf_counter() - t0
+    print(f"encode: pack_into {into / n * 1e6:.2f} us/frame, loco_speed() {helper / n * 1e6:.2f} us/frame")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--frames", type=int, default=200000)
+    args = ap.parse_args()
+    bench_decode(args.frames)
+    bench_encode(args.frames)
+
+
+if __name__ == "__main__":
+    main()
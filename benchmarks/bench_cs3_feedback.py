@@ -0,0 +1,82 @@
+"""
+Receção de feedback S88 no CS3Client sob carga, contra o simulador local
+(apps/cs3_sim.py): frames descodificadas por segundo, atualizações do
+estado e latência de ping (ida e volta) enquanto o feedback corre.
+
+Uso (na raiz do projeto):
+    python benchmarks/bench_cs3_feedback.py
+    python benchmarks/bench_cs3_feedback.py --seconds 5 --rates max,20000,100000
+
+"max" é a taxa do barramento CAN real (~2000 frames/s); taxas acima só
+existem no simulador e servem para ver a folga do decoder. A CPU é a do
+processo inteiro (cliente + simulador correm no mesmo processo).
+"""
+import argparse
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from apps import cs3_can, cs3_client  # noqa: E402
+from apps.cs3_client import CS3Client  # noqa: E402
+from apps.cs3_sim import CS3Simulator, parse_rate  # noqa: E402
+
+
+def run(rate: float, seconds: float, pings: int):
+    sim = CS3Simulator(port=0, udp_reply_port=0, contacts=256, feedback_rate=rate).start()
+    client = CS3Client(host="127.0.0.1", port=sim.port, auto_connect=False)
+
+    pong = threading.Event()
+
+    def on_ping(cmd, resp, hash_, dlc, buf, off):
+        if resp:
+            pong.set()
+
+    client.reader.on(cs3_can.CMD_PING, on_ping)
+    client.connect()
+    time.sleep(0.2)
+
+    frames0, updates0 = client.reader.frames, client.state.updates
+    cpu0, t0 = time.process_time(), time.perf_counter()
+    rtts = []
+    interval = seconds / pings
+    for _ in range(pings):
+        pong.clear()
+        t = time.perf_counter()
+        client.send_raw(cs3_can.ping())
+        if pong.wait(1.0):
+            rtts.append((time.perf_counter() - t) * 1e6)
+        time.sleep(max(0.0, interval - (time.perf_counter() - t)))
+    elapsed = time.perf_counter() - t0
+    cpu = time.process_time() - cpu0
+    frames = client.reader.frames - frames0
+    updates = client.state.updates - updates0
+    sent = sim.feedback_tx
+    client.disconnect()
+    sim.stop()
+
+    rtts.sort()
+    p99 = rtts[max(0, int(len(rtts) * 0.99) - 1)] if rtts else float("nan")
+    print(f"{rate:9.0f} f/s  recebidas {frames / elapsed:9.0f} f/s  "
+          f"estado {updates / elapsed:9.0f} upd/s  "
+          f"ping p50 {statistics.median(rtts) if rtts else float('nan'):7.1f} us  p99 {p99:7.1f} us  "
+          f"CPU {100 * cpu / elapsed:5.1f}%  (sim enviou {sent})")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seconds", type=float, default=3.0)
+    ap.add_argument("--pings", type=int, default=300)
+    ap.add_argument("--rates", default="max,20000,100000")
+    args = ap.parse_args()
+
+    cs3_client.LOG_TX = False
+    for rate in args.rates.split(","):
+        run(parse_rate(rate.strip()), args.seconds, args.pings)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Latência de comandos CS3 por TCP, UDP e modo hybrid contra o simulador
+local da CS3 (apps/cs3_sim.py responde a cada comando com o bit de resposta).
+
+Uso (na raiz do projeto):
+    python benchmarks/bench_cs3_transport.py
+    python benchmarks/bench_cs3_transport.py --count 2000 --burst 500
+
+Mede:
+  - ida e volta de um comando isolado (envia loco_speed, espera o eco)
+  - rajada: N comandos seguidos até chegar o último eco
+"""
+import argparse
+import socket
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from apps import cs3_can, cs3_client  # noqa: E402
+from apps.cs3_client import CS3Client  # noqa: E402
+from apps.cs3_sim import CS3Simulator  # noqa: E402
+
+UID = 0x4006
+
+
+def _free_udp_port() -> int:
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def run(transport: str, sim: CS3Simulator, count: int, burst: int):
+    rx_port = _free_udp_port()
+    sim.udp_reply_port = rx_port
+    client = CS3Client(host="127.0.0.1", port=sim.port, auto_connect=False,
+                       transport=transport, udp_rx_port=rx_port)
+
+    echoes = [0]
+    last_speed = [-1]
+    got = threading.Event()
+
+    def on_speed(cmd, resp, hash_, dlc, buf, off):
+        if resp:
+            echoes[0] += 1
+            last_speed[0] = (buf[off + 4] << 8) | buf[off + 5]
+            got.set()
+
+    for reader in (client.reader, client.udp_reader):
+        reader.on(cs3_can.CMD_LOCO_SPEED, on_speed)
+    client.connect()
+    time.sleep(0.1)
+
+    rtts = []
+    for i in range(count):
+        got.clear()
+        t0 = time.perf_counter()
+        client.set_loco_speed(UID, i % 1000)
+        if not got.wait(1.0):
+            continue   # perdido (UDP)
+        rtts.append((time.perf_counter() - t0) * 1e6)
+
+    echoes[0] = 0
+    t0 = time.perf_counter()
+    for i in range(burst):
+        client.set_loco_speed(UID, i % 1000)
+    deadline = time.perf_counter() + 5.0
+    while echoes[0] < burst and time.perf_counter() < deadline:
+        time.sleep(0.0005)
+    burst_ms = (time.perf_counter() - t0) * 1000.0
+    client.disconnect()
+
+    rtts.sort()
+    print(f"{transport:6s}  rtt p50 {statistics.median(rtts):7.1f} us  "
+          f"p99 {rtts[int(len(rtts) * 0.99) - 1]:7.1f} us  perdidos {count - len(rtts):4d}  |  "
+          f"rajada {burst}: {burst_ms:6.1f} ms ({echoes[0]} ecos)")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--count", type=int, default=1000)
+    ap.add_argument("--burst", type=int, default=500)
+    args = ap.parse_args()
+
+    cs3_client.LOG_TX = False
+    sim = CS3Simulator(port=0, udp_reply_port=0).start()
+    for transport in ("tcp", "udp", "hybrid"):
+        run(transport, sim, args.count, args.burst)
+    sim.stop()
+
+
+if __name__ == "__main__":
+    main()
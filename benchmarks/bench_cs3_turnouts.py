@@ -0,0 +1,56 @@
+"""
+Tempo para estabelecer uma rota de N agulhas na CS3 (simulador local) com
+o escalonador de apps/cs3_turnouts.py, e o pico de bobines ligadas ao
+mesmo tempo que cada configuração provoca na fonte.
+
+Uso (na raiz do projeto):
+    python benchmarks/bench_cs3_turnouts.py
+    python benchmarks/bench_cs3_turnouts.py --turnouts 24 --districts 3
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from apps import cs3_client  # noqa: E402
+from apps.cs3_client import CS3Client  # noqa: E402
+from apps.cs3_sim import CS3Simulator  # noqa: E402
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--turnouts", type=int, default=16)
+    ap.add_argument("--districts", type=int, default=2)
+    ap.add_argument("--pulse-ms", type=int, default=200)
+    ap.add_argument("--spacing-ms", type=int, default=50)
+    args = ap.parse_args()
+
+    cs3_client.LOG_TX = False
+    sim = CS3Simulator(port=0, udp_reply_port=0, turnouts=args.turnouts).start()
+    client = CS3Client(host="127.0.0.1", port=sim.port, auto_connect=False)
+    client.connect()
+
+    per_district = -(-args.turnouts // args.districts)
+    route = [{"id": str(a), "position": "turnout" if a % 2 else "straight"}
+             for a in range(1, args.turnouts + 1)]
+    split = [dict(it, district=f"D{(int(it['id']) - 1) // per_district}") for it in route]
+
+    runs = [
+        ("sequencial, 1 distrito", route, 1),
+        (f"{args.districts} distritos em paralelo", split, 1),
+        (f"{args.districts} distritos, 2 bobines/distrito", split, 2),
+        ("tudo de uma vez (sem limite)", route, args.turnouts),
+    ]
+    for label, items, parallel in runs:
+        sim.max_coils_on = 0
+        r = client.set_turnouts(items, args.pulse_ms, args.spacing_ms, parallel)
+        print(f"{label:34s} {r['total_ms']:7.0f} ms  pico {sim.max_coils_on:3d} bobines  "
+              f"{r['counts']}")
+
+    client.disconnect()
+    sim.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Benchmark do parse do plan.xml: parser DOM antigo (ET.parse + 6x findall)
+contra o parser streaming de apps.rocrail_plan (backend etree e, se estiver
+instalado, lxml), em planos sintéticos.
+
+Uso (na raiz do projeto):
+    python benchmarks/bench_plan_parse.py
+    python benchmarks/bench_plan_parse.py --sizes 1000 10000 100000 --repeat 3
+
+O pico de memória é medido com tracemalloc (só conta alocações Python;
+com o backend lxml a árvore em C não entra na conta).
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from apps import rocrail_plan  # noqa: E402
+
+
+def parse_plan_dom(path: Path) -> Dict[str, Any]:
+    """Implementação anterior de parse_plan(): árvore completa + findall por tipo."""
+    root = ET.parse(path).getroot()
+
+    blocks = [{
+        "id": b.get("id"), "desc": b.get("desc"), "type": b.get("type"),
+        "x": b.get("x"), "y": b.get("y"), "z": b.get("z"),
+    } for b in root.findall(".//block")]
+
+    locos = []
+    for lc in root.findall(".//loc") + root.findall(".//lc"):
+        locos.append({
+            "id": lc.get("id"), "addr": lc.get("addr"), "desc": lc.get("desc"),
+            "protocol": lc.get("prot"), "image": lc.get("image"), "max_speed": lc.get("V_max"),
+            "functions": [{
+                "no": fn.get("no"), "text": fn.get("text"), "icon": fn.get("icon"),
+                "type": fn.get("type"), "state": fn.get("state"),
+            } for fn in lc.findall("fn")],
+        })
+
+    switches = [{
+        "id": sw.get("id"), "addr": sw.get("addr"), "port": sw.get("port"),
+        "desc": sw.get("desc"), "type": sw.get("type"), "state": sw.get("state"),
+        "x": sw.get("x"), "y": sw.get("y"), "z": sw.get("z"),
+    } for sw in root.findall(".//switch")]
+
+    sensors = [{
+        "id": sn.get("id"), "addr": sn.get("addr"), "port": sn.get("port"),
+        "desc": sn.get("desc"), "type": sn.get("type"),
+    } for sn in root.findall(".//sensor")]
+
+    tracks = [{
+        "id": t.get("id"), "type": t.get("type"), "blockid": t.get("blockid"),
+        "x": t.get("x"), "y": t.get("y"), "z": t.get("z"), "angle": t.get("angle"),
+    } for t in root.findall(".//track")]
+
+    return {"blocks": blocks, "locos": locos, "switches": switches,
+            "sensors": sensors, "tracks": tracks}
+
+
+def write_synthetic_plan(path: Path, n_elements: int, seed: int = 1):
+    """Plano com ~n_elements objetos: 70% tracks, 10% blocos, 10% agulhas, 8% sensores, 2% locos."""
+    rnd = random.Random(seed)
+    n_blocks = n_switches = n_elements // 10
+    n_sensors = n_elements * 8 // 100
+    n_locos = max(1, n_elements // 50)
+    n_tracks = n_elements - n_blocks - n_switches - n_sensors - n_locos
+
+    with path.open("w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<plan title="bench">\n')
+        f.write("<lclist>\n")
+        for i in range(n_locos):
+            f.write(f'<lc id="L{i}" addr="{i}" prot="M" V_max="100" desc="loco {i}">')
+            for fn in range(4):
+                f.write(f'<fn no="{fn}" text="f{fn}" type="default"/>')
+            f.write("</lc>\n")
+        f.write("</lclist>\n<bklist>\n")
+        for i in range(n_blocks):
+            f.write(f'<block id="B{i}" desc="bloco {i}" type="none" x="{rnd.randint(0, 999)}" '
+                    f'y="{rnd.randint(0, 999)}" z="{rnd.randint(0, 2)}"/>\n')
+        f.write("</bklist>\n<swlist>\n")
+        for i in range(n_switches):
+            f.write(f'<switch id="S{i}" addr="{i}" port="1" type="left" state="straight" '
+                    f'x="{rnd.randint(0, 999)}" y="{rnd.randint(0, 999)}"/>\n')
+        f.write("</swlist>\n<fblist>\n")
+        for i in range(n_sensors):
+            f.write(f'<sensor id="F{i}" addr="{i}" port="1" type="default"/>\n')
+        f.write("</fblist>\n<tklist>\n")
+        for i in range(n_tracks):
+            f.write(f'<track id="T{i}" type="straight" x="{rnd.randint(0, 999)}" '
+                    f'y="{rnd.randint(0, 999)}" z="{rnd.randint(0, 2)}" angle="0"/>\n')
+        f.write("</tklist>\n</plan>\n")
+
+
+def measure(fn: Callable[[Path], Dict[str, Any]], path: Path, repeat: int) -> Tuple[float, float, Dict[str, Any]]:
+    """Devolve (melhor tempo em ms, pico de memória em MB, resultado)."""
+    best = float("inf")
+    result: Dict[str, Any] = {}
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn(path)
+        best = min(best, (time.perf_counter() - t0) * 1000.0)
+
+    tracemalloc.start()
+    fn(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak / 1e6, result
+
+
+def streaming_with(backend: str) -> Callable[[Path], Dict[str, Any]]:
+    def run(path: Path) -> Dict[str, Any]:
+        rocrail_plan.XML_BACKEND = backend
+        return rocrail_plan._parse_plan_file(path)
+    run.__name__ = f"stream/{backend}"
+    return run
+
+
+def main(argv: List[str] = None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args(argv)
+
+    backends = ["etree"] + (["lxml"] if rocrail_plan._lxml_etree is not None else [])
+    parsers = [parse_plan_dom] + [streaming_with(b) for b in backends]
+
+    # o parser de produção faz prints de progresso; aqui não interessam
+    devnull = open(os.devnull, "w")
+
+    print(f"{'elementos':>10} {'MB xml':>7}  {'parser':<13} {'ms':>8} {'pico MB':>8} {'vs dom':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.sizes:
+            path = Path(tmp) / f"plan_{n}.xml"
+            write_synthetic_plan(path, n)
+            size_mb = path.stat().st_size / 1e6
+
+            dom_ms, reference = None, None
+            for parser in parsers:
+                stdout, sys.stdout = sys.stdout, devnull
+                try:
+                    ms, peak_mb, result = measure(parser, path, args.repeat)
+                finally:
+                    sys.stdout = stdout
+                if dom_ms is None:
+                    dom_ms, reference = ms, result
+                same = "" if result == reference else "  (RESULTADO DIFERENTE!)"
+                print(f"{n:>10} {size_mb:>7.1f}  {parser.__name__:<13} {ms:>8.1f} "
+                      f"{peak_mb:>8.1f} {dom_ms / ms:>6.2f}x{same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Autopilot do RC car (apps/rc_autopilot.py) sobre frames sintéticas: tempo
+por etapa do pipeline e erro lateral em malha fechada com pure pursuit e
+PID, sem câmara nem carro.
+
+Cada frame é desenhada a partir do estado de um carro simulado (desvio
+lateral e rumo em relação a uma pista com curvas): chão escuro com ruído e
+duas linhas claras. O carro responde ao steering com um modelo cinemático
+simples, por isso o resultado serve para comparar controladores e ganhos,
+não como valores para o carro real (para isso: replay sobre vídeo gravado).
+
+Uso (na raiz do projeto):
+    python benchmarks/bench_rc_autopilot.py
+    python benchmarks/bench_rc_autopilot.py --frames 600 --width 1280 --height 720
+"""
+import argparse
+import math
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from apps import rc_autopilot  # noqa: E402
+from apps.rc_autopilot import LaneDetector, LanePilot, StageTimes, SteeringController  # noqa: E402
+
+FPS = 30.0
+SPEED = 1.0            # meias-larguras de imagem por segundo
+STEER_RATE = 1.5       # rumo (rad/s) com steering = 1
+LANE_HALF = 0.6        # meia largura da faixa (normalizada)
+
+
+class LaneSim:
+    """Carro numa pista com curvatura variável; desenha a vista da câmara."""
+
+    def __init__(self, width: int, height: int, seed: int = 1):
+        self.w, self.h = width, height
+        self.rng = np.random.default_rng(seed)
+        self.offset = 0.3       # carro à esquerda (+) / direita (-) do centro da faixa
+        self.heading = 0.0
+        self.t = 0.0
+        self.errors = []
+        ys = np.arange(height)
+        roi_top = int(height * rc_autopilot.ROI_TOP)
+        # distância no chão de cada linha de imagem (perto no fundo)
+        y_norm = np.clip((height - 1 - ys) / max(height - 1 - roi_top, 1), 0.0, 1.5)
+        self.dist = rc_autopilot.LOOKAHEAD_NEAR + y_norm * (rc_autopilot.LOOKAHEAD_FAR - rc_autopilot.LOOKAHEAD_NEAR)
+        self.xs = np.linspace(-1.0, 1.0, width)
+        self.line_w = 0.04
+
+    def curvature(self) -> float:
+        return 0.35 * math.sin(self.t * 0.5)
+
+    def frame(self) -> np.ndarray:
+        k = self.curvature()
+        d = self.dist[:, None]
+        # centro da faixa visto do carro em cada linha de imagem
+        center = self.offset - self.heading * d + 0.5 * k * d * d
+        x = self.xs[None, :]
+        lines = (np.abs(x - (center - LANE_HALF)) < self.line_w) | (np.abs(x - (center + LANE_HALF)) < self.line_w)
+        img = self.rng.integers(20, 60, size=(self.h, self.w), dtype=np.uint8)
+        img[lines] = 220
+        return np.repeat(img[:, :, None], 3, axis=2)
+
+    def step(self, steering: float):
+        dt = 1.0 / FPS
+        self.heading += (STEER_RATE * steering - SPEED * self.curvature()) * dt
+        self.offset -= SPEED * math.sin(self.heading) * dt
+        self.t += dt
+        self.errors.append(self.offset)
+
+
+def closed_loop(label: str, controller: SteeringController, frames: int, width: int, height: int):
+    sim = LaneSim(width, height)
+    pilot = LanePilot(LaneDetector("lane"), controller, use_yolo=False)
+    stats = StageTimes()
+    lost = 0
+    for _ in range(frames):
+        frame = sim.frame()
+        r = pilot.process(frame, time.perf_counter())
+        stats.add(r["times"])
+        lost += r["found"] == 0
+        sim.step(r["steering"])
+    err = np.abs(np.array(sim.errors[frames // 5:]))     # sem o transitório inicial
+    st = stats.summary()
+    print(f"{label:18s} |desvio| médio {err.mean():5.3f}  máx {err.max():5.3f}  sem faixa {lost:3d}  "
+          f"preprocess p50 {st['preprocess']['p50']:6.3f} ms  lane p50 {st['lane']['p50']:6.3f} ms  "
+          f"control p50 {st['control']['p50']:6.3f} ms  pipeline p99 {st['total']['p99']:6.3f} ms")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--frames", type=int, default=300)
+    ap.add_argument("--width", type=int, default=640)
+    ap.add_argument("--height", type=int, default=480)
+    args = ap.parse_args()
+
+    print(f"{args.width}x{args.height}, ROI {rc_autopilot.ROI_TOP:.2f}..1, redução {rc_autopilot.DOWNSCALE}x")
+    closed_loop("pure pursuit", SteeringController("pursuit"), args.frames, args.width, args.height)
+    closed_loop("PID", SteeringController("pid"), args.frames, args.width, args.height)
+    closed_loop("PID (só P, kd=0)", SteeringController("pid", kd=0.0), args.frames, args.width, args.height)
+
+
+if __name__ == "__main__":
+    main()
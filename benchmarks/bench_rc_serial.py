@@ -0,0 +1,127 @@
+"""
+Protocolo série do RC car: bytes por comando e latência servidor -> Arduino
+(e ACK de volta) a 115200 baud, ASCII antigo vs. frames binárias.
+
+O "Arduino" é uma thread do próprio benchmark no lado mestre de um pty
+(loopback, sem hardware); o SerialBackend abre o lado escravo com pyserial
+como se fosse a porta real. Um pty não tem baud rate, por isso o Arduino
+virtual espera o tempo de fio de cada pedaço (10 bits/byte) antes de o
+tratar e antes de mandar o ACK. A latência inclui a passagem pela fila e
+pela thread de escrita do backend; "CPU send()" é o custo para quem envia.
+
+Uso (na raiz do projeto, Linux/macOS, precisa de pyserial):
+    python benchmarks/bench_rc_serial.py
+    python benchmarks/bench_rc_serial.py --commands 2000 --baud 115200
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+import tty
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from apps import rc_serial_proto  # noqa: E402
+from apps.rc_car_core import SerialBackend  # noqa: E402
+
+
+class VirtualArduino(threading.Thread):
+    """Lê o lado mestre do pty, descodifica comandos e responde com ACKs."""
+
+    def __init__(self, fd: int, baud: int, protocol: str):
+        super().__init__(daemon=True)
+        self.fd = fd
+        self.byte_s = 10.0 / baud
+        self.protocol = protocol
+        self.reader = rc_serial_proto.FrameReader()
+        self.reader.on(rc_serial_proto.T_CMD, self._on_cmd)
+        self.line = bytearray()
+        self.decoded = threading.Event()
+        self.last = None
+        self.running = True
+
+    def _on_cmd(self, seq, fields):
+        self.last = fields[:2]
+        self.decoded.set()
+        if fields[2] & rc_serial_proto.FLAG_ACK_REQ:
+            ack = rc_serial_proto.encode_ack(seq)
+            time.sleep(len(ack) * self.byte_s)
+            os.write(self.fd, ack)
+
+    def run(self):
+        while self.running:
+            try:
+                data = os.read(self.fd, 256)
+            except OSError:
+                return
+            time.sleep(len(data) * self.byte_s)
+            if self.protocol == "binary":
+                self.reader.feed(data)
+                continue
+            self.line += data
+            while b"\n" in self.line:
+                raw, _, rest = bytes(self.line).partition(b"\n")
+                self.line = bytearray(rest)
+                s, t = (float(p.split(":")[1]) for p in raw.decode("ascii").split(";"))
+                self.last = (s, t)
+                self.decoded.set()
+
+
+def run(protocol: str, ack: bool, commands: int, baud: int):
+    master, slave = os.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    arduino = VirtualArduino(master, baud, protocol)
+    arduino.start()
+    backend = SerialBackend(os.ttyname(slave), baud, protocol=protocol, ack=ack, reset_wait_s=0.0)
+    backend.ready.wait(5.0)
+
+    lat = []
+    cpu = 0.0
+    for i in range(commands):
+        s = ((i % 41) - 20) / 20.0
+        t = ((i * 7 % 41) - 20) / 20.0
+        arduino.decoded.clear()
+        c0 = time.process_time()
+        t0 = time.perf_counter()
+        backend.send(s, t)
+        cpu += time.process_time() - c0
+        if not arduino.decoded.wait(1.0):
+            continue
+        lat.append((time.perf_counter() - t0) * 1000.0)
+        if ack:
+            # espera o ACK chegar antes do próximo comando
+            deadline = time.perf_counter() + 0.1
+            while backend.acks + backend.nacks < i + 1 and time.perf_counter() < deadline:
+                time.sleep(0.0002)
+
+    st = backend.get_status()
+    arduino.running = False
+    backend.close()
+    os.close(master)
+    os.close(slave)
+
+    lat.sort()
+    label = protocol + (" + ACK" if ack else "")
+    ack_txt = f"ACK p50 {st['ack_ms']['p50']:6.2f} ms" if st["ack_ms"] else ""
+    print(f"{label:14s} {st['bytes_tx'] / st['frames_tx']:5.1f} B/cmd  "
+          f"fio {st['bytes_tx'] / st['frames_tx'] * 10000.0 / baud:5.2f} ms  "
+          f"latência p50 {statistics.median(lat):6.2f} ms  p99 {lat[int(0.99 * (len(lat) - 1))]:6.2f} ms  "
+          f"CPU send() {cpu / commands * 1e6:5.1f} us  {ack_txt}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--commands", type=int, default=500)
+    ap.add_argument("--baud", type=int, default=115200)
+    args = ap.parse_args()
+
+    for protocol, ack in (("ascii", False), ("binary", False), ("binary", True)):
+        run(protocol, ack, args.commands, args.baud)
+
+
+if __name__ == "__main__":
+    main()
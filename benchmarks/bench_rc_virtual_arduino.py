@@ -0,0 +1,163 @@
+"""
+RC car ponta a ponta sem hardware: RCCarController -> SerialBackend ->
+pty -> Arduino virtual (apps/rc_virtual_arduino.py).
+
+Três medições:
+  - comandos/s: SerialBackend.send() o mais depressa possível; quantos
+    comandos o "Arduino" recebe por segundo e quantos o backend descarta
+    (fila cheia) quando a porta não dá vazão
+  - latência ponta a ponta: rc_car.set_manual_command() até o Arduino
+    aplicar esse steering (inclui o loop de controlo a RC_CONTROL_HZ, a fila,
+    o fio ao baud rate e a latência injetada), p50/p99
+  - contrapressão e erros: os mesmos comandos com tráfego extra a entupir
+    a porta, sketch lento (buffer da UART a transbordar), baud baixo e bits
+    trocados / ACKs perdidos
+
+Os números dependem do pty e do escalonador do SO (não é uma UART real);
+servem para comparar configurações e para apanhar regressões no backend.
+
+Uso (na raiz do projeto, Linux/macOS, precisa de pyserial):
+    python benchmarks/bench_rc_virtual_arduino.py
+    python benchmarks/bench_rc_virtual_arduino.py --commands 400 --seconds 3
+"""
+import argparse
+import contextlib
+import io
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from apps import rc_serial_proto  # noqa: E402
+from apps.rc_car_core import DummyBackend, SerialBackend, rc_car  # noqa: E402
+from apps.rc_virtual_arduino import VirtualArduino  # noqa: E402
+
+RESET_S = 0.2
+
+
+def pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def connect(baud: int, protocol: str = "binary", ack: bool = False, **device):
+    """Arduino virtual + SerialBackend ligado a ele, já depois do reset."""
+    dev = VirtualArduino(baud, protocol, reset_delay_s=RESET_S, seed=1, **device).start()
+    backend = SerialBackend(dev.port, baud, protocol=protocol, ack=ack, reset_wait_s=RESET_S + 0.05)
+    if not backend.ready.wait(5.0):
+        raise RuntimeError(f"porta {dev.port} não abriu: {backend.last_error}")
+    time.sleep(0.05)      # banner de arranque
+    return dev, backend
+
+
+def close(dev: VirtualArduino, backend: SerialBackend):
+    backend.close()
+    time.sleep(0.05)
+    dev.stop()
+
+
+def bench_throughput(baud: int, protocol: str, seconds: float):
+    dev, backend = connect(baud, protocol)
+    frame = 9 if protocol == "binary" else len(rc_serial_proto.encode_ascii(-0.5, 0.25))
+    rx0, sent = dev.cmds_rx, 0
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < seconds:
+        backend.send(-0.5, 0.25)
+        sent += 1
+        if sent % 64 == 0:
+            time.sleep(0.0005)
+    elapsed = time.perf_counter() - t0
+    received = dev.cmds_rx - rx0
+    st = dev.get_stats()
+    close(dev, backend)
+    print(f"{protocol:6s} {baud:7d} baud  {sent / elapsed:9.0f} cmd/s oferecidos  "
+          f"{received / elapsed:6.0f} cmd/s recebidos (máx. teórico {baud / 10 / frame:5.0f})  "
+          f"descartados {backend.dropped / sent:6.1%}  overflow UART {st['rx_overflow']} B")
+
+
+def bench_latency(label: str, commands: int, period: float, baud: int = 115200,
+                  ack: bool = False, flood_hz: float = 0.0, **device):
+    dev, backend = connect(baud, ack=ack, **device)
+    rc_car.set_backend(backend)
+
+    flooding = threading.Event()
+    if flood_hz:
+        flooding.set()
+
+        def flood():
+            # outro produtor a encher a mesma porta (p.ex. comandos auxiliares)
+            while flooding.is_set():
+                backend.send(0.0, 0.0)
+                time.sleep(1.0 / flood_hz)
+
+        threading.Thread(target=flood, daemon=True).start()
+
+    sent = []
+    with contextlib.redirect_stdout(io.StringIO()):     # o backend loga cada comando novo
+        for i in range(commands):
+            steering = rc_serial_proto.dequantize(rc_serial_proto.quantize(((i % 97) - 48) / 50.0))
+            sent.append((time.perf_counter(), steering))
+            rc_car.set_manual_command(steering, 0.3)
+            time.sleep(period)
+        time.sleep(0.2)
+        flooding.clear()
+        rc_car.emergency_stop()
+    time.sleep(0.05)
+
+    applied = list(dev.applied)
+    lat, j = [], 0
+    for t_set, steering in sent:
+        while j < len(applied) and applied[j][0] < t_set:
+            j += 1
+        k = j
+        while k < len(applied) and abs(applied[k][1] - steering) > 1e-6:
+            k += 1
+        if k < len(applied):
+            lat.append((applied[k][0] - t_set) * 1000.0)
+    st = dev.get_stats()
+    bst = backend.get_status()
+    rc_car.set_backend(DummyBackend())
+    time.sleep(0.05)
+    dev.stop()
+
+    line = f"{label:28s} "
+    if lat:
+        line += f"p50 {pct(lat, 0.5):7.2f} ms  p99 {pct(lat, 0.99):7.2f} ms  "
+    line += (f"aplicados {len(lat):4d}/{commands}  descartados {bst['dropped']:5d}  "
+             f"overflow {st['rx_overflow']:5d} B  CRC Arduino {st['crc_errors']:3d}  "
+             f"CRC servidor {bst['crc_errors']:3d}  telemetria {bst['telemetry']['samples']}/{st['telem_tx']}")
+    if ack:
+        line += f"  ACKs {bst['acks']}/{bst['frames_tx']}"
+    print(line)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--commands", type=int, default=200)
+    ap.add_argument("--period-ms", type=float, default=25.0)
+    ap.add_argument("--seconds", type=float, default=2.0)
+    args = ap.parse_args()
+    period = args.period_ms / 1000.0
+
+    print("== comandos/s (send() sem pausa) ==")
+    bench_throughput(115200, "ascii", args.seconds)
+    bench_throughput(115200, "binary", args.seconds)
+    bench_throughput(1000000, "binary", args.seconds)
+
+    print(f"\n== latência set_manual_command -> Arduino ({args.commands} comandos a cada {args.period_ms:g} ms) ==")
+    bench_latency("base (115200)", args.commands, period)
+    bench_latency("com ACK", args.commands, period, ack=True)
+    bench_latency("latência 10 ms ±5 ms", args.commands, period, latency_ms=10.0, jitter_ms=5.0)
+
+    print("\n== contrapressão e erros ==")
+    bench_latency("9600 baud", args.commands, period, baud=9600)
+    bench_latency("9600 baud + 2000 cmd/s extra", args.commands, period, baud=9600, flood_hz=2000.0)
+    bench_latency("sketch lento (loop 10 ms)", args.commands, period, loop_ms=10.0, flood_hz=2000.0)
+    bench_latency("bits trocados 1e-3 + ACK", args.commands, period, ack=True, error_rate=1e-3)
+    bench_latency("ACKs perdidos 5%", args.commands, period, ack=True, ack_drop_rate=0.05)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Canal de controlo do RC car: POST HTTP por comando (/api/rc/manual) vs.
+WebSocket (apps/rc_ws.py), ambos a alimentar o mesmo RCCarController.
+
+Mede a latência de um comando (pedido -> resposta, ou ping da aplicação no
+WebSocket, que passa pelo mesmo caminho que os comandos) e quantas
+mensagens de controlo por segundo o servidor trata, com a CPU do processo
+(cliente e servidor correm no mesmo processo, por isso a CPU é o total).
+
+O lado HTTP é um Flask mínimo com o mesmo handler que a rota real, servido
+pelo servidor de desenvolvimento do Werkzeug com keep-alive.
+
+Uso (na raiz do projeto):
+    python benchmarks/bench_rc_ws.py
+    python benchmarks/bench_rc_ws.py --messages 20000 --pings 500
+"""
+import argparse
+import base64
+import http.client
+import logging
+import os
+import socket
+import statistics
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from apps import rc_ws  # noqa: E402
+from apps.rc_car_core import RCCarBackendBase, rc_car  # noqa: E402
+
+
+class QuietBackend(RCCarBackendBase):
+    def set_command(self, steering: float, throttle: float):
+        pass
+
+
+def pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class WsClient:
+    """Cliente WebSocket mínimo (frames mascaradas, como um browser)."""
+
+    def __init__(self, port: int):
+        self.sock = socket.create_connection(("127.0.0.1", port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        key = base64.b64encode(os.urandom(16)).decode("ascii")
+        self.sock.sendall((f"GET {rc_ws.RC_WS_PATH} HTTP/1.1\r\nHost: localhost\r\n"
+                           f"Origin: http://localhost:5005\r\n"
+                           f"Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                           f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+        self.buf = b""
+        while b"\r\n\r\n" not in self.buf:
+            self.buf += self.sock.recv(4096)
+        head, _, self.buf = self.buf.partition(b"\r\n\r\n")
+        assert rc_ws.accept_key(key).encode() in head, head
+        self.mask = os.urandom(4)
+
+    def frame(self, payload: bytes) -> bytes:
+        return rc_ws.encode_frame(rc_ws.OP_BINARY, payload, self.mask)
+
+    def _parse(self):
+        buf = self.buf
+        if len(buf) < 2:
+            return None
+        n, pos = buf[1] & 0x7F, 2
+        if n == 126:
+            if len(buf) < 4:
+                return None
+            n, pos = struct.unpack("!H", buf[2:4])[0], 4
+        elif n == 127:
+            if len(buf) < 10:
+                return None
+            n, pos = struct.unpack("!Q", buf[2:10])[0], 10
+        if len(buf) < pos + n:
+            return None
+        self.buf = buf[pos + n:]
+        return buf[0] & 0x0F, buf[pos:pos + n]
+
+    def recv_message(self):
+        """Próxima mensagem do servidor: (opcode, payload)."""
+        while True:
+            msg = self._parse()
+            if msg is not None:
+                return msg
+            self.buf += self.sock.recv(65536)
+
+    def ping(self, i: int) -> float:
+        t = time.perf_counter()
+        self.sock.sendall(self.frame(struct.pack("<BI", rc_ws.MSG_PING, i)))
+        while True:
+            op, data = self.recv_message()
+            if op == rc_ws.OP_BINARY and data[0] == rc_ws.MSG_PONG:
+                return (time.perf_counter() - t) * 1000.0
+
+
+def bench_ws(messages: int, pings: int):
+    server = rc_ws.RCWebSocketServer(host="127.0.0.1", port=0).start()
+    client = WsClient(server.port)
+
+    rtts = [client.ping(i) for i in range(pings)]
+
+    frames = b"".join(client.frame(struct.pack("<Bhh", rc_ws.MSG_CONTROL, (i % 200) * 100 - 10000, 3000))
+                      for i in range(1000))
+    cpu0, t0 = time.process_time(), time.perf_counter()
+    rx0 = server.control_rx
+    for _ in range(messages // 1000):
+        client.sock.sendall(frames)
+    client.ping(0)   # espera que o servidor trate tudo o que veio antes
+    elapsed = time.perf_counter() - t0
+    cpu = time.process_time() - cpu0
+    handled = server.control_rx - rx0
+    client.sock.close()
+    server.stop()
+    print(f"WebSocket  comando p50 {statistics.median(rtts):6.3f} ms  p99 {pct(rtts, 0.99):6.3f} ms  "
+          f"{handled / elapsed:9.0f} msg/s  {handled / cpu:9.0f} msg/s por core")
+
+
+def bench_http(messages: int, pings: int):
+    try:
+        from flask import Flask, jsonify, request
+        from werkzeug.serving import make_server
+    except ImportError:
+        print("HTTP       (Flask não instalado, sem comparação)")
+        return
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    app = Flask("bench_rc_ws")
+
+    @app.route("/api/rc/manual", methods=["POST"])
+    def api_rc_manual():
+        data = request.json or {}
+        rc_car.set_manual_command(float(data.get("steering", 0.0)), float(data.get("throttle", 0.0)))
+        return jsonify({"status": "ok"})
+
+    srv = make_server("127.0.0.1", 0, app, threaded=True)
+    srv.RequestHandlerClass.protocol_version = "HTTP/1.1"    # keep-alive
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    conn = http.client.HTTPConnection("127.0.0.1", srv.server_port)
+
+    def post(i):
+        body = f'{{"steering": {(i % 200) / 200.0}, "throttle": 0.1}}'
+        conn.request("POST", "/api/rc/manual", body, {"Content-Type": "application/json"})
+        conn.getresponse().read()
+
+    rtts = []
+    for i in range(pings):
+        t = time.perf_counter()
+        post(i)
+        rtts.append((time.perf_counter() - t) * 1000.0)
+
+    n = min(messages, 5000)
+    cpu0, t0 = time.process_time(), time.perf_counter()
+    for i in range(n):
+        post(i)
+    elapsed = time.perf_counter() - t0
+    cpu = time.process_time() - cpu0
+    conn.close()
+    srv.shutdown()
+    print(f"HTTP POST  comando p50 {statistics.median(rtts):6.3f} ms  p99 {pct(rtts, 0.99):6.3f} ms  "
+          f"{n / elapsed:9.0f} msg/s  {n / cpu:9.0f} msg/s por core")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--messages", type=int, default=20000)
+    ap.add_argument("--pings", type=int, default=300)
+    args = ap.parse_args()
+
+    rc_car.set_backend(QuietBackend())
+    bench_http(args.messages, args.pings)
+    bench_ws(args.messages, args.pings)
+    rc_car.emergency_stop()
+
+
+if __name__ == "__main__":
+    main()
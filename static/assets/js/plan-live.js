@@ -0,0 +1,59 @@
+// Atualizações do plan.xml quase em tempo real (polling de /api/rocrail/plan/diffs).
+// O servidor só envia o diff (adicionados / removidos / atributos alterados),
+// por isso as páginas atualizam as listas em memória sem recarregar o plano.
+// Cada pedido responde logo (não prende o worker do gunicorn); enquanto o plano
+// não muda, o browser revalida com a ETag e recebe um 304 sem corpo.
+
+"use strict";
+
+// Intervalo entre pedidos de diffs
+const PLAN_POLL_MS = 2000;
+
+// Aplica o diff de um tipo ("switches", "tracks", ...) a uma lista de objetos.
+// Objetos sem id são identificados pela posição ("@x,y,z"), tal como no servidor.
+function applyPlanDiff(list, diff, kind) {
+  const keyOf = o => (o.id !== null && o.id !== undefined) ? o.id : `@${o.x},${o.y},${o.z}`;
+  const removed = new Set((diff.removed || {})[kind] || []);
+  const changed = {};
+  ((diff.changed || {})[kind] || []).forEach(c => { changed[c.id] = c.attrs; });
+
+  const out = [];
+  (list || []).forEach(obj => {
+    const key = keyOf(obj);
+    if (removed.has(key)) return;
+    out.push(changed[key] ? Object.assign({}, obj, changed[key]) : obj);
+  });
+  ((diff.added || {})[kind] || []).forEach(obj => out.push(obj));
+  return out;
+}
+
+// Pede os diffs periodicamente. onDiff(diff) é chamado por cada versão nova;
+// onReset() quando o cliente perdeu diffs e deve recarregar tudo.
+function planLive(diffsUrl, onDiff, onReset) {
+  let version = null;
+  let timer = null;
+
+  async function poll() {
+    try {
+      const url = version === null ? diffsUrl : `${diffsUrl}?since=${version}`;
+      const res = await fetch(url, { cache: "no-cache" });
+      if (res.ok) {
+        const data = await res.json();
+        if (data.reset) {
+          if (onReset) onReset();
+        }
+        (data.diffs || []).forEach(diff => {
+          console.log("[PLAN_LIVE] v" + diff.version, diff);
+          onDiff(diff);
+        });
+        version = data.version;
+      }
+    } catch (e) {
+      console.error("[PLAN_LIVE] Erro a pedir diffs:", e);
+    }
+    timer = setTimeout(poll, PLAN_POLL_MS);
+  }
+
+  poll();
+  return () => clearTimeout(timer);
+}
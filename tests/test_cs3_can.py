@@ -0,0 +1,52 @@
+import struct
+
+from apps import cs3_can
+from apps.cs3_can import CanFrameReader
+
+
+def make_reader(**kwargs):
+    seen = []
+    reader = CanFrameReader(**kwargs)
+    reader.on(cs3_can.CMD_LOCO_SPEED,
+              lambda cmd, resp, h, dlc, buf, off: seen.append(struct.unpack_from(">IH", buf, off)))
+    return reader, seen
+
+
+def test_encode_frame_layout():
+    frame = cs3_can.loco_speed(0x4006, 1500)
+    assert len(frame) == cs3_can.FRAME_SIZE
+    can_id, dlc, data = struct.unpack(">IB8s", frame)
+    assert cs3_can.split_can_id(can_id) == (0, cs3_can.CMD_LOCO_SPEED, 0, cs3_can.DEFAULT_HASH)
+    assert dlc == 6 and struct.unpack_from(">IH", data) == (0x4006, cs3_can.SPEED_MAX)
+
+
+def test_frames_split_across_reads_are_joined():
+    reader, seen = make_reader()
+    data = cs3_can.loco_speed(1, 10) + cs3_can.loco_speed(2, 20) + cs3_can.ping()
+    # bytes a conta-gotas: cada frame só é despachada quando fica completa
+    for i in range(0, len(data), 5):
+        reader.feed(data[i:i + 5])
+    assert seen == [(1, 10), (2, 20)]
+    assert reader.frames == 3 and reader.start == reader.end == 0
+
+
+def test_partial_frame_survives_buffer_compaction():
+    reader, seen = make_reader(capacity_frames=2)
+    data = b"".join(cs3_can.loco_speed(i, i) for i in range(5))
+    reader.feed(data[:20])
+    reader.feed(data[20:])
+    assert seen == [(i, i) for i in range(5)]
+
+
+def test_datagram_rest_is_discarded():
+    reader, seen = make_reader()
+    reader.feed_datagram(cs3_can.loco_speed(1, 10) + b"\x00\x08")
+    # o resto do datagrama anterior não se junta ao seguinte
+    reader.feed_datagram(cs3_can.loco_speed(2, 20))
+    assert seen == [(1, 10), (2, 20)]
+
+
+def test_unregistered_commands_are_ignored():
+    reader, seen = make_reader()
+    assert reader.feed(cs3_can.system_stop() + cs3_can.loco_speed(3, 30)) == 2
+    assert seen == [(3, 30)]
@@ -0,0 +1,101 @@
+import socket
+import struct
+import time
+
+import pytest
+
+from apps import cs3_can
+from apps.cs3_client import CS3Client
+from apps.cs3_config import ConfigCache, ConfigStream, build_stream, parse_cs2
+from apps.cs3_sim import CS3Simulator
+
+LOKS = "[lokomotive]\nlokomotive\n .name=BR 218\n .uid=0x4006\n .funktionen\n ..nr=0\n"
+
+
+def stream_frames(text: str, bad_crc: bool = False) -> bytes:
+    padded, crc, length = build_stream(text)
+    if bad_crc:
+        crc ^= 0x0101
+    frames = [cs3_can.encode_frame(cs3_can.CMD_CONFIG_STREAM, struct.pack(">IH", length, crc))]
+    frames += [cs3_can.encode_frame(cs3_can.CMD_CONFIG_STREAM, padded[i:i + 8])
+               for i in range(0, len(padded), 8)]
+    return b"".join(frames)
+
+
+def feed(stream: ConfigStream, data: bytes):
+    for off in range(0, len(data), cs3_can.FRAME_SIZE):
+        stream.on_frame(data[off + 4], data, off + 5)
+
+
+def test_cs2_parser_records_and_subrecords():
+    entries = parse_cs2(LOKS)
+    assert entries == [("lokomotive", {"name": "BR 218", "uid": "0x4006", "funktionen": [{"nr": "0"}]})]
+
+
+def test_stream_checks_crc_and_fills_cache(tmp_path):
+    cache = ConfigCache(tmp_path)
+    stream = ConfigStream("loks", cache)
+    feed(stream, stream_frames(LOKS))
+    assert stream.done.is_set() and stream.error is None
+    assert stream.text == LOKS and not stream.from_cache
+
+    again = ConfigStream("loks", cache)
+    feed(again, stream_frames(LOKS)[:cs3_can.FRAME_SIZE])
+    # só com o cabeçalho (CRC igual) já há resultado da cache
+    assert again.done.is_set() and again.from_cache and again.entries == stream.entries
+
+
+def test_stream_with_bad_crc_fails(tmp_path):
+    stream = ConfigStream("loks", ConfigCache(tmp_path))
+    feed(stream, stream_frames(LOKS, bad_crc=True))
+    assert stream.done.is_set() and "CRC" in stream.error
+
+
+def test_rest_of_cached_stream_is_discarded_by_the_reader(tmp_path):
+    client = CS3Client(auto_connect=False)
+    client.config_cache = ConfigCache(tmp_path)
+    client.config_cache.store("loks", *build_stream(LOKS)[1:], LOKS)
+
+    old = ConfigStream("loks", client.config_cache)
+    first = stream_frames(LOKS)
+    old.on_frame(first[4], first, 5)
+    assert old.from_cache
+    # como request_config() deixa um stream servido da cache
+    client._discarding = old
+    client._stream = new = ConfigStream("mags", client.config_cache)
+
+    mags = "[magnetartikel]\nartikel\n .id=1\n"
+    client.reader.feed(first[cs3_can.FRAME_SIZE:] + stream_frames(mags))
+    assert client._discarding is None
+    assert new.done.is_set() and new.text == mags
+
+
+def free_udp_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.mark.parametrize("transport", ["tcp", "udp", "hybrid"])
+def test_client_against_simulator(tmp_path, transport):
+    rx_port = free_udp_port()
+    sim = CS3Simulator(port=0, udp_reply_port=rx_port, locos=3, turnouts=2).start()
+    client = CS3Client(host="127.0.0.1", port=sim.port, auto_connect=False,
+                       transport=transport, udp_rx_port=rx_port)
+    client.config_cache = ConfigCache(tmp_path)
+    try:
+        client.connect()
+        if transport != "udp":
+            # 2º pedido servido da cache: o 3º não espera pelo resto do 2º
+            for _ in range(3):
+                locos = client.request_loco_list()
+            assert len(locos) == 3
+        uid = cs3_can.loco_uid(1, "mfx")
+        client.set_loco_speed(uid, 500)
+        deadline = time.time() + 2.0
+        while sim.locos[uid]["speed"] != 500 and time.time() < deadline:
+            time.sleep(0.01)
+        assert sim.locos[uid]["speed"] == 500
+    finally:
+        client.disconnect()
+        sim.stop()
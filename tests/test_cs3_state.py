@@ -0,0 +1,45 @@
+from apps.cs3_state import CS3StateStore
+
+
+def test_update_publishes_only_real_changes():
+    store = CS3StateStore()
+    first = store.update("locos", "16390", speed=100)
+    assert first["seq"] == 1
+    assert store.update("locos", "16390", speed=100) is first
+    second = store.update("locos", "16390", direction="forward")
+    assert second is not first and second["seq"] == 2
+    # o registo publicado antes não é alterado
+    assert "direction" not in first
+    assert second["speed"] == 100
+
+
+def test_update_nested_functions():
+    store = CS3StateStore()
+    store.update_nested("locos", "1", "functions", 0, True)
+    rec = store.update_nested("locos", "1", "functions", 3, True)
+    assert rec["functions"] == {0: True, 3: True}
+    assert store.update_nested("locos", "1", "functions", 3, True) is rec
+
+
+def test_changes_since_and_reset():
+    store = CS3StateStore()
+    store.update("locos", "1", speed=0)
+    store.update("turnouts", "T1", position="straight")
+    store.update("locos", "1", speed=50)
+    changes = store.changes_since(1)
+    assert [(r["kind"], r["seq"]) for r in changes["changed"]] == [("turnouts", 2), ("locos", 3)]
+    assert changes["seq"] == 3 and not changes["reset"]
+
+    # seq de outra sessão (servidor reiniciado): vai tudo
+    changes = store.changes_since(99)
+    assert changes["reset"] and len(changes["changed"]) == 2
+
+
+def test_snapshot_and_counts():
+    store = CS3StateStore()
+    store.update("feedback", "1:5", occupied=True)
+    store.update("system", "track", state="go")
+    snap = store.snapshot()
+    assert snap["feedback"]["1:5"]["occupied"] is True
+    assert snap["locos"] == {} and snap["seq"] == 2
+    assert store.counts() == {"locos": 0, "turnouts": 0, "feedback": 1, "system": 1}
@@ -0,0 +1,68 @@
+import asyncio
+import struct
+
+import pytest
+
+from apps import cs3_can
+from apps.cs3_client import CS3Client
+from apps.cs3_turnouts import build_turnout_batch, district_of, parse_districts
+
+
+class FakeCS3:
+    """Só o que o lote usa do CS3Client; a CS reporta o fim de cada impulso."""
+
+    turnout_uid = CS3Client.turnout_uid
+
+    def __init__(self, report=True):
+        self.turnouts = {"Entrada": {"uid": cs3_can.accessory_uid(40), "name": "Entrada"}}
+        self.accessory_listeners = []
+        self.report = report
+        self.sent = []
+
+    def send_raw(self, data):
+        uid, position, _, time_10ms = struct.unpack_from(">IBBH", data, 5)
+        self.sent.append((uid, position))
+        if self.report:
+            asyncio.get_running_loop().call_later(
+                time_10ms / 100.0, lambda: [fn(uid, position, 0) for fn in list(self.accessory_listeners)])
+
+
+def test_parse_districts_and_lookup():
+    districts = parse_districts("1-16=norte, 17-32=sul,40=patio,lixo")
+    assert districts == [(1, 16, "norte"), (17, 32, "sul"), (40, 40, "patio")]
+    assert [district_of(a, districts) for a in (1, 17, 40, 41)] == ["norte", "sul", "patio", "default"]
+
+
+def test_batch_is_validated_before_switching():
+    client = FakeCS3()
+    with pytest.raises(ValueError) as e:
+        build_turnout_batch(client, [["1", "straight"], {"position": "turnout"},
+                                     {"id": "2", "position": "left"}, {"id": "nada"}], 20)
+    assert [err["index"] for err in e.value.args[0]] == [1, 2, 3]
+    assert client.sent == []
+
+
+def test_repeated_turnout_keeps_last_position():
+    batch = build_turnout_batch(FakeCS3(), [["1", "straight"], ["Entrada", "turnout"],
+                                            ["1", "turnout"]], 20)
+    assert [(it["id"], it["position"]) for it in batch.items] == [("Entrada", "turnout"), ("1", "turnout")]
+
+
+def test_district_is_paced_and_districts_run_in_parallel():
+    client = FakeCS3()
+    items = [{"id": str(a), "district": "norte"} for a in (1, 2, 3)] + [{"id": "20", "district": "sul"}]
+    batch = build_turnout_batch(client, items, pulse_ms=30, spacing_ms=20, max_parallel=1)
+    result = asyncio.run(batch.run())
+    assert result["counts"] == {"done": 4, "assumed": 0, "error": 0}
+    norte = [r for r in result["results"] if r["district"] == "norte"]
+    for prev, nxt in zip(norte, norte[1:]):
+        assert nxt["start_ms"] >= prev["done_ms"] + 15
+    sul = next(r for r in result["results"] if r["district"] == "sul")
+    assert sul["start_ms"] < norte[1]["start_ms"]
+    assert client.accessory_listeners == []
+
+
+def test_missing_report_is_assumed_after_margin():
+    batch = build_turnout_batch(FakeCS3(report=False), [["1", "straight"]], pulse_ms=10)
+    result = asyncio.run(batch.run())
+    assert result["results"][0]["status"] == "assumed" and result["status"] == "ok"
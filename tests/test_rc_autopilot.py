@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+
+from apps import rc_autopilot
+from apps.rc_autopilot import AutopilotRunner, LanePilot, YOLO_EVERY
+
+
+class FakeCar:
+    def __init__(self, throttle=0.0):
+        self.autopilot_enabled = True
+        self.last_command = {"steering": 0.0, "throttle": throttle}
+        self.sent = []
+
+    def set_autopilot_command(self, steering, throttle):
+        self.sent.append((steering, throttle))
+        self.last_command = {"steering": steering, "throttle": throttle}
+
+    def enable_autopilot(self, enabled):
+        self.autopilot_enabled = enabled
+
+
+def make_runner(monkeypatch, throttle):
+    car = FakeCar(throttle)
+    monkeypatch.setattr(rc_autopilot, "rc_car", car)
+    runner = AutopilotRunner(budget_ms=80)
+    runner.pilot = LanePilot(use_yolo=False)
+    return runner, car
+
+
+def result(throttle, total_ms):
+    return {"steering": 0.1, "throttle": throttle, "times": {"total": total_ms}}
+
+
+def test_late_command_that_speeds_up_is_dropped(monkeypatch):
+    runner, car = make_runner(monkeypatch, 0.2)
+    runner._send(result(0.3, 120.0))
+    assert car.sent == [] and runner.late == 1
+    assert runner.pilot.yolo_every == 2 * YOLO_EVERY
+
+
+@pytest.mark.parametrize("throttle", [0.1, 0.0])
+def test_late_command_that_slows_or_stops_is_sent(monkeypatch, throttle):
+    # abrandar e o stop por obstáculo (throttle 0) nunca são descartados
+    runner, car = make_runner(monkeypatch, 0.3)
+    runner._send(result(throttle, 120.0))
+    assert car.sent == [(0.1, throttle)]
+    assert runner.late == 1 and runner.sent == 1
+
+
+def test_off_on_while_runner_exits_keeps_a_runner(monkeypatch):
+    car = FakeCar()
+    monkeypatch.setattr(rc_autopilot, "rc_car", car)
+    stopping = threading.Event()
+    release = threading.Event()
+
+    class StubCamera:
+        def __init__(self, url):
+            pass
+
+        def start(self):
+            pass
+
+        def wait(self, seq, timeout=1.0):
+            time.sleep(0.005)
+            return None
+
+        def stop(self):
+            # a thread antiga fica presa a sair enquanto chega o ON
+            stopping.set()
+            release.wait(5.0)
+
+    monkeypatch.setattr(rc_autopilot, "CameraSource", StubCamera)
+    runner = AutopilotRunner()
+    runner.on_autopilot(True)
+    first = runner._thread
+
+    car.autopilot_enabled = False
+    assert stopping.wait(5.0)
+    car.autopilot_enabled = True
+    runner.on_autopilot(True)
+    release.set()
+    first.join(5.0)
+    assert runner.running and runner._thread is not first
+
+    car.autopilot_enabled = False
+    runner._thread.join(5.0)
+    assert not runner.running
@@ -0,0 +1,74 @@
+from apps.rc_car_core import RCCarBackendBase, RCCarController
+
+
+class RecordingBackend(RCCarBackendBase):
+    def __init__(self):
+        self.sent = []
+        self.stops = 0
+
+    def set_command(self, steering, throttle):
+        self.sent.append((steering, throttle))
+
+    def stop(self):
+        self.stops += 1
+
+
+def make_controller():
+    backend = RecordingBackend()
+    ctl = RCCarController(backend, hz=50, setpoint_timeout_s=0.5)
+    ctl._ensure_loop = lambda: None     # os ticks são chamados à mão
+    return ctl, backend
+
+
+def run_ticks(ctl, start, n):
+    """Corre até n ticks a partir de start; devolve o instante do último."""
+    now = start
+    for _ in range(n):
+        now += ctl.period
+        if not ctl._tick(now):
+            break
+    return now
+
+
+def test_throttle_is_slewed_towards_setpoint():
+    ctl, backend = make_controller()
+    ctl.set_manual_command(0.2, 1.0)
+    ctl._tick(ctl._setpoint_at)
+    assert backend.sent == [(0.2, 0.04)]      # 2.0/s a 50 Hz
+
+
+def test_releasing_the_stick_disarms_without_watchdog_trip():
+    ctl, backend = make_controller()
+    ctl.enable_autopilot(True)
+    ctl.set_autopilot_command(0.0, 0.5)
+    run_ticks(ctl, ctl._setpoint_at, 20)
+    ctl.set_manual_command(0.0, 0.0)
+    ctl.enable_autopilot(True)
+    # trava até 0/0 e dorme sem STOP, mesmo depois do timeout
+    t0 = ctl._setpoint_at
+    run_ticks(ctl, t0, 100)
+    assert backend.sent[-1] == (0.0, 0.0)
+    assert not ctl._armed
+    assert ctl._tick(t0 + 10.0) is False
+    assert ctl.watchdog_trips == 0 and backend.stops == 0
+    assert ctl.autopilot_enabled
+
+
+def test_watchdog_trips_when_car_is_moving():
+    ctl, backend = make_controller()
+    ctl.set_manual_command(0.0, 0.5)
+    t0 = ctl._setpoint_at
+    run_ticks(ctl, t0, 5)
+    assert ctl._tick(t0 + 0.6) is False
+    assert ctl.watchdog_trips == 1 and backend.stops == 1
+    assert ctl._output == [0.0, 0.0] and not ctl._armed
+
+
+def test_emergency_stop_between_ticks_is_not_overwritten():
+    ctl, backend = make_controller()
+    ctl.set_manual_command(0.0, 0.5)
+    t0 = run_ticks(ctl, ctl._setpoint_at, 5)
+    ctl.emergency_stop()
+    sent = len(backend.sent)
+    assert ctl._tick(t0 + ctl.period) is False
+    assert len(backend.sent) == sent and ctl._output == [0.0, 0.0]
@@ -0,0 +1,39 @@
+from apps import rc_serial_proto as proto
+from apps.rc_serial_proto import CommandEncoder, FrameReader
+
+
+def test_cmd_roundtrip_and_seq_wraps():
+    enc = CommandEncoder()
+    enc.seq = 255
+    frame = bytes(enc.encode(0.5, -1.0, proto.FLAG_STOP))
+    assert len(frame) == proto.CMD_SIZE and frame[0] == proto.SYNC
+    (ftype, seq, (s, t, flags)), = FrameReader().feed(frame)
+    assert (ftype, seq, flags) == (proto.T_CMD, 0, proto.FLAG_STOP)
+    assert abs(s - 0.5) < 1e-4 and t == -1.0
+
+
+def test_frames_split_byte_by_byte():
+    reader = FrameReader()
+    acks = []
+    reader.on(proto.T_ACK, lambda seq, fields: acks.append((seq, fields)))
+    data = proto.encode_ack(7) + proto.encode_telemetry(8, 7.4, 1.25)
+    frames = [f for b in data for f in reader.feed(bytes((b,)))]
+    assert [f[0] for f in frames] == [proto.T_ACK, proto.T_TELEM]
+    assert acks == [(7, (proto.ACK_OK,))]
+    assert frames[1][2][:2] == (7.4, 1.25) and frames[1][2][4] == 1.0
+    assert reader.buf == bytearray()
+
+
+def test_resync_after_banner_and_bad_crc():
+    reader = FrameReader()
+    bad = bytearray(proto.encode_ack(1))
+    bad[3] ^= 0x10
+    # banner de texto do sketch, sync com tipo desconhecido, CRC errado
+    data = b"RC car firmware READY\r\n" + bytes((proto.SYNC, 0x55)) + bytes(bad) + proto.encode_ack(2)
+    frames = reader.feed(data)
+    assert [f[1] for f in frames] == [2]
+    assert reader.crc_errors == 1 and reader.resyncs >= 2
+
+
+def test_ascii_fallback_is_clamped():
+    assert proto.encode_ascii(0.25, -3.0) == b"S:0.25;T:-1.00\n"
@@ -0,0 +1,35 @@
+import numpy as np
+
+from apps.rc_telemetry import TelemetryRing
+
+FIELDS = ("battery_v", "wheel_speed")
+
+
+def filled(n, size=5):
+    ring = TelemetryRing(size=size, fields=FIELDS)
+    for i in range(n):
+        ring.append((8.0 - i * 0.01, float(i)), t=100.0 + i * 0.1)
+    return ring
+
+
+def test_ring_keeps_last_samples_in_order_after_wrap():
+    ring = filled(12)
+    rows = ring.since(10.0)
+    assert ring.count == 12
+    assert rows[:, 2].tolist() == [7.0, 8.0, 9.0, 10.0, 11.0]
+
+
+def test_since_cuts_relative_to_last_sample():
+    ring = filled(12)
+    assert ring.since(0.25)[:, 2].tolist() == [9.0, 10.0, 11.0]
+    assert len(TelemetryRing(size=4, fields=FIELDS).since(1.0)) == 0
+
+
+def test_summary_and_window():
+    ring = filled(4, size=10)
+    s = ring.summary(seconds=1.0)
+    assert s["samples"] == 4 and s["rate_hz"] == 10.0
+    assert s["last"] == {"battery_v": 7.97, "wheel_speed": 3.0}
+    w = ring.window(1.0, points=2)
+    assert w["points"] == 2 and w["wheel_speed"] == [0.5, 2.5]
+    assert np.isclose(w["t"][0], 100.05)
@@ -0,0 +1,68 @@
+import os
+import time
+
+import pytest
+
+pytest.importorskip("serial")
+if not hasattr(os, "openpty"):
+    pytest.skip("sem pty neste sistema", allow_module_level=True)
+
+from apps.rc_car_core import SerialBackend
+from apps.rc_virtual_arduino import VirtualArduino
+
+
+def wait_for(cond, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not cond() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return cond()
+
+
+@pytest.fixture
+def arduino():
+    ard = VirtualArduino(reset_delay_s=0.05, telemetry_hz=100, loop_ms=0.5, seed=1).start()
+    yield ard
+    ard.stop()
+
+
+def test_serial_backend_against_virtual_arduino(arduino):
+    backend = SerialBackend(arduino.port, ack=True, reset_wait_s=0.1)
+    try:
+        assert backend.ready.wait(5.0)
+        backend.set_command(0.25, 0.5)
+        assert wait_for(lambda: arduino.throttle == pytest.approx(0.5, abs=1e-3))
+        assert arduino.steering == pytest.approx(0.25, abs=1e-3)
+        # ACK do comando e telemetria lida por cima do banner do sketch
+        assert wait_for(lambda: backend.acks >= 1 and backend.telemetry.count >= 3)
+        assert backend.reader.crc_errors == 0 and backend.nacks == 0
+        assert backend.telemetry.summary()["last"]["battery_v"] > 7.0
+
+        backend.stop()
+        assert wait_for(lambda: arduino.throttle == 0.0)
+    finally:
+        backend.close()
+
+
+def test_failsafe_stops_car_without_commands(arduino):
+    arduino.failsafe_s = 0.1
+    backend = SerialBackend(arduino.port, reset_wait_s=0.1)
+    try:
+        assert backend.ready.wait(5.0)
+        backend.set_command(0.0, 0.4)
+        assert wait_for(lambda: arduino.throttle > 0.0)
+        assert wait_for(lambda: arduino.failsafe_trips == 1 and arduino.throttle == 0.0)
+    finally:
+        backend.close()
+
+
+def test_close_delivers_final_stop(arduino):
+    backend = SerialBackend(arduino.port, reset_wait_s=0.1)
+    assert backend.ready.wait(5.0)
+    backend.set_command(0.3, 0.6)
+    assert wait_for(lambda: arduino.throttle > 0.0)
+    for _ in range(10):
+        backend.set_command(0.3, 0.6)
+    # set_backend() depende disto: o último comando que o carro recebe é o STOP
+    backend.close()
+    assert wait_for(lambda: arduino.applied[-1][1:] == (0.0, 0.0), timeout=2.0)
+    assert arduino.failsafe_trips == 0
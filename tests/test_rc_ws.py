@@ -0,0 +1,133 @@
+import base64
+import os
+import socket
+import struct
+import time
+
+import pytest
+
+from apps import rc_ws
+from apps.rc_ws import RCWebSocketServer
+
+
+class RecordingCar:
+    def __init__(self):
+        self.calls = []
+
+    def set_manual_command(self, steering, throttle):
+        self.calls.append(("manual", round(steering, 3), round(throttle, 3)))
+
+    def emergency_stop(self):
+        self.calls.append(("stop",))
+
+    def enable_autopilot(self, enabled):
+        self.calls.append(("autopilot", enabled))
+
+    def get_status(self):
+        return {}
+
+
+@pytest.fixture
+def server(monkeypatch):
+    car = RecordingCar()
+    monkeypatch.setattr(rc_ws, "rc_car", car)
+    srv = RCWebSocketServer(host="127.0.0.1", port=0, status_hz=1,
+                            allowed_origins=["https://painel.example.com/"]).start()
+    yield srv, car
+    srv.stop()
+
+
+def handshake(port, origin, host="127.0.0.1:5005", extra=""):
+    sock = socket.create_connection(("127.0.0.1", port), timeout=5.0)
+    key = base64.b64encode(os.urandom(16)).decode("ascii")
+    head = f"GET /rc HTTP/1.1\r\nHost: {host}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+    if origin is not None:
+        head += f"Origin: {origin}\r\n"
+    sock.sendall((head + extra + f"Sec-WebSocket-Key: {key}\r\n\r\n").encode())
+    buf = b""
+    while b"\r\n\r\n" not in buf:
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        buf += chunk
+    status = buf.split(b"\r\n", 1)[0].decode()
+    if " 101 " in status:
+        assert rc_ws.accept_key(key).encode() in buf
+    return sock, status
+
+
+def recv_frame(sock):
+    head = sock.recv(2)
+    n = head[1] & 0x7F
+    assert n < 126
+    data = b""
+    while len(data) < n:
+        data += sock.recv(n - len(data))
+    return head[0] & 0x0F, data
+
+
+@pytest.mark.parametrize("origin", ["http://127.0.0.1:5005", "https://painel.example.com"])
+def test_same_host_or_listed_origin_is_accepted(server, origin):
+    srv, _ = server
+    sock, status = handshake(srv.port, origin)
+    sock.close()
+    assert " 101 " in status
+
+
+@pytest.mark.parametrize("origin", ["http://evil.example.com", "null", None])
+def test_foreign_or_missing_origin_is_rejected(server, origin):
+    srv, _ = server
+    sock, status = handshake(srv.port, origin)
+    sock.close()
+    assert " 403 " in status
+    assert srv.rejected == 1 and not srv.clients
+
+
+@pytest.mark.parametrize("extra, status", [
+    ("X-Forwarded-Host: rocrail.example.com\r\n", " 101 "),
+    ("", " 403 "),
+])
+def test_proxied_handshake_uses_forwarded_host(server, extra, status):
+    # nginx sem "Host $host" reencaminha o host do upstream
+    srv, _ = server
+    sock, got = handshake(srv.port, "https://rocrail.example.com", host="appseed_app:5006", extra=extra)
+    sock.close()
+    assert status in got
+
+
+def test_control_message_and_application_ping(server):
+    srv, car = server
+    sock, _ = handshake(srv.port, "http://127.0.0.1")
+    mask = os.urandom(4)
+    msg = bytes((rc_ws.MSG_CONTROL,)) + struct.pack("<hh", 16384, -32767)
+    # mensagem fragmentada em duas frames (a 1ª sem FIN)
+    first = bytearray(rc_ws.encode_frame(rc_ws.OP_BINARY, msg[:2], mask))
+    first[0] &= 0x7F
+    sock.sendall(bytes(first) + rc_ws.encode_frame(rc_ws.OP_CONT, msg[2:], mask))
+    sock.sendall(rc_ws.encode_frame(rc_ws.OP_BINARY, b"\x04\x2a\x00\x00\x00", mask))
+    assert recv_frame(sock) == (rc_ws.OP_BINARY, b"\x84\x2a\x00\x00\x00")
+    assert car.calls == [("manual", 0.5, -1.0)]
+    # a ligação que conduziu o carro pára-o quando cai
+    sock.close()
+    deadline = time.monotonic() + 5.0
+    while ("stop",) not in car.calls and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert car.calls[-1] == ("stop",) and srv.control_rx == 1
+
+
+def test_unmasked_client_frame_closes_with_protocol_error(server):
+    srv, _ = server
+    sock, _ = handshake(srv.port, "http://127.0.0.1")
+    sock.sendall(rc_ws.encode_frame(rc_ws.OP_BINARY, b"\x02"))
+    assert recv_frame(sock) == (rc_ws.OP_CLOSE, struct.pack("!H", 1002))
+    sock.close()
+
+
+def test_encode_frame_lengths_and_mask_roundtrip():
+    mask = b"\x01\x02\x03\x04"
+    for n in (0, 125, 126, 70000):
+        payload = os.urandom(n)
+        frame = rc_ws.encode_frame(rc_ws.OP_BINARY, payload, mask)
+        pos = {125: 2, 0: 2, 126: 4, 70000: 10}[n]
+        assert frame[1] & 0x80
+        assert rc_ws.unmask(frame[pos + 4:], frame[pos:pos + 4]) == payload
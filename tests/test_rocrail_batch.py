@@ -0,0 +1,58 @@
+import pytest
+
+from apps.rocrail_core import build_batch, build_command
+
+
+@pytest.mark.parametrize("item, xml", [
+    ({"op": "go", "loco_id": "ICE1", "speed": 40}, '<lc id="ICE1" V="40"/>'),
+    ({"op": "speed", "loco_id": "ICE1", "speed": 0}, '<lc id="ICE1" V="0"/>'),
+    ({"op": "stop", "loco_id": "BR218"}, '<lc id="BR218" cmd="stop"/>'),
+    ({"op": "direction", "loco_id": "ICE1", "direction": "rev"}, '<lc id="ICE1" dir="false"/>'),
+    ({"op": "function", "loco_id": "ICE1", "fn_no": 3, "state": False}, '<lc id="ICE1" f3="false"/>'),
+    ({"op": "switch", "id": "SW1", "cmd": "TURNOUT"}, '<sw id="SW1" cmd="turnout"/>'),
+])
+def test_build_command(item, xml):
+    assert build_command(item) == xml
+
+
+@pytest.mark.parametrize("item", [
+    "go",
+    {"op": "fly", "loco_id": "ICE1"},
+    {"op": "go", "speed": 40},
+    {"op": "go", "loco_id": "ICE1", "speed": 101},
+    {"op": "direction", "loco_id": "ICE1", "direction": "up"},
+    {"op": "function", "loco_id": "ICE1", "fn_no": -1},
+    {"op": "switch", "cmd": "straight"},
+    {"op": "switch", "id": "SW1", "cmd": "left"},
+])
+def test_build_command_invalid(item):
+    with pytest.raises(ValueError):
+        build_command(item)
+
+
+def test_build_batch_ok():
+    xml_list, results = build_batch([
+        {"op": "go", "loco_id": "ICE1", "speed": 40},
+        {"op": "switch", "id": "SW1", "cmd": "turnout"},
+    ])
+    assert xml_list == ['<lc id="ICE1" V="40"/>', '<sw id="SW1" cmd="turnout"/>']
+    assert [r["status"] for r in results] == ["ok", "ok"]
+
+
+def test_build_batch_all_or_nothing():
+    xml_list, results = build_batch([
+        {"op": "go", "loco_id": "ICE1", "speed": 40},
+        {"op": "go", "loco_id": "ICE1", "speed": "fast"},
+        {"op": "stop", "loco_id": "ICE1"},
+    ])
+    assert xml_list == []
+    # os válidos não foram enviados: não podem aparecer como "ok"
+    assert [r["status"] for r in results] == ["skipped", "error", "skipped"]
+    assert results[1]["index"] == 1 and results[1]["error"]
+
+
+def test_error_messages_are_portuguese():
+    _, results = build_batch([{"op": "go", "speed": 40}, {"op": "switch"},
+                              {"op": "go", "loco_id": "ICE1", "speed": "fast"}])
+    assert [r["error"] for r in results] == [
+        "loco_id em falta", "id em falta", "speed não é um inteiro: 'fast'"]
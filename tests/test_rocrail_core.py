@@ -0,0 +1,42 @@
+import socket
+import time
+
+from apps.rocrail_core import RocrailClient
+
+
+def listening_socket():
+    srv = socket.socket()
+    srv.bind(("127.0.0.1", 0))
+    srv.listen()
+    srv.settimeout(5.0)
+    return srv
+
+
+def test_first_command_after_lazy_start_is_sent():
+    srv = listening_socket()
+    client = RocrailClient("127.0.0.1", srv.getsockname()[1])
+    try:
+        # sem start() antes: o comando espera pela primeira ligação
+        client.send_xml('<lc id="ICE1" V="40"/>')
+        conn, _ = srv.accept()
+        conn.settimeout(5.0)
+        assert conn.recv(1024) == b'<lc id="ICE1" V="40"/>\n'
+        conn.close()
+    finally:
+        client.conn.close()
+        srv.close()
+
+
+def test_unreachable_rocrail_drops_without_waiting_again():
+    srv = listening_socket()
+    port = srv.getsockname()[1]
+    srv.close()   # porta fechada: ligação recusada
+    client = RocrailClient("127.0.0.1", port)
+    client.conn.retry_s = 60.0
+    try:
+        assert client.send_batch(['<lc id="ICE1" cmd="stop"/>']) is False
+        t0 = time.perf_counter()
+        assert client.send_batch(['<lc id="ICE1" cmd="stop"/>']) is False
+        assert time.perf_counter() - t0 < 0.5
+    finally:
+        client.conn.close()
@@ -0,0 +1,68 @@
+from apps import rocrail_dispatcher
+from apps.rocrail_dispatcher import BlockDispatcher
+from apps.rocrail_graph import build_block_graph
+from apps.rocrail_safety import CollisionPredictor
+
+# anel B1 -> B2 -> B3 -> B4 -> B1 (blocos nos cantos, tracks nos lados)
+RING = {
+    "blocks": [{"id": "B1", "x": 0, "y": 0}, {"id": "B2", "x": 2, "y": 0},
+               {"id": "B3", "x": 2, "y": 2}, {"id": "B4", "x": 0, "y": 2}],
+    "tracks": [{"id": "T1", "x": 1, "y": 0, "type": "straight"},
+               {"id": "T2", "x": 2, "y": 1, "type": "straight"},
+               {"id": "T3", "x": 1, "y": 2, "type": "straight"},
+               {"id": "T4", "x": 0, "y": 1, "type": "straight"}],
+    "switches": [],
+}
+
+
+def without_block(plan, block_id):
+    return dict(plan, blocks=[b for b in plan["blocks"] if b["id"] != block_id])
+
+
+def test_trains_reserve_ahead_and_wait_for_occupied_blocks():
+    sent = []
+    disp = BlockDispatcher(build_block_graph(RING), commander=sent.extend, lookahead=1)
+    disp.set_occupancy("B2", True)
+    disp.add_train("ICE1", ["B1", "B2", "B3", "B4"])
+    assert disp.trains["ICE1"].ahead == [] and "ICE1" in disp.waiting["B2"]
+
+    disp.set_occupancy("B2", False)
+    assert disp.trains["ICE1"].ahead == ["B2"]
+    assert sent[-1] == {"op": "go", "loco_id": "ICE1", "speed": 40}
+
+
+def test_new_graph_drops_trains_whose_route_is_gone():
+    sent = []
+    disp = BlockDispatcher(build_block_graph(RING), commander=sent.extend)
+    disp.add_train("ICE1", ["B1", "B2", "B3", "B4"])
+    disp.add_train("BR218", ["B4", "B1"], loop=False)
+
+    disp.set_graph(build_block_graph(without_block(RING, "B2")))
+    assert list(disp.trains) == ["BR218"]
+    assert {"op": "stop", "loco_id": "ICE1"} in sent
+    assert "ICE1" not in disp.reserved_by.values()
+    # o bloco libertado passa para o comboio que esperava por ele
+    assert disp.reserved_by["B1"] == "BR218"
+
+
+def test_get_dispatcher_follows_plan_version(monkeypatch):
+    graphs = [build_block_graph(RING)]
+    monkeypatch.setattr(rocrail_dispatcher, "get_block_graph", lambda: graphs[-1])
+    monkeypatch.setattr(rocrail_dispatcher, "dispatcher", None)
+    disp = rocrail_dispatcher.get_dispatcher()
+    assert rocrail_dispatcher.get_dispatcher().graph is graphs[0]
+
+    graphs.append(build_block_graph(without_block(RING, "B4")))
+    assert rocrail_dispatcher.get_dispatcher() is disp
+    assert disp.graph is graphs[1]
+    from apps.rocrail_core import rocrail
+    rocrail.remove_listener(disp.on_rocrail_event)
+
+
+def test_predictor_switches_graph_between_cycles():
+    graphs = [build_block_graph(RING)]
+    pred = CollisionPredictor(graphs[0], graph_provider=lambda: graphs[-1])
+    graphs.append(build_block_graph(without_block(RING, "B4")))
+    pred.step()
+    assert pred.graph is graphs[1]
+    assert "B4" not in pred.block_index
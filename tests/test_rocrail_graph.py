@@ -0,0 +1,33 @@
+from apps.rocrail_graph import build_block_graph
+
+# B1 - SW1 - B2 a direito; pelo desvio da SW1 chega-se a B3 (por baixo)
+PLAN = {
+    "blocks": [{"id": "B1", "x": "0", "y": "0"}, {"id": "B2", "x": "2", "y": "0"},
+               {"id": "B3", "x": "1", "y": "2"}],
+    "tracks": [{"id": "T1", "x": "1", "y": "1", "type": "straight"}],
+    "switches": [{"id": "SW1", "x": "1", "y": "0", "type": "left"}],
+}
+
+
+def test_routes_set_switches_by_direction():
+    graph = build_block_graph(PLAN)
+    assert graph.route_dict("B1", "B2")["switches"] == [{"id": "SW1", "cmd": "straight"}]
+    route = graph.route_dict("B1", "B3")
+    assert route["blocks"] == ["B1", "B3"]
+    assert route["switches"] == [{"id": "SW1", "cmd": "turnout"}]
+    assert graph.route_dict("B1", "NOPE") is None
+
+
+def test_routes_are_cached_per_graph():
+    graph = build_block_graph(PLAN)
+    graph.route("B1", "B3")
+    graph.route("B1", "B3")
+    assert graph.stats()["route_cache"]["hits"] == 1
+    # um grafo novo (outra versão do plano) começa com a cache vazia
+    assert build_block_graph(PLAN).stats()["route_cache"]["size"] == 0
+
+
+def test_graph_is_not_rebuilt_while_plan_is_missing(tmp_path, monkeypatch):
+    from apps import rocrail_graph, rocrail_plan
+    monkeypatch.setattr(rocrail_plan, "ROCRAIL_PLAN_PATH", tmp_path / "nope.xml")
+    assert rocrail_graph.get_block_graph() is rocrail_graph.get_block_graph()
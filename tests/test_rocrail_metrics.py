@@ -0,0 +1,61 @@
+from apps import rocrail_metrics
+from apps.rocrail_metrics import CommandLatencyTracker, classify_command
+
+
+def test_classify_command_expected_values():
+    assert classify_command('<lc id="ICE1" V="40"/>') == ("speed", "lc", "ICE1", "V", "40")
+    assert classify_command('<lc id="ICE1" cmd="stop"/>') == ("stop", "lc", "ICE1", "V", "0")
+    assert classify_command('<lc id="ICE1" dir="false"/>') == ("direction", "lc", "ICE1", "dir", "false")
+    assert classify_command('<lc id="ICE1" f2="true"/>') == ("function", "lc", "ICE1", "f2", "true")
+    assert classify_command('<sw id="SW1" cmd="turnout"/>') == ("switch", "sw", "SW1", "state", "turnout")
+    assert classify_command('<lc id="ICE1"/>') is None
+
+
+def test_unrelated_lc_event_does_not_confirm():
+    m = CommandLatencyTracker()
+    m.on_sent('<lc id="ICE1" V="40"/>', sent_at=0.0)
+    # broadcast com V/dir de outro estado: não é a confirmação
+    m.on_event("lc", {"id": "ICE1", "V": "0", "dir": "true"}, received_at=0.01)
+    assert m.histograms["speed"].count == 0
+    m.on_event("lc", {"id": "ICE1", "V": "40", "dir": "true"}, received_at=0.05)
+    assert m.histograms["speed"].count == 1
+    assert round(m.histograms["speed"].max_ms) == 50
+    assert not m.pending
+
+
+def test_direction_function_and_switch_compare_values():
+    m = CommandLatencyTracker()
+    m.on_sent('<lc id="ICE1" dir="false"/>', sent_at=0.0)
+    m.on_sent('<lc id="ICE1" f0="true"/>', sent_at=0.0)
+    m.on_sent('<sw id="SW1" cmd="turnout"/>', sent_at=0.0)
+    m.on_event("lc", {"id": "ICE1", "V": "0", "dir": "true", "fn": "false"}, received_at=0.01)
+    m.on_event("sw", {"id": "SW1", "state": "straight"}, received_at=0.01)
+    assert sum(h.count for h in m.histograms.values()) == 0
+    m.on_event("lc", {"id": "ICE1", "V": "0", "dir": "false", "fn": "true"}, received_at=0.02)
+    m.on_event("sw", {"id": "SW1", "state": "turnout"}, received_at=0.02)
+    assert m.histograms["direction"].count == 1
+    assert m.histograms["function"].count == 1
+    assert m.histograms["switch"].count == 1
+
+
+def test_newer_confirmation_supersedes_older_command():
+    m = CommandLatencyTracker()
+    m.on_sent('<lc id="ICE1" V="40"/>', sent_at=0.0)
+    m.on_sent('<lc id="ICE1" V="60"/>', sent_at=0.001)
+    m.on_event("lc", {"id": "ICE1", "V": "60"}, received_at=0.02)
+    assert m.histograms["speed"].count == 1
+    assert m.superseded["speed"] == 1
+    assert not m.pending
+
+
+def test_unanswered_objects_expire_and_are_capped():
+    m = CommandLatencyTracker(timeout_s=1.0)
+    m.on_sent('<lc id="GHOST" V="10"/>', sent_at=0.0)
+    # um envio para outro objeto, mais tarde, expira a fila do que nunca respondeu
+    m.on_sent('<lc id="ICE1" V="10"/>', sent_at=5.0)
+    assert ("lc", "GHOST") not in m.pending
+    assert m.timeouts["speed"] == 1
+
+    for i in range(rocrail_metrics.MAX_PENDING_PER_OBJECT + 10):
+        m.on_sent(f'<lc id="ICE1" f{i % 20}="true"/>', sent_at=5.0)
+    assert len(m.pending[("lc", "ICE1")]) == rocrail_metrics.MAX_PENDING_PER_OBJECT
@@ -0,0 +1,132 @@
+import os
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from apps import rocrail_plan
+from apps.rocrail_plan import parse_plan
+
+PLAN_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<plan>
+  <bklist>
+    <block id="B1" desc="Estação" x="0" y="0" z="0"/>
+    <block id="B2" x="2" y="0" z="0"/>
+  </bklist>
+  <lclist>
+    <loc id="ICE1" addr="3" prot="M" V_max="100">
+      <fn no="0" text="luz" state="true"/>
+      <fn no="1" text="som"/>
+    </loc>
+  </lclist>
+  <swlist><switch id="SW1" addr="10" type="left" state="straight" x="1" y="0" z="0"/></swlist>
+  <fblist><sensor id="S1" addr="5"/></fblist>
+  <tklist>
+    <track id="T1" type="straight" x="1" y="1" z="0"/>
+    <track id="T2" type="curve" blockid="B2" x="3" y="0" z="0" angle="90"/>
+  </tklist>
+</plan>
+"""
+
+
+@pytest.fixture
+def plan_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(rocrail_plan, "SNAPSHOT_ENABLED", False)
+    path = tmp_path / "plan.xml"
+    path.write_text(PLAN_XML, encoding="utf-8")
+    loads = []
+    load = rocrail_plan._load_plan
+    monkeypatch.setattr(rocrail_plan, "_load_plan", lambda p: loads.append(p) or load(p))
+    yield path, loads
+    rocrail_plan._plan_cache.pop(str(path), None)
+    rocrail_plan._plan_errors.pop(str(path), None)
+
+
+def touch(path, content):
+    st = os.stat(path)
+    path.write_text(content, encoding="utf-8")
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+
+def test_parse_plan_records(plan_file):
+    path, _ = plan_file
+    plan = parse_plan(path)
+    assert [b["id"] for b in plan["blocks"]] == ["B1", "B2"]
+    assert plan["locos"][0]["functions"][0] == {
+        "no": "0", "text": "luz", "icon": None, "type": None, "state": "true"}
+    assert plan["switches"][0]["state"] == "straight"
+    assert plan["sensors"][0]["addr"] == "5"
+    assert plan["tracks"][1]["blockid"] == "B2"
+
+
+def test_cache_hit_until_file_changes(plan_file):
+    path, loads = plan_file
+    first = parse_plan(path)
+    assert parse_plan(path) is first
+    assert len(loads) == 1
+
+    touch(path, PLAN_XML.replace('<block id="B2"', '<block id="B3"'))
+    second = parse_plan(path)
+    assert second is not first
+    assert [b["id"] for b in second["blocks"]] == ["B1", "B3"]
+    assert len(loads) == 2
+
+
+def test_broken_file_keeps_last_good_plan_and_is_not_reparsed(plan_file):
+    path, loads = plan_file
+    good = parse_plan(path)
+    touch(path, PLAN_XML[:-20])
+    for _ in range(3):
+        assert parse_plan(path) is good
+    assert len(loads) == 2          # a versão partida só é lida uma vez
+
+    touch(path, PLAN_XML)
+    assert parse_plan(path) is not good
+    assert len(loads) == 3
+
+
+def test_broken_file_without_good_version_raises_once_parsed(plan_file):
+    path, loads = plan_file
+    touch(path, "<plan><bklist>")
+    for _ in range(2):
+        with pytest.raises(ET.ParseError):
+            parse_plan(path)
+    assert len(loads) == 1
+
+
+def test_missing_file_gives_empty_plan(tmp_path):
+    assert parse_plan(tmp_path / "nope.xml") == {
+        "blocks": [], "locos": [], "switches": [], "sensors": [], "tracks": []}
+
+
+def test_stray_elements_outside_records_are_ignored(plan_file):
+    path, _ = plan_file
+    # <fn> fora de uma loco e listas desconhecidas não entram no plano
+    touch(path, PLAN_XML.replace(
+        "<tklist>", '<fn no="9"/><stlist><st id="R1"><swcmd id="SW1"/></st></stlist><tklist>'))
+    plan = parse_plan(path)
+    assert [t["id"] for t in plan["tracks"]] == ["T1", "T2"]
+    assert [len(l["functions"]) for l in plan["locos"]] == [2]
+
+
+def test_etree_iterator_detaches_processed_elements(tmp_path, monkeypatch):
+    path = tmp_path / "plan.xml"
+    path.write_text(PLAN_XML, encoding="utf-8")
+    roots = []
+    iterparse = ET.iterparse
+
+    def spy(*args, **kwargs):
+        for event, elem in iterparse(*args, **kwargs):
+            if not roots:
+                roots.append(elem)
+            yield event, elem
+
+    monkeypatch.setattr(rocrail_plan.ET, "iterparse", spy)
+    tags = [elem.tag for elem in rocrail_plan._iter_elements_etree(path)]
+    assert tags.count("block") == 2 and tags.count("track") == 2
+    # no fim a raiz não guarda nenhum dos elementos já tratados
+    assert roots[0].tag == "plan" and len(roots[0]) == 0
+
+
+def test_missing_file_is_the_same_plan_object(tmp_path):
+    # o grafo / índice só se reconstroem quando o plano devolvido é outro
+    assert parse_plan(tmp_path / "nope.xml") is parse_plan(tmp_path / "nope.xml")
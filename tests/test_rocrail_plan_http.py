@@ -0,0 +1,47 @@
+import gzip
+import json
+
+import pytest
+
+from apps import rocrail_plan_http
+from apps.rocrail_plan_http import PlanResponseCache, variant_key
+
+PLAN_V1 = {"blocks": [{"id": "B1"}], "locos": [], "switches": [{"id": "SW1", "x": "1", "y": "2"}],
+           "sensors": [], "tracks": []}
+PLAN_V2 = dict(PLAN_V1, blocks=[{"id": "B1"}, {"id": "B2"}])
+
+
+@pytest.fixture
+def plans(monkeypatch):
+    current = [PLAN_V1]
+    monkeypatch.setattr(rocrail_plan_http, "parse_plan", lambda: current[-1])
+    return current
+
+
+def test_variant_key_is_normalised():
+    assert variant_key("switches", "y, x,id,x", None) == ("switches", ("id", "x", "y"), None)
+    assert variant_key(None, None, "tracks,nope,blocks") == (None, None, ("blocks", "tracks"))
+
+
+def test_body_carries_the_etag_of_its_version(plans):
+    cache = PlanResponseCache()
+    key = variant_key("switches", "id,x", None)
+    body = cache.get(key)
+    assert json.loads(body.raw) == [{"id": "SW1", "x": "1"}]
+    assert gzip.decompress(body.gz) == body.raw
+    assert cache.get(key) is body
+
+    plans.append(PLAN_V2)
+    full = cache.get(variant_key(None, None, None))
+    assert json.loads(full.raw)["blocks"] == [{"id": "B1"}, {"id": "B2"}]
+    new_body = cache.get(key)
+    assert new_body is not body and new_body.etag != body.etag
+    # o plano inteiro é serializado logo ao mudar de versão (para o hash)
+    assert cache.get_stats()["hits"] == 2
+
+
+def test_not_modified_counter(plans):
+    cache = PlanResponseCache()
+    for _ in range(3):
+        cache.count_not_modified()
+    assert cache.get_stats()["not_modified"] == 3
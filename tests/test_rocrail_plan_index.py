@@ -0,0 +1,40 @@
+from apps.rocrail_plan_index import PlanIndex
+
+PLAN = {
+    "blocks": [{"id": "B1", "x": "0", "y": "0", "z": "0"}],
+    "locos": [{"id": "ICE1"}],
+    "switches": [
+        {"id": "SW1", "x": "10", "y": "4", "z": "0", "state": "straight"},
+        {"id": "SW2", "x": "nan", "y": "4", "z": "0"},
+        {"id": "SW3", "x": "inf", "y": "-inf", "z": "nan"},
+    ],
+    "sensors": [],
+    "tracks": [
+        {"id": "T1", "x": "1", "y": "0", "z": "0", "blockid": "B1"},
+        {"id": "T2", "x": "40", "y": "40", "z": "1"},
+    ],
+}
+
+
+def test_lookup_returns_original_record():
+    index = PlanIndex(PLAN, cell=8)
+    obj = index.get("switches", "SW1")
+    assert (obj.x, obj.y, obj.z) == (10.0, 4.0, 0)
+    assert index.data(obj) is PLAN["switches"][0]
+    assert not hasattr(obj, "__dict__")
+    assert [index.data(t)["id"] for t in index.tracks_by_block["B1"]] == ["T1"]
+
+
+def test_non_finite_coordinates_stay_out_of_the_grid():
+    index = PlanIndex(PLAN, cell=8)
+    assert index.get("switches", "SW2").x is None
+    assert index.get("switches", "SW3").z == 0
+    ids = {o.id for o in index.query_rect(-1e9, -1e9, 1e9, 1e9)}
+    assert ids == {"B1", "SW1", "T1", "T2"}
+
+
+def test_query_rect_by_level_and_kind():
+    index = PlanIndex(PLAN, cell=8)
+    assert [o.id for o in index.query_rect(0, 0, 20, 20, z=0, kinds=["switches"])] == ["SW1"]
+    assert [o.id for o in index.query_rect(30, 30, 50, 50)] == ["T2"]
+    assert index.query_rect(30, 30, 50, 50, z=0) == []
@@ -0,0 +1,57 @@
+import pytest
+
+from apps import rocrail_plan, rocrail_plan_snapshot
+from apps.rocrail_plan import parse_plan
+from apps.rocrail_plan_snapshot import load_snapshot, snapshot_path, source_hash, write_snapshot
+
+from tests.test_rocrail_plan import PLAN_XML
+
+
+@pytest.fixture
+def plan_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(rocrail_plan_snapshot, "SNAPSHOT_DIR", tmp_path / "cache")
+    path = tmp_path / "workspace" / "plan.xml"
+    path.parent.mkdir()
+    path.write_text(PLAN_XML, encoding="utf-8")
+    yield path
+    rocrail_plan._plan_cache.pop(str(path), None)
+
+
+def test_snapshot_roundtrip(plan_path):
+    plan = rocrail_plan._parse_plan_file(plan_path)
+    digest = source_hash(plan_path)
+    out = write_snapshot(plan_path, digest, plan)
+    # na pasta da aplicação, nunca ao lado do plan.xml do utilizador
+    assert out == snapshot_path(plan_path) and out.parent.name == "cache"
+    assert list(plan_path.parent.iterdir()) == [plan_path]
+
+    snap = load_snapshot(plan_path, digest)
+    try:
+        assert snap.to_plan() == plan
+    finally:
+        snap.close()
+    assert load_snapshot(plan_path, b"\0" * 20) is None
+
+
+def test_load_plan_uses_snapshot_and_closes_it(plan_path, monkeypatch):
+    first = rocrail_plan._load_plan(plan_path)
+    assert snapshot_path(plan_path).exists()
+
+    opened = []
+    load = rocrail_plan.load_snapshot
+    monkeypatch.setattr(rocrail_plan, "load_snapshot", lambda *a: opened.append(load(*a)) or opened[-1])
+    monkeypatch.setattr(rocrail_plan, "_parse_plan_file", lambda p: pytest.fail("não devia fazer parse"))
+    assert rocrail_plan._load_plan(plan_path) == first
+    assert opened[0].mm.closed
+
+
+def test_changed_xml_rewrites_the_snapshot(plan_path):
+    parse_plan(plan_path)
+    plan_path.write_text(PLAN_XML.replace('id="B2"', 'id="B9"'), encoding="utf-8")
+    plan = rocrail_plan._load_plan(plan_path)
+    assert [b["id"] for b in plan["blocks"]] == ["B1", "B9"]
+    snap = load_snapshot(plan_path, source_hash(plan_path))
+    try:
+        assert [b["id"] for b in snap.to_plan()["blocks"]] == ["B1", "B9"]
+    finally:
+        snap.close()
@@ -0,0 +1,61 @@
+import time
+
+import pytest
+
+from apps import rocrail_plan, rocrail_plan_watch
+from apps.rocrail_plan_watch import PlanWatcher, diff_plans
+
+from tests.test_rocrail_plan import PLAN_XML, touch
+
+
+@pytest.fixture
+def watcher(tmp_path, monkeypatch):
+    monkeypatch.setattr(rocrail_plan, "SNAPSHOT_ENABLED", False)
+    path = tmp_path / "plan.xml"
+    path.write_text(PLAN_XML, encoding="utf-8")
+    yield PlanWatcher(path)
+    rocrail_plan._plan_cache.pop(str(path), None)
+
+
+def test_diff_reports_added_removed_and_changed():
+    old = {"switches": [{"id": "SW1", "state": "straight"}, {"id": "SW2"}]}
+    new = {"switches": [{"id": "SW1", "state": "turnout"}, {"id": "SW3"}]}
+    diff = diff_plans(old, new)
+    assert diff["added"]["switches"] == [{"id": "SW3"}]
+    assert diff["removed"]["switches"] == ["SW2"]
+    assert diff["changed"]["switches"] == [{"id": "SW1", "attrs": {"state": "turnout"}}]
+
+
+def test_diffs_since_does_not_block_without_timeout(watcher):
+    t0 = time.perf_counter()
+    assert watcher.diffs_since(0, 0) == (0, [])
+    assert time.perf_counter() - t0 < 0.1
+
+    touch(watcher.path, PLAN_XML.replace('state="straight"', 'state="turnout"'))
+    assert watcher.check()
+    version, diffs = watcher.diffs_since(0, 0)
+    assert version == 1
+    assert diffs[0]["changed"]["switches"] == [{"id": "SW1", "attrs": {"state": "turnout"}}]
+
+
+def test_client_behind_history_must_reset(watcher):
+    watcher.version = rocrail_plan_watch.HISTORY + 5
+    watcher.history.append((watcher.version, {}))
+    assert watcher.diffs_since(1, 0) == (watcher.version, None)
+
+
+def test_version_from_before_a_restart_must_reset(watcher):
+    # a versão conta por processo: since=5 vem de antes de a app reiniciar
+    assert watcher.diffs_since(5, 0) == (0, None)
+    assert watcher.diffs_since(0, 0) == (0, [])
+
+
+def test_diffs_route_asks_for_reset_after_restart(watcher, monkeypatch):
+    from flask import Flask
+    from apps.home import blueprint, routes
+
+    monkeypatch.setattr(routes, "get_plan_watcher", lambda: watcher)
+    app = Flask(__name__)
+    app.register_blueprint(blueprint)
+    r = app.test_client().get("/api/rocrail/plan/diffs?since=5", headers={"If-None-Match": '"plan-v5"'})
+    assert r.status_code == 200 and r.json == {"version": 0, "reset": True}
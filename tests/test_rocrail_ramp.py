@@ -0,0 +1,86 @@
+import threading
+import time
+
+from apps.rocrail_core import LOCO_DEFAULT, RocrailClient
+from apps.rocrail_ramp import CURVES, SpeedRamp, SpeedRampEngine, TimerWheel
+
+
+def make_client():
+    client = RocrailClient()
+    sent = []
+    client.send_batch = lambda xml_list: sent.extend(xml_list) or True
+    return client, sent
+
+
+def test_ramp_values_follow_curve():
+    ramp = SpeedRamp("ICE1", 0, 100, start_tick=0, ticks=10, curve=CURVES["linear"])
+    assert [ramp.value_at(t) for t in (0, 5, 10, 20)] == [0, 50, 100, 100]
+    s = SpeedRamp("ICE1", 0, 100, start_tick=0, ticks=10, curve=CURVES["s_curve"])
+    assert s.value_at(2) < 20 and s.value_at(5) == 50
+
+
+def test_timer_wheel_returns_items_on_due_tick():
+    wheel = TimerWheel(slots=4)
+    wheel.schedule(6, "a")          # dá uma volta à wheel
+    wheel.schedule(2, "b")
+    due = {t: wheel.advance() for t in range(1, 7)}
+    assert due[2] == ["b"] and due[6] == ["a"]
+    assert all(not items for t, items in due.items() if t not in (2, 6))
+
+
+def test_emergency_stop_stops_every_ramping_loco():
+    client, sent = make_client()
+    client.ramps.start_ramp("BR218", 80, 30.0)
+    client.ramps.start_ramp("V200", 60, 30.0)
+    client.emergency_stop()
+    assert sorted(sent) == sorted([
+        f'<lc id="{LOCO_DEFAULT}" cmd="stop"/>',
+        '<lc id="BR218" cmd="stop"/>',
+        '<lc id="V200" cmd="stop"/>',
+    ])
+    assert client.ramps.ramps == {}
+
+
+def test_emergency_stop_listed_locos_are_not_repeated():
+    client, sent = make_client()
+    client.ramps.start_ramp("BR218", 80, 30.0)
+    client.emergency_stop(["BR218"])
+    assert sent == ['<lc id="BR218" cmd="stop"/>']
+
+
+def test_ramp_starts_from_speed_reported_by_rocrail():
+    client, _ = make_client()
+    client._dispatch_events('<lc id="BR218" V="55" dir="true"/>', 0.0)
+    assert client.ramps.current["BR218"] == 55
+    ramp = client.ramps.start_ramp("BR218", 0, 30.0)
+    assert ramp.start == 55
+    client.ramps.cancel_all()
+
+
+def test_cancel_during_tick_send_keeps_stop_last():
+    log = []
+    in_send = threading.Event()
+    release = threading.Event()
+
+    def send_batch(xml_list):
+        # o lote do tick fica "a ser escrito" até o cancel já ter sido pedido
+        in_send.set()
+        release.wait(5.0)
+        log.extend(xml_list)
+
+    engine = SpeedRampEngine(send_batch, tick_s=0.005)
+    engine.start_ramp("ICE1", 100, 1.0)
+    assert in_send.wait(5.0)
+
+    def stop_loco():
+        engine.cancel("ICE1")
+        log.append('<lc id="ICE1" cmd="stop"/>')
+
+    stopper = threading.Thread(target=stop_loco)
+    stopper.start()
+    time.sleep(0.05)
+    release.set()
+    stopper.join(5.0)
+    time.sleep(0.05)
+    assert log[-1] == '<lc id="ICE1" cmd="stop"/>'
+    assert len(log) >= 2 and engine.ramps == {}
@@ -0,0 +1,55 @@
+import pytest
+from flask import Flask
+
+from apps.home import blueprint, routes
+
+ROUTE = {"from": "B1", "to": "B2", "blocks": ["B1", "B2"],
+         "switches": [{"id": "SW1", "cmd": "turnout"}]}
+
+
+class FakeGraph:
+    def route_dict(self, src, dst):
+        return dict(ROUTE) if (src, dst) == ("B1", "B2") else None
+
+
+class FakeIndex:
+    def get(self, kind, obj_id):
+        return obj_id
+
+    def data(self, obj):
+        return {"addr": "3", "port": "2"}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(routes, "get_block_graph", FakeGraph)
+    app = Flask(__name__)
+    app.register_blueprint(blueprint)
+    return app.test_client()
+
+
+@pytest.mark.parametrize("body", [
+    {}, {"from": "B1"}, {"from": ["B1"], "to": "B2"}, {"from": "B1", "to": {"id": "B2"}},
+    {"from": "", "to": "B2"}, ["B1", "B2"],
+])
+def test_route_set_requires_from_and_to_strings(client, body):
+    r = client.post("/api/rocrail/route/set", json=body)
+    assert r.status_code == 400 and r.json["error"] == "from/to obrigatórios"
+
+
+def test_route_set_unknown_route_is_404(client):
+    r = client.post("/api/rocrail/route/set", json={"from": "B2", "to": "B1"})
+    assert r.status_code == 404
+
+
+def test_route_set_cs3_validation_error_is_400(client, monkeypatch):
+    class FakeCS3:
+        def set_turnouts(self, items):
+            assert items == [{"id": "10", "position": "turnout"}]
+            raise ValueError([{"index": 0, "error": "agulha desconhecida"}])
+
+    monkeypatch.setattr(routes, "get_plan_index", FakeIndex)
+    monkeypatch.setattr(routes, "get_cs3", FakeCS3)
+    r = client.post("/api/rocrail/route/set", json={"from": "B1", "to": "B2", "via": "cs3"})
+    assert r.status_code == 400
+    assert r.json["error"] == [{"index": 0, "error": "agulha desconhecida"}]
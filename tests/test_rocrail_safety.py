@@ -0,0 +1,65 @@
+from apps.rocrail_graph import build_block_graph
+from apps.rocrail_safety import CollisionPredictor
+
+# B1 - B2 - B3 numa linha reta: (0,0) [1,0] (2,0) [3,0] (4,0)
+PLAN = {
+    "blocks": [{"id": "B1", "x": 0, "y": 0}, {"id": "B2", "x": 2, "y": 0}, {"id": "B3", "x": 4, "y": 0}],
+    "tracks": [{"id": "T1", "x": 1, "y": 0, "type": "straight"},
+               {"id": "T2", "x": 3, "y": 0, "type": "straight"}],
+    "switches": [],
+}
+
+
+def make_predictor():
+    sent = []
+    pred = CollisionPredictor(build_block_graph(PLAN), commander=sent.extend)
+    pred.update_train("ICE1", block="B1", speed=100)
+    return pred, sent
+
+
+def test_stop_is_held_while_obstacle_is_ahead():
+    pred, sent = make_predictor()
+    pred.set_obstacle("B2", True)
+
+    pred.step()
+    assert sent == [{"op": "stop", "loco_id": "ICE1"}]
+    assert pred.trains["ICE1"].action == "stop"
+
+    # o Rocrail confirma V=0; o obstáculo continua lá: nada de "go"
+    pred.on_rocrail_event("lc", {"id": "ICE1", "V": "0"})
+    for _ in range(5):
+        pred.step()
+    assert sent == [{"op": "stop", "loco_id": "ICE1"}]
+    assert pred.trains["ICE1"].action == "stop"
+    assert pred.trains["ICE1"].requested_speed == 100
+
+    pred.set_obstacle("B2", False)
+    pred.step()
+    assert sent[-1] == {"op": "go", "loco_id": "ICE1", "speed": 100}
+    assert pred.trains["ICE1"].action == "clear"
+
+
+def test_stop_does_not_relax_to_slow():
+    pred, sent = make_predictor()
+    pred.set_obstacle("B2", True)
+    pred.step()
+    assert pred.trains["ICE1"].action == "stop"
+
+    # o obstáculo passa para mais longe (conflito só na zona de "slow")
+    pred.set_obstacle("B2", False)
+    pred.set_obstacle("B3", True)
+    pred.braking_s = pred.horizon_s
+    t_conflict = pred.predict()[0]["time_s"]
+    # stop_s < t_conflict <= slow_s = 2 * stop_s
+    pred.braking_s = 0.75 * t_conflict - pred.reaction_time_s()
+    conflicts = pred.step()
+    assert [c["action"] for c in conflicts] == ["slow"]
+    assert pred.trains["ICE1"].action == "stop"
+    assert sent == [{"op": "stop", "loco_id": "ICE1"}]
+
+
+def test_no_conflict_no_commands():
+    pred, sent = make_predictor()
+    for _ in range(3):
+        assert pred.step() == []
+    assert sent == []